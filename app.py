@@ -2,6 +2,7 @@
 import streamlit as st
 import tempfile
 import os
+import time
 from datetime import date
 
 import config
@@ -13,8 +14,8 @@ from models.survey_data import (
 from models.estimate_data import (
     EstimateData, CategoryType, LineItem, LineItemReasoning, PricingMethod,
 )
+from extraction import jobs
 from extraction.pdf_reader import pdf_to_images
-from extraction.survey_extractor import extract_survey_data, extract_survey_data_multi
 from extraction.survey_validator import validate_survey_data
 from generation.estimate_builder import build_estimate, update_line_item
 from generation.pdf_generator import generate_pdf
@@ -22,14 +23,14 @@ from generation.csv_exporter import export_estimate_to_csv_detailed
 
 # v2.3 新機能（音声編集・屋根レイアウト・製品カタログ）
 from voice.voice_recorder import record_and_transcribe, is_whisper_available
-from voice.voice_command_parser import parse_voice_command
+from voice.voice_command_parser import parse_voice_command, parse_stats as voice_parse_stats
 from voice.estimate_editor import apply_commands
+from pricing.edit_session import EstimateEditSession
 from roof.satellite_fetcher import get_roof_view, geocode_address
 from roof.panel_layout import (
     compute_panel_layout, panel_dimensions_from_module,
     render_layout_svg, render_layout_png,
 )
-from product.catalog_extractor import extract_product_catalog
 from product.product_registry import (
     load_registry, add_product, find_by_model,
     get_active_module_for_estimate, delete_product,
@@ -506,6 +507,8 @@ def main():
 
     # セッション初期化
     _init_session()
+    # 再接続（再読み込み）時は URL のジョブIDから読み取り中の画面に戻る
+    _restore_survey_job()
 
     # ステップインジケーター
     _render_step_indicator()
@@ -564,6 +567,8 @@ def _init_session():
         "pdf_bytes": None,
         "tmp_pdf_paths": [],
         "client_name": "",
+        "survey_job_id": None,  # バックグラウンド読み取りジョブ（extraction.jobs）
+        "catalog_job_id": None,
     }
     for k, v in defaults.items():
         if k not in st.session_state:
@@ -1403,6 +1408,10 @@ def _render_step1_direct_input():
 def _render_step1_pdf_upload():
     st.markdown('<div style="margin-bottom:0.5rem;"><span style="font-size:1.25rem;font-weight:700;color:#1B2D45;">📄 図面・現調シートPDFアップロード</span></div>', unsafe_allow_html=True)
 
+    # 読み取りジョブが進行中なら進捗だけを表示する（再実行・画面遷移をまたいで継続）
+    if _render_survey_job():
+        return
+
     # API Key チェック
     api_key = config.get_api_key()
     if not api_key:
@@ -1468,17 +1477,10 @@ def _render_step1_pdf_upload():
                     images = pdf_to_images(sample_tmp_path, dpi=150)
                     st.session_state.pdf_images = images
                     st.session_state.tmp_pdf_paths = [sample_tmp_path]
-                    progress_bar = st.progress(0, text="準備中...")
-                    progress_bar.progress(10, text="サンプルPDFを読み込み中...")
-                    progress_bar.progress(30, text="AI解析を開始しています...")
-                    survey = extract_survey_data_multi([sample_tmp_path])
-                    progress_bar.progress(90, text="データを整理しています...")
-                    progress_bar.progress(100, text="読み取り完了！")
-                    st.session_state.survey_data = survey
-                    st.session_state.step = 2
-                    st.rerun()
                 except Exception as e:
                     st.error(f"⚠️ サンプルの読み取りに失敗しました: {e}")
+                else:
+                    _start_survey_job([sample_tmp_path])
 
     if uploaded_files:
         st.markdown(f"""
@@ -1566,39 +1568,201 @@ def _render_step1_pdf_upload():
             total_pages = len(all_images)
             label = f"🔍 AI読み取り開始（{file_count}件 / {total_pages}ページを解析）"
             if st.button(label, type="primary", use_container_width=True):
-                progress_bar = st.progress(0, text="準備中...")
                 category_map = {"自動判別": None, "高圧（法人）": "commercial", "低圧（住宅）": "residential"}
-                category_arg = category_map.get(category_choice)
-                try:
-                    progress_bar.progress(10, text="📄 PDFを画像に変換中...")
-                    progress_bar.progress(20, text="🔍 書類タイプを判別中（住宅 or 法人）...")
-                    progress_bar.progress(40, text="🤖 AIが手書き文字を認識しています...")
-                    survey = extract_survey_data_multi(
-                        tmp_paths,
-                        category=category_arg,
-                        use_image_enhancement=use_enhancement,
-                        use_self_consistency=use_self_consistency,
-                    )
-                    progress_bar.progress(70, text="📊 データを構造化しています...")
-                    progress_bar.progress(90, text="✅ ドメイン知識で検証・補正中...")
-                    progress_bar.progress(100, text="🎉 読み取り完了！")
-                    st.session_state.survey_data = survey
-                    st.session_state.step = 2
-                    st.rerun()
-                except RuntimeError as e:
-                    st.error(f"⚠️ {e}")
-                    st.info("💡 **対処法**: PDFファイルが正常に開けるか確認し、再度お試しください。"
-                            "問題が続く場合は、PDFを1ファイルずつアップロードしてみてください。")
-                except Exception as e:
-                    st.error(f"⚠️ 予期しないエラーが発生しました: {e}")
-                    st.info("💡 しばらく待ってから再度お試しください。")
-                    st.exception(e)
+                # 読み取りはバックグラウンドジョブで実行し、この画面は進捗を問い合わせる
+                # （完成したセクションから先に表示する。同じPDF・設定なら結果を再利用）
+                _start_survey_job(
+                    tmp_paths,
+                    category=category_map.get(category_choice),
+                    use_image_enhancement=use_enhancement,
+                    use_self_consistency=use_self_consistency,
+                )
     else:
         if st.button("← 入力方法に戻る"):
             st.session_state.step = 0
             st.rerun()
 
 
+# ストリーミング抽出で先出し表示するセクション（応答JSONのトップレベルキー）
+_STREAM_SECTION_LABELS = {
+    "project": "案件情報",
+    "equipment": "計画設備",
+    "high_voltage": "高圧チェック項目",
+    "supplementary": "別紙",
+    "confirmation": "最終確認",
+}
+
+
+def _render_stream_preview(placeholder) -> None:
+    """読み取り途中のセクション（検証済み）を placeholder に表示する。
+
+    確定値ではなく参考表示。読み取り完了後に Step 2 で全体を確認・修正する。
+    """
+    sections = st.session_state.get("survey_stream_sections") or {}
+    with placeholder.container():
+        st.caption("⏳ 読み取り済みの項目から順に表示しています（完了後に確認画面へ進みます）")
+        for name, label in _STREAM_SECTION_LABELS.items():
+            entry = sections.get(name)
+            if not entry or not isinstance(entry.get("data"), dict):
+                continue
+            values = [f"{k}: {v}" for k, v in entry["data"].items()
+                      if v not in (None, "", [], {}) and not isinstance(v, (dict, list))]
+            st.markdown(f"**✅ {label}**　" + "　/　".join(values[:8]))
+            for w in entry.get("warnings") or []:
+                st.caption(f"　⚠️ {w}")
+
+
+# 読み取りジョブの段階（extraction.jobs の stage）→ 表示文言
+_JOB_STAGE_LABELS = {
+    "queued": "⏳ 読み取りの順番を待っています...",
+    "render": "📄 PDFを画像に変換中...",
+    "classify": "🔍 書類タイプを判別中（住宅 or 法人）...",
+    "call": "🤖 AIが手書き文字を認識しています...",
+    "validate": "✅ ドメイン知識で検証・補正中...",
+    "done": "🎉 読み取り完了！",
+}
+# 読み取り中に状態を問い合わせる間隔（秒）
+_JOB_POLL_SEC = 1.0
+
+
+def _start_survey_job(pdf_paths: list[str], **options) -> None:
+    """現調シートの読み取りジョブを投入し、ジョブIDをセッションと URL に保存する。"""
+    job = jobs.submit_survey_extraction(pdf_paths, **options)
+    st.session_state.survey_job_id = job.id
+    st.session_state.survey_stream_sections = {}
+    st.query_params["job"] = job.id
+    st.rerun()
+
+
+def _clear_survey_job() -> None:
+    st.session_state.survey_job_id = None
+    if "job" in st.query_params:
+        del st.query_params["job"]
+
+
+def _restore_survey_job() -> None:
+    """新しいセッション（再接続・再読み込み）で URL のジョブIDがあれば読み取り画面に戻す。"""
+    if st.session_state.get("survey_job_id"):
+        return
+    job_id = st.query_params.get("job")
+    if not job_id:
+        return
+    job = jobs.get(job_id)
+    if job is None or job.kind != "survey":
+        del st.query_params["job"]
+        return
+    st.session_state.survey_job_id = job.id
+    st.session_state.input_mode = "pdf"
+    st.session_state.step = 1
+    st.session_state.tmp_pdf_paths = [p for p in job.inputs if os.path.exists(p)]
+    if not st.session_state.get("pdf_images"):
+        try:
+            st.session_state.pdf_images = [
+                img for p in st.session_state.tmp_pdf_paths for img in pdf_to_images(p, dpi=150)]
+        except Exception:
+            st.session_state.pdf_images = None
+
+
+def _render_survey_job() -> bool:
+    """読み取りジョブの進捗を表示する。
+
+    Returns:
+        進行中のジョブを表示した場合 True（呼び出し側はアップロード画面を出さない）。
+        完了時は Step 2 へ進み、失敗・取り消し時はメッセージを出して False を返す。
+    """
+    job_id = st.session_state.get("survey_job_id")
+    job = jobs.get(job_id)
+    if job is None:
+        if job_id:
+            _clear_survey_job()
+            st.warning("読み取りジョブが見つかりません（サーバーが再起動した可能性があります）。"
+                       "もう一度読み取りを開始してください。")
+        return False
+
+    if job.status == jobs.DONE:
+        _clear_survey_job()
+        st.session_state.survey_data = job.result
+        st.session_state.survey_stream_sections = {}
+        st.session_state.step = 2
+        st.rerun()
+    if job.status == jobs.FAILED:
+        _clear_survey_job()
+        st.error(f"⚠️ {job.error}")
+        st.info("💡 **対処法**: PDFファイルが正常に開けるか確認し、再度お試しください。"
+                "問題が続く場合は、PDFを1ファイルずつアップロードしてみてください。")
+        return False
+    if job.status == jobs.CANCELLED:
+        _clear_survey_job()
+        st.info("読み取りを取り消しました。")
+        return False
+
+    # 読み取り中: 段階と先出しセクションを表示して、一定間隔で再実行する
+    st.session_state.survey_stream_sections = dict(job.sections)
+    pct = job.progress
+    text = _JOB_STAGE_LABELS.get(job.stage, "🤖 読み取り中...")
+    done_labels = [label for name, label in _STREAM_SECTION_LABELS.items() if name in job.sections]
+    if job.stage == "call" and done_labels:
+        pct = min(40 + len(done_labels) * 8, 88)
+        text = f"🤖 読み取り中…「{done_labels[-1]}」まで完了"
+    st.progress(pct, text=f"{text}（{job.elapsed_sec:.0f}秒）")
+    if job.sections:
+        _render_stream_preview(st.empty())
+    st.caption("💡 画面を離れても読み取りは続きます。この画面に戻ると結果を受け取れます。")
+
+    col_back, col_cancel = st.columns([1, 1])
+    with col_back:
+        if st.button("← 入力方法に戻る（読み取りは続行）", key="survey_job_back"):
+            st.session_state.step = 0
+            st.rerun()
+    with col_cancel:
+        if st.button("✖ 読み取りを取り消す", key="survey_job_cancel"):
+            jobs.cancel(job.id)
+            _clear_survey_job()
+            st.rerun()
+
+    time.sleep(_JOB_POLL_SEC)
+    st.rerun()
+    return True
+
+
+def _render_roi_reextract(survey: SurveyData) -> None:
+    """低信頼度の項目（MAX_ROI_FIELDS 件以下）だけを部分再読み取りするボタン。
+
+    全ページを送り直す再読み取りより速く、トークンも少ない。
+    失敗しても現在の読み取り結果はそのまま残す。
+    """
+    from extraction.roi_reextract import (
+        MAX_ROI_FIELDS, low_confidence_fields, reextract_low_confidence_fields,
+    )
+    report = st.session_state.pop("roi_reextract_report", None)
+    if report:
+        st.success(
+            f"🎯 {len(report['fields'])}項目を部分再読み取りしました: "
+            f"信頼度更新 {len(report['confidences'])}件 / 値の変更 {len(report['changed'])}件"
+            f"（{report['elapsed_sec']}秒）")
+    pdf_paths = [p for p in (st.session_state.get("tmp_pdf_paths") or []) if os.path.exists(p)]
+    fields = low_confidence_fields(survey)
+    if not pdf_paths or not fields or len(fields) > MAX_ROI_FIELDS:
+        return
+    cols = st.columns([3, 1])
+    with cols[0]:
+        st.caption(f"🎯 低信頼度の{len(fields)}項目だけを、記入箇所の拡大画像で読み直せます"
+                   "（全ページの再読み取りより短時間）")
+    with cols[1]:
+        if not st.button(f"🎯 {len(fields)}項目を再読み取り", key="step2_roi_reextract",
+                         use_container_width=True):
+            return
+    with st.spinner("記入箇所を拡大して読み直しています..."):
+        try:
+            updated, report = reextract_low_confidence_fields(survey, pdf_paths, fields)
+        except Exception as e:
+            st.warning(f"⚠️ 部分再読み取りに失敗しました（現在の結果のまま続行できます）: {e}")
+            return
+    st.session_state.survey_data = updated
+    st.session_state.roi_reextract_report = report
+    st.rerun()
+
+
 # =============================================================
 # Step 2: 確認・修正画面（共通）
 # =============================================================
@@ -1666,6 +1830,10 @@ def _render_step2_review():
                 st.success(f"{len(validation.auto_fixes)}件の自動修正を適用しました")
                 st.rerun()
 
+    # 低信頼度の項目が数件だけなら、その領域だけを高解像度で読み直せる
+    if is_pdf_mode:
+        _render_roi_reextract(survey)
+
     if is_pdf_mode and survey.extraction_warnings:
         with st.expander("🔍 AI読み取りの注意事項", expanded=False):
             for w in survey.extraction_warnings:
@@ -2011,14 +2179,21 @@ def _render_voice_edit_section(estimate: EstimateData):
                 return
 
             # 解析結果を表示
+            stats = voice_parse_stats()
+            last = stats.get("last_path")
+            if last:
+                st.caption(
+                    f"解析経路: {'ローカル規則' if last == 'local' else 'Claude'}"
+                    f"（{stats[last]['avg_ms']:,.0f}ms 平均）／ローカル命中率 {stats['hit_rate']:.0%}"
+                )
             st.markdown("**解析されたコマンド:**")
             for i, cmd in enumerate(commands, 1):
                 action = cmd.get("action", "?")
                 reason = cmd.get("reason", "")
                 st.markdown(f"  {i}. `{action}` — {reason}")
 
-            # 適用
-            new_estimate, logs = apply_commands(estimate, commands)
+            # 適用（編集セッション経由。この1回の適用を1手として取り消せる）
+            new_estimate, logs = apply_commands(estimate, commands, session=_edit_session(estimate))
             for log in logs:
                 if log.startswith("✅"):
                     st.success(log)
@@ -2095,17 +2270,33 @@ def _render_product_info_section(estimate: EstimateData):
                 tmp.write(catalog_file.getvalue())
                 tmp_path = tmp.name
 
-            if st.button("🤖 AIで仕様を抽出して登録", type="primary", key="catalog_extract_btn"):
-                with st.spinner("カタログを解析中..."):
-                    try:
-                        product = extract_product_catalog(tmp_path)
-                        registered = add_product(product)
-                        st.success(f"✅ 登録しました: {registered.get('maker', '?')} / {registered.get('model', '?')}")
-                        with st.expander("抽出された仕様（詳細）", expanded=True):
-                            st.json(registered)
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"⚠️ 抽出に失敗しました: {e}")
+            if st.button("🤖 AIで仕様を抽出して登録", type="primary", key="catalog_extract_btn",
+                         disabled=bool(st.session_state.get("catalog_job_id"))):
+                st.session_state.catalog_job_id = jobs.submit_catalog_extraction(tmp_path).id
+
+        # --- カタログ抽出ジョブ（バックグラウンド）の進捗・結果 ---
+        catalog_job = jobs.get(st.session_state.get("catalog_job_id"))
+        if catalog_job is not None:
+            if not catalog_job.done:
+                st.progress(catalog_job.progress,
+                            text=f"カタログを解析中...（{catalog_job.elapsed_sec:.0f}秒）")
+                if st.button("✖ 解析を取り消す", key="catalog_job_cancel"):
+                    jobs.cancel(catalog_job.id)
+                    st.session_state.catalog_job_id = None
+                    st.rerun()
+                time.sleep(_JOB_POLL_SEC)
+                st.rerun()
+            st.session_state.catalog_job_id = None
+            if catalog_job.status == jobs.DONE:
+                try:
+                    registered = add_product(catalog_job.result)
+                    st.success(f"✅ 登録しました: {registered.get('maker', '?')} / {registered.get('model', '?')}")
+                    with st.expander("抽出された仕様（詳細）", expanded=True):
+                        st.json(registered)
+                except Exception as e:
+                    st.error(f"⚠️ 登録に失敗しました: {e}")
+            elif catalog_job.status == jobs.FAILED:
+                st.error(f"⚠️ 抽出に失敗しました: {catalog_job.error}")
 
         # --- 登録済み一覧 ---
         with st.expander("📋 登録済みカタログ一覧", expanded=False):
@@ -2186,12 +2377,7 @@ def _add_master_item_to_estimate(
             note=f"商品コード {product.get('product_code', '')}".strip(),
         ),
     )
-    section.items.append(item)
-    section.calculate_totals()
-    estimate.summary.calculate_totals()
-    estimate.cover.total_before_tax = estimate.summary.total_before_tax
-    estimate.cover.tax = estimate.summary.tax
-    estimate.cover.total_with_tax = estimate.summary.total_with_tax
+    _edit_session(estimate).add_item(section, item)
     return True
 
 
@@ -2282,6 +2468,7 @@ def _render_price_master_section(estimate: EstimateData):
                 "型番": r.get("model", ""),
                 "品名": r.get("name", ""),
                 "単価(税抜)": r.get("unit_price"),  # int or None（数値列）
+                "単価の出典": r.get("price_source", ""),
                 "備考": remarks,
             })
         if view:
@@ -2435,7 +2622,7 @@ def _render_roof_layout_section(estimate: EstimateData):
 
         # --- 入力 ---
         default_addr = survey.project.address if survey else ""
-        col1, col2 = st.columns([3, 1])
+        col1, col2, col3 = st.columns([3, 1, 1])
         with col1:
             address = st.text_input(
                 "設置先住所", value=default_addr,
@@ -2444,6 +2631,12 @@ def _render_roof_layout_section(estimate: EstimateData):
             )
         with col2:
             zoom = st.number_input("ズーム", min_value=17, max_value=21, value=20, key="roof_zoom")
+        with col3:
+            grid = st.selectbox(
+                "取得範囲", options=[2, 3, 4], index=0, key="roof_grid",
+                format_func=lambda n: f"{n}×{n}" + ("（標準）" if n == 2 else "（大規模）"),
+                help="大きな工場・倉庫は 3×3〜4×4 で広い範囲を取得します（タイルは並列取得・キャッシュ済み）",
+            )
 
         # 衛星画像取得
         if st.button("🛰️ 衛星画像を取得", type="secondary", key="roof_fetch_btn"):
@@ -2451,7 +2644,7 @@ def _render_roof_layout_section(estimate: EstimateData):
                 st.warning("住所を入力してください。")
             else:
                 with st.spinner("衛星画像を取得中..."):
-                    view = get_roof_view(address.strip(), zoom=int(zoom))
+                    view = get_roof_view(address.strip(), zoom=int(zoom), grid=int(grid))
                 if view.get("error"):
                     st.error(f"⚠️ {view['error']}")
                     st.info("💡 Google Maps APIキーがあると番地レベルでも正確に取得できます。"
@@ -2620,6 +2813,7 @@ def _render_supply_selection_section(estimate: EstimateData):
         state = tuple(sorted(flags.items()))
         if st.session_state.supply_applied != state:
             apply_supply_attribute(estimate, snap, flags)
+            _edit_session(estimate).refresh()  # 明細を組み替えたため履歴も消す
             st.session_state.supply_applied = state
             st.rerun()
         return
@@ -2649,6 +2843,7 @@ def _render_supply_selection_section(estimate: EstimateData):
     state = tuple(sorted(flags.items()))
     if st.session_state.supply_applied != state:
         apply_supply_selection(estimate, snap, flags)
+        _edit_session(estimate).refresh()  # 明細を組み替えたため履歴も消す
         st.session_state.supply_applied = state
         st.rerun()
 
@@ -2657,6 +2852,44 @@ def _render_supply_selection_section(estimate: EstimateData):
 # Step 3: 見積プレビュー
 # =============================================================
 
+# 取り消し・やり直しの後に古い入力値で再適用しないよう消す Step 3 の入力欄
+_STEP3_INPUT_KEY_PREFIXES = ("qty_", "price_", "amt_", "manual_before_tax")
+
+
+def _edit_session(estimate: EstimateData) -> EstimateEditSession:
+    """見積ごとの編集セッション（合計の差分更新・取り消し履歴）を返す。"""
+    session = st.session_state.get("edit_session")
+    if session is None or session.estimate is not estimate:
+        session = EstimateEditSession(estimate)
+        st.session_state.edit_session = session
+    return session
+
+
+def _render_undo_redo(estimate: EstimateData):
+    """直前の編集の取り消し・やり直し"""
+    session = _edit_session(estimate)
+    history = session.history()
+    cols = st.columns([1, 1, 4])
+    with cols[0]:
+        undo = st.button("↶ 元に戻す", disabled=not session.can_undo,
+                         use_container_width=True, key="estimate_undo_btn")
+    with cols[1]:
+        redo = st.button("↷ やり直す", disabled=not session.can_redo,
+                         use_container_width=True, key="estimate_redo_btn")
+    with cols[2]:
+        if history:
+            st.caption(f"直前の編集: {history[-1]}（{len(history)}件まで戻せます）")
+    if undo or redo:
+        label = session.undo() if undo else session.redo()
+        for key in list(st.session_state.keys()):
+            if str(key).startswith(_STEP3_INPUT_KEY_PREFIXES):
+                del st.session_state[key]
+        st.session_state.pdf_bytes = None  # 再生成必要
+        if label:
+            st.toast(f"{'取り消し' if undo else 'やり直し'}: {label}")
+        st.rerun()
+
+
 def _render_step3_estimate():
     st.markdown('<div style="margin-bottom:0.5rem;"><span style="font-size:1.25rem;font-weight:700;color:#1B2D45;">📊 見積プレビュー・編集</span></div>', unsafe_allow_html=True)
 
@@ -2683,6 +2916,7 @@ def _render_step3_estimate():
     _render_price_master_section(estimate)
     _render_supply_selection_section(estimate)  # 2026-08-13 商品ごと支給品選択
     _render_roof_layout_section(estimate)
+    _render_undo_redo(estimate)
 
     # 値引き調整
     with st.expander("💰 値引き調整", expanded=False):
@@ -2691,13 +2925,7 @@ def _render_step3_estimate():
             "税抜合計（手動設定）", value=estimate.summary.total_before_tax,
             min_value=0, step=10000, key="manual_before_tax")
         if new_before_tax != estimate.summary.total_before_tax:
-            estimate.summary.discount = new_before_tax - estimate.summary.subtotal
-            estimate.summary.total_before_tax = new_before_tax
-            estimate.summary.tax = int(new_before_tax * 0.10)
-            estimate.summary.total_with_tax = new_before_tax + estimate.summary.tax
-            estimate.cover.total_before_tax = estimate.summary.total_before_tax
-            estimate.cover.tax = estimate.summary.tax
-            estimate.cover.total_with_tax = estimate.summary.total_with_tax
+            _edit_session(estimate).set_total_before_tax(new_before_tax)
 
     # サマリーカード
     st.markdown(f"""
@@ -2826,13 +3054,8 @@ def _render_category_editor(estimate: EstimateData, cat_idx: int, cat):
                         min_value=0, step=1000, label_visibility="collapsed")
 
                 if new_price != item.unit_price or new_amount != item.amount:
-                    item.unit_price = new_price
-                    item.amount = new_amount
-                    cat.calculate_totals()
-                    estimate.summary.calculate_totals()
-                    estimate.cover.total_with_tax = estimate.summary.total_with_tax
-                    estimate.cover.total_before_tax = estimate.summary.total_before_tax
-                    estimate.cover.tax = estimate.summary.tax
+                    _edit_session(estimate).update_item(
+                        cat, item, unit_price=new_price, amount=new_amount)
 
                 st.markdown(
                     '<span class="manual-badge" style="animation:pulse 2s infinite;">⚠ 手動入力 — 単価・金額を入力してください</span>',
@@ -6,21 +6,37 @@
 
 再実行で常に同じ結果（idは商品コード基準で安定）になるよう設計している。
 
+ページごとに内容ハッシュを取り、抽出済みの行をキャッシュする（月次の差し替えで
+変わったページだけを pdfplumber で読み直す。未読のページはプロセスプールで並列に
+抽出する）。出力前に既存の price_master.json と商品コードで突き合わせ、
+追加・削除・価格変更だけを表示する。内容に変化が無ければファイルを書き換えない。
+JSON と一緒に、アプリが参照する索引つきの `knowledge/price_master.sqlite` も書き出す
+（product/price_master.build_master_db）。
+
 使い方:
-    python build_price_master.py [PDFパス]
+    python build_price_master.py [PDFパス] [--no-cache] [--workers N] [--dry-run]
 
 PDFパスを省略した場合は既定の Downloads 配下のファイルを探す。
+キャッシュの置き場所は環境変数 SANEI_PRICE_CACHE_DIR（既定は一時ディレクトリ）。
 """
 from __future__ import annotations
 
+import argparse
+import hashlib
 import json
+import os
 import re
 import sys
+import tempfile
 import unicodedata
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 
-import pdfplumber
+import fitz  # PyMuPDF（ページの内容ハッシュ用）
+
+from product import price_master as pm
 
 # ---------------------------------------------------------------------------
 # 設定
@@ -35,6 +51,11 @@ SOURCE_NAME = "㈱サンエー様 産業用部材価格表 資料.pdf"
 SOURCE_DATE = "2025-05-30"  # PDF右上の日付
 SCHEMA_VERSION = 1
 
+# ページ抽出キャッシュ。抽出・正規化の処理を変えたら CACHE_VERSION を上げる
+CACHE_VERSION = 1
+_CACHE_DIR_ENV = "SANEI_PRICE_CACHE_DIR"
+CACHE_FILENAME = "price_master_pages.json"
+
 # NFKC では正規化されない「CJK部首補助(U+2E80-2EFF)」の補正マップ
 RADICAL_FIX = {
     "⻑": "長",  # U+2ED1 CJK RADICAL LONG ONE
@@ -102,34 +123,194 @@ def extract_warranty(remarks: str) -> str:
     return ""
 
 
-def build_rows(pdf_path: Path) -> tuple[list[tuple[int, list[str]]], list[str]]:
-    """PDFから (データ行[(ページ番号, セル)], 条件フッター行) を抽出する。"""
+def page_hashes(pdf_path: Path) -> list[str]:
+    """ページごとの内容ハッシュ（コンテンツストリーム＋参照するフォームXObject）。"""
+    doc = fitz.open(str(pdf_path))
+    try:
+        hashes = []
+        for page in doc:
+            h = hashlib.sha256(f"{CACHE_VERSION}:{tuple(page.rect)}".encode())
+            h.update(page.read_contents())
+            for xref, *_ in page.get_xobjects():
+                h.update(doc.xref_stream(xref) or b"")
+            hashes.append(h.hexdigest())
+        return hashes
+    finally:
+        doc.close()
+
+
+def _extract_page(job: tuple[str, int]) -> dict:
+    """1ページ分の {"rows": データ行のセル, "conditions": 条件フッターの文} を抽出する。
+
+    プロセスプールから呼ぶためモジュール直下に置く。pdfplumber は抽出が必要な
+    ときだけ読み込む（全ページがキャッシュにあればPDFを解析しない）。
+    """
+    import pdfplumber
+
+    pdf_path, pidx = job
+    rows: list[list[str]] = []
+    parts: list[str] = []
+    with pdfplumber.open(pdf_path) as pdf:
+        page = pdf.pages[pidx - 1]
+        for table in page.extract_tables():
+            for r in table:
+                cells = [normalize_text(c or "") for c in r]
+                # ヘッダ行（部材/メーカー...）を除外
+                if cells[0].replace(" ", "") == "部材" and cells[1] == "メーカー":
+                    continue
+                rows.append(cells)
+        # 条件フッター（最終ページの【条件】以降）
+        text = normalize_text(page.extract_text() or "")
+        idx = text.find("【条件】")
+        if idx >= 0:
+            tail = text[idx:]
+            # ページ番号表記を除去
+            tail = re.sub(r"\s*\d\s*/\s*\d\s*ページ\s*$", "", tail).strip()
+            # 文単位でざっくり分割（番号付き条文＋注意書き）
+            for part in re.split(r"(?<=。)\s+|(?<=\))\s+(?=\d)", tail):
+                part = part.strip()
+                if part:
+                    parts.append(part)
+    return {"rows": rows, "conditions": parts}
+
+
+def default_cache_path() -> Path:
+    value = os.environ.get(_CACHE_DIR_ENV)
+    base = Path(value) if value else Path(tempfile.gettempdir()) / "sanei-estimate-ai"
+    return base / CACHE_FILENAME
+
+
+def _load_cache(path: Path) -> dict:
+    try:
+        doc = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(doc, dict) or doc.get("version") != CACHE_VERSION:
+        return {}
+    pages = doc.get("pages")
+    return pages if isinstance(pages, dict) else {}
+
+
+def _save_cache(path: Path, pages: dict) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"version": CACHE_VERSION, "pages": pages},
+                                  ensure_ascii=False), encoding="utf-8")
+        tmp.replace(path)
+    except OSError as e:
+        print(f"[WARN] ページキャッシュを保存できませんでした: {e}")
+
+
+def build_rows(
+    pdf_path: Path,
+    cache_path: Path | None = None,
+    workers: int | None = None,
+    stats: dict | None = None,
+) -> tuple[list[tuple[int, list[str]]], list[str]]:
+    """PDFから (データ行[(ページ番号, セル)], 条件フッター行) を抽出する。
+
+    cache_path を渡すと、内容ハッシュが一致するページは前回の抽出結果を使う。
+    stats を渡すと {"pages": 総ページ数, "cached": キャッシュ利用数} を書き込む。
+    """
+    hashes = page_hashes(pdf_path)
+    cache = _load_cache(cache_path) if cache_path else {}
+    results = {h: cache[h] for h in hashes if h in cache}
+    pending = [i for i, h in enumerate(hashes, start=1) if h not in results]
+    if pending:
+        jobs = [(str(pdf_path), i) for i in pending]
+        n = min(len(jobs), workers or os.cpu_count() or 1)
+        if n <= 1:
+            extracted = [_extract_page(j) for j in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=n) as pool:
+                extracted = list(pool.map(_extract_page, jobs))
+        for pidx, data in zip(pending, extracted):
+            results[hashes[pidx - 1]] = data
+    if cache_path and pending:
+        _save_cache(cache_path, {h: results[h] for h in hashes})
+    if stats is not None:
+        stats.update(pages=len(hashes), cached=len(hashes) - len(pending))
+
     rows: list[tuple[int, list[str]]] = []
     conditions: list[str] = []
-    with pdfplumber.open(str(pdf_path)) as pdf:
-        for pidx, page in enumerate(pdf.pages, start=1):
-            for table in page.extract_tables():
-                for r in table:
-                    cells = [normalize_text(c or "") for c in r]
-                    # ヘッダ行（部材/メーカー...）を除外
-                    if cells[0].replace(" ", "") == "部材" and cells[1] == "メーカー":
-                        continue
-                    rows.append((pidx, cells))
-            # 条件フッター（最終ページの【条件】以降）
-            text = normalize_text(page.extract_text() or "")
-            idx = text.find("【条件】")
-            if idx >= 0:
-                tail = text[idx:]
-                # ページ番号表記を除去
-                tail = re.sub(r"\s*\d\s*/\s*\d\s*ページ\s*$", "", tail).strip()
-                # 文単位でざっくり分割（番号付き条文＋注意書き）
-                for part in re.split(r"(?<=。)\s+|(?<=\))\s+(?=\d)", tail):
-                    part = part.strip()
-                    if part and part not in conditions:
-                        conditions.append(part)
+    seen: set[str] = set()
+    for pidx, h in enumerate(hashes, start=1):
+        data = results[h]
+        rows.extend((pidx, list(cells)) for cells in data["rows"])
+        for part in data["conditions"]:
+            if part not in seen:
+                seen.add(part)
+                conditions.append(part)
     return rows, conditions
 
 
+def _diff_key(p: dict) -> str:
+    return p.get("product_code") or p.get("id") or ""
+
+
+def diff_products(old: list[dict], new: list[dict]) -> dict:
+    """商品コードで突き合わせた差分 {"added", "removed", "price_changed"} を返す。
+
+    同じコードが複数掲載されている場合は canonical（価格参照の優先）の行で比べる。
+    price_changed の要素は {"product_code", "name", "old", "new"}（old/new は
+    (unit_price, unit_price_note)）。
+    """
+    def _index(products: list[dict]) -> dict[str, dict]:
+        index: dict[str, dict] = {}
+        for p in products:
+            key = _diff_key(p)
+            if key and (key not in index or p.get("is_canonical", True)):
+                index[key] = p
+        return index
+
+    before, after = _index(old), _index(new)
+    added = [after[k] for k in after if k not in before]
+    removed = [before[k] for k in before if k not in after]
+    changed = []
+    for key, p in after.items():
+        q = before.get(key)
+        if q is None:
+            continue
+        old_price = (q.get("unit_price"), q.get("unit_price_note", ""))
+        new_price = (p.get("unit_price"), p.get("unit_price_note", ""))
+        if old_price != new_price:
+            changed.append({"product_code": key, "name": p.get("name", ""),
+                            "old": old_price, "new": new_price})
+    return {"added": added, "removed": removed, "price_changed": changed}
+
+
+def _format_price(price: tuple) -> str:
+    value, note = price
+    return f"¥{value:,}" if value is not None else (note or "価格なし")
+
+
+def print_diff(diff: dict) -> None:
+    """差分だけを表示する（レビュー用）。"""
+    total = sum(len(v) for v in diff.values())
+    if not total:
+        print("  差分: なし")
+        return
+    print(f"  差分: 追加 {len(diff['added'])} / 削除 {len(diff['removed'])} / "
+          f"価格変更 {len(diff['price_changed'])}")
+    for p in diff["added"]:
+        price = _format_price((p.get("unit_price"), p.get("unit_price_note", "")))
+        print(f"    + {_diff_key(p)} {p.get('name', '')[:30]} {price}")
+    for p in diff["removed"]:
+        print(f"    - {_diff_key(p)} {p.get('name', '')[:30]}")
+    for c in diff["price_changed"]:
+        print(f"    ~ {c['product_code']} {c['name'][:30]} "
+              f"{_format_price(c['old'])} -> {_format_price(c['new'])}")
+
+
+def _load_existing(path: Path) -> dict:
+    try:
+        doc = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return doc if isinstance(doc, dict) else {}
+
+
 def assign_categories(rows: list[list[str]]) -> list[str]:
     """各行のカテゴリを決定する（マージ欠落を補完）。
 
@@ -177,13 +358,26 @@ def assign_categories(rows: list[list[str]]) -> list[str]:
     return categories
 
 
-def main() -> int:
-    pdf_path = Path(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PDF
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="価格表PDFから単価マスターJSONを生成する")
+    parser.add_argument("pdf", nargs="?", default=str(DEFAULT_PDF), help="価格表PDFのパス")
+    parser.add_argument("--no-cache", action="store_true", help="ページキャッシュを使わない")
+    parser.add_argument("--workers", type=int, default=None, help="並列抽出のプロセス数")
+    parser.add_argument("--dry-run", action="store_true", help="差分を表示するだけで書き込まない")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    pdf_path = Path(args.pdf)
     if not pdf_path.exists():
         print(f"[ERROR] PDFが見つかりません: {pdf_path}")
         return 1
 
-    page_rows, conditions = build_rows(pdf_path)
+    stats: dict = {}
+    page_rows, conditions = build_rows(
+        pdf_path,
+        cache_path=None if args.no_cache else default_cache_path(),
+        workers=args.workers,
+        stats=stats,
+    )
     pages = [p for p, _ in page_rows]
     rows = [c for _, c in page_rows]
     categories = assign_categories(rows)
@@ -193,6 +387,7 @@ def main() -> int:
     last_parent_maker = ""
     cur_maker = ""
     makers_seen: list[str] = []
+    makers_set: set[str] = set()
 
     for i, r in enumerate(rows):
         part, maker, code, model, name, price_raw, remarks = (
@@ -209,7 +404,8 @@ def main() -> int:
         ):
             cur_maker = "オムロン (自家消費用途)"
         maker = cur_maker
-        if maker and maker not in makers_seen:
+        if maker and maker not in makers_set:
+            makers_set.add(maker)
             makers_seen.append(maker)
 
         unit_price, price_note = parse_price(price_raw)
@@ -295,7 +491,8 @@ def main() -> int:
             p["id"] = base
 
     # カテゴリ順を実データに合わせる
-    present = [c for c in CATEGORY_ORDER if any(p["category"] == c for p in products)]
+    used = {p["category"] for p in products}
+    present = [c for c in CATEGORY_ORDER if c in used]
     # 想定外カテゴリがあれば末尾に追加
     for p in products:
         if p["category"] not in present:
@@ -315,9 +512,30 @@ def main() -> int:
         "products": products,
     }
 
+    # ------------------------------------------------------------------
+    # 既存マスターとの差分（内容が同じなら書き換えず updated_at も据え置く）
+    # ------------------------------------------------------------------
+    existing = _load_existing(OUTPUT_PATH)
+    diff = diff_products(existing.get("products") or [], products)
+    unchanged = bool(existing) and all(
+        existing.get(k) == v for k, v in payload.items() if k != "updated_at")
+    print(f"  ページ: {stats['pages']}ページ中 {stats['cached']}ページはキャッシュを使用")
+    print_diff(diff)
+    if args.dry_run:
+        print("[DRY-RUN] 書き込みは行いません")
+        return 0
+    db_path = OUTPUT_PATH.with_suffix(".sqlite")
+    if unchanged:
+        if not db_path.exists():
+            pm.build_master_db(OUTPUT_PATH, db_path)
+        print(f"[OK] 変更なし（{OUTPUT_PATH} は更新しません）")
+        return 0
+
     OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
     with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
         json.dump(payload, f, ensure_ascii=False, indent=2)
+    pm.build_master_db(OUTPUT_PATH, db_path)
+    print(f"[OK] 索引つきマスター: {db_path}")
 
     # ------------------------------------------------------------------
     # 検証サマリ
@@ -336,7 +554,7 @@ def main() -> int:
     print(f"  品種別: {kinds}")
     # コード重複チェック
     codes = [p["product_code"] for p in products if p["product_code"]]
-    dups = {c for c in codes if codes.count(c) > 1}
+    dups = {c for c, n in Counter(codes).items() if n > 1}
     dup_products = [p for p in products if p["is_duplicate"]]
     canonical_dups = [p for p in dup_products if p["is_canonical"]]
     intra = [p for p in dup_products if p.get("is_intra_page_duplicate")]
@@ -346,8 +564,7 @@ def main() -> int:
     print(f"    └ canonical(優先採用) {len(canonical_dups)}件 / superseded {len(dup_products)-len(canonical_dups)}件")
     print(f"    └ クロスページ重複 {len(cross)}件 / 同一ページ内重複 {len(intra)}件（要・正価格確認）")
     # ページ別件数
-    from collections import Counter as _C
-    pg = _C(p["source_page"] for p in products)
+    pg = Counter(p["source_page"] for p in products)
     print(f"  ページ別: {dict(sorted(pg.items()))}")
     # 価格未設定（注記なし）の行を警告
     missing = [p for p in products if p["unit_price"] is None and not p["unit_price_note"]]
@@ -13,12 +13,15 @@ app.py から呼ばれる。見積作成フローとは独立した「別系統
   drafting_png       : 生成済み PNG bytes
   drafting_pdf       : 生成済み PDF bytes
   drafting_warnings  : 抽出時の要確認事項
+  drafting_job_id    : 実行中の抽出ジョブ（extraction.jobs）の ID
+  drafting_job_files : 抽出ジョブに渡した一時ファイルパス
 """
 
 from __future__ import annotations
 
 import os
 import tempfile
+import time
 
 import streamlit as st
 
@@ -28,6 +31,10 @@ from drafting.models import (
     default_spec, spec_to_dict, spec_from_dict,
 )
 from drafting import sample_specs
+from extraction import jobs
+
+# 抽出ジョブの状態を問い合わせる間隔（秒）
+_JOB_POLL_SEC = 1.0
 
 
 # =============================================================
@@ -42,6 +49,8 @@ def init_drafting_session():
         "drafting_pdf": None,
         "drafting_warnings": [],
         "drafting_drawing_type": DrawingType.LAYOUT,
+        "drafting_job_id": None,
+        "drafting_job_files": [],
     }
     for k, v in defaults.items():
         if k not in st.session_state:
@@ -131,6 +140,10 @@ def render_step1_upload():
     st.caption("現地調査の手書きスケッチ・航空写真（赤ペン寸法入り）・建築図面・現地写真をアップロードしてください。"
                "AIが屋根寸法・モジュール・枚数・系統を読み取り、確認フォームに反映します。")
 
+    # 抽出ジョブが進行中なら進捗だけを表示する
+    if _render_extraction_job():
+        return
+
     col1, col2 = st.columns([3, 2])
     with col1:
         files = st.file_uploader(
@@ -191,7 +204,7 @@ def render_step1_upload():
 
 
 def _run_extraction(files, dtype: str):
-    """アップロードファイルを一時保存 → spec_extractor で抽出 → step2 へ。"""
+    """アップロードファイルを一時保存 → 抽出ジョブを投入（結果は _render_extraction_job で受け取る）。"""
     _cleanup_temp_files()  # 前回抽出の一時ファイルを残さない
     tmp_paths = []
     try:
@@ -205,27 +218,64 @@ def _run_extraction(files, dtype: str):
         st.error(f"ファイルの保存に失敗しました: {e}")
         return
 
-    with st.spinner("AIが現調資料を読み取っています（屋根寸法・モジュール・枚数・系統）..."):
+    job = jobs.submit_drafting_extraction(tmp_paths, drawing_type=dtype)
+    st.session_state.drafting_job_id = job.id
+    st.session_state.drafting_job_files = tmp_paths
+    st.rerun()
+
+
+def _discard_job_files():
+    for p in (st.session_state.get("drafting_job_files") or []):
         try:
-            from drafting.spec_extractor import extract_drafting_spec
-            spec = extract_drafting_spec(tmp_paths, drawing_type=dtype)
-            # 新規下書きの点検通路は既定800mm（AI抽出対象外の項目。0で無効化可能）
-            if not float(getattr(spec.panel, "walkway_mm", 0) or 0):
-                spec.panel.walkway_mm = 800.0
-        except Exception as e:
-            st.error(f"⚠️ 抽出に失敗しました: {e}")
-            st.info("「手入力で1から作成」から手動で入力することもできます。")
-            for p in tmp_paths:
-                try:
-                    os.unlink(p)
-                except Exception:
-                    pass
-            return
+            os.unlink(p)
+        except Exception:
+            pass
+    st.session_state.drafting_job_files = []
+
+
+def _render_extraction_job() -> bool:
+    """抽出ジョブの進捗を表示する。進行中なら True（アップロード画面は出さない）。
 
-    _load_draft(spec_to_dict(spec), list(getattr(spec, "warnings", []) or []))
-    st.session_state.drafting_files = tmp_paths
-    st.session_state.step = 2
+    完了時は下書きを読み込んで step2 へ進み、失敗・取り消し時は一時ファイルを消して False。
+    """
+    job = jobs.get(st.session_state.get("drafting_job_id"))
+    if job is None:
+        st.session_state.drafting_job_id = None
+        return False
+
+    if job.status == jobs.DONE:
+        spec = job.result
+        # 新規下書きの点検通路は既定800mm（AI抽出対象外の項目。0で無効化可能）
+        if not float(getattr(spec.panel, "walkway_mm", 0) or 0):
+            spec.panel.walkway_mm = 800.0
+        _load_draft(spec_to_dict(spec), list(getattr(spec, "warnings", []) or []))
+        st.session_state.drafting_files = st.session_state.drafting_job_files
+        st.session_state.drafting_job_files = []
+        st.session_state.drafting_job_id = None
+        st.session_state.step = 2
+        st.rerun()
+    if job.status in (jobs.FAILED, jobs.CANCELLED):
+        st.session_state.drafting_job_id = None
+        _discard_job_files()
+        if job.status == jobs.FAILED:
+            st.error(f"⚠️ 抽出に失敗しました: {job.error}")
+            st.info("「手入力で1から作成」から手動で入力することもできます。")
+        else:
+            st.info("読み取りを取り消しました。")
+        return False
+
+    st.progress(job.progress,
+                text=f"AIが現調資料を読み取っています（屋根寸法・モジュール・枚数・系統）..."
+                     f"（{job.elapsed_sec:.0f}秒）")
+    st.caption("💡 画面を離れても読み取りは続きます。この画面に戻ると結果を受け取れます。")
+    if st.button("✖ 読み取りを取り消す", key="drafting_job_cancel"):
+        jobs.cancel(job.id)
+        st.session_state.drafting_job_id = None
+        _discard_job_files()
+        st.rerun()
+    time.sleep(_JOB_POLL_SEC)
     st.rerun()
+    return True
 
 
 # =============================================================
@@ -432,6 +482,7 @@ def render_step2_confirm():
 def _generate_drawing(d: dict):
     """dict → DraftingSpec → 学習ルール適用 → place_panels → render_drawing → step3。"""
     learned_notes = []
+    learned_defaults = []
     with st.spinner("製図を生成しています..."):
         try:
             from drafting.layout_engine import place_panels
@@ -443,6 +494,15 @@ def _generate_drawing(d: dict):
                 spec, learned_notes = apply_learned_drawing_rules(spec)
             except Exception:
                 learned_notes = []
+            # 各学習既定値を何件の図面が支えているか（集計ストアを読むだけで軽量）
+            try:
+                from learning.drawing_stats import (
+                    format_learned_default, learned_drawing_defaults,
+                )
+                learned_defaults = [format_learned_default(e)
+                                    for e in learned_drawing_defaults()]
+            except Exception:
+                learned_defaults = []
             spec = place_panels(spec)
             out = render_drawing(spec)
         except Exception as e:
@@ -452,6 +512,7 @@ def _generate_drawing(d: dict):
     st.session_state.drafting_pdf = out.get("pdf_bytes")
     st.session_state.drafting_spec_dict = spec_to_dict(spec)  # 配置・集計反映後
     st.session_state.drafting_learning_notes = learned_notes  # step3 で表示する
+    st.session_state.drafting_learned_defaults = learned_defaults
     # 設計確定情報（2026-08-15 ルールブック図面側10条: 図面完成時に作成し、
     # 見積側はこれを正として再判断しない）
     try:
@@ -499,6 +560,9 @@ def render_step3_result():
     learned_notes = st.session_state.get("drafting_learning_notes") or []
     if learned_notes:
         st.caption("🧠 学習済みルール適用: " + " / ".join(learned_notes))
+    learned_defaults = st.session_state.get("drafting_learned_defaults") or []
+    if learned_defaults:
+        st.caption("📊 学習済み既定値の根拠: " + " / ".join(learned_defaults))
 
     st.image(png, use_container_width=True)
 
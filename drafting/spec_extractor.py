@@ -6,9 +6,13 @@ Claude Vision で読み取り、drafting/models.py の DraftingSpec を生成す
 設計方針:
 - 入力は複数ファイル混在可（PDF は extraction.pdf_reader.pdf_to_images で画像化、
   PNG/JPG は読み込んで base64 化）。全画像を 1 リクエストの content に並べて
-  JSON 抽出を依頼する。画像枚数・合計サイズが大きい場合は間引き／ダウンスケールする。
+  JSON 抽出を依頼する。画像枚数が多い場合は間引き、合計サイズは
+  extraction.image_budget（余白トリミング・頁別解像度・合計上限）で収める。
 - few-shot として drafting/sample_specs.py の正解 spec を spec_to_dict した JSON を
   プロンプトに埋め込む（kurihara_layout = 住宅単面・横置き、tok_string = 法人複数面・系統あり）。
+  抽出指示と few-shot はシステムプロンプト側にまとめ、組み立て結果をプロセス内で
+  キャッシュしたうえで cache_control を付けて送る（再抽出時は API 側のキャッシュ読み出し）。
+  ユーザープロンプトは図面種別・ヒントだけの短い指示。
 - 出力は DraftingSpec の dict 構造に厳密準拠した JSON。spec_from_dict が受理できる形にして
   復元する。読めない寸法は推定せず 0/null とし warnings に記録する。
 - API キー無し／API 失敗時は例外を投げず、warnings に理由を入れた最小 spec を返す
@@ -220,84 +224,57 @@ def _golden_example_json(name: str) -> str:
     return json.dumps(d, ensure_ascii=False, indent=2)
 
 
-def _learned_examples_block() -> str:
-    """学習センターで承認された実案件の正解 spec を few-shot 追記ブロックにする。
+def _learned_examples() -> list:
+    """学習センターで承認された実案件の正解 spec（{name, spec}）。2件まで。
 
-    learning ストアが無い/壊れている場合は空文字を返し、従来プロンプトのまま動く
-    （学習系の失敗で抽出フローを止めない）。プロンプト肥大防止のため2件まで。
+    learning ストアが無い/壊れている場合は [] を返し、従来プロンプトのまま動く
+    （学習系の失敗で抽出フローを止めない）。
     """
     try:
         from learning.apply_drawing import learned_golden_examples
-        blocks = []
-        for i, ex in enumerate(learned_golden_examples(2), start=1):
-            spec_d = ex.get("spec") if isinstance(ex, dict) else None
-            if not isinstance(spec_d, dict):
-                continue
-            # deepcopy 相当（元の学習ストア payload を汚さない）+ 座標 panels を落として軽量化
-            d = json.loads(json.dumps(spec_d, ensure_ascii=False))
-            for face in d.get("roof_faces", []) or []:
-                if isinstance(face, dict):
-                    face["panels"] = []
-            name = ex.get("name") or f"学習例{i}"
-            blocks.append(
-                f"\n【実案件の学習済みお手本{i}（{name}。過去に人が確認した正解）】\n"
-                "```json\n" + json.dumps(d, ensure_ascii=False, indent=2) + "\n```\n"
-            )
-        return "".join(blocks)
+        return [ex for ex in learned_golden_examples(2)
+                if isinstance(ex, dict) and isinstance(ex.get("spec"), dict)]
     except Exception as e:
-        logger.debug(f"学習済みお手本の注入をスキップ: {e}")
-        return ""
-
+        logger.debug(f"学習済みお手本の取得をスキップ: {e}")
+        return []
+
+
+def _learned_examples_block(examples: list) -> str:
+    """学習済みお手本を few-shot 追記ブロックにする（無ければ空文字）。"""
+    blocks = []
+    for i, ex in enumerate(examples, start=1):
+        # deepcopy 相当（元の学習ストア payload を汚さない）+ 座標 panels を落として軽量化
+        d = json.loads(json.dumps(ex["spec"], ensure_ascii=False))
+        for face in d.get("roof_faces", []) or []:
+            if isinstance(face, dict):
+                face["panels"] = []
+        name = ex.get("name") or f"学習例{i}"
+        blocks.append(
+            f"\n【実案件の学習済みお手本{i}（{name}。過去に人が確認した正解）】\n"
+            "```json\n" + json.dumps(d, ensure_ascii=False, indent=2) + "\n```\n"
+        )
+    return "".join(blocks)
 
-def build_system_prompt() -> str:
-    """システムプロンプト（抽出専門家のロール定義）を生成する。"""
-    return (
-        "あなたは太陽光発電設備の現地調査資料（現調資料）から、製図に必要な仕様を読み取る専門家です。\n"
-        "入力画像は次のいずれか、または複数の組み合わせです:\n"
-        "- 手書きスケッチ（屋根の形・寸法を赤ペン等で書き込んだもの）\n"
-        "- 航空写真／衛星写真に寸法や枚数を赤ペンで書き込んだもの\n"
-        "- 建築図面（屋根伏図・平面図・立面図）\n"
-        "- 現地写真\n\n"
-        "手書きの日本語・数字を文脈から正確に読み取ってください。\n"
-        "寸法はすべて mm（ミリメートル）に統一して出力してください"
-        "（「8.85m」「885cm」のような表記は 8850 に換算）。\n"
-        "読み取れない寸法・項目は推定せず、0 または null とし、warnings に必ず記載してください。\n"
-        "出力は指定された JSON 構造のみとし、説明文・前置き・マークダウンは一切含めないでください。"
-    )
 
+# few-shot に使うゴールデン spec（名前, 見出し）。この集合がキャッシュキーの一部
+_GOLDEN_EXAMPLES = (
+    ("kurihara_layout", "住宅・瓦・配置図・横置き10枚。単一屋根面・系統なし"),
+    ("tok_string", "法人・ストリングス図・複数屋根面・PCS3台・系統表あり"),
+)
 
-def build_user_prompt(drawing_type: str = DrawingType.LAYOUT, hint: str = "") -> str:
-    """ユーザープロンプト（抽出指示＋スキーマ＋few-shot）を生成する。
+# 組み立て済みシステムプロンプトのキャッシュ。学習ストア（Supabase の場合あり）の
+# 読み直しはこの秒数に1回まで（自プロセスでのルール保存時は即時に読み直す）。
+# Anthropic のプロンプトキャッシュ（既定5分）と同じ窓にしておく。
+SYSTEM_PROMPT_RECHECK_SEC = 300
+_system_prompt_cache: dict = {"key": None, "prompt": "", "revision": None, "checked_at": 0.0}
 
-    Args:
-        drawing_type: 図面種別（layout/string/equipment）。出力 JSON の drawing_type に反映。
-        hint: 呼び出し側からの補足ヒント（例: 施主名・既知のメーカー等）。空なら無視。
-
-    Returns:
-        ユーザープロンプト文字列。
-    """
-    dtype = drawing_type if drawing_type in _VALID_DRAWING_TYPES else DrawingType.LAYOUT
-    dtype_label = DrawingType.LABEL.get(dtype, dtype)
 
+def _static_instructions() -> str:
+    """抽出指示・スキーマ・作図ルール（図面種別・ヒントに依存しない固定部分）。"""
     roof_type_lines = "\n".join(f'    - "{k}" = {v}' for k, v in RoofType.LABEL.items())
     orient_lines = "\n".join(f'    - "{k}" = {v}' for k, v in Orientation.LABEL.items())
     mount_lines = "\n".join(f'    - "{m}"' for m in MountType.ALL)
-
-    example_kurihara = _golden_example_json("kurihara_layout")
-    example_tok = _golden_example_json("tok_string")
-    learned_block = _learned_examples_block()  # 学習済みお手本（無ければ空）
-
-    hint_block = ""
-    if hint and hint.strip():
-        hint_block = (
-            "\n【追加ヒント（呼び出し側からの補足。矛盾する場合は画像を優先）】\n"
-            f"{hint.strip()}\n"
-        )
-
-    return f"""次の画像群は太陽光発電の現調資料です。これらから製図用の仕様を抽出してください。
-作成する図面種別は「{dtype_label}」（drawing_type="{dtype}"）です。
-
-【抽出してほしい情報】
+    return f"""【抽出してほしい情報】
 1. 施主名 / 工事名（customer_name, title.project_name）
 2. モジュール（パネル）: メーカー・型番・1枚出力W・長辺mm・短辺mm（panel）
 3. 屋根面ごとに:
@@ -403,29 +380,123 @@ drafting/models.py の DraftingSpec の dict 構造に厳密準拠した JSON 
 - 数値は数値型で（文字列にしない）。寸法 mm は整数または小数。
 - confidence は主要フィールド名→"high"/"medium"/"low" の辞書。手書きで曖昧な値は "low"。
 - warnings は人間が確認すべき点（手書き寸法の読み取り曖昧箇所、判読不能項目など）の文字列配列。
-- drawing_type は必ず "{dtype}" にしてください。
+- drawing_type は必ずユーザー指示で指定された値にしてください。
 - gap_long_mm / gap_short_mm / margin_mm / walkway_mm / パネル寸法（long_mm,
   short_mm）は、資料に明記が無い場合は**キー自体を出力しない**でください
   （キーが無ければ屋根種別ごとの標準値が使われます。0 を書くのは「0mm」と
   明記されている場合のみ。不明を 0 にすると隙間ゼロ・寸法ゼロとして扱われ、
   配置計算が壊れます）。
 - その他の不明な項目は、文字列は ""、配列は []、数値は null にしてください。
+"""
+
+
+def _golden_examples_block() -> str:
+    """ゴールデン spec の正解出力例ブロック（コード内定数のため内容は不変）。"""
+    blocks = []
+    for i, (name, label) in enumerate(_GOLDEN_EXAMPLES, start=1):
+        blocks.append(f"【正解出力例{i}（{label}）】\n```json\n{_golden_example_json(name)}\n```\n")
+    return "\n".join(blocks)
+
+
+def _assemble_system_prompt(learned_block: str) -> str:
+    return (
+        "あなたは太陽光発電設備の現地調査資料（現調資料）から、製図に必要な仕様を読み取る専門家です。\n"
+        "入力画像は次のいずれか、または複数の組み合わせです:\n"
+        "- 手書きスケッチ（屋根の形・寸法を赤ペン等で書き込んだもの）\n"
+        "- 航空写真／衛星写真に寸法や枚数を赤ペンで書き込んだもの\n"
+        "- 建築図面（屋根伏図・平面図・立面図）\n"
+        "- 現地写真\n\n"
+        "手書きの日本語・数字を文脈から正確に読み取ってください。\n"
+        "寸法はすべて mm（ミリメートル）に統一して出力してください"
+        "（「8.85m」「885cm」のような表記は 8850 に換算）。\n"
+        "読み取れない寸法・項目は推定せず、0 または null とし、warnings に必ず記載してください。\n"
+        "出力は指定された JSON 構造のみとし、説明文・前置き・マークダウンは一切含めないでください。\n\n"
+        + _static_instructions()
+        + "\n" + _golden_examples_block() + learned_block
+        + "\n出力は上記の例と同じキー構造にしてください。\n"
+        "※例では confidence / warnings を簡略化していますが、実際の出力では手書きの\n"
+        "読み取りに少しでも迷った項目（寸法・枚数・角度・施主名の漢字・型番など）を\n"
+        "必ず confidence（\"low\"/\"medium\"）と warnings に挙げてください。\n"
+        "panels（座標）は空配列 [] のままで構いません（配置計算は別工程で行います）。"
+    )
+
+
+def build_system_prompt() -> str:
+    """システムプロンプト（ロール定義＋抽出指示＋few-shot）を返す。
+
+    抽出ごとに変わらない部分をすべてここに集め、Anthropic のプロンプトキャッシュ
+    対象にする（build_system_blocks）。組み立て結果は (ゴールデン例の集合,
+    学習済みお手本の内容ハッシュ) をキーにプロセス内でキャッシュし、同じキーなら
+    同一文字列を返す（文字列が1文字でも変わると API 側のキャッシュが外れるため）。
+    学習ストアの読み直しは SYSTEM_PROMPT_RECHECK_SEC に1回まで。
+    """
+    cache = _system_prompt_cache
+    try:
+        from learning import store
+        revision = store.local_revision("drawing")
+    except Exception:
+        revision = None
+    now = time.monotonic()
+    if (cache["key"] is not None and cache["revision"] == revision
+            and now - cache["checked_at"] < SYSTEM_PROMPT_RECHECK_SEC):
+        return cache["prompt"]
+
+    examples = _learned_examples()
+    try:
+        from learning.store import rules_version
+        learned_version = rules_version(examples)
+    except Exception:
+        learned_version = json.dumps(examples, ensure_ascii=False, sort_keys=True)
+    key = (tuple(name for name, _label in _GOLDEN_EXAMPLES), learned_version)
+    if key != cache["key"]:
+        cache["prompt"] = _assemble_system_prompt(_learned_examples_block(examples))
+        cache["key"] = key
+        logger.info("製図抽出のシステムプロンプトを再構築（%d文字・学習お手本%d件）",
+                    len(cache["prompt"]), len(examples))
+    cache["revision"] = revision
+    cache["checked_at"] = now
+    return cache["prompt"]
+
+
+def build_system_blocks() -> list[dict]:
+    """messages API の system 引数（cache_control 付きテキストブロック1つ）。
+
+    固定部分は数千トークンある few-shot を含むため、キャッシュ窓内の再抽出では
+    入力トークンの大半がキャッシュ読み出しになる。
+    """
+    return [{
+        "type": "text",
+        "text": build_system_prompt(),
+        "cache_control": {"type": "ephemeral"},
+    }]
+
+
+def build_user_prompt(drawing_type: str = DrawingType.LAYOUT, hint: str = "") -> str:
+    """ユーザープロンプト（抽出ごとに変わる短い指示）を生成する。
+
+    抽出指示・スキーマ・few-shot は build_system_prompt 側（キャッシュ対象）にある。
+
+    Args:
+        drawing_type: 図面種別（layout/string/equipment）。出力 JSON の drawing_type に反映。
+        hint: 呼び出し側からの補足ヒント（例: 施主名・既知のメーカー等）。空なら無視。
+
+    Returns:
+        ユーザープロンプト文字列。
+    """
+    dtype = drawing_type if drawing_type in _VALID_DRAWING_TYPES else DrawingType.LAYOUT
+    dtype_label = DrawingType.LABEL.get(dtype, dtype)
+
+    hint_block = ""
+    if hint and hint.strip():
+        hint_block = (
+            "\n【追加ヒント（呼び出し側からの補足。矛盾する場合は画像を優先）】\n"
+            f"{hint.strip()}\n"
+        )
+
+    return f"""次の画像群は太陽光発電の現調資料です。これらから製図用の仕様を抽出してください。
+作成する図面種別は「{dtype_label}」（drawing_type="{dtype}"）です。
 {hint_block}
-【正解出力例1（住宅・瓦・配置図・横置き10枚。単一屋根面・系統なし）】
-```json
-{example_kurihara}
-```
-
-【正解出力例2（法人・ストリングス図・複数屋根面・PCS3台・系統表あり）】
-```json
-{example_tok}
-```
-{learned_block}
-上記の例と同じキー構造で、今回の画像から読み取った JSON を返してください。
-※例では confidence / warnings を簡略化していますが、実際の出力では手書きの
-読み取りに少しでも迷った項目（寸法・枚数・角度・施主名の漢字・型番など）を
-必ず confidence（"low"/"medium"）と warnings に挙げてください。
-panels（座標）は空配列 [] のままで構いません（配置計算は別工程で行います）。
+システム指示の例と同じキー構造で、今回の画像から読み取った JSON を返してください。
 JSON 以外のテキストは一切出力しないでください。"""
 
 
@@ -449,7 +520,7 @@ def _build_content(images: list[dict], user_prompt: str) -> list[dict]:
     return content
 
 
-def _call_claude_api(content: list[dict], system_prompt: str, attempt: int,
+def _call_claude_api(content: list[dict], system_prompt, attempt: int,
                      temperature: float = 0.0) -> dict:
     """Claude Vision API を呼び出して JSON dict を返す。
 
@@ -463,10 +534,12 @@ def _call_claude_api(content: list[dict], system_prompt: str, attempt: int,
     from config import get_api_key
     # JSON抽出・Visionモデル切替（CLAUDE_VISION_MODEL + Fable差分吸収 +
     # フォールバック）は survey_extractor の実装を流用（重複実装を避ける）
+    from extraction import api_client, api_replay
     from extraction.survey_extractor import (
         _extract_json, _create_vision_message, _first_text_block)
 
-    client = anthropic.Anthropic(api_key=get_api_key())
+    client = api_replay.client(
+        lambda: api_client.shared_client(anthropic, get_api_key), "drafting")
     response = _create_vision_message(
         client, content, temperature, system=system_prompt)
     response_text = _first_text_block(response)
@@ -766,30 +839,18 @@ def extract_drafting_spec_from_images(
         images = images[:MAX_TOTAL_IMAGES]
 
     # リクエスト合計サイズの上限制御（base64 合計が API 上限32MBを超えると413で全滅するため）。
-    # 後半頁を捨てるのではなく、まず全頁を均等に縮小して収める（鶴見交番の
-    # 注記付き現調写真20頁のように、後半頁に屋根寸法・貫通穴等の重要注記が
-    # あるケースで打ち切りは情報欠落になる。2026-08-15 ルールブック2条）
-    total_b64 = sum(len(img.get("image_base64") or "") for img in images)
-    if total_b64 > MAX_REQUEST_BYTES and len(images) > 1:
-        per_image_budget = max(300_000,
-                               int(MAX_REQUEST_BYTES * 3 / 4 / len(images)))
-        shrunk: list[dict] = []
-        for img in images:
-            b64 = img.get("image_base64") or ""
-            if len(b64) * 3 / 4 > per_image_budget and b64:
-                try:
-                    raw = base64.b64decode(b64)
-                    new_bytes, new_media = _downscale_image_bytes(
-                        raw, max_bytes=per_image_budget)
-                    if new_media:
-                        img = dict(img)
-                        img["image_base64"] = base64.b64encode(new_bytes).decode("ascii")
-                        img["media_type"] = new_media
-                except Exception as e:
-                    logger.warning(f"全頁縮小に失敗（元画像で続行）: {e}")
-            shrunk.append(img)
-        images = shrunk
+    # 後半頁を捨てるのではなく、画像予算で余白を切り、情報密度の低い頁から縮小して
+    # 全頁を収める（鶴見交番の注記付き現調写真20頁のように、後半頁に屋根寸法・
+    # 貫通穴等の重要注記があるケースで打ち切りは情報欠落になる。2026-08-15 ルールブック2条）
+    try:
+        from extraction.image_budget import apply_image_budget
+        images, _budget = apply_image_budget(
+            images, label="drafting", max_bytes=MAX_REQUEST_BYTES * 3 // 4,
+            max_page_bytes=MAX_IMAGE_BYTES, max_dim_px=MAX_IMAGE_DIM_PX)
+    except Exception as e:
+        logger.warning(f"画像予算の適用に失敗（元画像で続行）: {e}")
 
+    # 予算で収まらなかった場合の最終安全弁（通常は全頁が残る）
     kept: list[dict] = []
     total_b64 = 0
     for img in images:
@@ -812,7 +873,8 @@ def extract_drafting_spec_from_images(
     except Exception as e:
         return _fallback_spec(drawing_type, f"設定の読み込みに失敗しました: {e}", pre_warnings)
 
-    if not api_key:
+    from extraction import api_replay
+    if not api_key and not api_replay.is_replaying():
         return _fallback_spec(
             drawing_type,
             "ANTHROPIC_API_KEY が未設定のため AI 抽出を実行できませんでした。"
@@ -820,7 +882,7 @@ def extract_drafting_spec_from_images(
             pre_warnings,
         )
 
-    system_prompt = build_system_prompt()
+    system_prompt = build_system_blocks()
     user_prompt = build_user_prompt(drawing_type=drawing_type, hint=hint)
     content = _build_content(images, user_prompt)
 
@@ -938,8 +1000,9 @@ def _self_test() -> bool:
         userp = build_user_prompt(drawing_type="layout", hint="施主は法人")
         userp_str = build_user_prompt(drawing_type="string")
         assert isinstance(sysp, str) and len(sysp) > 50
-        assert "DraftingSpec" in userp and "正解出力例" in userp
-        assert 'drawing_type="string"' in userp_str
+        assert "DraftingSpec" in sysp and "正解出力例" in sysp
+        assert build_system_prompt() is sysp, "同一キーならキャッシュ済み文字列のはず"
+        assert "施主は法人" in userp and 'drawing_type="string"' in userp_str
         print(f"[OK] プロンプト生成: system={len(sysp)}文字 / user(layout)={len(userp)}文字")
     except Exception as e:
         ok = False
@@ -0,0 +1,310 @@
+"""Anthropic クライアントのプロセス共有（接続プール・同時実行数・流量制御）
+
+各抽出器（現調シート・分類・製図・カタログ・見積パース・音声コマンド）は、呼び出しの
+たびに anthropic.Anthropic(api_key=get_api_key()) を作っていた。これだと毎回
+クライアント生成・シークレット参照・新規 HTTP 接続のコストがかかり、複数の利用者が
+同時に抽出すると 429（レート制限）にもなりやすい。
+
+このモジュールはプロセス内で1つのクライアントを使い回し、全呼び出しで共有する:
+
+- 共有クライアント（shared_client）。HTTP 接続はキープアライブ付きのプールで再利用する
+- 同時実行数のセマフォ（SANEI_API_CONCURRENCY、既定 4）
+- リクエスト数のトークンバケット（SANEI_API_RPM、既定 50回/分・バースト 10）
+- 429 を受けたら retry-after（無ければ既定秒数）の間、新規リクエストの開始を止める
+
+APIキーはクライアント生成時と KEY_RECHECK_SEC ごとにだけ読み、変わっていれば作り直す。
+SDK を差し替えた場合（テストのフェイク等・DefaultHttpxClient を持たないもの）は
+接続プールも流量制御も使わず、従来どおりその場で生成する。
+
+呼び出し側は api_replay と組み合わせて使う:
+    client = api_replay.client(lambda: api_client.shared_client(anthropic, get_api_key),
+                               "survey")
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+import anthropic
+
+logger = logging.getLogger(__name__)
+
+CONCURRENCY_ENV = "SANEI_API_CONCURRENCY"
+RPM_ENV = "SANEI_API_RPM"
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RPM = 50
+BUCKET_CAPACITY = 10
+# 429 で retry-after が無いときに新規リクエストを止める秒数
+RATE_LIMIT_PAUSE_SEC = 10.0
+# APIキーを読み直す間隔（Streamlit secrets / 環境変数の変更に追従する）
+KEY_RECHECK_SEC = 300.0
+
+# HTTP 接続プール（同時実行数より少し多めに保持し、アイドル接続も再利用する）
+MAX_CONNECTIONS = 16
+MAX_KEEPALIVE_CONNECTIONS = 8
+KEEPALIVE_EXPIRY_SEC = 60.0
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        value = int(os.environ.get(name, "") or default)
+        return value if value > 0 else default
+    except ValueError:
+        logger.warning(f"{name} が整数ではありません。既定値 {default} を使います")
+        return default
+
+
+class TokenBucket:
+    """リクエスト数のトークンバケット（スレッド間で共有）。"""
+
+    def __init__(self, rate_per_sec: float, capacity: int,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """1トークン取れれば 0.0、取れなければ次に取れるまでの秒数を返す。"""
+        with self._lock:
+            now = self._clock()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self) -> float:
+        """トークンが取れるまで待つ。待った秒数を返す。"""
+        waited = 0.0
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds: float) -> None:
+        """429 を受けたとき、全呼び出し元の新規リクエストを seconds 秒止める。"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+            self._tokens = 0.0
+
+
+class Limiter:
+    """同時実行数のセマフォとトークンバケットの組（全スレッドで共有）。"""
+
+    def __init__(self, concurrency: int, rpm: int, capacity: int = BUCKET_CAPACITY):
+        self.concurrency = concurrency
+        self._semaphore = threading.BoundedSemaphore(concurrency)
+        self.bucket = TokenBucket(rpm / 60.0, min(capacity, rpm))
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "waited_sec": 0.0, "rate_limited": 0}
+
+    def _count(self, waited: float) -> None:
+        with self._stats_lock:
+            self.stats["requests"] += 1
+            self.stats["waited_sec"] += waited
+
+    def acquire(self) -> None:
+        started = time.monotonic()
+        self._semaphore.acquire()
+        try:
+            self.bucket.acquire()
+        except BaseException:
+            self._semaphore.release()
+            raise
+        self._count(time.monotonic() - started)
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+    def on_error(self, exc: BaseException) -> None:
+        """レート制限・過負荷なら新規リクエストを一時停止する。"""
+        status = getattr(exc, "status_code", None)
+        if not isinstance(exc, anthropic.RateLimitError) and status not in (429, 529):
+            return
+        pause = RATE_LIMIT_PAUSE_SEC
+        headers = getattr(getattr(exc, "response", None), "headers", None)
+        try:
+            if headers is not None and headers.get("retry-after") is not None:
+                pause = float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+        with self._stats_lock:
+            self.stats["rate_limited"] += 1
+        self.bucket.pause(pause)
+        logger.warning(f"APIのレート制限を受けたため {pause:.0f}秒 新規リクエストを止めます")
+
+
+# =============================================================
+# 流量制御付きクライアント
+# =============================================================
+
+class _ThrottledStream:
+    """messages.stream(...) の代替。with の間だけ枠を確保する。"""
+
+    def __init__(self, open_stream: Callable[[], object], limiter: Limiter):
+        self._open = open_stream
+        self._limiter = limiter
+        self._manager = None
+
+    def __enter__(self):
+        self._limiter.acquire()
+        try:
+            self._manager = self._open()
+            return self._manager.__enter__()
+        except BaseException as e:
+            self._limiter.on_error(e)
+            self._limiter.release()
+            raise
+
+    def __exit__(self, *exc):
+        try:
+            return self._manager.__exit__(*exc)
+        finally:
+            if exc[1] is not None:
+                self._limiter.on_error(exc[1])
+            self._limiter.release()
+
+
+class _ThrottledMessages:
+    def __init__(self, messages, limiter: Limiter):
+        self._messages = messages
+        self._limiter = limiter
+
+    def create(self, **kwargs):
+        self._limiter.acquire()
+        try:
+            return self._messages.create(**kwargs)
+        except Exception as e:
+            self._limiter.on_error(e)
+            raise
+        finally:
+            self._limiter.release()
+
+    def stream(self, **kwargs):
+        return _ThrottledStream(lambda: self._messages.stream(**kwargs), self._limiter)
+
+    def __getattr__(self, name):
+        return getattr(self._messages, name)
+
+
+class _ThrottledClient:
+    """messages だけ流量制御を挟み、それ以外は元のクライアントに委譲する。"""
+
+    def __init__(self, client, messages):
+        self._client = client
+        self.messages = messages
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+# =============================================================
+# 共有クライアントの管理
+# =============================================================
+
+class ClientManager:
+    """プロセス内で共有するクライアントと Limiter を保持する。"""
+
+    def __init__(self, concurrency: Optional[int] = None, rpm: Optional[int] = None):
+        self.limiter = Limiter(concurrency or _env_int(CONCURRENCY_ENV, DEFAULT_CONCURRENCY),
+                               rpm or _env_int(RPM_ENV, DEFAULT_RPM))
+        self._lock = threading.Lock()
+        self._sync = None          # (api_key, 生成時刻, クライアント)
+
+    def _limits(self, sdk):
+        # httpx / httpx2 のどちらの SDK でも同じ Limits 型を使う
+        return type(sdk.DEFAULT_CONNECTION_LIMITS)(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY_SEC,
+        )
+
+    def sync_client(self, sdk, api_key_fn: Callable[[], str]):
+        with self._lock:
+            cached = self._sync
+            now = time.monotonic()
+            if cached and now - cached[1] < KEY_RECHECK_SEC:
+                return cached[2]
+            api_key = api_key_fn()
+            if cached and cached[0] == api_key:
+                self._sync = (api_key, now, cached[2])
+                return cached[2]
+            if cached:
+                logger.info("APIキーが変わったため共有クライアントを作り直します")
+                _close_quietly(cached[2]._client)
+            client = sdk.Anthropic(
+                api_key=api_key, http_client=sdk.DefaultHttpxClient(limits=self._limits(sdk)))
+            throttled = _ThrottledClient(client, _ThrottledMessages(client.messages, self.limiter))
+            # キー未設定のクライアントは共有しない（設定後の呼び出しで作り直す）
+            self._sync = (api_key, now, throttled) if api_key else None
+            return throttled
+
+    def close(self) -> None:
+        with self._lock:
+            if self._sync:
+                _close_quietly(self._sync[2]._client)
+            self._sync = None
+
+
+def _close_quietly(client) -> None:
+    try:
+        client.close()
+    except Exception as e:
+        logger.debug(f"クライアントのクローズに失敗（無視）: {e}")
+
+
+_manager: Optional[ClientManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_manager() -> ClientManager:
+    """プロセス共有の ClientManager（初回呼び出し時に環境変数から設定）。"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ClientManager()
+        return _manager
+
+
+def reset() -> None:
+    """共有クライアントを破棄する（設定変更後・テスト用）。"""
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.close()
+        _manager = None
+
+
+def _pooled(sdk) -> bool:
+    return hasattr(sdk, "DefaultHttpxClient") and hasattr(sdk, "DEFAULT_CONNECTION_LIMITS")
+
+
+def shared_client(sdk=anthropic, api_key_fn: Optional[Callable[[], str]] = None):
+    """共有の同期クライアント（接続プール・同時実行数・流量制御つき）。
+
+    Args:
+        sdk: anthropic モジュール（呼び出し側のモジュール変数を渡す。テストの差し替え用）
+        api_key_fn: APIキーを返す関数（既定は config.get_api_key）
+    """
+    if api_key_fn is None:
+        from config import get_api_key as api_key_fn
+    if not _pooled(sdk):
+        return sdk.Anthropic(api_key=api_key_fn())
+    return get_manager().sync_client(sdk, api_key_fn)
+
+
+def stats() -> dict:
+    """共有 Limiter の累計（リクエスト数・待ち時間・レート制限回数）。"""
+    return dict(get_manager().limiter.stats)
@@ -0,0 +1,338 @@
+"""Claude API 応答の記録・再生（オフライン評価・CI 用）
+
+現調シート・分類・製図・カタログ・見積パース・音声コマンドの各 API 呼び出しは、
+クライアント生成を client(factory, label) 経由にしている。モードに応じて次のように振る舞う:
+
+- ""（既定）: factory() の実クライアントをそのまま返す（従来どおり）
+- "record": 実クライアントを包み、応答テキストを fixture（JSON）として保存する
+- "replay": ネットワークもAPIキーも使わず、保存済み fixture から応答を再生する
+
+モードと保存先は環境変数 SANEI_API_REPLAY / SANEI_API_FIXTURES、または use() で
+切り替える（use はコンテキスト変数なので、並列評価ではケースごとに別の保存先にできる）。
+
+fixture のキーはリクエスト内容（label・system・messages・temperature）のハッシュ。
+画像データはハッシュに置き換えてから計算し、モデル名・max_tokens は含めない
+（フォールバック先モデルやストリーミング時の上限変更で別キーにならないように）。
+再生時にキーが一致しない場合（画像前処理のライブラリ差など）は、同じ label の
+fixture を記録順に使う。それも尽きたら ReplayMissError。
+
+使用例:
+    >>> from extraction import api_replay
+    >>> with api_replay.use("replay", "tests/fixtures/api/sample_commercial"):
+    ...     survey = extract_survey_data_multi(pdfs)   # API を呼ばずに再生
+"""
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+MODE_ENV = "SANEI_API_REPLAY"
+DIR_ENV = "SANEI_API_FIXTURES"
+DEFAULT_FIXTURE_DIR = Path(__file__).resolve().parent.parent / "tests" / "fixtures" / "api"
+
+MODES = ("", "record", "replay")
+
+# 再生時にストリームへ流すテキスト断片の長さ
+_REPLAY_CHUNK = 64
+
+_override: contextvars.ContextVar = contextvars.ContextVar("api_replay_override", default=None)
+_lock = threading.Lock()
+# 保存先ディレクトリ → {"by_key": {key: fixture}, "by_label": {label: [fixture...]},
+#                      "cursor": {label: 次に使う位置}}
+_indexes: dict = {}
+
+
+class ReplayMissError(RuntimeError):
+    """再生モードで該当する fixture が無い。"""
+
+
+# =============================================================
+# 設定
+# =============================================================
+
+def mode() -> str:
+    """現在のモード（"" / "record" / "replay"）。"""
+    override = _override.get()
+    value = override[0] if override else os.environ.get(MODE_ENV, "")
+    value = (value or "").strip().lower()
+    return value if value in MODES else ""
+
+
+def fixture_dir() -> Path:
+    """現在の fixture 保存先。"""
+    override = _override.get()
+    if override and override[1]:
+        return Path(override[1])
+    return Path(os.environ.get(DIR_ENV) or DEFAULT_FIXTURE_DIR)
+
+
+def is_replaying() -> bool:
+    """再生モードか（APIキー未設定でも抽出を進めてよいかの判定に使う）。"""
+    return mode() == "replay"
+
+
+@contextlib.contextmanager
+def use(new_mode: str, directory=None):
+    """このコンテキスト（スレッドのコンテキスト変数）内だけモードと保存先を切り替える。"""
+    if new_mode not in MODES:
+        raise ValueError(f"不明なモードです: {new_mode}（{MODES} のいずれか）")
+    token = _override.set((new_mode, str(directory) if directory else ""))
+    try:
+        if new_mode == "replay":
+            reset_cursor(fixture_dir())
+        yield
+    finally:
+        _override.reset(token)
+
+
+def reset_cursor(directory=None) -> None:
+    """記録順フォールバックの読み位置を先頭に戻す（同じ fixture を再生し直すとき）。"""
+    with _lock:
+        _indexes.pop(str(Path(directory or fixture_dir())), None)
+
+
+# =============================================================
+# キーと fixture
+# =============================================================
+
+def _strip_images(obj):
+    """画像 base64 をハッシュに置き換えた複製（キー計算用）。"""
+    if isinstance(obj, dict):
+        if obj.get("type") == "base64" and isinstance(obj.get("data"), str):
+            digest = hashlib.sha256(obj["data"].encode("ascii", "ignore")).hexdigest()
+            return {**obj, "data": f"sha256:{digest}"}
+        return {k: _strip_images(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_strip_images(v) for v in obj]
+    return obj
+
+
+def request_key(label: str, kwargs: dict) -> str:
+    """リクエスト内容のキー（モデル名・max_tokens は含めない）。"""
+    payload = {
+        "label": label,
+        "system": _strip_images(kwargs.get("system")),
+        "messages": _strip_images(kwargs.get("messages")),
+        "temperature": kwargs.get("temperature"),
+    }
+    text = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_fixtures(directory=None, label: Optional[str] = None) -> list[dict]:
+    """保存先の fixture を記録順に返す（label 指定でその種別のみ）。"""
+    root = Path(directory or fixture_dir())
+    if not root.is_dir():
+        return []
+    out = []
+    for path in sorted(root.glob("*.json")):
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"fixture を読めません（スキップ）: {path}: {e}")
+            continue
+        if not isinstance(data, dict) or "response" not in data:
+            continue  # ground_truth.json 等の付帯ファイル
+        if label is None or data.get("label") == label:
+            out.append(data)
+    return sorted(out, key=lambda d: (d.get("seq", 0), d.get("key", "")))
+
+
+def _response_payload(message) -> dict:
+    texts = [getattr(b, "text", "") for b in (getattr(message, "content", None) or [])
+             if getattr(b, "type", "") == "text"]
+    usage = getattr(message, "usage", None)
+    usage_dict = {}
+    for name in ("input_tokens", "output_tokens",
+                 "cache_read_input_tokens", "cache_creation_input_tokens"):
+        value = getattr(usage, name, None) if usage is not None else None
+        if isinstance(value, int):
+            usage_dict[name] = value
+    return {"texts": texts, "stop_reason": getattr(message, "stop_reason", None),
+            "usage": usage_dict}
+
+
+def save_fixture(label: str, kwargs: dict, message, latency_sec: float,
+                 streamed: bool = False, directory=None) -> Path:
+    """1回分の応答を fixture として保存する。"""
+    root = Path(directory or fixture_dir())
+    key = request_key(label, kwargs)
+    with _lock:
+        root.mkdir(parents=True, exist_ok=True)
+        seq = len(list(root.glob("[0-9][0-9][0-9][0-9]-*.json"))) + 1
+        path = root / f"{seq:04d}-{label}-{key[:12]}.json"
+        data = {
+            "label": label,
+            "key": key,
+            "seq": seq,
+            "model": kwargs.get("model"),
+            "temperature": kwargs.get("temperature"),
+            "streamed": streamed,
+            "latency_sec": round(latency_sec, 3),
+            "recorded_at": datetime.now().isoformat(timespec="seconds"),
+            "response": _response_payload(message),
+        }
+        path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        _indexes.pop(str(root), None)
+    logger.info(f"API応答を記録: {path.name}（{label}・{latency_sec:.2f}秒）")
+    return path
+
+
+def _lookup(label: str, kwargs: dict) -> dict:
+    root = fixture_dir()
+    key = request_key(label, kwargs)
+    with _lock:
+        index = _indexes.get(str(root))
+        if index is None:
+            fixtures = load_fixtures(root)
+            index = {
+                "by_key": {},
+                "by_label": {},
+                "cursor": {},
+            }
+            for fx in fixtures:
+                index["by_key"].setdefault(fx.get("key"), []).append(fx)
+                index["by_label"].setdefault(fx.get("label"), []).append(fx)
+            _indexes[str(root)] = index
+        exact = index["by_key"].get(key)
+        if exact:
+            # 同一リクエストが複数回記録されていれば（リトライ等）順に返す
+            pos = index["cursor"].get(key, 0)
+            index["cursor"][key] = pos + 1
+            return exact[min(pos, len(exact) - 1)]
+        seq_list = index["by_label"].get(label) or []
+        pos = index["cursor"].get(label, 0)
+        if pos < len(seq_list):
+            index["cursor"][label] = pos + 1
+            logger.debug(f"fixture のキー不一致のため記録順で再生: {label} #{pos + 1}")
+            return seq_list[pos]
+    raise ReplayMissError(
+        f"再生用の API 応答が見つかりません（{label}・保存先 {root}）。"
+        f"{MODE_ENV}=record で記録し直してください。")
+
+
+def _replay_message(fixture: dict):
+    resp = fixture.get("response") or {}
+    usage = {"input_tokens": 0, "output_tokens": 0, **(resp.get("usage") or {})}
+    return SimpleNamespace(
+        content=[SimpleNamespace(type="text", text=t) for t in resp.get("texts") or []],
+        stop_reason=resp.get("stop_reason") or "end_turn",
+        usage=SimpleNamespace(**usage),
+        model=fixture.get("model"),
+    )
+
+
+# =============================================================
+# クライアント
+# =============================================================
+
+class _ReplayStream:
+    def __init__(self, message):
+        self._message = message
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        for block in self._message.content:
+            text = block.text
+            for i in range(0, len(text), _REPLAY_CHUNK):
+                yield text[i:i + _REPLAY_CHUNK]
+
+    def get_final_message(self):
+        return self._message
+
+
+class _ReplayMessages:
+    def __init__(self, label: str):
+        self._label = label
+
+    def create(self, **kwargs):
+        return _replay_message(_lookup(self._label, kwargs))
+
+    def stream(self, **kwargs):
+        return _ReplayStream(_replay_message(_lookup(self._label, kwargs)))
+
+
+class _RecordingStream:
+    def __init__(self, manager, label: str, kwargs: dict, started: float):
+        self._manager = manager
+        self._label = label
+        self._kwargs = kwargs
+        self._started = started
+        self._stream = None
+
+    def __enter__(self):
+        self._stream = self._manager.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._manager.__exit__(*exc)
+
+    @property
+    def text_stream(self):
+        return self._stream.text_stream
+
+    def get_final_message(self):
+        message = self._stream.get_final_message()
+        _save_safely(self._label, self._kwargs, message,
+                     time.monotonic() - self._started, streamed=True)
+        return message
+
+
+class _RecordingMessages:
+    def __init__(self, messages, label: str):
+        self._messages = messages
+        self._label = label
+
+    def create(self, **kwargs):
+        started = time.monotonic()
+        message = self._messages.create(**kwargs)
+        _save_safely(self._label, kwargs, message, time.monotonic() - started)
+        return message
+
+    def stream(self, **kwargs):
+        return _RecordingStream(self._messages.stream(**kwargs), self._label, kwargs,
+                                time.monotonic())
+
+
+def _save_safely(label, kwargs, message, latency_sec, streamed=False) -> None:
+    # 記録の失敗で本来の抽出を止めない
+    try:
+        save_fixture(label, kwargs, message, latency_sec, streamed=streamed)
+    except Exception as e:
+        logger.warning(f"API応答の記録に失敗（抽出は続行）: {e}")
+
+
+def client(factory: Callable[[], object], label: str):
+    """モードに応じた Anthropic 互換クライアントを返す。
+
+    Args:
+        factory: 実クライアントを返す関数（例: lambda: api_client.shared_client(anthropic,
+                 get_api_key)）。再生モードでは呼ばない（APIキー不要）
+        label: fixture の種別（"survey" / "classifier" / "drafting" / "catalog" /
+               "estimate" / "voice"）
+    """
+    current = mode()
+    if current == "replay":
+        return SimpleNamespace(messages=_ReplayMessages(label))
+    real = factory()
+    if current == "record":
+        return SimpleNamespace(messages=_RecordingMessages(real.messages, label))
+    return real
@@ -41,6 +41,9 @@ import re
 import anthropic
 
 from extraction.pdf_reader import pdf_to_images
+from extraction.prompts import (
+    CLASSIFICATION_INSTRUCTION, cached_system_blocks, log_cache_usage,
+)
 from config import get_api_key, CLAUDE_MODEL
 
 logger = logging.getLogger(__name__)
@@ -119,6 +122,7 @@ def classify_documents(pdf_paths: list[str]) -> dict:
     """複数PDFをまとめて住宅/法人で分類する
 
     各PDFの先頭2ページのみを画像化して Claude Vision API に投げる。
+    分類基準（CLASSIFICATION_PROMPT）は cache_control 付きの system として送る。
     失敗時は unknown を返し、例外は握りつぶさず logger.warning で記録する。
 
     Args:
@@ -164,7 +168,8 @@ def classify_documents(pdf_paths: list[str]) -> dict:
     if not content_blocks:
         return _unknown_result(pdf_paths, "すべてのPDFで画像化に失敗しました")
 
-    content_blocks.append({"type": "text", "text": CLASSIFICATION_PROMPT})
+    # 固定の分類基準は system（キャッシュ対象）に置き、user 側は画像と短い指示だけ
+    content_blocks.append({"type": "text", "text": CLASSIFICATION_INSTRUCTION})
 
     last_error = None
     for attempt in range(1, MAX_RETRIES + 1):
@@ -181,16 +186,20 @@ def classify_documents(pdf_paths: list[str]) -> dict:
 
 def _call_classify_api(content: list[dict], attempt: int) -> dict:
     """Claude Vision APIで分類を実行（temperature=0）"""
-    client = anthropic.Anthropic(api_key=get_api_key())
+    from extraction import api_client, api_replay
+    client = api_replay.client(
+        lambda: api_client.shared_client(anthropic, get_api_key), "classifier")
 
     response = client.messages.create(
         model=CLAUDE_MODEL,
         max_tokens=1024,
         temperature=0,
+        system=cached_system_blocks(CLASSIFICATION_PROMPT),
         messages=[
             {"role": "user", "content": content},
         ],
     )
+    log_cache_usage(response, f"分類 {CLAUDE_MODEL}")
 
     response_text = response.content[0].text
     logger.info(f"分類API応答(試行{attempt}): {response_text[:200]}...")
@@ -0,0 +1,311 @@
+"""Vision リクエストの画像予算（余白トリミング・ページ別解像度・合計上限）
+
+pdf_to_images は全ページを 200dpi の全面画像にするため、白い余白の多いページや
+写真ページも、手書きの密な表と同じだけトークンを使う。Vision API に送る直前に
+ページ群をまとめて次の順で整える:
+
+1. 余白トリミング: ほぼ白（明度 235 以上）の外周を切り落とす（少し余白を残す）。
+2. ページ別解像度: image_preprocessor._ink_stats（_looks_like_diagram と同じ統計）で
+   インク密度を測り、密な手書き表は原寸、まばらなページ・写真は縮小する。
+3. 合計予算: リクエスト全体の推定トークン（画素数/750）とバイト数の上限に収まるよう、
+   情報密度の低いページから優先して縮小する（先頭から打ち切らない。全ページ残す）。
+
+前後の画素数・バイト数の合計はリクエストごとに logger.info で記録する。
+画像として開けないページ（テスト用のダミー等）は素通しする。
+
+使用例:
+    >>> from extraction.image_budget import apply_image_budget
+    >>> pages, report = apply_image_budget(pages, label="survey")
+    >>> report["pixels_after"] <= report["pixels_before"]
+    True
+"""
+from __future__ import annotations
+
+import base64
+import io
+import logging
+import math
+from typing import Optional
+
+from PIL import Image
+
+from extraction.image_preprocessor import _ink_stats
+
+logger = logging.getLogger(__name__)
+
+# 画像トークンの目安（Anthropic: 幅×高さ/750）
+PIXELS_PER_TOKEN = 750
+# 1 リクエストの画像トークン上限（200dpi A4 の密なページ約15枚分）
+DEFAULT_MAX_TOKENS = 80_000
+# 1 リクエストの画像合計バイト上限（base64 前。API上限32MBに対し base64 膨張込みで安全側）
+DEFAULT_MAX_BYTES = 20_000_000
+# 画像1枚のバイト上限（pdf_reader.MAX_IMAGE_BYTES と同じ）
+MAX_PAGE_BYTES = 4_500_000
+# 縮小しても長辺はこれ以上残す（手書き数字が潰れない下限）
+MIN_LONG_EDGE_PX = 1000
+
+# 余白判定の明度しきい値と、残す余白（短辺に対する比率）
+_BLANK_LEVEL = 235
+_CROP_PAD_RATIO = 0.015
+# これ未満しか面積が減らないならトリミングしない（再エンコードの無駄を避ける）
+_MIN_CROP_GAIN = 0.03
+
+# ページ種別 → (解像度倍率, 予算配分の優先度)
+_PAGE_CLASSES = {
+    "dense": (1.0, 1.0),     # 手書きの表・細かい注記
+    "normal": (0.85, 0.8),
+    "diagram": (0.85, 0.8),  # 線画（線は太く、文字は少なめ）
+    "sparse": (0.7, 0.6),    # 書き込みの少ないページ
+    "photo": (0.6, 0.5),     # 写真（暗部の塊が多くエッジが少ない）
+    "blank": (0.5, 0.3),
+}
+
+
+def classify_page(stats: Optional[dict]) -> str:
+    """_ink_stats の統計からページ種別（_PAGE_CLASSES のキー）を決める。"""
+    if not stats:
+        return "normal"
+    dark = stats.get("dark_ratio", 0.0)
+    edge = stats.get("edge_ratio", 0.0)
+    if dark > 0.35 or (dark > 0.2 and edge < 0.03):
+        return "photo"
+    if edge >= 0.06:
+        return "dense"
+    if edge < 0.015:
+        return "sparse"
+    if dark < 0.08 and edge > 0.02:
+        return "diagram"
+    return "normal"
+
+
+def _content_bbox(pil_img: Image.Image) -> Optional[tuple]:
+    """ほぼ白でない画素の外接矩形。真っ白なら None。"""
+    gray = pil_img.convert("L") if pil_img.mode != "L" else pil_img
+    return gray.point(lambda v: 255 if v < _BLANK_LEVEL else 0).getbbox()
+
+
+def crop_to_content(pil_img: Image.Image) -> tuple[Image.Image, Optional[tuple]]:
+    """白い外周を切り落とす。切らない場合（真っ白を含む）は (元画像, None)。
+
+    Returns:
+        (画像, 切り出し矩形 (left, top, right, bottom) or None)
+    """
+    bbox = _content_bbox(pil_img)
+    if bbox is None:
+        return pil_img, None
+    w, h = pil_img.size
+    pad = int(min(w, h) * _CROP_PAD_RATIO) + 8
+    box = (max(0, bbox[0] - pad), max(0, bbox[1] - pad),
+           min(w, bbox[2] + pad), min(h, bbox[3] + pad))
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    if area >= w * h * (1 - _MIN_CROP_GAIN):
+        return pil_img, None
+    return pil_img.crop(box), box
+
+
+def _encode(pil_img: Image.Image, media_type: str, quality: int = 85) -> tuple[bytes, str]:
+    buf = io.BytesIO()
+    if media_type == "image/jpeg":
+        pil_img.convert("RGB").save(buf, format="JPEG", quality=quality)
+        return buf.getvalue(), "image/jpeg"
+    pil_img.save(buf, format="PNG", optimize=True)
+    return buf.getvalue(), "image/png"
+
+
+def _resize(pil_img: Image.Image, scale: float) -> Image.Image:
+    if scale >= 0.999:
+        return pil_img
+    w, h = pil_img.size
+    return pil_img.resize((max(1, round(w * scale)), max(1, round(h * scale))), Image.LANCZOS)
+
+
+def _area_factors(areas: list[float], priorities: list[float], floors: list[float],
+                  budget: float) -> list[float]:
+    """合計面積を budget に収める面積倍率（優先度の低いページほど強く縮める）。
+
+    各ページの倍率は max(下限, min(1, t × 優先度))。合計が予算以下になる最大の t を
+    二分探索する（下限だけで予算を超える場合は下限を返す）。
+    """
+    if sum(areas) <= budget:
+        return [1.0] * len(areas)
+
+    def _factors(t):
+        return [max(f, min(1.0, t * p)) for p, f in zip(priorities, floors)]
+
+    lo, hi = 0.0, 1.0 / min(priorities)
+    for _ in range(40):
+        t = (lo + hi) / 2
+        if sum(a * f for a, f in zip(areas, _factors(t))) <= budget:
+            lo = t
+        else:
+            hi = t
+    return _factors(lo)
+
+
+def _clamp_scale(scale: float, size: tuple, max_dim_px: int) -> float:
+    """倍率を「長辺 MIN_LONG_EDGE_PX 以上・max_dim_px 以下」に収める。"""
+    long_edge = max(size)
+    if long_edge > MIN_LONG_EDGE_PX:
+        scale = max(scale, MIN_LONG_EDGE_PX / long_edge)
+    else:
+        scale = max(scale, 1.0)
+    if max_dim_px and long_edge * scale > max_dim_px:
+        scale = max_dim_px / long_edge
+    return min(scale, 1.0)
+
+
+def apply_image_budget(
+    pages: list[dict],
+    *,
+    label: str = "",
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+    max_page_bytes: int = MAX_PAGE_BYTES,
+    max_dim_px: int = 0,
+) -> tuple[list[dict], dict]:
+    """ページ画像群を予算内に整える（入力の dict は変更しない）。
+
+    Args:
+        pages: list of {"page", "image_base64", "image_bytes", "media_type", ...}
+               （pdf_to_images の出力互換。image_bytes が無ければ base64 から復元）
+        label: ログ用の呼び出し元名（"survey" / "drafting" など）
+        max_tokens: リクエスト全体の推定画像トークン上限
+        max_bytes: リクエスト全体の画像バイト上限（base64 前）
+        max_page_bytes: 画像1枚のバイト上限
+        max_dim_px: 画像1枚の長辺上限（0 なら無制限）
+
+    Returns:
+        (整えたページ群, report)。report は
+        {"pixels_before", "pixels_after", "bytes_before", "bytes_after",
+         "pages": [{"page", "class", "crop", "scale", "size", "bytes"}, ...]}
+        各ページ dict にも "budget"（report["pages"] の該当要素）を付ける。
+    """
+    items = []
+    for page in pages:
+        raw = page.get("image_bytes")
+        if not raw and page.get("image_base64"):
+            try:
+                raw = base64.b64decode(page["image_base64"])
+            except Exception:
+                raw = b""
+        pil = None
+        if raw:
+            try:
+                pil = Image.open(io.BytesIO(raw))
+                pil.load()
+                if pil.mode not in ("RGB", "L"):
+                    pil = pil.convert("RGB")
+            except Exception as e:
+                logger.debug(f"画像予算: ページ{page.get('page')}を開けず素通し: {e}")
+                pil = None
+        items.append({"page": page, "raw": raw or b"", "pil": pil})
+
+    pixels_before = sum(it["pil"].size[0] * it["pil"].size[1]
+                        for it in items if it["pil"] is not None)
+    bytes_before = sum(len(it["raw"]) for it in items)
+
+    # --- 1) トリミング + 種別判定 ---
+    for it in items:
+        if it["pil"] is None:
+            continue
+        cropped, box = crop_to_content(it["pil"])
+        if box is None and _content_bbox(cropped) is None:
+            cls = "blank"
+        else:
+            cls = classify_page(_ink_stats(cropped))
+        scale, priority = _PAGE_CLASSES[cls]
+        it.update(img=cropped, box=box, cls=cls, priority=priority,
+                  scale=_clamp_scale(scale, cropped.size, max_dim_px))
+
+    # --- 2) 合計トークン予算（優先度の低いページから縮小） ---
+    sized = [it for it in items if it["pil"] is not None]
+    if sized:
+        areas = [it["img"].size[0] * it["img"].size[1] * it["scale"] ** 2 for it in sized]
+        floors = [(_clamp_scale(0.0, it["img"].size, max_dim_px) / it["scale"]) ** 2
+                  for it in sized]
+        factors = _area_factors(areas, [it["priority"] for it in sized], floors,
+                                max_tokens * PIXELS_PER_TOKEN)
+        for it, f in zip(sized, factors):
+            it["scale"] = _clamp_scale(it["scale"] * math.sqrt(f), it["img"].size, max_dim_px)
+
+    # --- 3) エンコード（写真・元JPEGは JPEG、それ以外は PNG） ---
+    for it in sized:
+        src_media = it["page"].get("media_type", "image/png")
+        media = "image/jpeg" if it["cls"] == "photo" or src_media == "image/jpeg" else "image/png"
+        it["img"] = _resize(it["img"], it["scale"])
+        if it["box"] is None and it["scale"] >= 0.999:
+            it["out"], it["media"] = it["raw"], src_media  # 手を加えない
+        else:
+            it["out"], it["media"] = _encode(it["img"], media)
+        if len(it["out"]) > max_page_bytes:
+            it["img"], it["out"], it["media"] = _fit_bytes(it["img"], max_page_bytes)
+
+    # --- 4) 合計バイト予算（大きいページから JPEG 化・縮小） ---
+    total = sum(len(it.get("out", it["raw"])) for it in items)
+    for quality in (80, 65, 50):
+        if total <= max_bytes:
+            break
+        for it in sorted(sized, key=lambda x: len(x["out"]), reverse=True):
+            if total <= max_bytes:
+                break
+            new, media = _encode(it["img"], "image/jpeg", quality)
+            if len(new) < len(it["out"]):
+                total -= len(it["out"]) - len(new)
+                it["out"], it["media"] = new, media
+    while total > max_bytes and sized:
+        it = max(sized, key=lambda x: len(x["out"]))
+        if max(it["img"].size) <= MIN_LONG_EDGE_PX // 2:
+            break
+        it["img"] = _resize(it["img"], 0.8)
+        it["scale"] *= 0.8
+        new, media = _encode(it["img"], "image/jpeg", 50)
+        total -= len(it["out"]) - len(new)
+        it["out"], it["media"] = new, media
+
+    # --- 5) 出力 ---
+    out_pages, report_pages = [], []
+    for it in items:
+        page = dict(it["page"])
+        if it["pil"] is not None:
+            data = it["out"]
+            page["image_bytes"] = data
+            page["media_type"] = it["media"]
+            page["image_base64"] = base64.standard_b64encode(data).decode("utf-8")
+            info = {"page": page.get("page"), "class": it["cls"], "crop": it["box"],
+                    "scale": round(it["scale"], 3), "size": it["img"].size,
+                    "bytes": len(data)}
+            page["budget"] = info
+            report_pages.append(info)
+        out_pages.append(page)
+
+    pixels_after = sum(it["img"].size[0] * it["img"].size[1] for it in sized)
+    bytes_after = sum(len(it.get("out", it["raw"])) for it in items)
+    report = {
+        "pixels_before": pixels_before, "pixels_after": pixels_after,
+        "bytes_before": bytes_before, "bytes_after": bytes_after,
+        "pages": report_pages,
+    }
+    logger.info(
+        f"画像予算[{label or '-'}]: {len(pages)}枚 "
+        f"画素 {pixels_before:,}→{pixels_after:,} "
+        f"(約{pixels_before // PIXELS_PER_TOKEN:,}→{pixels_after // PIXELS_PER_TOKEN:,}トークン) "
+        f"バイト {bytes_before:,}→{bytes_after:,} "
+        f"種別 {','.join(p['class'] for p in report_pages) or '-'}"
+    )
+    return out_pages, report
+
+
+def _fit_bytes(pil_img: Image.Image, max_bytes: int) -> tuple[Image.Image, bytes, str]:
+    """1枚を max_bytes 以下の JPEG にする（品質→寸法の順に下げる）。
+
+    Returns:
+        (最終寸法の画像, バイト列, media_type)
+    """
+    img = pil_img
+    for _ in range(6):
+        for quality in (85, 70, 55):
+            data, media = _encode(img, "image/jpeg", quality)
+            if len(data) <= max_bytes:
+                return img, data, media
+        img = _resize(img, 0.8)
+    return (img, *_encode(img, "image/jpeg", 40))
@@ -348,14 +348,14 @@ def _remove_background(gray: Image.Image) -> Image.Image:
         return gray
 
 
-def _looks_like_diagram(pil_img: Image.Image) -> bool:
-    """画素統計から「図面っぽい画像」かどうか簡易判定する。
+def _ink_stats(pil_img: Image.Image) -> Optional[dict]:
+    """画素統計（暗画素率・エッジ密度）を測る。失敗時は None。
 
-    判定基準:
-        - 暗画素比率（dark_ratio）: 8%未満 → 線画的（図面寄り）
-        - エッジ密度（edge_ratio）: 高め → 線が多い
+    600px 以下に縮小したグレースケールで測る（_looks_like_diagram と
+    image_budget の解像度選択が共用する）。
 
-    numpyが無い場合は PIL の getextrema/histogram で簡易判定。
+    Returns:
+        {"dark_ratio": 暗画素（128未満）の比率, "edge_ratio": エッジ強度50以上の比率}
     """
     try:
         if pil_img.mode != "L":
@@ -379,7 +379,7 @@ def _looks_like_diagram(pil_img: Image.Image) -> bool:
             arr = _np.asarray(gray, dtype=_np.uint8)
             edge_arr = _np.asarray(edges, dtype=_np.uint8)
             if arr.size == 0:
-                return False
+                return None
             # 暗画素率（しきい値128未満を暗とみなす）
             dark_ratio = float((arr < 128).mean())
             # エッジ密度（エッジ強度50以上を「エッジ」とみなす）
@@ -392,12 +392,24 @@ def _looks_like_diagram(pil_img: Image.Image) -> bool:
             edge_hist = edges.histogram()
             edge_total = sum(edge_hist) or 1
             edge_ratio = sum(edge_hist[50:]) / edge_total
-
-        # 線画的: 暗画素が少なく、エッジは一定数ある
-        # 手書き的: 暗画素（インクの塊）がそれなりにある
-        if dark_ratio < 0.08 and edge_ratio > 0.02:
-            return True
-        return False
+        return {"dark_ratio": dark_ratio, "edge_ratio": edge_ratio}
     except Exception as e:
-        logger.debug(f"_looks_like_diagram 失敗（手書き扱いにフォールバック）: {e}")
+        logger.debug(f"_ink_stats 失敗: {e}")
+        return None
+
+
+def _looks_like_diagram(pil_img: Image.Image) -> bool:
+    """画素統計から「図面っぽい画像」かどうか簡易判定する。
+
+    判定基準（統計は _ink_stats）:
+        - 暗画素比率（dark_ratio）: 8%未満 → 線画的（図面寄り）
+        - エッジ密度（edge_ratio）: 高め → 線が多い
+
+    統計が取れない場合は手書き扱い（False）。
+    """
+    stats = _ink_stats(pil_img)
+    if stats is None:
         return False
+    # 線画的: 暗画素が少なく、エッジは一定数ある
+    # 手書き的: 暗画素（インクの塊）がそれなりにある
+    return stats["dark_ratio"] < 0.08 and stats["edge_ratio"] > 0.02
@@ -0,0 +1,338 @@
+"""抽出ジョブのバックグラウンド実行（現調シート・製図・カタログ）
+
+Streamlit のスクリプト実行中に抽出（20〜90秒）を同期で呼ぶと、その間は再実行も
+画面遷移もできず、離脱すると結果も失われる。このモジュールは抽出をプロセス共有の
+スレッドプールで実行し、画面側はジョブIDだけをセッションに持って状態を問い合わせる。
+
+- submit_*_extraction() でジョブを投入し Job を受け取る（job.id をセッション等に保存）
+- get(job_id) で状態（queued / running / done / failed / cancelled）・段階
+  （render / classify / call / validate）・進捗・先出しセクション・結果を得る
+- cancel(job_id) で取り消す。待機中はそのまま取り消し、実行中は次の段階の境目
+  （ストリーミング抽出ならセクションの区切り）で中断し、結果は捨てる
+- 結果は入力（ファイル内容＋オプション）のハッシュでキャッシュし、同じ入力の
+  再投入は即座に完了ジョブを返す。同じ入力が実行中ならそのジョブを返す。
+  API 失敗時の代替結果（例外にならない空の結果）はキャッシュしない（cacheable）。
+  force=True ならキャッシュを使わずに抽出し直す
+
+ジョブはプロセス内のメモリにあるため、再実行・再接続（ブラウザの再読み込み）後も
+ジョブIDが分かれば結果を取り出せる。サーバープロセスの再起動では失われる。
+"""
+from __future__ import annotations
+
+import contextvars
+import copy
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = 2
+RESULT_CACHE_SIZE = 32
+# 終了したジョブを保持する秒数（これを過ぎたものは次の投入時に破棄）
+JOB_TTL_SEC = 3600.0
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+# 段階 → 進捗（%）の目安
+STAGE_PROGRESS = {
+    "queued": 0,
+    "render": 10,
+    "classify": 25,
+    "call": 40,
+    "validate": 90,
+    "done": 100,
+}
+
+
+class JobCancelled(BaseException):
+    """ジョブの取り消し。
+
+    抽出処理の `except Exception`（リトライ・フォールバック）に捕まらず
+    呼び出し元まで戻るよう、asyncio.CancelledError と同じく BaseException を継承する。
+    """
+
+
+class Job:
+    """1件の抽出ジョブ。属性の更新はワーカースレッド、参照は画面側から行う。"""
+
+    def __init__(self, kind: str, input_hash: str = "", inputs: Optional[list[str]] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.input_hash = input_hash
+        self.inputs = list(inputs or [])  # 入力ファイル（再接続時の画面復元用）
+        self.status = QUEUED
+        self.stage = "queued"
+        self.progress = 0
+        self.message = ""
+        self.result: Any = None
+        self.error = ""
+        self.cached = False
+        self.sections: dict = {}
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cancel = threading.Event()
+        self._future = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def elapsed_sec(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def check_cancelled(self) -> None:
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+
+    def report(self, stage: str, message: str = "", progress: Optional[int] = None) -> None:
+        """段階の更新（抽出側の on_progress に渡す）。取り消し済みならここで中断する。"""
+        self.check_cancelled()
+        self.stage = stage
+        self.message = message
+        self.progress = progress if progress is not None else STAGE_PROGRESS.get(stage, self.progress)
+
+    def add_section(self, name: str, data, warnings=None) -> None:
+        """ストリーミング抽出で完成したセクション（先出し表示用）。"""
+        self.check_cancelled()
+        self.sections[name] = {"data": data, "warnings": list(warnings or [])}
+
+    def snapshot(self) -> dict:
+        return {
+            "id": self.id, "kind": self.kind, "status": self.status, "stage": self.stage,
+            "progress": self.progress, "message": self.message, "error": self.error,
+            "cached": self.cached, "elapsed_sec": round(self.elapsed_sec, 1),
+        }
+
+
+class JobManager:
+    """ジョブの投入・実行・問い合わせ・取り消しと結果キャッシュ。"""
+
+    def __init__(self, max_workers: int = JOB_WORKERS, cache_size: int = RESULT_CACHE_SIZE):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="extraction-job")
+        self._lock = threading.Lock()
+        self._jobs: dict[str, Job] = {}
+        self._cache: OrderedDict = OrderedDict()  # (kind, input_hash) → 結果
+        self._cache_size = cache_size
+
+    def submit(self, kind: str, fn: Callable[[Job], Any], input_hash: str = "",
+               inputs: Optional[list[str]] = None, force: bool = False,
+               cacheable: Optional[Callable[[Any], bool]] = None) -> Job:
+        """fn(job) をバックグラウンドで実行するジョブを投入する。
+
+        Args:
+            force: True ならキャッシュ済みの結果を使わずに実行し直す
+            cacheable: 結果をキャッシュしてよいかの判定（False ならキャッシュしない）。
+                       API 失敗時に代替結果を返す抽出関数で、失敗を使い回さないために使う
+        """
+        with self._lock:
+            self._prune()
+            if input_hash:
+                key = (kind, input_hash)
+                if key in self._cache and not force:
+                    self._cache.move_to_end(key)
+                    job = Job(kind, input_hash, inputs)
+                    job.status, job.stage, job.progress = DONE, "done", 100
+                    job.result = copy.deepcopy(self._cache[key])
+                    job.cached = True
+                    job.started_at = job.finished_at = time.time()
+                    self._jobs[job.id] = job
+                    logger.info(f"抽出ジョブ {kind}: 同じ入力の結果を再利用（{job.id}）")
+                    return job
+                for other in self._jobs.values():
+                    if (other.kind, other.input_hash) == key and not other.done \
+                            and not other.cancel_requested:
+                        return other
+            job = Job(kind, input_hash, inputs)
+            self._jobs[job.id] = job
+        # api_replay.use() 等のコンテキスト変数をワーカーへ引き継ぐ
+        ctx = contextvars.copy_context()
+        job._future = self._executor.submit(ctx.run, self._run, job, fn, cacheable)
+        return job
+
+    def _run(self, job: Job, fn: Callable[[Job], Any],
+             cacheable: Optional[Callable[[Any], bool]] = None) -> None:
+        if job.cancel_requested:
+            job.status, job.finished_at = CANCELLED, time.time()
+            return
+        job.status, job.started_at = RUNNING, time.time()
+        try:
+            result = fn(job)
+            job.check_cancelled()
+        except JobCancelled:
+            job.status = CANCELLED
+            logger.info(f"抽出ジョブ {job.kind} を取り消しました（{job.id}）")
+        except Exception as e:
+            job.status, job.error = FAILED, str(e)
+            logger.warning(f"抽出ジョブ {job.kind} が失敗（{job.id}）: {e}")
+        else:
+            job.result = result
+            job.status, job.stage, job.progress = DONE, "done", 100
+            if job.input_hash:
+                if cacheable is None or cacheable(result):
+                    self._remember(job.kind, job.input_hash, result)
+                else:
+                    logger.info(f"抽出ジョブ {job.kind}: 代替結果のためキャッシュしません（{job.id}）")
+        finally:
+            job.finished_at = time.time()
+
+    def _remember(self, kind: str, input_hash: str, result) -> None:
+        try:
+            stored = copy.deepcopy(result)
+        except Exception as e:
+            logger.warning(f"抽出結果をキャッシュできません（続行）: {e}")
+            return
+        with self._lock:
+            self._cache[(kind, input_hash)] = stored
+            self._cache.move_to_end((kind, input_hash))
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def _prune(self) -> None:
+        now = time.time()
+        for job_id in [j.id for j in self._jobs.values()
+                       if j.done and j.finished_at and now - j.finished_at > JOB_TTL_SEC]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        if not job_id:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: Optional[str]) -> bool:
+        """取り消しを要求する。待機中ならその場で取り消し済みになる。"""
+        job = self.get(job_id)
+        if job is None or job.done:
+            return False
+        job._cancel.set()
+        if job._future is not None and job._future.cancel():
+            job.status, job.finished_at = CANCELLED, time.time()
+        return True
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for job in self._jobs.values():
+                job._cancel.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_manager: Optional[JobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_manager() -> JobManager:
+    """プロセス共有の JobManager。"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
+
+
+def reset() -> None:
+    """全ジョブとキャッシュを破棄する（テスト用）。"""
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.shutdown()
+        _manager = None
+
+
+def get(job_id: Optional[str]) -> Optional[Job]:
+    return get_manager().get(job_id)
+
+
+def cancel(job_id: Optional[str]) -> bool:
+    return get_manager().cancel(job_id)
+
+
+def hash_inputs(kind: str, paths: list[str], **options) -> str:
+    """ファイル内容とオプションからキャッシュキーを作る（読めないファイルはパスで代用）。"""
+    h = hashlib.sha256()
+    h.update(kind.encode("utf-8"))
+    h.update(json.dumps(options, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8"))
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+        except OSError:
+            h.update(f"path:{Path(path).name}".encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+# =============================================================
+# 抽出ジョブ
+# =============================================================
+
+def submit_survey_extraction(pdf_paths: list[str], force: bool = False, **options) -> Job:
+    """現調シートの抽出（extract_survey_data_multi）。options はそのまま渡す。
+
+    失敗時は例外になる（FAILED でキャッシュされない）ため cacheable は渡さない。
+    """
+    def run(job: Job):
+        from extraction.survey_extractor import extract_survey_data_multi
+        return extract_survey_data_multi(
+            list(pdf_paths), on_progress=job.report, on_section=job.add_section, **options)
+
+    return get_manager().submit("survey", run, hash_inputs("survey", pdf_paths, **options),
+                                inputs=pdf_paths, force=force)
+
+
+def _drafting_cacheable(spec) -> bool:
+    """extract_drafting_spec の代替結果（_fallback_spec）でないか。"""
+    confidence = getattr(spec, "confidence", None)
+    return not (isinstance(confidence, dict) and confidence.get("_extraction") == "low")
+
+
+def _catalog_cacheable(product) -> bool:
+    """extract_product_catalog の空の結果（_empty_result）でないか。"""
+    return isinstance(product, dict) and bool(product.get("extraction_path"))
+
+
+def submit_drafting_extraction(file_paths: list[str], drawing_type: str = "layout",
+                               hint: str = "", force: bool = False) -> Job:
+    """製図用の現調資料の抽出（extract_drafting_spec）。"""
+    def run(job: Job):
+        from drafting.spec_extractor import extract_drafting_spec
+        job.report("call", "AIが現調資料を読み取っています")
+        spec = extract_drafting_spec(list(file_paths), drawing_type=drawing_type, hint=hint)
+        job.report("validate", "読み取り結果を整理しています")
+        return spec
+
+    return get_manager().submit(
+        "drafting", run,
+        hash_inputs("drafting", file_paths, drawing_type=drawing_type, hint=hint),
+        inputs=file_paths, force=force, cacheable=_drafting_cacheable)
+
+
+def submit_catalog_extraction(path: str, force: bool = False) -> Job:
+    """製品カタログの仕様抽出（extract_product_catalog）。"""
+    def run(job: Job):
+        from product.catalog_extractor import extract_product_catalog
+        job.report("call", "カタログを解析しています")
+        product = extract_product_catalog(path)
+        job.report("validate", "仕様を整理しています")
+        return product
+
+    return get_manager().submit("catalog", run, hash_inputs("catalog", [path]), inputs=[path],
+                                force=force, cacheable=_catalog_cacheable)
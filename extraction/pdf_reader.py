@@ -2,6 +2,9 @@
 import base64
 import io
 import logging
+import re
+from typing import Iterable, Optional
+
 import fitz  # PyMuPDF
 from PIL import Image, ImageEnhance, ImageOps
 
@@ -16,6 +19,8 @@ def pdf_to_images(
     dpi: int = 200,
     auto_rotate: bool = True,
     enhance_contrast: bool = True,
+    pages: Optional[Iterable[int]] = None,
+    keep_original: Iterable[int] = (),
 ) -> list[dict]:
     """PDFの各ページをPNG画像に変換してbase64エンコード
 
@@ -28,10 +33,15 @@ def pdf_to_images(
         dpi: 解像度（デフォルト200dpi）
         auto_rotate: PDFのページ回転メタデータに従って自動回転する
         enhance_contrast: 手書きOCRのために軽微なコントラスト強調を適用する
+        pages: 変換するページ番号（1始まり）。None なら全ページ。範囲外は無視し、
+            指定したページだけをレンダリングする（select_pages_by_text と組み合わせる）
+        keep_original: コントラスト強調前のPNGも "original_bytes" として返すページ番号
+            （1始まり。サムネイル等、見た目を変えたくない用途に使い回す）。
+            回転補正したページは元の見た目と異なるため返さない
 
     Returns:
         list of {"page": int, "image_base64": str, "image_bytes": bytes,
-                 "media_type": str}
+                 "media_type": str}（keep_original のページは "original_bytes" も）
     """
     try:
         doc = fitz.open(pdf_path)
@@ -42,9 +52,20 @@ def pdf_to_images(
         doc.close()
         raise RuntimeError("PDFにページがありません。空のPDFファイルです。")
 
-    pages = []
+    if pages is None:
+        page_indexes = range(len(doc))
+    else:
+        requested = list(pages)
+        page_indexes = sorted({p - 1 for p in requested if 1 <= p <= len(doc)})
+        if not page_indexes:
+            count = len(doc)
+            doc.close()
+            raise RuntimeError(f"指定ページ {requested} がPDF（{count}ページ）にありません。")
+
+    keep = set(keep_original)
+    results = []
 
-    for page_num in range(len(doc)):
+    for page_num in page_indexes:
         page = doc[page_num]
 
         # PDFのページ回転情報を取得（auto_rotateがTrueの場合のみ補正）
@@ -79,6 +100,8 @@ def pdf_to_images(
             logger.error(f"ページ{page_num + 1}のレンダリングに完全に失敗しました。スキップします。")
             continue
 
+        original_bytes = img_bytes if page_num + 1 in keep and not rotation else None
+
         # コントラスト強調（手書きOCRの精度向上のため軽微に適用）
         if enhance_contrast:
             try:
@@ -96,15 +119,66 @@ def pdf_to_images(
 
         img_base64 = base64.standard_b64encode(img_bytes).decode("utf-8")
 
-        pages.append({
+        result = {
             "page": page_num + 1,
             "image_base64": img_base64,
             "image_bytes": img_bytes,
             "media_type": media_type,
-        })
+        }
+        if original_bytes is not None:
+            result["original_bytes"] = original_bytes
+        results.append(result)
 
     doc.close()
-    return pages
+    return results
+
+
+def select_pages_by_text(
+    pdf_path: str,
+    max_pages: int,
+    keywords: Optional[Iterable[str]] = None,
+    always: Iterable[int] = (1,),
+) -> list[int]:
+    """テキスト層だけを見て、情報の多そうなページを max_pages 枚選ぶ（レンダリングしない）。
+
+    スコアはキーワードの出現数（1語5点）と数字の量で、仕様表のページほど高くなる。
+    always のページ（既定は表紙の1ページ目）は必ず含める。テキスト層が無い
+    スキャンPDFなどで差が付かない場合は先頭から max_pages 枚（従来どおり）。
+
+    Returns:
+        ページ番号（1始まり）の昇順リスト
+    """
+    try:
+        doc = fitz.open(pdf_path)
+    except Exception as e:
+        raise RuntimeError(f"PDFファイルを開けません（ファイル破損またはパスワード保護の可能性）: {e}") from e
+    try:
+        n = len(doc)
+        if n <= max_pages:
+            return list(range(1, n + 1))
+        words = [k.lower() for k in (keywords or []) if k]
+        scores = []
+        for i in range(n):
+            try:
+                text = doc[i].get_text("text").lower()
+            except Exception:
+                text = ""
+            digits = len(re.findall(r"\d", text))
+            score = sum(text.count(w) for w in words) * 5 + min(digits, 400) / 40
+            scores.append(score)
+    finally:
+        doc.close()
+
+    if not any(scores):
+        return list(range(1, max_pages + 1))
+    chosen = [p for p in always if 1 <= p <= n][:max_pages]
+    ranked = sorted(range(1, n + 1), key=lambda p: (-scores[p - 1], p))
+    for p in ranked:
+        if len(chosen) >= max_pages:
+            break
+        if p not in chosen:
+            chosen.append(p)
+    return sorted(chosen)
 
 
 def _apply_image_enhancement(img_bytes: bytes) -> tuple[bytes, str]:
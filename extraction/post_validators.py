@@ -7,6 +7,7 @@ Claude API から返った SurveyData 相当の dict に対して、ドメイン
 
 公開関数:
     - validate_and_correct(raw) -> (corrected, warnings, confidence_updates)
+    - validate_section(name, section) -> (corrected_section, warnings, confidence_updates)
     - validate_pv_capacity_consistency(equipment) -> (kw, warning, confidence)
     - validate_module_output_w(value) -> (value, warning, confidence)
     - validate_postal_code(value) -> (value, warning, confidence)
@@ -505,33 +506,8 @@ def normalize_design_status(value: str) -> tuple[str, str | None]:
 # メインエントリ: validate_and_correct
 # =====================================================================
 
-def validate_and_correct(raw: dict) -> tuple[dict, list[str], dict]:
-    """抽出辞書全体を検証＆補正する。
-
-    入力 dict はディープコピーされ、原データは変更されない。
-
-    Args:
-        raw: Claude API 返却の dict（project / equipment / high_voltage 等を含む）
-
-    Returns:
-        (corrected_dict, warnings, confidence_updates)
-            - corrected_dict: 補正後の dict
-            - warnings: 補正・検証ログのリスト
-            - confidence_updates: フィールドパス → "high"/"medium"/"low"
-    """
-    if not isinstance(raw, dict):
-        return raw, [], {}
-
-    corrected = copy.deepcopy(raw)
-    warnings: list[str] = []
-    confidence_updates: dict[str, str] = {}
-
-    # ---- project ----
-    project = corrected.setdefault("project", {})
-    if not isinstance(project, dict):
-        project = {}
-        corrected["project"] = project
-
+def _validate_project(project: dict, warnings: list, confidence_updates: dict) -> None:
+    """project セクション（住所・郵便番号・調査日）の検証＆補正（破壊的）。"""
     # 住所 ↔ 郵便番号の整合
     addr = project.get("address") or ""
     pc = project.get("postal_code") or ""
@@ -566,12 +542,9 @@ def validate_and_correct(raw: dict) -> tuple[dict, list[str], dict]:
         if warn:
             warnings.append(warn)
 
-    # ---- equipment ----
-    equipment = corrected.setdefault("equipment", {})
-    if not isinstance(equipment, dict):
-        equipment = {}
-        corrected["equipment"] = equipment
 
+def _validate_equipment(equipment: dict, warnings: list, confidence_updates: dict) -> None:
+    """equipment セクション（メーカー・出力W・PV容量・設計確定度）の検証＆補正（破壊的）。"""
     # メーカー名正規化 + 型式→メーカー逆引き
     maker = (equipment.get("module_maker") or "").strip()
     model = (equipment.get("module_model") or "").strip()
@@ -621,30 +594,91 @@ def validate_and_correct(raw: dict) -> tuple[dict, list[str], dict]:
         if warn:
             warnings.append(warn)
 
-    # ---- high_voltage ----
-    hv = corrected.get("high_voltage")
-    if isinstance(hv, dict):
-        for sep_key in ("separation_ns_mm", "separation_ew_mm"):
-            if sep_key in hv and hv[sep_key] is not None:
-                mm, warn = validate_separation(hv[sep_key])
-                if mm != _safe_float(hv[sep_key]):
-                    hv[sep_key] = mm
-                if warn:
-                    warnings.append(f"{sep_key}: {warn}")
-
-    # ---- confirmation ----
-    confirmation = corrected.get("confirmation")
-    if isinstance(confirmation, dict):
-        for date_key in ("surveyor_date", "design_review_date", "works_review_date"):
-            if confirmation.get(date_key):
-                nd, warn = normalize_date(confirmation[date_key])
-                if nd != confirmation[date_key]:
-                    warnings.append(
-                        f"{date_key} を正規化しました: '{confirmation[date_key]}' → '{nd}'"
-                    )
-                    confirmation[date_key] = nd
-                if warn:
-                    warnings.append(warn)
+
+def _validate_high_voltage(hv: dict, warnings: list, confidence_updates: dict) -> None:
+    """high_voltage セクション（離隔距離）の検証＆補正（破壊的）。"""
+    for sep_key in ("separation_ns_mm", "separation_ew_mm"):
+        if sep_key in hv and hv[sep_key] is not None:
+            mm, warn = validate_separation(hv[sep_key])
+            if mm != _safe_float(hv[sep_key]):
+                hv[sep_key] = mm
+            if warn:
+                warnings.append(f"{sep_key}: {warn}")
+
+
+def _validate_confirmation(confirmation: dict, warnings: list, confidence_updates: dict) -> None:
+    """confirmation セクション（確認日付）の検証＆補正（破壊的）。"""
+    for date_key in ("surveyor_date", "design_review_date", "works_review_date"):
+        if confirmation.get(date_key):
+            nd, warn = normalize_date(confirmation[date_key])
+            if nd != confirmation[date_key]:
+                warnings.append(
+                    f"{date_key} を正規化しました: '{confirmation[date_key]}' → '{nd}'"
+                )
+                confirmation[date_key] = nd
+            if warn:
+                warnings.append(warn)
+
+
+# セクション名 → 検証関数（validate_and_correct の適用順）。
+# project / equipment は欠けていても空 dict として検証する（信頼度 low を付けるため）。
+_SECTION_VALIDATORS = {
+    "project": _validate_project,
+    "equipment": _validate_equipment,
+    "high_voltage": _validate_high_voltage,
+    "confirmation": _validate_confirmation,
+}
+_REQUIRED_SECTIONS = ("project", "equipment")
+
+
+def validate_section(name: str, section) -> tuple[dict, list[str], dict]:
+    """トップレベルの1セクションだけを検証＆補正する（ストリーミング抽出の先出し用）。
+
+    各セクションの検証は他セクションを参照しないため、完成したセクションから
+    順に呼べる。validate_and_correct と同じ規則を適用する（入力は変更しない）。
+
+    Returns:
+        (corrected_section, warnings, confidence_updates)。検証対象外のセクションや
+        dict でない値はそのまま（warnings / confidence_updates は空）。
+    """
+    validator = _SECTION_VALIDATORS.get(name)
+    if validator is None or not isinstance(section, dict):
+        return section, [], {}
+    corrected = copy.deepcopy(section)
+    warnings: list[str] = []
+    confidence_updates: dict[str, str] = {}
+    validator(corrected, warnings, confidence_updates)
+    return corrected, warnings, confidence_updates
+
+
+def validate_and_correct(raw: dict) -> tuple[dict, list[str], dict]:
+    """抽出辞書全体を検証＆補正する。
+
+    入力 dict はディープコピーされ、原データは変更されない。
+
+    Args:
+        raw: Claude API 返却の dict（project / equipment / high_voltage 等を含む）
+
+    Returns:
+        (corrected_dict, warnings, confidence_updates)
+            - corrected_dict: 補正後の dict
+            - warnings: 補正・検証ログのリスト
+            - confidence_updates: フィールドパス → "high"/"medium"/"low"
+    """
+    if not isinstance(raw, dict):
+        return raw, [], {}
+
+    corrected = copy.deepcopy(raw)
+    warnings: list[str] = []
+    confidence_updates: dict[str, str] = {}
+
+    for name, validator in _SECTION_VALIDATORS.items():
+        section = corrected.get(name)
+        if name in _REQUIRED_SECTIONS and not isinstance(section, dict):
+            section = {}
+            corrected[name] = section
+        if isinstance(section, dict):
+            validator(section, warnings, confidence_updates)
 
     return corrected, warnings, confidence_updates
 
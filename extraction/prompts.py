@@ -10,15 +10,62 @@
 - CLASSIFICATION_PROMPT: 文書を commercial / residential / unknown に分類するプロンプト
 
 すべてのプロンプトは models/survey_data.py の SurveyData スキーマと互換のJSONを返す。
+
+送り方（プロンプトキャッシュ）:
+上記の長いプロンプトは毎回同一のため、messages API の system に
+cached_system_blocks() で cache_control 付きブロックとして渡す。user 側は
+ページ画像と短い指示（SURVEY_EXTRACTION_INSTRUCTION 等）だけにし、同一プロンプトの
+再抽出ではシステム部分がキャッシュ読み出しになるようにする。
+応答のキャッシュ状況は log_cache_usage() でログに出す。
 """
+import logging
+
+logger = logging.getLogger(__name__)
 
 __all__ = [
     "COMMERCIAL_EXTRACTION_PROMPT",
     "RESIDENTIAL_EXTRACTION_PROMPT",
     "CLASSIFICATION_PROMPT",
+    "SURVEY_EXTRACTION_INSTRUCTION",
+    "CLASSIFICATION_INSTRUCTION",
+    "cached_system_blocks",
+    "log_cache_usage",
 ]
 
 
+def cached_system_blocks(prompt: str) -> list[dict]:
+    """固定プロンプトを cache_control 付きの system ブロック（1個）にする。
+
+    キャッシュはプレフィックス一致のため、呼び出しごとに内容が変わる文字列
+    （ファイル名・日時など）は含めないこと。短すぎるプロンプト（モデルの最小
+    キャッシュ長未満）は API 側でキャッシュされないだけで、エラーにはならない。
+    """
+    return [{"type": "text", "text": prompt, "cache_control": {"type": "ephemeral"}}]
+
+
+def log_cache_usage(response, label: str) -> dict:
+    """応答 usage のプロンプトキャッシュ状況をログに出し、数値を dict で返す。
+
+    cache_read_input_tokens = キャッシュ読み出し（ヒット）、
+    cache_creation_input_tokens = 今回キャッシュに書き込んだ分、
+    input_tokens = キャッシュ対象外の入力（画像・短い指示）。
+    usage を持たない応答（テスト用の偽応答など）は空 dict。
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {}
+    stats = {
+        key: int(getattr(usage, key, 0) or 0)
+        for key in ("input_tokens", "cache_read_input_tokens",
+                    "cache_creation_input_tokens", "output_tokens")
+    }
+    logger.info(
+        "API usage（%s）: キャッシュ読出 %d / キャッシュ書込 %d / 非キャッシュ入力 %d / 出力 %d tokens",
+        label, stats["cache_read_input_tokens"], stats["cache_creation_input_tokens"],
+        stats["input_tokens"], stats["output_tokens"])
+    return stats
+
+
 # ---------------------------------------------------------------------------
 # 共通ヒューリスティック（手書き判別ガイド・典型値・自己整合チェック）
 # ---------------------------------------------------------------------------
@@ -654,3 +701,16 @@ CLASSIFICATION_PROMPT = """あなたは太陽光発電案件の書類を分類
 【最終指示・絶対遵守】
 **JSON以外のテキストは一切返すな**。純粋なJSONオブジェクトのみを返すこと。
 """
+
+
+# ---------------------------------------------------------------------------
+# user 側の短い指示（system にキャッシュした上記プロンプトと組で使う）
+# ---------------------------------------------------------------------------
+SURVEY_EXTRACTION_INSTRUCTION = (
+    "上記の画像群（PDFの各ページ）を、システム指示の手順・判別ガイド・"
+    "出力JSONスキーマに従って読み取り、純粋なJSONオブジェクトのみを返してください。"
+)
+
+CLASSIFICATION_INSTRUCTION = (
+    "上記の画像群を、システム指示の基準で分類し、指定のJSONのみを返してください。"
+)
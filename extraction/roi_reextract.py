@@ -0,0 +1,399 @@
+"""低信頼度フィールドの部分再読み取り（領域切り出し → 少数項目だけの再抽出）
+
+validate_survey_data / _check_confidence_levels が数項目だけを low と判定したとき、
+全ページ（最大20頁）を送り直す代わりに、その項目が書かれた領域だけを高解像度で
+切り出して小さなリクエストで読み直す。
+
+手順:
+1. 位置特定: 全ページの縮小画像（長辺800px）を1回送り、各項目のページと
+   矩形（画像に対する0〜1の比率）を返させる。特定できない項目は、プロンプトの
+   書類構成（1ページ目=案件情報・設備・高圧・最終確認 / 2ページ目=別紙）から
+   ページ全体を既定とする。
+2. 切り出し: 該当ページを ROI_DPI（300dpi）でレンダリングし、近接する矩形を
+   まとめて余白付きで切り出す（image_budget で1枚・合計の上限内に収める）。
+3. 再抽出: 切り出し画像と対象項目の一覧だけを送り、温度を変えて2回読む。
+4. 統合: 元の値と2回の読み取りを merge_extractions で多数決する。
+   多数が一致し、かつ新しい読み取りが多数側に入った項目だけ値と信頼度を更新し、
+   バラバラ（low）なら元の値を残す。どの読み取りにも出てこない項目（サンプルが
+   すべて失敗した場合を含む）は元の値だけの「票」で信頼度を上げない。
+   更新後は validate_and_correct → _parse_raw_data で全体を再検証する。
+
+API 呼び出しは survey_extractor._call_claude_api を実行時に参照する
+（モデルのフォールバック・JSON 修復を共用し、テストでは差し替えられる）。
+"""
+from __future__ import annotations
+
+import base64
+import io
+import json
+import logging
+import time
+from typing import Optional
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from extraction import survey_extractor as _se
+from extraction.image_budget import apply_image_budget
+from extraction.post_validators import validate_and_correct
+from extraction.self_consistency import (
+    _MISSING, _get_nested, _set_nested, merge_extractions, vote_field,
+)
+from models.survey_data import ConfidenceLevel, SurveyData
+
+logger = logging.getLogger(__name__)
+
+# これを超える項目数なら部分再読み取りより全体の再抽出が妥当
+MAX_ROI_FIELDS = 8
+# 切り出し用のレンダリング解像度（通常の抽出は200dpi）
+ROI_DPI = 300
+# 位置特定用の縮小画像の長辺
+LOCATE_LONG_EDGE_PX = 800
+# 矩形の周囲に足す余白（画像に対する比率）と、同一領域にまとめる距離
+ROI_PAD = 0.04
+_MERGE_GAP = 0.05
+# 再抽出のサンプル温度（元の値と合わせて3票で多数決）
+FOCUSED_TEMPERATURES = [0.0, 0.3]
+
+# 位置を特定できなかった項目の既定ページ（prompts の書類構成に準拠）
+_DEFAULT_SECTION_PAGE = {
+    "project": 1, "equipment": 1, "high_voltage": 1, "confirmation": 1,
+    "supplementary": 2,
+}
+
+_LOCATE_INSTRUCTION = """上記は現調資料の各ページの縮小画像です（各画像の直前にページ番号）。
+次の項目が記入されている位置を特定してください。
+
+{fields}
+
+以下のJSON形式のみを返してください。bbox は [左, 上, 右, 下] を画像の幅・高さに
+対する 0〜1 の比率で表し、記入欄の見出しと手書き部分の両方を含めてください。
+見つからない項目は省略してください。
+
+{{"locations": {{"project.project_name": {{"page": 1, "bbox": [0.1, 0.05, 0.6, 0.1]}}}}}}"""
+
+_FOCUSED_INSTRUCTION = """上記は現調資料から切り出した領域の画像です（各画像の直前に元のページ番号）。
+次の項目だけを、画像から読み取ってください。
+
+{fields}
+
+手書き文字は一文字ずつ丁寧に読み、丸で囲まれた選択肢は囲まれた方を選んでください。
+読み取れない項目は推測せず null にしてください。
+以下の形のJSONのみを返してください（対象項目以外は含めない）。
+
+{example}"""
+
+
+# =============================================================
+# 項目の定義
+# =============================================================
+
+def _field_label(path: str) -> Optional[str]:
+    """"section.field" の表示名（SurveyData の Field description）。存在しなければ None。"""
+    parts = path.split(".")
+    if len(parts) != 2:
+        return None
+    section_field = SurveyData.model_fields.get(parts[0])
+    if section_field is None or not hasattr(section_field.annotation, "model_fields"):
+        return None
+    field = section_field.annotation.model_fields.get(parts[1])
+    if field is None:
+        return None
+    return field.description or parts[1]
+
+
+def low_confidence_fields(survey: SurveyData) -> list[str]:
+    """survey.field_confidences のうち low の項目（再読み取りできるものだけ）。"""
+    out = []
+    for path, conf in (survey.field_confidences or {}).items():
+        level = conf.value if hasattr(conf, "value") else conf
+        if level == ConfidenceLevel.LOW.value and _field_label(path):
+            out.append(path)
+    return out
+
+
+def _fields_text(fields: list[str]) -> str:
+    return "\n".join(f"- {p}（{_field_label(p)}）" for p in fields)
+
+
+# =============================================================
+# ページのレンダリング
+# =============================================================
+
+def _page_index(pdf_paths: list[str]) -> list[tuple[str, int]]:
+    """全PDFを通した通しページ番号 → (PDFパス, PDF内のページ番号)。"""
+    index = []
+    for path in pdf_paths:
+        doc = fitz.open(path)
+        try:
+            index.extend((path, i + 1) for i in range(len(doc)))
+        finally:
+            doc.close()
+    return index[:_se.MAX_TOTAL_PAGES]
+
+
+def _render_page(pdf_path: str, page_no: int, dpi: int = ROI_DPI,
+                 long_edge_px: int = 0) -> Image.Image:
+    """1ページを PIL 画像にする（位置特定と切り出しで同じ座標系を使う）。
+
+    long_edge_px を指定すると dpi の代わりに長辺のピクセル数で倍率を決める。
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        rect = doc[page_no - 1].rect
+        zoom = long_edge_px / max(rect.width, rect.height) if long_edge_px else dpi / 72
+        pix = doc[page_no - 1].get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    finally:
+        doc.close()
+
+
+def _image_block(pil_img: Image.Image, media_type: str = "image/png") -> dict:
+    buf = io.BytesIO()
+    if media_type == "image/jpeg":
+        pil_img.convert("RGB").save(buf, format="JPEG", quality=85)
+    else:
+        pil_img.save(buf, format="PNG", optimize=True)
+    return {"type": "image", "source": {
+        "type": "base64", "media_type": media_type,
+        "data": base64.standard_b64encode(buf.getvalue()).decode("utf-8")}}
+
+
+# =============================================================
+# 1) 位置特定
+# =============================================================
+
+def _valid_bbox(bbox) -> Optional[tuple]:
+    try:
+        x0, y0, x1, y1 = (min(1.0, max(0.0, float(v))) for v in bbox)
+    except (TypeError, ValueError):
+        return None
+    if x1 - x0 < 0.005 or y1 - y0 < 0.005:
+        return None
+    return (x0, y0, x1, y1)
+
+
+def locate_fields(pages: list[tuple[str, int]], fields: list[str]) -> dict:
+    """各項目の {path: {"page": 通しページ番号, "bbox": (x0, y0, x1, y1)}} を返す。
+
+    特定できなかった項目は既定ページ全体（_DEFAULT_SECTION_PAGE）にする。
+    位置特定の失敗で再読み取りは止めない。
+    """
+    located: dict = {}
+    content: list[dict] = []
+    for no, (path, page_no) in enumerate(pages, start=1):
+        content.append({"type": "text", "text": f"ページ{no}"})
+        content.append(_image_block(
+            _render_page(path, page_no, long_edge_px=LOCATE_LONG_EDGE_PX), "image/jpeg"))
+    content.append({"type": "text",
+                    "text": _LOCATE_INSTRUCTION.format(fields=_fields_text(fields))})
+    try:
+        raw = _se._call_claude_api(content, attempt=1)
+        for path, loc in ((raw or {}).get("locations") or {}).items():
+            if path not in fields or not isinstance(loc, dict):
+                continue
+            page = int(loc.get("page") or 0)
+            bbox = _valid_bbox(loc.get("bbox"))
+            if 1 <= page <= len(pages) and bbox:
+                located[path] = {"page": page, "bbox": bbox}
+    except Exception as e:
+        logger.warning(f"部分再読み取り: 位置特定に失敗（既定ページ全体で続行）: {e}")
+
+    for path in fields:
+        if path not in located:
+            page = _DEFAULT_SECTION_PAGE.get(path.split(".")[0], 1)
+            located[path] = {"page": page if page <= len(pages) else 1,
+                             "bbox": (0.0, 0.0, 1.0, 1.0), "default": True}
+    return located
+
+
+# =============================================================
+# 2) 領域の切り出し
+# =============================================================
+
+def _near(a: tuple, b: tuple) -> bool:
+    return not (a[2] + _MERGE_GAP < b[0] or b[2] + _MERGE_GAP < a[0]
+                or a[3] + _MERGE_GAP < b[1] or b[3] + _MERGE_GAP < a[1])
+
+
+def group_regions(located: dict) -> list[dict]:
+    """ページごとに近接する矩形をまとめ、余白を足した切り出し領域の一覧にする。
+
+    Returns:
+        [{"page": 通しページ番号, "bbox": (x0, y0, x1, y1), "fields": [path, ...]}, ...]
+    """
+    regions: list[dict] = []
+    for path, loc in sorted(located.items(), key=lambda kv: (kv[1]["page"], kv[1]["bbox"])):
+        x0, y0, x1, y1 = loc["bbox"]
+        box = (max(0.0, x0 - ROI_PAD), max(0.0, y0 - ROI_PAD),
+               min(1.0, x1 + ROI_PAD), min(1.0, y1 + ROI_PAD))
+        for region in regions:
+            if region["page"] == loc["page"] and _near(region["bbox"], box):
+                rb = region["bbox"]
+                region["bbox"] = (min(rb[0], box[0]), min(rb[1], box[1]),
+                                  max(rb[2], box[2]), max(rb[3], box[3]))
+                region["fields"].append(path)
+                break
+        else:
+            regions.append({"page": loc["page"], "bbox": box, "fields": [path]})
+    return regions
+
+
+def crop_regions(pages: list[tuple[str, int]], regions: list[dict]) -> list[dict]:
+    """各領域を ROI_DPI で切り出し、image_budget で上限内に収めた画像 dict にする。"""
+    rendered: dict = {}
+    crops: list[dict] = []
+    for region in regions:
+        page = region["page"]
+        if page not in rendered:
+            rendered[page] = _render_page(*pages[page - 1], ROI_DPI)
+        img = rendered[page]
+        w, h = img.size
+        x0, y0, x1, y1 = region["bbox"]
+        left, top = int(x0 * w), int(y0 * h)
+        crop = img.crop((left, top, max(left + 1, int(x1 * w)), max(top + 1, int(y1 * h))))
+        buf = io.BytesIO()
+        crop.save(buf, format="PNG")
+        data = buf.getvalue()
+        crops.append({"page": page, "image_bytes": data, "media_type": "image/png",
+                      "image_base64": base64.standard_b64encode(data).decode("utf-8")})
+    crops, _report = apply_image_budget(crops, label="roi")
+    return crops
+
+
+# =============================================================
+# 3)〜4) 再抽出と統合
+# =============================================================
+
+def _nested_example(fields: list[str]) -> str:
+    example: dict = {}
+    for path in fields:
+        _set_nested(example, path, "…")
+    return json.dumps(example, ensure_ascii=False)
+
+
+def _readings(raw: dict, fields: list[str]) -> dict:
+    """応答から対象項目の読めた値だけを取り出す（null・空文字は票にしない）。"""
+    out: dict = {}
+    for path in fields:
+        value = _get_nested(raw or {}, path)
+        if value is _MISSING or value is None or value == "":
+            continue
+        _set_nested(out, path, value)
+    return out
+
+
+def reextract_low_confidence_fields(
+    survey: SurveyData,
+    pdf_paths: list[str],
+    fields: Optional[list[str]] = None,
+) -> tuple[SurveyData, dict]:
+    """低信頼度の項目だけを、該当領域の高解像度切り出しで読み直す。
+
+    Args:
+        survey: 抽出済みの SurveyData（変更しない）
+        pdf_paths: 抽出に使った PDF（extract_survey_data_multi と同じ順序）
+        fields: 対象の項目パス（"project.project_name" 形式）。None なら low の項目すべて
+
+    Returns:
+        (更新後の SurveyData, report)。report は
+        {"fields", "skipped", "locations", "regions", "crop_pixels", "changed",
+         "confidences", "elapsed_sec"}。対象外の場合は survey をそのまま返す。
+    """
+    started = time.monotonic()
+    targets = [p for p in (fields if fields is not None else low_confidence_fields(survey))
+               if _field_label(p)]
+    report: dict = {"fields": targets, "skipped": "", "locations": {}, "regions": [],
+                    "crop_pixels": 0, "changed": {}, "confidences": {}, "elapsed_sec": 0.0}
+    if not targets:
+        report["skipped"] = "対象項目なし"
+        return survey, report
+    if len(targets) > MAX_ROI_FIELDS:
+        report["skipped"] = f"対象が{len(targets)}項目と多いため全体の再読み取りが妥当"
+        return survey, report
+
+    pages = _page_index(pdf_paths)
+    if not pages:
+        report["skipped"] = "ページなし"
+        return survey, report
+
+    located = locate_fields(pages, targets)
+    regions = group_regions(located)
+    crops = crop_regions(pages, regions)
+    report["locations"] = located
+    report["regions"] = regions
+    report["crop_pixels"] = sum(c["budget"]["size"][0] * c["budget"]["size"][1]
+                                for c in crops if c.get("budget"))
+
+    content: list[dict] = []
+    for crop in crops:
+        content.append({"type": "text", "text": f"ページ{crop['page']}の一部"})
+        content.append({"type": "image", "source": {
+            "type": "base64", "media_type": crop["media_type"],
+            "data": crop["image_base64"]}})
+    content.append({"type": "text", "text": _FOCUSED_INSTRUCTION.format(
+        fields=_fields_text(targets), example=_nested_example(targets))})
+
+    samples: list[dict] = []
+    for temp in FOCUSED_TEMPERATURES:
+        try:
+            samples.append(_readings(
+                _se._call_claude_api(content, attempt=1, temperature=temp),
+                targets))
+        except Exception as e:
+            logger.warning(f"部分再読み取りのサンプル失敗 (temp={temp}): {e}")
+
+    fresh = [s for s in samples if s]
+    if not fresh:
+        # 読み直せた項目が無い。元の値だけで信頼度を上げない
+        report["skipped"] = "再読み取りで値を得られなかった"
+        report["elapsed_sec"] = round(time.monotonic() - started, 2)
+        logger.warning(f"部分再読み取り: {len(targets)}項目とも読み直せませんでした")
+        return survey, report
+
+    raw = survey.model_dump(mode="json")
+    original = _readings(raw, targets)
+    # 高解像度の読み取りを先に並べる（同数なら新しい読み取りを優先）
+    merged, confs = merge_extractions(fresh + [original])
+
+    new_confs = dict(raw.get("field_confidences") or {})
+    for path in targets:
+        conf = confs.get(path)
+        value = _get_nested(merged, path)
+        if conf not in ("high", "medium") or value is _MISSING:
+            continue  # 票が割れた（または誰も読めない）なら元の値と low を残す
+        readings = [v for v in (_get_nested(s, path) for s in fresh) if v is not _MISSING]
+        if not any(vote_field([v, value])[1] == "high" for v in readings):
+            continue  # 新しい読み取りが多数側に無い（元の値だけの票）なら上げない
+        old = _get_nested(raw, path)
+        if old != value:
+            report["changed"][path] = (old, value)
+        _set_nested(raw, path, value)
+        new_confs[path] = conf
+        report["confidences"][path] = conf
+    raw["field_confidences"] = new_confs
+
+    raw.pop("extraction_warnings", None)
+    raw, validator_warnings, validator_confs = validate_and_correct(raw)
+    updated = _se._parse_raw_data(raw)
+    for k, v in (validator_confs or {}).items():
+        if v == ConfidenceLevel.LOW.value:
+            updated.field_confidences[k] = ConfidenceLevel.LOW
+    warnings = list(survey.extraction_warnings)
+    for w in list(updated.extraction_warnings) + list(validator_warnings):
+        if w not in warnings:
+            warnings.append(w)
+    if report["confidences"]:
+        warnings.append(
+            f"低信頼度の{len(targets)}項目を部分再読み取りし、"
+            f"{len(report['confidences'])}項目の信頼度を更新しました"
+            f"（値の変更{len(report['changed'])}件）。")
+    updated.extraction_warnings = warnings
+
+    report["elapsed_sec"] = round(time.monotonic() - started, 2)
+    logger.info(
+        f"部分再読み取り: {len(targets)}項目 / {len(regions)}領域 / "
+        f"切り出し{report['crop_pixels']:,}px → 更新{len(report['confidences'])}項目 "
+        f"変更{len(report['changed'])}件 ({report['elapsed_sec']}秒)"
+    )
+    return updated, report
@@ -0,0 +1,109 @@
+"""ストリーミング応答のインクリメンタルJSONパーサ（トップレベル項目の逐次取り出し）
+
+messages.stream で届くテキスト断片を feed() で渡すと、トップレベルのJSON
+オブジェクトのメンバー（"project": {...} など）が閉じた時点で (キー, 値) を返す。
+応答全体を待たずに、完成したセクションから検証・画面表示できるようにするためのもの。
+
+- 走査は届いた分だけ1回ずつ（全体で O(応答長)）。文字列リテラル内の括弧・
+  エスケープは無視する（survey_extractor._extract_json と同じ判定）。
+- 前置き文やコードフェンス（```json）は最初の "{" までを読み飛ばす。
+- 各メンバーは survey_extractor._sanitize_json_str（末尾カンマ・コメント等の修復）を
+  通してから json.loads する。それでも読めないメンバーは黙って飛ばす
+  （最終的な全体パースは従来どおり _extract_json が行うため、ここは先出し専用）。
+
+使用例:
+    >>> p = IncrementalJSONParser()
+    >>> p.feed('{"project": {"name": "A"}, "equip')
+    [('project', {'name': 'A'})]
+    >>> p.feed('ment": {}}')
+    [('equipment', {})]
+"""
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalJSONParser:
+    """トップレベルオブジェクトのメンバーを完成順に取り出すパーサ。"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        """新しい応答の受信を始める（フォールバック時の再送などで使う）。"""
+        self._text = ""
+        self._pos = 0
+        self._started = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = 0
+        self.sections: dict = {}
+
+    @property
+    def text(self) -> str:
+        """これまでに受信したテキスト全体。"""
+        return self._text
+
+    @property
+    def done(self) -> bool:
+        """トップレベルオブジェクトが閉じたか。"""
+        return self._done
+
+    def feed(self, chunk: str) -> list[tuple]:
+        """テキスト断片を追加し、新たに完成したメンバー [(キー, 値), ...] を返す。"""
+        if not chunk:
+            return []
+        self._text += chunk
+        completed: list[tuple] = []
+        text = self._text
+        i = self._pos
+        n = len(text)
+        while i < n and not self._done:
+            ch = text[i]
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                    self._member_start = i + 1
+                i += 1
+                continue
+            if self._escape:
+                self._escape = False
+            elif self._in_string:
+                if ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit(text[self._member_start:i], completed)
+                    self._done = True
+            elif ch == "," and self._depth == 1:
+                self._emit(text[self._member_start:i], completed)
+                self._member_start = i + 1
+            i += 1
+        self._pos = i
+        return completed
+
+    def _emit(self, member: str, completed: list) -> None:
+        """"キー": 値 の断片を読み、読めれば completed と sections に加える。"""
+        member = member.strip()
+        if not member:
+            return
+        from extraction.survey_extractor import _sanitize_json_str
+        try:
+            parsed = json.loads(_sanitize_json_str("{" + member + "}"))
+        except (json.JSONDecodeError, ValueError) as e:
+            logger.debug("ストリーム中のメンバーを読めず先出しを省略: %s (%s)", member[:80], e)
+            return
+        for key, value in parsed.items():
+            self.sections[key] = value
+            completed.append((key, value))
@@ -14,10 +14,16 @@ from extraction.pdf_reader import pdf_to_images
 from extraction.prompts import (
     COMMERCIAL_EXTRACTION_PROMPT,
     RESIDENTIAL_EXTRACTION_PROMPT,
+    SURVEY_EXTRACTION_INSTRUCTION,
+    cached_system_blocks,
+    log_cache_usage,
 )
+from extraction import api_client, api_replay
+from extraction.image_budget import apply_image_budget
 from extraction.image_preprocessor import auto_select_pipeline
 from extraction.self_consistency import merge_extractions
-from extraction.post_validators import validate_and_correct
+from extraction.post_validators import validate_and_correct, validate_section
+from extraction.streaming_json import IncrementalJSONParser
 from config import get_api_key, CLAUDE_MODEL, CLAUDE_VISION_MODEL
 
 logger = logging.getLogger(__name__)
@@ -34,6 +40,10 @@ import os
 _SELF_CONSISTENCY_ENABLED = os.environ.get("SURVEY_SELF_CONSISTENCY", "0") == "1"
 _SELF_CONSISTENCY_TEMPS = [0.0, 0.2, 0.3]
 
+# ストリーミング時の max_tokens（thinking 常時ONモデル）。非ストリーミングは SDK の
+# 上限（約21,333）に収まる 20000 が限界だが、ストリーミングにはその制約が無い
+STREAM_MAX_TOKENS = 32000
+
 SURVEY_EXTRACTION_PROMPT = """あなたは太陽光発電設備の現地調査シート（現調シート）を読み取る専門家です。
 手書きの日本語を高精度で読み取ってください。
 
@@ -300,18 +310,32 @@ def extract_survey_data_multi(
     category: str | None = None,
     use_image_enhancement: bool = True,
     use_self_consistency: bool | None = None,
+    on_section=None,
+    on_progress=None,
 ) -> SurveyData:
     """複数PDFからデータを統合抽出（v2.2 高精度版）
 
     住宅/法人を自動判別し、それぞれ専用プロンプトで抽出。
     画像前処理（傾き補正・コントラスト強化）と後処理バリデーションで精度を最大化。
 
+    on_section を渡すとストリーミングで抽出し、応答JSONのトップレベル項目
+    （project / equipment / high_voltage ...）が閉じるたびに
+    on_section(name, 検証済みセクションdict, warnings) を呼ぶ（画面の先出し表示用）。
+    戻り値は従来どおり応答全体を検証した SurveyData（先出し分は参考表示）。
+
+    on_progress を渡すと段階の境目で on_progress(stage, message) を呼ぶ
+    （stage は "render" / "classify" / "call" / "validate"）。バックグラウンド
+    ジョブの進捗表示と取り消しに使い、ここで送出された例外は抽出を中断する。
+
     Args:
         pdf_paths: PDFファイルパスのリスト
         category: 'commercial' / 'residential' / None（Noneなら自動判別）
         use_image_enhancement: 手書きOCR向け画像前処理を適用するか
         use_self_consistency: 自己一貫性パス（複数回サンプリング多数決）。
                               Noneの場合は環境変数 SURVEY_SELF_CONSISTENCY=1 で有効化
+                              （複数サンプルの多数決のため先出しは行わない）
+        on_section: セクション完成時のコールバック（None なら非ストリーミング）
+        on_progress: 段階の通知コールバック（extraction.jobs の Job.report 等）
 
     Returns:
         SurveyData: 抽出された現調データ
@@ -322,7 +346,12 @@ def extract_survey_data_multi(
     if use_self_consistency is None:
         use_self_consistency = _SELF_CONSISTENCY_ENABLED
 
+    def _progress(stage: str, message: str) -> None:
+        if on_progress is not None:
+            on_progress(stage, message)
+
     # --- ステップ1: PDF→画像変換 ---
+    _progress("render", "PDFを画像に変換しています")
     all_pages = []
     for pdf_path in pdf_paths:
         try:
@@ -353,8 +382,15 @@ def extract_survey_data_multi(
             except Exception as e:
                 logger.warning(f"画像前処理失敗（元画像で続行）: {e}")
 
+    # --- ステップ2.5: 画像予算（余白トリミング・ページ別解像度・合計上限） ---
+    try:
+        all_pages, _budget = apply_image_budget(all_pages, label="survey")
+    except Exception as e:
+        logger.warning(f"画像予算の適用に失敗（元画像で続行）: {e}")
+
     # --- ステップ3: 文書カテゴリ判定（住宅/法人） ---
     if category is None:
+        _progress("classify", "書類タイプを判別しています（住宅 or 法人）")
         try:
             from extraction.document_classifier import classify_documents
             cls = classify_documents(pdf_paths)
@@ -368,7 +404,10 @@ def extract_survey_data_multi(
         category = "commercial"
 
     # --- ステップ4: プロンプト選択 ---
+    # 長い固定プロンプト（ヒューリスティック・few-shot・スキーマ）は system に置いて
+    # プロンプトキャッシュ対象にし、user 側は画像と短い指示だけにする
     prompt = COMMERCIAL_EXTRACTION_PROMPT if category == "commercial" else RESIDENTIAL_EXTRACTION_PROMPT
+    system = cached_system_blocks(prompt)
 
     content = []
     for page in all_pages:
@@ -382,24 +421,28 @@ def extract_survey_data_multi(
         })
     content.append({
         "type": "text",
-        "text": prompt,
+        "text": SURVEY_EXTRACTION_INSTRUCTION,
     })
 
     # --- ステップ5: 抽出（自己一貫性パスの場合は複数回サンプリング） ---
     last_error = None
     last_error_kind = None  # JSONエラー / APIエラー / その他 を記録
 
+    _progress("call", "AIが手書き文字を認識しています")
+
     # 自己一貫性パス: 複数回サンプリングして多数決
     if use_self_consistency:
         try:
             results = []
             for temp in _SELF_CONSISTENCY_TEMPS:
                 try:
-                    r = _call_claude_api(content, attempt=1, temperature=temp)
+                    r = _call_claude_api(content, attempt=1, temperature=temp,
+                                         system=system)
                     results.append(r)
                 except Exception as e:
                     logger.warning(f"self-consistency サンプル失敗 (temp={temp}): {e}")
             if results:
+                _progress("validate", "ドメイン知識で検証・補正しています")
                 merged, sc_confs = merge_extractions(results)
                 logger.info(f"self-consistency: {len(results)}サンプルから多数決")
                 # 後処理バリデーター適用
@@ -417,9 +460,28 @@ def extract_survey_data_multi(
         except Exception as e:
             logger.warning(f"self-consistency失敗、単一パスにフォールバック: {e}")
 
+    emit_section = None
+    if on_section is not None:
+        emitted: set[str] = set()
+
+        def _emit_section(name, value):
+            # リトライ・モデルのフォールバック再送で同じセクションを重ねて先出ししない
+            if name in emitted:
+                return
+            emitted.add(name)
+            # 先出しは同じ規則で検証してから渡す。表示側の失敗で抽出は止めない
+            corrected, section_warnings, _conf = validate_section(name, value)
+            try:
+                on_section(name, corrected, section_warnings)
+            except Exception as e:
+                logger.warning(f"セクション先出しコールバックで例外（抽出は続行）: {e}")
+
+        emit_section = _emit_section
+
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            raw_data = _call_claude_api(content, attempt)
+            raw_data = _call_claude_api(content, attempt, system=system, on_section=emit_section)
+            _progress("validate", "ドメイン知識で検証・補正しています")
             # 後処理バリデーター適用
             raw_data, validator_warnings, validator_confs = validate_and_correct(raw_data)
             survey = _parse_raw_data(raw_data)
@@ -490,7 +552,8 @@ def extract_survey_data_multi(
     )
 
 
-def _call_claude_api(content: list[dict], attempt: int, temperature: float = 0.0) -> dict:
+def _call_claude_api(content: list[dict], attempt: int, temperature: float = 0.0,
+                     system=None, on_section=None) -> dict:
     """Claude Vision APIを呼び出してJSONレスポンスを返す
 
     モデルは config.CLAUDE_VISION_MODEL（2026-08-10 から claude-fable-5 を試験導入）。
@@ -503,9 +566,27 @@ def _call_claude_api(content: list[dict], attempt: int, temperature: float = 0.0
     - 自己一貫性パス時のみ temperature を上げて多様性を出す
     - 前置きやコードフェンス混じりの応答は _extract_json 側で除去する
       （Sonnet 4.6 以降は assistant プリフィルが 400 になるため使用しない）
+    - system に固定プロンプト（cached_system_blocks）を渡すとキャッシュ対象になる
+    - on_section(name, value) を渡すとストリーミングで受信し、トップレベル項目が
+      閉じるたびに呼ぶ（値は未検証の生 dict）。最終的なパースは応答全体で行う
     """
-    client = anthropic.Anthropic(api_key=get_api_key())
-    response = _create_vision_message(client, content, temperature)
+    client = api_replay.client(
+        lambda: api_client.shared_client(anthropic, get_api_key), "survey")
+    stream_handler = None
+    if on_section is not None:
+        parser = IncrementalJSONParser()
+
+        def _on_text(chunk):
+            if chunk is None:  # 新しい応答の開始（モデルのフォールバック再送）
+                parser.reset()
+                return
+            for name, value in parser.feed(chunk):
+                on_section(name, value)
+
+        stream_handler = _on_text
+
+    response = _create_vision_message(client, content, temperature, system=system,
+                                      on_text=stream_handler)
 
     # レスポンスからJSONを抽出
     response_text = _first_text_block(response)
@@ -525,7 +606,7 @@ _NO_TEMPERATURE_MODEL_PREFIXES = (
 
 
 def _create_vision_message(client, content: list[dict], temperature: float,
-                           system: str = None):
+                           system=None, on_text=None):
     """CLAUDE_VISION_MODEL で Vision リクエストを送る。
 
     Fable が利用できない環境（組織のデータ保持設定による 400、
@@ -535,7 +616,7 @@ def _create_vision_message(client, content: list[dict], temperature: float,
     """
     try:
         response = _send_vision_request(
-            client, CLAUDE_VISION_MODEL, content, temperature, system)
+            client, CLAUDE_VISION_MODEL, content, temperature, system, on_text)
         if getattr(response, "stop_reason", None) == "refusal":
             raise ValueError(
                 f"{CLAUDE_VISION_MODEL} の安全分類器により応答が拒否されました")
@@ -557,12 +638,17 @@ def _create_vision_message(client, content: list[dict], temperature: float,
             "画像読み取りモデル %s が利用できないため %s にフォールバックします: %s",
             CLAUDE_VISION_MODEL, CLAUDE_MODEL, e)
         return _send_vision_request(
-            client, CLAUDE_MODEL, content, temperature, system)
+            client, CLAUDE_MODEL, content, temperature, system, on_text)
 
 
 def _send_vision_request(client, model: str, content: list[dict],
-                         temperature: float, system: str = None):
-    """モデルごとのAPI仕様差を吸収して messages.create を呼ぶ。"""
+                         temperature: float, system=None, on_text=None):
+    """モデルごとのAPI仕様差を吸収して messages.create を呼ぶ。
+
+    system は文字列、または cache_control 付きブロックのリスト（そのまま渡す）。
+    on_text を渡すと messages.stream で受信し、本文テキストの差分ごとに
+    on_text(chunk) を呼ぶ（開始時に on_text(None)）。戻り値はどちらも最終 Message。
+    """
     kwargs = {
         "model": model,
         "messages": [{"role": "user", "content": content}],
@@ -577,7 +663,18 @@ def _send_vision_request(client, model: str, content: list[dict],
     else:
         kwargs["max_tokens"] = 8192
         kwargs["temperature"] = temperature
-    return client.messages.create(**kwargs)
+    if on_text is None:
+        response = client.messages.create(**kwargs)
+    else:
+        if model.startswith(_NO_TEMPERATURE_MODEL_PREFIXES):
+            kwargs["max_tokens"] = STREAM_MAX_TOKENS
+        on_text(None)
+        with client.messages.stream(**kwargs) as stream:
+            for chunk in stream.text_stream:
+                on_text(chunk)
+            response = stream.get_final_message()
+    log_cache_usage(response, model)
+    return response
 
 
 def _first_text_block(response) -> str:
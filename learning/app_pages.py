@@ -561,6 +561,13 @@ def render_step2_review():
                 except Exception as e:
                     st.error(f"⚠️ 学習ルールの保存に失敗しました: {e}")
                     return
+                if kind == "drawing":
+                    # 屋根種別ごとの集計（中央値・支持件数）を逐次更新。失敗してもルールは保存済み
+                    try:
+                        from learning.drawing_stats import record_approved_rules
+                        record_approved_rules(approved_rules)
+                    except Exception as e:
+                        st.warning(f"⚠️ 図面学習の集計更新に失敗しました（ルールは保存済み）: {e}")
                 st.session_state.learning_saved_count = len(approved_rules)
                 _clear_diff_checkbox_state()
                 st.session_state.step = 3
@@ -9,6 +9,10 @@ DraftingSpec に反映する（docs/LEARNING_LOOP_DESIGN.md §13）。
   （drafting/models.py の PanelSpec / RoofFace の初期値と対）。
   ユーザーが確認フォームで変えた値（既定値以外）には触れない。
 
+学習値は learning/drawing_stats の集計（屋根種別ごとの中央値・最頻の向き）が
+MIN_SUPPORT 件以上あればそれを使い、無ければルールの値（最新の承認）を使う。
+集計は承認時に逐次更新済みのため、ここでは履歴を再走査しない。
+
 呼び出し側（drafting/app_pages._generate_drawing）は try/except で保護されるが、
 本モジュール内でもストア読込失敗を握り、製図フローを止めない。
 """
@@ -16,6 +20,7 @@ import logging
 
 from drafting.models import Orientation, RoofType
 from learning import store
+from learning.drawing_stats import aggregated_value, load_stats_index
 
 logger = logging.getLogger(__name__)
 
@@ -59,6 +64,19 @@ def _roof_label(roof_type: str) -> str:
     return RoofType.LABEL.get(roof_type, roof_type)
 
 
+def _support_note(count: int) -> str:
+    """適用説明の末尾（集計値なら支持図面件数を添える）。"""
+    return f"（学習値・図面{count}件の集計）" if count else "（学習値）"
+
+
+def _resolve(stats: dict, field: str, roof_type: str, fallback):
+    """集計値があればそれを、無ければルールの値を返す。(value, 支持件数 or 0)。"""
+    value, count = aggregated_value(stats, field, roof_type)
+    if value is not None:
+        return value, count
+    return fallback, 0
+
+
 def apply_learned_drawing_rules(spec):
     """有効な学習済み図面ルールを spec に適用する（破壊的変更OK）。
 
@@ -77,6 +95,7 @@ def apply_learned_drawing_rules(spec):
     except Exception as e:
         logger.warning("学習済み図面ルールの読込に失敗（適用をスキップ）: %s", e)
         return spec, messages
+    stats = load_stats_index() if rules else {}
 
     faces = [f for f in (getattr(spec, "roof_faces", None) or []) if f is not None]
     face_types = {getattr(f, "roof_type", "") for f in faces}
@@ -92,22 +111,26 @@ def apply_learned_drawing_rules(spec):
                 if roof_type != "*" and roof_type not in face_types:
                     continue
                 parts = []
-                gl = payload.get("gap_long_mm")
+                gl, n_gl = _resolve(stats, "gap_long_mm", roof_type,
+                                    payload.get("gap_long_mm"))
                 if gl is not None and _is_default(spec.panel.gap_long_mm, DEFAULT_GAP_LONG_MM) \
                         and _differs(gl, spec.panel.gap_long_mm):
                     parts.append(f"縦 {_fmt_mm(spec.panel.gap_long_mm)}→{_fmt_mm(gl)}mm")
                     spec.panel.gap_long_mm = float(gl)
-                gs = payload.get("gap_short_mm")
+                gs, n_gs = _resolve(stats, "gap_short_mm", roof_type,
+                                    payload.get("gap_short_mm"))
                 if gs is not None and _is_default(spec.panel.gap_short_mm, DEFAULT_GAP_SHORT_MM) \
                         and _differs(gs, spec.panel.gap_short_mm):
                     parts.append(f"横 {_fmt_mm(spec.panel.gap_short_mm)}→{_fmt_mm(gs)}mm")
                     spec.panel.gap_short_mm = float(gs)
                 if parts:
                     messages.append(
-                        f"{_roof_label(roof_type)}のパネル間隔 {'・'.join(parts)}（学習値）")
+                        f"{_roof_label(roof_type)}のパネル間隔 {'・'.join(parts)}"
+                        f"{_support_note(max(n_gl, n_gs))}")
 
             elif kind == "margin_override":
-                new_margin = payload.get("margin_mm")
+                new_margin, n_support = _resolve(stats, "margin_mm", roof_type,
+                                                 payload.get("margin_mm"))
                 if new_margin is None:
                     continue
                 applied = False
@@ -121,10 +144,12 @@ def apply_learned_drawing_rules(spec):
                 if applied:
                     messages.append(
                         f"{_roof_label(roof_type)}のマージン "
-                        f"{_fmt_mm(DEFAULT_MARGIN_MM)}→{_fmt_mm(new_margin)}mm（学習値）")
+                        f"{_fmt_mm(DEFAULT_MARGIN_MM)}→{_fmt_mm(new_margin)}mm"
+                        f"{_support_note(n_support)}")
 
             elif kind == "orientation_preference":
-                new_ori = payload.get("orientation", "")
+                new_ori, n_support = _resolve(stats, "orientation", roof_type,
+                                              payload.get("orientation", ""))
                 if new_ori not in (Orientation.PORTRAIT, Orientation.LANDSCAPE):
                     continue
                 applied = False
@@ -137,7 +162,8 @@ def apply_learned_drawing_rules(spec):
                 if applied:
                     messages.append(
                         f"{_roof_label(roof_type)}のパネル向き "
-                        f"自動→{Orientation.LABEL.get(new_ori, new_ori)}（学習値）")
+                        f"自動→{Orientation.LABEL.get(new_ori, new_ori)}"
+                        f"{_support_note(n_support)}")
 
             # golden_example は spec には適用しない（spec_extractor の few-shot 用）
         except Exception as e:
@@ -151,7 +177,7 @@ def apply_learned_drawing_rules(spec):
 def learned_golden_examples(limit: int = 2) -> list:
     """有効な golden_example ルールの payload（{name, spec}）を新しい順に返す。
 
-    spec_extractor.build_user_prompt の few-shot 注入用。プロンプト肥大を防ぐため
+    spec_extractor.build_system_prompt の few-shot 注入用。プロンプト肥大を防ぐため
     呼び出し側は limit=2 を既定とする。ストア読込失敗時は []（本体を止めない）。
     """
     try:
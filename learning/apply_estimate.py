@@ -20,12 +20,19 @@ pricing/knowledge_base.load_pricing_rules() の末尾から呼ばれるため、
   場合は適用せず警告ログのみ（誤爆で同名全項目を書き換え/削除する事故防止）。
 - item_add: 対象カテゴリのリスト末尾に fixed 項目として追加。
 - 入力 rules は deepcopy してから変更（YAMLロード結果の破壊防止）。
+- 有効ルール集合はルール内容（store.rules_version）ごとに1回だけ
+  (反映先リスト, 正規化摘要) の索引へコンパイルし、適用時は pricing rules の
+  各リストを1パスで索引してから適用順どおりに処理する（ルール数×項目数の
+  総当たりをしない）。直近の所要時間は learned_rules_summary()["timing"]。
 
 呼び出し側（pricing/knowledge_base.load_pricing_rules）は try/except で保護されるが、
 本モジュール内でもストア読込失敗・個別ルールの不備を握り、見積生成を止めない。
 """
 import copy
 import logging
+import time
+from dataclasses import dataclass, field
+from typing import Optional
 
 from learning import store
 from learning.estimate_diff import normalize_desc
@@ -68,6 +75,12 @@ _FIXED_STRUCTURE_LISTS = ("supplied_items", "material_items",
 # 適用しない（basis_quantity_unit を持たない旧形式ルールへの防御）。
 PANEL_RATE_MAX_UNIT_PRICE = 100_000
 
+# コンパイル済みルール集合（プロセス内キャッシュ。store.rules_version で無効化）
+_COMPILED = None
+
+# 直近の apply_learned_rules の計測値（learned_rules_summary で公開）
+_LAST_APPLY: dict = {}
+
 
 # =============================================================
 # 内部ユーティリティ
@@ -92,36 +105,191 @@ def _narrow_candidates(candidates: list, rule: dict) -> list:
     複合照合。match_remarks（正規化備考）があれば備考一致で絞り、無ければ
     （旧形式ルール互換）現単価 == payload.old_unit_price の項目に絞る。
     どちらも無いルールは絞り込みなし（呼び出し側の件数ガードのみ）。
+    candidates は _ItemIndex の (項目, 正規化備考) のリスト。
     """
     match_remarks = rule.get("match_remarks") or ""
     payload = rule.get("payload", {}) or {}
     old_price = payload.get("old_unit_price")
     if match_remarks:
-        return [it for it in candidates
-                if normalize_desc(str(it.get("remarks", ""))) == match_remarks]
+        return [c for c in candidates if c[1] == match_remarks]
     if old_price is not None:
-        return [it for it in candidates if it.get("unit_price") == old_price]
+        return [c for c in candidates if c[0].get("unit_price") == old_price]
     return candidates
 
 
-def _apply_price_override(rules: dict, rule: dict) -> None:
+@dataclass
+class _CompiledOp:
+    """コンパイル済みルール1件（適用順はストアの並び順のまま）。"""
+    kind: str
+    rule: dict
+    list_names: list
+    match_desc: str
+    new_price: Optional[int] = None
+
+
+@dataclass
+class _CompiledRules:
+    """有効ルール集合のコンパイル結果（store.rules_version 単位でキャッシュ）。
+
+    keys は (反映先リスト名, 正規化摘要) の集合。_ItemIndex はこのキーに
+    該当する項目だけを索引し、正規化備考は索引時に1回だけ計算する。
+    """
+    version: str
+    ops: list = field(default_factory=list)
+    keys: frozenset = frozenset()
+    compile_ms: float = 0.0
+
+
+class _ItemIndex:
+    """pricing rules のリストを1パスで走査して作る (リスト名, 正規化摘要) 索引。
+
+    ルール数 × 項目数の総当たりを避けるため、各項目の摘要・備考の正規化は
+    ここで1回だけ行う。削除は removed に記録し、finalize で1回だけリストを
+    作り直す（適用途中の項目追加・削除も索引に反映し、逐次適用と同じ結果にする）。
+    """
+
+    def __init__(self, rules: dict, keys: frozenset):
+        self.rules = rules
+        self.keys = keys
+        self.buckets: dict = {}
+        self.removed: set = set()
+        self.dirty: set = set()
+        self.scanned = 0
+        for list_name in {k[0] for k in keys}:
+            for item in rules.get(list_name) or []:
+                if not isinstance(item, dict):
+                    continue
+                self.scanned += 1
+                self._put(list_name, item)
+
+    def _put(self, list_name: str, item: dict) -> None:
+        key = (list_name, normalize_desc(str(item.get("description", ""))))
+        if key in self.keys:
+            self.buckets.setdefault(key, []).append(
+                (item, normalize_desc(str(item.get("remarks", "")))))
+
+    def candidates(self, list_name: str, match_desc: str) -> list:
+        return list(self.buckets.get((list_name, match_desc), []))
+
+    def remove(self, list_name: str, match_desc: str, item: dict) -> None:
+        key = (list_name, match_desc)
+        self.buckets[key] = [c for c in self.buckets.get(key, []) if c[0] is not item]
+        self.removed.add(id(item))
+        self.dirty.add(list_name)
+
+    def append(self, list_name: str, item: dict) -> None:
+        self.rules[list_name].append(item)
+        self._put(list_name, item)
+
+    def live_items(self, list_name: str) -> list:
+        return [it for it in self.rules.get(list_name) or []
+                if isinstance(it, dict) and id(it) not in self.removed]
+
+    def finalize(self) -> None:
+        for list_name in self.dirty:
+            self.rules[list_name] = [
+                it for it in self.rules.get(list_name) or []
+                if id(it) not in self.removed]
+
+
+def _compile_rules(learned: list, version: str) -> _CompiledRules:
+    """有効ルールを _CompiledOp 列に変換する。
+
+    適用できないルール（照合キー欠落・支給品/材料費の構成変更・カテゴリ不明の
+    item_add）はここで落とす。ログはコンパイル時の1回だけ出る。
+    """
+    started = time.perf_counter()
+    ops, keys = [], set()
+    for rule in learned:
+        try:
+            op = _compile_one(rule)
+        except Exception as e:
+            # 1ルールの不備で他ルールの適用・見積生成を止めない
+            logger.warning("学習ルールの適用に失敗（id=%s）: %s", rule.get("id", "?"), e)
+            continue
+        if op is None:
+            continue
+        ops.append(op)
+        keys.update((name, op.match_desc) for name in op.list_names)
+    return _CompiledRules(
+        version=version, ops=ops, keys=frozenset(keys),
+        compile_ms=round((time.perf_counter() - started) * 1000, 3))
+
+
+def _compile_one(rule: dict) -> Optional[_CompiledOp]:
+    kind = rule.get("kind", "")
+    payload = rule.get("payload", {}) or {}
+    if kind == "unit_price_override":
+        new_price = payload.get("unit_price")
+        match_desc = rule.get("match_description", "")
+        if new_price is None or not match_desc:
+            return None
+        return _CompiledOp(kind, rule, _target_list_names(rule.get("category", "")),
+                           match_desc, new_price=int(new_price))
+
+    if kind == "item_suppress":
+        match_desc = rule.get("match_description", "")
+        if not match_desc:
+            return None
+        if rule.get("category", "") in FIXED_STRUCTURE_CATEGORIES:
+            logger.info(
+                "item_suppress は支給品・材料費には適用しません（項目構成は学習で"
+                "変更しない方針。id=%s, 摘要=%r）",
+                rule.get("id", "?"), rule.get("display_description") or match_desc)
+            return None
+        # カテゴリ不明ルールの全リスト適用からも支給品・材料費は除外
+        list_names = [name for name in _target_list_names(rule.get("category", ""))
+                      if name not in _FIXED_STRUCTURE_LISTS]
+        return _CompiledOp(kind, rule, list_names, match_desc)
+
+    if kind == "item_add":
+        category = payload.get("category") or rule.get("category", "")
+        if category in FIXED_STRUCTURE_CATEGORIES:
+            logger.info(
+                "item_add は支給品・材料費には適用しません（項目構成は学習で"
+                "変更しない方針。id=%s, 摘要=%r）",
+                rule.get("id", "?"),
+                payload.get("description") or rule.get("display_description", ""))
+            return None
+        list_name = CATEGORY_TO_LIST.get(category)
+        if not list_name:
+            # 追加先を特定できない item_add は適用しない（安全側）
+            logger.warning("item_add のカテゴリが不明のため適用しません（id=%s, category=%r）",
+                           rule.get("id", "?"), category)
+            return None
+        description = payload.get("description") or rule.get("display_description", "")
+        if not description:
+            return None
+        return _CompiledOp(kind, rule, [list_name], normalize_desc(description))
+
+    return None  # 未知の kind は無視（前方互換）
+
+
+def _get_compiled(learned: list) -> tuple:
+    """ルール集合のコンパイル結果を返す（内容が同じならキャッシュを再利用）。
+
+    Returns:
+        (_CompiledRules, cache_hit)
+    """
+    global _COMPILED
+    version = store.rules_version(learned)
+    if _COMPILED is not None and _COMPILED.version == version:
+        return _COMPILED, True
+    _COMPILED = _compile_rules(learned, version)
+    return _COMPILED, False
+
+
+def _apply_price_override(index: _ItemIndex, op: _CompiledOp) -> None:
     """unit_price_override: 複合照合で特定した1項目の単価を学習値に差し替える。
 
     摘要のみの照合では備考違いの同名項目を全て上書きしてしまうため、
     _narrow_candidates で絞った上、なお2件以上一致する場合は適用しない（安全側）。
     """
-    payload = rule.get("payload", {}) or {}
-    new_price = payload.get("unit_price")
-    match_desc = rule.get("match_description", "")
-    if new_price is None or not match_desc:
-        return
-    new_price = int(new_price)
-
-    for list_name in _target_list_names(rule.get("category", "")):
+    rule, match_desc, new_price = op.rule, op.match_desc, op.new_price
+    for list_name in op.list_names:
         candidates = [
-            it for it in (rules.get(list_name) or [])
-            if it.get("pricing_method") != "lump_formula"  # unit_price 不使用
-            and normalize_desc(str(it.get("description", ""))) == match_desc
+            c for c in index.candidates(list_name, match_desc)
+            if c[0].get("pricing_method") != "lump_formula"  # unit_price 不使用
         ]
         candidates = _narrow_candidates(candidates, rule)
         if len(candidates) > 1:
@@ -131,7 +299,7 @@ def _apply_price_override(rules: dict, rule: dict) -> None:
                 len(candidates), rule.get("id", "?"), list_name,
                 rule.get("display_description") or match_desc)
             continue
-        for item in candidates:  # 0件 or 1件
+        for item, _ in candidates:  # 0件 or 1件
             # panel_rate（枚数連動）項目は unit_price が「1枚あたり単価」。
             # 別単位（式等）で学習された単価や桁違いの値を掛けると金額が
             # 枚数倍に暴発するため、単位不一致・上限超過のルールは適用しない。
@@ -170,32 +338,15 @@ def _apply_price_override(rules: dict, rule: dict) -> None:
                             f"（学習補正: {old_disp}→¥{new_price:,}）")
 
 
-def _apply_suppress(rules: dict, rule: dict) -> None:
+def _apply_suppress(index: _ItemIndex, op: _CompiledOp) -> None:
     """item_suppress: 複合照合で特定した1項目をリストから除去する。
 
     摘要のみの照合では備考違いの同名項目を全て削除してしまうため、
     _narrow_candidates で絞った上、なお2件以上一致する場合は適用しない（安全側）。
     """
-    match_desc = rule.get("match_description", "")
-    if not match_desc:
-        return
-    if rule.get("category", "") in FIXED_STRUCTURE_CATEGORIES:
-        logger.info(
-            "item_suppress は支給品・材料費には適用しません（項目構成は学習で"
-            "変更しない方針。id=%s, 摘要=%r）",
-            rule.get("id", "?"), rule.get("display_description") or match_desc)
-        return
-    for list_name in _target_list_names(rule.get("category", "")):
-        if list_name in _FIXED_STRUCTURE_LISTS:
-            continue  # カテゴリ不明ルールの全リスト適用からも支給品・材料費は除外
-        lst = rules.get(list_name)
-        if not lst:
-            continue
-        candidates = [
-            it for it in lst
-            if normalize_desc(str(it.get("description", ""))) == match_desc
-        ]
-        candidates = _narrow_candidates(candidates, rule)
+    rule, match_desc = op.rule, op.match_desc
+    for list_name in op.list_names:
+        candidates = _narrow_candidates(index.candidates(list_name, match_desc), rule)
         if not candidates:
             continue
         if len(candidates) > 1:
@@ -205,39 +356,21 @@ def _apply_suppress(rules: dict, rule: dict) -> None:
                 len(candidates), rule.get("id", "?"), list_name,
                 rule.get("display_description") or match_desc)
             continue
-        target = candidates[0]
-        rules[list_name] = [it for it in lst if it is not target]
+        index.remove(list_name, match_desc, candidates[0][0])
 
 
-def _apply_add(rules: dict, rule: dict) -> None:
+def _apply_add(index: _ItemIndex, op: _CompiledOp) -> None:
     """item_add: 対象カテゴリのリスト末尾に fixed 項目を追加する。"""
+    rule = op.rule
     payload = rule.get("payload", {}) or {}
-    category = payload.get("category") or rule.get("category", "")
-    if category in FIXED_STRUCTURE_CATEGORIES:
-        logger.info(
-            "item_add は支給品・材料費には適用しません（項目構成は学習で"
-            "変更しない方針。id=%s, 摘要=%r）",
-            rule.get("id", "?"),
-            payload.get("description") or rule.get("display_description", ""))
-        return
-    list_name = CATEGORY_TO_LIST.get(category)
-    if not list_name:
-        # 追加先を特定できない item_add は適用しない（安全側）
-        logger.warning("item_add のカテゴリが不明のため適用しません（id=%s, category=%r）",
-                       rule.get("id", "?"), category)
-        return
-
+    list_name = op.list_names[0]
     description = payload.get("description") or rule.get("display_description", "")
-    if not description:
-        return
 
-    lst = rules.get(list_name)
-    if not isinstance(lst, list):
-        lst = rules[list_name] = []
+    if not isinstance(index.rules.get(list_name), list):
+        index.rules[list_name] = []
 
     # 既に同名項目がある場合は二重追加しない（防御）
-    match_desc = normalize_desc(description)
-    if any(normalize_desc(str(it.get("description", ""))) == match_desc for it in lst):
+    if index.candidates(list_name, op.match_desc):
         return
 
     # 数量は数値で持つ（pricing_engine._resolve_quantity は数値も受け付ける）
@@ -246,11 +379,11 @@ def _apply_add(rules: dict, rule: dict) -> None:
     if quantity == int(quantity):
         quantity = int(quantity)
 
-    max_no = max((int(it.get("no", 0)) for it in lst), default=0)
+    max_no = max((int(it.get("no", 0)) for it in index.live_items(list_name)), default=0)
     evidence = rule.get("evidence") or {}
     project = evidence.get("project_name") or evidence.get("file_name") or "学習データ"
 
-    lst.append({
+    index.append(list_name, {
         "no": max_no + 1,
         "description": description,
         "remarks": payload.get("remarks", "") or "",
@@ -262,6 +395,13 @@ def _apply_add(rules: dict, rule: dict) -> None:
     })
 
 
+_APPLIERS = {
+    "unit_price_override": _apply_price_override,
+    "item_suppress": _apply_suppress,
+    "item_add": _apply_add,
+}
+
+
 # =============================================================
 # 公開関数
 # =============================================================
@@ -269,6 +409,10 @@ def _apply_add(rules: dict, rule: dict) -> None:
 def apply_learned_rules(rules: dict) -> dict:
     """有効な学習済み見積ルールを pricing rules に適用して返す。
 
+    有効ルール集合は内容（store.rules_version）ごとに1回だけコンパイルし、
+    pricing rules の各リストは1パスで索引してから適用する。
+    所要時間は learned_rules_summary()["timing"] で確認できる。
+
     Args:
         rules: pricing_rules.yaml のロード結果 dict。
 
@@ -276,6 +420,7 @@ def apply_learned_rules(rules: dict) -> dict:
         学習ルール適用済みの dict（deepcopy。入力は変更しない）。
         学習ルールが無い/読込失敗の場合は入力をそのまま返す。
     """
+    started = time.perf_counter()
     try:
         learned = store.enabled_rules("estimate")
     except Exception as e:
@@ -284,21 +429,26 @@ def apply_learned_rules(rules: dict) -> dict:
     if not learned or not isinstance(rules, dict):
         return rules
 
+    compiled, cache_hit = _get_compiled(learned)
     rules = copy.deepcopy(rules)
-    for rule in learned:
+    index = _ItemIndex(rules, compiled.keys)
+    for op in compiled.ops:
         try:
-            kind = rule.get("kind", "")
-            if kind == "unit_price_override":
-                _apply_price_override(rules, rule)
-            elif kind == "item_suppress":
-                _apply_suppress(rules, rule)
-            elif kind == "item_add":
-                _apply_add(rules, rule)
-            # 未知の kind は無視（前方互換）
+            _APPLIERS[op.kind](index, op)
         except Exception as e:
             # 1ルールの不備で他ルールの適用・見積生成を止めない
-            logger.warning("学習ルールの適用に失敗（id=%s）: %s", rule.get("id", "?"), e)
+            logger.warning("学習ルールの適用に失敗（id=%s）: %s", op.rule.get("id", "?"), e)
             continue
+    index.finalize()
+
+    _LAST_APPLY.clear()
+    _LAST_APPLY.update({
+        "rules": len(compiled.ops),
+        "items_scanned": index.scanned,
+        "compile_ms": 0.0 if cache_hit else compiled.compile_ms,
+        "apply_ms": round((time.perf_counter() - started) * 1000, 3),
+        "cache_hit": cache_hit,
+    })
     return rules
 
 
@@ -306,9 +456,13 @@ def learned_rules_summary() -> dict:
     """UI表示用の学習済みルール件数サマリ（有効ルールのみ）。
 
     Returns:
-        {"total": 有効件数, "price": 単価上書き, "add": 項目追加, "suppress": 項目抑止}
+        {"total": 有効件数, "price": 単価上書き, "add": 項目追加, "suppress": 項目抑止,
+         "timing": 直近の apply_learned_rules の計測値（未実行なら {}）}
+        timing のキー: rules（適用対象ルール数）/ items_scanned / compile_ms /
+        apply_ms（読込・コンパイル込みの全体）/ cache_hit
     """
-    summary = {"total": 0, "price": 0, "add": 0, "suppress": 0}
+    summary = {"total": 0, "price": 0, "add": 0, "suppress": 0,
+               "timing": dict(_LAST_APPLY)}
     try:
         rules = store.enabled_rules("estimate")
     except Exception as e:
@@ -0,0 +1,346 @@
+"""見積の一括学習（保存履歴 × 正規CSVフォルダ）
+
+学習センターの1件ずつの差分学習（app_pages._run_estimate_diff）を、過去の
+数百件規模の履歴に対してまとめて回すバッチジョブ。
+
+フロー:
+  1) pair_history_with_csvs: 見積履歴（list_estimate_history）と正規CSVを見積IDで対応付け
+  2) iter_batch_learning: 各ペアを parse_estimate_csv + diff_estimates にかける
+     （ProcessPoolExecutor で並列化し、1ペア完了ごとに BatchProgress を yield）
+  3) aggregate_proposals: 案件をまたいで proposed_rule を store._dedup_key 単位で集約し、
+     支持案件数・単価分布・一貫性からスコアを付けた RuleCandidate を降順に並べる
+  4) save_candidates: 人が選んだ候補だけを store.add_rules に1回で保存
+
+設計方針:
+- 差分の判定ロジックは diff_estimates をそのまま使う（学習可否の判断を二重実装しない）。
+- ペアごとに Supabase へ往復しない。履歴の payload は
+  history.load_estimate_history_payloads でまとめて読み、ワーカーには dict で渡す。
+  ルール保存も最後に1回だけ（add_rules はその都度全件を読み書きするため）。
+- 単価上書きの候補は各案件の学習単価の中央値を採用する（外れ値1件に引っ張られない）。
+"""
+from __future__ import annotations
+
+import csv
+import io
+import logging
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Union
+
+from learning import history, store
+from learning.models import BatchLearningReport, RuleCandidate
+
+logger = logging.getLogger(__name__)
+
+# 並列ワーカー数の既定値（CSVパース・差分は軽いCPU処理。Streamlit Cloud の
+# 小さなコンテナでも詰まらない程度に抑える）
+DEFAULT_MAX_WORKERS = 4
+
+# 候補として残す最小支持案件数の既定値
+DEFAULT_MIN_SUPPORT = 2
+
+
+@dataclass
+class BatchPair:
+    """一括学習の1ペア（AI見積履歴 + 正規CSV）。"""
+    history_path: str
+    csv_path: str
+    estimate_id: str = ""
+    label: str = ""
+
+
+@dataclass
+class BatchProgress:
+    """iter_batch_learning が1ペア完了ごとに返す進捗イベント。"""
+    done: int
+    total: int
+    label: str
+    ok: bool
+    error: str = ""
+    diffs: list = field(default_factory=list)  # EstimateDiffItem の dict
+
+
+# =============================================================
+# 1) ペアリング
+# =============================================================
+
+def _csv_estimate_id(path: Path) -> str:
+    """CSVの「見積ID」行（detailed形式）を読む。無ければ ""。"""
+    try:
+        text = path.read_bytes().decode("utf-8-sig", errors="replace")
+        for row in csv.reader(io.StringIO(text)):
+            if len(row) > 1 and row[0].strip() == "見積ID":
+                return row[1].strip()
+    except Exception as e:
+        logger.warning("CSVの見積ID読込に失敗（%s）: %s", path.name, e)
+    return ""
+
+
+def pair_history_with_csvs(csv_dir: Union[str, Path],
+                           entries: Optional[list] = None) -> tuple:
+    """見積履歴と正規CSVフォルダを見積IDで対応付ける。
+
+    CSVの見積IDは detailed形式の「見積ID」行、無ければファイル名に
+    履歴の見積IDが含まれるかで判定する。同じ見積IDの履歴が複数ある場合は
+    最新（list_estimate_history の先頭）を採用する。
+
+    Args:
+        csv_dir: 正規見積CSVを置いたフォルダ
+        entries: list_estimate_history() の結果（省略時はここで取得）
+
+    Returns:
+        (pairs, unmatched_csv_names)
+    """
+    if entries is None:
+        entries = history.list_estimate_history()
+    latest_by_id: dict = {}
+    for entry in entries:
+        eid = str(entry.get("estimate_id") or "").strip()
+        if eid and eid not in latest_by_id:
+            latest_by_id[eid] = entry
+
+    pairs, unmatched = [], []
+    for csv_path in sorted(Path(csv_dir).glob("*.csv")):
+        eid = _csv_estimate_id(csv_path)
+        if eid not in latest_by_id:
+            eid = next((k for k in latest_by_id if k in csv_path.stem), "")
+        entry = latest_by_id.get(eid)
+        if entry is None:
+            unmatched.append(csv_path.name)
+            continue
+        pairs.append(BatchPair(
+            history_path=str(entry["path"]),
+            csv_path=str(csv_path),
+            estimate_id=eid,
+            label=entry.get("project_name") or csv_path.stem,
+        ))
+    return pairs, unmatched
+
+
+# =============================================================
+# 2) 差分抽出（プロセスプール）
+# =============================================================
+
+def _diff_pair(history_payload: dict, csv_bytes: bytes, csv_name: str,
+               history_name: str) -> list:
+    """ワーカー側: 1ペアを差分抽出して EstimateDiffItem の dict リストを返す。
+
+    プロセス間で受け渡すため引数・戻り値はすべて pickle 可能な素の値にする。
+    """
+    from learning.estimate_diff import diff_estimates
+    from learning.estimate_parser import parse_estimate_csv
+    from models.estimate_data import EstimateData
+
+    estimate = EstimateData.model_validate(history_payload.get("estimate", {}))
+    ai_parsed = history.estimate_to_parsed(estimate, file_name=history_name)
+    official = parse_estimate_csv(csv_bytes, source="official", file_name=csv_name)
+    return [d.model_dump() for d in diff_estimates(ai_parsed, official)]
+
+
+def iter_batch_learning(pairs: list,
+                        max_workers: int = DEFAULT_MAX_WORKERS) -> Iterator[BatchProgress]:
+    """各ペアの差分を抽出し、完了順に BatchProgress を yield する（ストリーミング進捗）。
+
+    max_workers <= 1 のときはプロセスを立てずに順次実行する（テスト・小規模用）。
+    1ペアの失敗は ok=False のイベントとして返し、残りの処理は続ける。
+    """
+    total = len(pairs)
+    payloads = history.load_estimate_history_payloads([p.history_path for p in pairs])
+
+    def _args(pair: BatchPair):
+        payload = payloads.get(pair.history_path)
+        if payload is None:
+            raise RuntimeError("見積履歴を読み込めませんでした")
+        return (payload, Path(pair.csv_path).read_bytes(),
+                Path(pair.csv_path).name, Path(pair.history_path).name)
+
+    done = 0
+    if max_workers <= 1:
+        for pair in pairs:
+            done += 1
+            try:
+                diffs = _diff_pair(*_args(pair))
+            except Exception as e:
+                yield BatchProgress(done, total, pair.label, ok=False, error=str(e))
+                continue
+            yield BatchProgress(done, total, pair.label, ok=True, diffs=diffs)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+        for pair in pairs:
+            try:
+                futures[pool.submit(_diff_pair, *_args(pair))] = pair
+            except Exception as e:
+                done += 1
+                yield BatchProgress(done, total, pair.label, ok=False, error=str(e))
+        for future in as_completed(futures):
+            pair = futures[future]
+            done += 1
+            try:
+                diffs = future.result()
+            except Exception as e:
+                yield BatchProgress(done, total, pair.label, ok=False, error=str(e))
+                continue
+            yield BatchProgress(done, total, pair.label, ok=True, diffs=diffs)
+
+
+# =============================================================
+# 3) 集約・ランキング
+# =============================================================
+
+def _payload_key(rule: dict) -> tuple:
+    """提案内容の一致判定用キー（payload を比較可能なタプルに）。"""
+    payload = rule.get("payload", {}) or {}
+    return tuple(sorted((k, str(v)) for k, v in payload.items()))
+
+
+def aggregate_proposals(diff_lists: list, processed_pairs: int,
+                        min_support: int = DEFAULT_MIN_SUPPORT) -> list:
+    """案件ごとの差分を store._dedup_key 単位で集約し、RuleCandidate を降順で返す。
+
+    score = 支持率 × 一貫性。単価上書きは支持案件の学習単価の中央値を
+    proposed_rule に採用し、最小・最大・平均も候補に載せる。
+    同一案件内の同キー重複は diff_estimates 側で参考表示に落ちているため、
+    ここでの support はそのまま案件数になる。
+    """
+    groups: dict = {}
+    for diffs in diff_lists:
+        for d in diffs:
+            rule = d.get("proposed_rule")
+            if not d.get("learnable") or not rule:
+                continue
+            groups.setdefault(store._dedup_key(rule), []).append(rule)
+
+    candidates = []
+    for rules in groups.values():
+        support = len(rules)
+        if support < min_support:
+            continue
+        modal_key, modal_count = Counter(_payload_key(r) for r in rules).most_common(1)[0]
+        representative = dict(next(r for r in rules if _payload_key(r) == modal_key))
+        consistency = modal_count / support
+        projects = [(r.get("evidence") or {}).get("project_name")
+                    or (r.get("evidence") or {}).get("file_name", "") for r in rules]
+
+        cand = RuleCandidate(
+            kind=representative.get("kind", ""),
+            category=representative.get("category", ""),
+            description=representative.get("display_description", ""),
+            support=support,
+            support_ratio=round(support / processed_pairs, 4) if processed_pairs else 0.0,
+            consistency=round(consistency, 4),
+            projects=projects,
+        )
+        if cand.kind == "unit_price_override":
+            prices = [int(p) for p in ((r.get("payload") or {}).get("unit_price")
+                                       for r in rules) if p is not None]
+            if prices:
+                median = int(round(statistics.median(prices)))
+                cand.price_min, cand.price_max = min(prices), max(prices)
+                cand.price_median = median
+                cand.price_mean = round(statistics.fmean(prices), 1)
+                payload = dict(representative.get("payload") or {})
+                payload["unit_price"] = median
+                representative["payload"] = payload
+                # 単価は揺れるのが普通なので、一貫性は中央値±5%に入る割合で測る
+                near = sum(1 for p in prices if abs(p - median) <= median * 0.05)
+                cand.consistency = round(near / len(prices), 4)
+        summary = (f"一括学習: {support}案件で同じ差分"
+                   + (f"（単価 中央値 ¥{cand.price_median:,}）"
+                      if cand.price_median is not None else ""))
+        representative["evidence"] = {
+            **(representative.get("evidence") or {}),
+            "project_name": f"一括学習（{support}案件）",
+            "summary": summary,
+            "support": support,
+        }
+        cand.proposed_rule = representative
+        cand.score = round(cand.support_ratio * cand.consistency, 4)
+        candidates.append(cand)
+
+    candidates.sort(key=lambda c: (-c.score, -c.support, c.category, c.description))
+    return candidates
+
+
+def run_batch_learning(csv_dir: Union[str, Path],
+                       max_workers: int = DEFAULT_MAX_WORKERS,
+                       min_support: int = DEFAULT_MIN_SUPPORT,
+                       on_progress: Optional[Callable[[BatchProgress], None]] = None,
+                       entries: Optional[list] = None) -> BatchLearningReport:
+    """ペアリング → 並列差分抽出 → 集約 までを実行してレポートを返す。
+
+    ルールの保存は行わない（人が候補を確認してから save_candidates する）。
+
+    Args:
+        csv_dir: 正規見積CSVのフォルダ
+        max_workers: 並列プロセス数（1以下で順次実行）
+        min_support: 候補に残す最小支持案件数
+        on_progress: 1ペア完了ごとに呼ばれるコールバック（UIの進捗バー等）
+        entries: list_estimate_history() の結果（省略時は取得）
+    """
+    started = time.perf_counter()
+    pairs, unmatched = pair_history_with_csvs(csv_dir, entries=entries)
+    report = BatchLearningReport(total_pairs=len(pairs), unmatched_csvs=unmatched)
+
+    diff_lists = []
+    for event in iter_batch_learning(pairs, max_workers=max_workers):
+        if event.ok:
+            diff_lists.append(event.diffs)
+        else:
+            report.failed_pairs.append(f"{event.label}: {event.error}")
+        if on_progress is not None:
+            on_progress(event)
+
+    report.processed_pairs = len(diff_lists)
+    report.candidates = aggregate_proposals(
+        diff_lists, report.processed_pairs, min_support=min_support)
+    report.elapsed_sec = round(time.perf_counter() - started, 3)
+    logger.info("一括学習: %d/%dペア処理・候補%d件（%.1f秒）",
+                report.processed_pairs, report.total_pairs,
+                len(report.candidates), report.elapsed_sec)
+    return report
+
+
+def save_candidates(candidates: list, source_label: str = "一括学習") -> int:
+    """選択された候補のルールを store に1回で保存し、学習ログに記録する。保存件数を返す。"""
+    rules = [c.proposed_rule for c in candidates if c.proposed_rule]
+    if not rules:
+        return 0
+    store.add_rules("estimate", rules)
+    store.append_learning_log({
+        "kind": "estimate",
+        "source_files": [source_label],
+        "approved": len(rules),
+        "total_diffs": sum(c.support for c in candidates if c.proposed_rule),
+    })
+    return len(rules)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="見積履歴 × 正規CSVフォルダの一括学習")
+    parser.add_argument("csv_dir", help="正規見積CSVのフォルダ")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS)
+    parser.add_argument("--min-support", type=int, default=DEFAULT_MIN_SUPPORT)
+    parser.add_argument("--out", help="レポートJSONの出力先（省略時は標準出力）")
+    args = parser.parse_args()
+
+    def _print_progress(ev: BatchProgress):
+        mark = "OK" if ev.ok else f"NG {ev.error}"
+        print(f"[{ev.done}/{ev.total}] {ev.label} {mark}")
+
+    result = run_batch_learning(args.csv_dir, max_workers=args.workers,
+                                min_support=args.min_support,
+                                on_progress=_print_progress)
+    text = json.dumps(result.model_dump(), ensure_ascii=False, indent=2)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    else:
+        print(text)
@@ -0,0 +1,227 @@
+"""図面学習の集計統計（屋根種別ごとの逐次更新ストア）
+
+承認された図面ルール（gap_override / margin_override / orientation_preference）を
+1件ずつ集計し、(項目, roof_type) ごとに件数・平均・中央値・向きの選択回数を持つ。
+store（knowledge/learned_drawing_stats.json）に保存する。
+
+- 更新は承認1件あたり O(1)（件数・平均の逐次更新 + 値ヒストグラムの加算）。
+  中央値はヒストグラム（mm 単位の離散値。実データは数種類）から再計算する。
+- apply_drawing はこの集計値（中央値・最頻の向き）を使い、履歴を再走査しない。
+- 「何件の図面が既定値を支えているか」は集計レコードの count をそのまま返す。
+
+集計は学習ルール本体（learned_drawing_rules.json）とは独立に積み上がる。
+ルールの無効化・削除は適用側でルールの有無として扱う（集計は消さない）。
+"""
+import logging
+from datetime import datetime
+from typing import Optional
+
+from drafting.models import Orientation, RoofType
+from learning import store
+
+logger = logging.getLogger(__name__)
+
+# 集計値をルールの値より優先するのに必要な図面件数（1件なら最新ルールと同値）
+MIN_SUPPORT = 2
+
+# kind → 集計対象の payload 項目
+_KIND_FIELDS = {
+    "gap_override": ("gap_long_mm", "gap_short_mm"),
+    "margin_override": ("margin_mm",),
+    "orientation_preference": ("orientation",),
+}
+_CATEGORICAL_FIELDS = ("orientation",)
+_FIELD_LABEL = {
+    "gap_long_mm": "パネル間隔(縦)",
+    "gap_short_mm": "パネル間隔(横)",
+    "margin_mm": "マージン",
+    "orientation": "向き",
+}
+
+
+def _num(val) -> Optional[float]:
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return None
+
+
+def _hist_key(value: float) -> str:
+    """ヒストグラムのキー（0.1mm 丸め。JSON のキーは文字列のため）。"""
+    return f"{round(value, 1):g}"
+
+
+def _median_from_hist(hist: dict) -> Optional[float]:
+    """値ヒストグラム {値文字列: 件数} の中央値（偶数件は中央2値の平均）。"""
+    values = sorted((float(k), int(n)) for k, n in hist.items() if int(n) > 0)
+    total = sum(n for _v, n in values)
+    if total == 0:
+        return None
+    lo_rank, hi_rank = (total - 1) // 2, total // 2
+    lo = hi = None
+    seen = 0
+    for v, n in values:
+        if lo is None and lo_rank < seen + n:
+            lo = v
+        if hi_rank < seen + n:
+            hi = v
+            break
+        seen += n
+    return (lo + hi) / 2
+
+
+def _mode(counts: dict, last: str) -> str:
+    """最多の選択肢（同数なら直近の値を優先）。"""
+    if not counts:
+        return ""
+    best = max(counts.values())
+    if counts.get(last) == best:
+        return last
+    return next(k for k, n in counts.items() if n == best)
+
+
+def _update_group(group: dict, value) -> bool:
+    """群レコード1件に観測値1つを加える。不正値なら False。"""
+    now = datetime.now().strftime("%Y-%m-%d %H:%M")
+    if group["field"] in _CATEGORICAL_FIELDS:
+        if not value:
+            return False
+        counts = group.setdefault("choices", {})
+        counts[value] = counts.get(value, 0) + 1
+        group["count"] = group.get("count", 0) + 1
+        group["last"] = value
+        group["value"] = _mode(counts, value)
+        group["updated_at"] = now
+        return True
+
+    v = _num(value)
+    if v is None:
+        return False
+    n = group.get("count", 0) + 1
+    mean = group.get("mean", 0.0)
+    group["count"] = n
+    group["mean"] = mean + (v - mean) / n
+    hist = group.setdefault("hist", {})
+    key = _hist_key(v)
+    hist[key] = hist.get(key, 0) + 1
+    group["median"] = _median_from_hist(hist)
+    group["min"] = min(group.get("min", v), v)
+    group["max"] = max(group.get("max", v), v)
+    group["last"] = v
+    group["value"] = group["median"]
+    group["updated_at"] = now
+    return True
+
+
+def _group_key(field: str, roof_type: str) -> tuple:
+    return (field, roof_type or "*")
+
+
+# =============================================================
+# 公開関数
+# =============================================================
+
+def record_approved_rules(rules: list[dict]) -> int:
+    """承認された図面ルール（1図面分）を集計へ加え、保存する。
+
+    learning/app_pages の「学習する」承認時に add_rules と並べて呼ぶ前提。
+    1図面の1承認につき、各 (項目, roof_type) は1観測として数える。
+    golden_example 等の集計対象外ルールは無視する。
+
+    Returns:
+        集計に加えた観測数。
+    """
+    groups = store.load_drawing_stats()
+    index = {_group_key(g.get("field", ""), g.get("roof_type", "*")): g for g in groups}
+    added = 0
+    for rule in rules or []:
+        fields = _KIND_FIELDS.get((rule or {}).get("kind", ""))
+        if not fields:
+            continue
+        payload = rule.get("payload", {}) or {}
+        roof_type = payload.get("roof_type", "*") or "*"
+        for field in fields:
+            if payload.get(field) is None:
+                continue
+            key = _group_key(field, roof_type)
+            group = index.get(key)
+            if group is None:
+                group = {"field": field, "roof_type": roof_type, "count": 0}
+                if _update_group(group, payload[field]):
+                    index[key] = group
+                    groups.append(group)
+                    added += 1
+            elif _update_group(group, payload[field]):
+                added += 1
+    if added:
+        store.save_drawing_stats(groups)
+    return added
+
+
+def load_stats_index() -> dict:
+    """集計を {(field, roof_type): 群レコード} で返す。読込失敗時は {}。"""
+    try:
+        groups = store.load_drawing_stats()
+    except Exception as e:
+        logger.warning("図面学習の集計の読込に失敗: %s", e)
+        return {}
+    return {_group_key(g.get("field", ""), g.get("roof_type", "*")): g
+            for g in groups if isinstance(g, dict)}
+
+
+def aggregated_value(stats: dict, field: str, roof_type: str):
+    """集計値と支持件数 (value, count)。件数が MIN_SUPPORT 未満なら value=None。"""
+    group = stats.get(_group_key(field, roof_type))
+    if not group:
+        return None, 0
+    count = int(group.get("count", 0) or 0)
+    if count < MIN_SUPPORT:
+        return None, count
+    return group.get("value"), count
+
+
+def learned_drawing_defaults() -> list[dict]:
+    """有効な学習済み既定値と、それを支える図面件数の一覧。
+
+    製図のたびに表示できるよう、ルールストアと集計ストアを1回ずつ読むだけで
+    組み立てる（履歴は読まない）。戻り値の各要素:
+        {"field", "roof_type", "value", "count", "source"}
+        source: "aggregate"（集計の中央値/最頻）| "rule"（最新ルールの値）
+    """
+    try:
+        rules = store.enabled_rules("drawing")
+    except Exception as e:
+        logger.warning("学習済み図面ルールの読込に失敗: %s", e)
+        return []
+    stats = load_stats_index()
+    out = []
+    for rule in rules:
+        fields = _KIND_FIELDS.get(rule.get("kind", ""))
+        if not fields:
+            continue
+        payload = rule.get("payload", {}) or {}
+        roof_type = payload.get("roof_type", "*") or "*"
+        for field in fields:
+            value, count = aggregated_value(stats, field, roof_type)
+            if value is not None:
+                out.append({"field": field, "roof_type": roof_type, "value": value,
+                            "count": count, "source": "aggregate"})
+            elif payload.get(field) is not None:
+                out.append({"field": field, "roof_type": roof_type,
+                            "value": payload[field], "count": max(count, 1),
+                            "source": "rule"})
+    return out
+
+
+def format_learned_default(entry: dict) -> str:
+    """learned_drawing_defaults の1件の表示文字列（例: "折板屋根のマージン 800mm（図面3件）"）。"""
+    roof_type = entry.get("roof_type", "*")
+    roof = "全屋根" if roof_type in ("", "*") else RoofType.LABEL.get(roof_type, roof_type)
+    field = entry.get("field", "")
+    value = entry.get("value")
+    if field in _CATEGORICAL_FIELDS:
+        shown = Orientation.LABEL.get(value, value)
+    else:
+        v = _num(value)
+        shown = f"{v:g}mm" if v is not None else str(value)
+    return f"{roof}の{_FIELD_LABEL.get(field, field)} {shown}（図面{entry.get('count', 0)}件）"
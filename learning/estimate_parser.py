@@ -4,8 +4,11 @@
 共通の中間表現 ParsedEstimate に変換する。差分抽出（estimate_diff）の入力を作る役割。
 
 公開関数:
-    - parse_estimate_pdf(pdf_path, source): 見積書PDFをClaudeで構造化してパース
-        1) PyMuPDF のテキスト層が十分（>300字）ならテキスト→Claude（安価・高精度）
+    - parse_estimate_pdf(pdf_path, source): 見積書PDFをパース
+        0) PyMuPDF の表抽出（find_tables）+ 単語座標で明細表を直接読む（API不要・数十ms）。
+           本ツール生成PDF（generation/pdf_generator）と罫線付きの正規見積が対象で、
+           明細合計 = 小計 の検算に通った場合のみ採用する
+        1) 検算NG・表なしで、PyMuPDF のテキスト層が十分（>300字）ならテキスト→Claude
         2) 乏しければ（スキャンPDF等）pdf_to_images + Vision にフォールバック
     - parse_estimate_csv(csv_bytes, source, file_name): 本ツール出力CSVをパース（API不要）
         generation/csv_exporter.py の detailed形式（"=== 見積明細 ===" セクション式）と
@@ -22,6 +25,7 @@ import json
 import logging
 import re
 import time
+import unicodedata
 from pathlib import Path
 from typing import Optional, Union
 
@@ -29,6 +33,7 @@ import anthropic
 import fitz  # PyMuPDF
 
 from config import CLAUDE_MODEL, get_api_key
+from extraction import api_client, api_replay
 from extraction.pdf_reader import pdf_to_images
 from extraction.survey_extractor import (  # JSON修復・数値パースを流用（コピーしない）
     _extract_json,        # 応答テキスト→JSON文字列（内部で _sanitize_json_str を適用）
@@ -71,6 +76,25 @@ _CATEGORY_ALIASES = {
     "諸経費等": "その他・諸経費等",
 }
 
+# 金額セル（"¥956,048.-" "-50,000" "△50,000" 等）の数値部分
+_YEN_RE = re.compile(r"([-−△▲]?)\s*[¥￥]?\s*([0-9０-９][0-9０-９,，]*)")
+
+# 明細ページの見出し「見積明細書（2. 材料費）」のカテゴリ部分
+_DETAIL_TITLE_RE = re.compile(r"[（(]\s*[0-9０-９]+\s*[.．]\s*([^）)\n]+?)\s*[）)]")
+
+# 構造パースで表ヘッダーとみなす列見出し（空白除去・NFKC後の完全一致）。
+# "見積単価" は "単価" より先に判定する（部分一致ではないが意図を明示）
+_HEADER_KEYWORDS = (
+    ("unit_price", ("見積単価", "単価")),
+    ("amount", ("見積額", "見積金額", "金額")),
+    ("quantity", ("数量",)),
+    ("unit", ("単位",)),
+    ("no", ("No.", "No", "NO", "NO.", "番号", "№")),
+    ("description", ("摘要", "品名", "名称", "項目")),
+    ("remarks", ("備考", "仕様", "規格")),
+    ("category", ("分類",)),
+)
+
 # 数量文字列の先頭数値部分（"288枚" → "288" と "枚"。全角数字・カンマ・小数対応）
 _QUANTITY_RE = re.compile(
     r"^\s*([-+]?[0-9０-９][0-9０-９,，]*(?:[.．][0-9０-９]+)?)\s*(.*)$"
@@ -214,17 +238,23 @@ def _normalize_discount(value: Optional[int]) -> Optional[int]:
     return value if value <= 0 else -value
 
 
-def _check_totals_consistency(parsed: ParsedEstimate) -> None:
-    """明細合計と抽出した小計の不整合（±1円超）を warnings に追記する。"""
+def _totals_problem(parsed: ParsedEstimate) -> Optional[str]:
+    """明細合計と小計の不整合（±1円超）の説明文を返す。整合 or 検算不能は None。"""
     amounts = [item.amount for item in parsed.items if item.amount is not None]
     if not amounts or parsed.subtotal is None:
-        return
+        return None
     items_total = sum(amounts)
     if abs(items_total - parsed.subtotal) > 1:
-        parsed.warnings.append(
-            f"明細の合計 ¥{items_total:,} と小計 ¥{parsed.subtotal:,} が一致しません"
-            f"（差 ¥{items_total - parsed.subtotal:,}）。読み落とし・誤読の可能性があります。"
-        )
+        return (f"明細の合計 ¥{items_total:,} と小計 ¥{parsed.subtotal:,} が一致しません"
+                f"（差 ¥{items_total - parsed.subtotal:,}）。読み落とし・誤読の可能性があります。")
+    return None
+
+
+def _check_totals_consistency(parsed: ParsedEstimate) -> None:
+    """明細合計と抽出した小計の不整合（±1円超）を warnings に追記する。"""
+    problem = _totals_problem(parsed)
+    if problem:
+        parsed.warnings.append(problem)
 
 
 # =============================================================
@@ -232,10 +262,12 @@ def _check_totals_consistency(parsed: ParsedEstimate) -> None:
 # =============================================================
 
 def parse_estimate_pdf(pdf_path: Union[str, Path], source: str) -> ParsedEstimate:
-    """見積書PDFを Claude で構造化して ParsedEstimate に変換する。
+    """見積書PDFを ParsedEstimate に変換する。
 
-    テキスト層が十分にあるPDF（本ツール生成PDFや電子見積）はテキストで、
-    スキャンPDFは画像（Vision）でパースする。
+    罫線付きの明細表を持つPDF（本ツール生成PDF・整った正規見積）は
+    PyMuPDF の表抽出で直接パースし、明細合計 = 小計 の検算に通れば API を使わない。
+    それ以外はテキスト層が十分にあればテキストで、スキャンPDFは画像（Vision）で
+    Claude に構造化させる。
 
     Args:
         pdf_path: 見積書PDFのパス
@@ -250,6 +282,19 @@ def parse_estimate_pdf(pdf_path: Union[str, Path], source: str) -> ParsedEstimat
     pdf_path = Path(pdf_path)
     file_name = pdf_path.name
 
+    # --- ステップ0: 表構造の直接パース（API不要の高速パス） ---
+    started = time.perf_counter()
+    structured = _parse_pdf_structured(pdf_path, source)
+    if structured is not None:
+        problem = _totals_problem(structured)
+        if structured.subtotal is not None and problem is None:
+            logger.info("見積PDFを構造パース（API不要・%d行・%.0fms）: %s",
+                        len(structured.items),
+                        (time.perf_counter() - started) * 1000, file_name)
+            return structured
+        logger.info("構造パースの検算に通らないためClaudeでパースします（%s）: %s",
+                    problem or "小計を読み取れず", file_name)
+
     # --- ステップ1: テキスト層の抽出を試みる ---
     text = _extract_pdf_text(pdf_path)
 
@@ -286,6 +331,205 @@ def parse_estimate_pdf(pdf_path: Union[str, Path], source: str) -> ParsedEstimat
     return parsed
 
 
+# =============================================================
+# PDF構造パース（API不要の高速パス）
+# =============================================================
+
+def _parse_yen(raw) -> Optional[int]:
+    """金額セルを整数化する。"¥956,048.-" / "-50,000" / "△50,000"（負） 対応。空欄は None。"""
+    if raw is None:
+        return None
+    m = _YEN_RE.search(str(raw))
+    if not m:
+        return None
+    value = _safe_int(m.group(2))
+    return -value if m.group(1) else value
+
+
+def _join_wrapped(text) -> str:
+    """セル内の折り返し改行を除去する（和文は詰め、英数字同士は空白で連結）。"""
+    lines = [ln.strip() for ln in str(text or "").split("\n") if ln.strip()]
+    out = ""
+    for ln in lines:
+        if out and out[-1].isascii() and out[-1].isalnum() \
+                and ln[0].isascii() and ln[0].isalnum():
+            out += " "
+        out += ln
+    return out
+
+
+def _header_columns(row: list) -> Optional[dict]:
+    """表の先頭行が列見出しなら {列キー: 列番号} を返す。見出しでなければ None。"""
+    columns: dict = {}
+    for idx, cell in enumerate(row):
+        text = re.sub(r"\s+", "", unicodedata.normalize("NFKC", str(cell or "")))
+        for key, words in _HEADER_KEYWORDS:
+            if key not in columns and text in words:
+                columns[key] = idx
+                break
+    return columns if "amount" in columns and len(columns) >= 3 else None
+
+
+def _same_line(a, b) -> bool:
+    """2単語の縦方向の重なりが低い方の高さの半分以上なら同じ行とみなす。"""
+    overlap = min(a[3], b[3]) - max(a[1], b[1])
+    return overlap >= 0.5 * min(a[3] - a[1], b[3] - b[1])
+
+
+def _value_right_of(words: list, labels: tuple, max_gap: float = 120.0) -> str:
+    """ラベル単語と同じ行で右に続く単語列を返す（単語間が大きく空いたら打ち切り）。"""
+    for label in words:
+        if label[4] not in labels:
+            continue
+        right = sorted((w for w in words if _same_line(w, label) and w[0] >= label[2] - 1),
+                       key=lambda w: w[0])
+        picked, prev_x1, gap = [], label[2], max_gap
+        for w in right:
+            if w[0] - prev_x1 > gap:
+                break
+            picked.append(w[4])
+            prev_x1, gap = w[2], 20.0  # 値の途中は詰まっている前提
+        if picked:
+            return " ".join(picked)
+    return ""
+
+
+def _read_page_fields(words: list, parsed: ParsedEstimate) -> None:
+    """ページ上のラベル付き項目（見積ID・発行日・宛先・工事名・表紙金額）を読む。"""
+    if not parsed.estimate_id:
+        parsed.estimate_id = _value_right_of(words, ("見積ID", "見積番号", "見積No."))
+    if not parsed.issue_date:
+        parsed.issue_date = _value_right_of(words, ("発行日", "見積日"))
+    if not parsed.project_name:
+        parsed.project_name = _value_right_of(words, ("工事名", "件名"))
+    if not parsed.client_name:
+        for w in words:
+            if w[4] in ("御中", "様"):
+                left = sorted((x for x in words if _same_line(x, w) and x[2] <= w[0] + 1),
+                              key=lambda x: x[0])
+                parsed.client_name = _strip_honorific(" ".join(x[4] for x in left))
+                break
+    if parsed.total_with_tax is None:
+        parsed.total_with_tax = _parse_yen(_value_right_of(words, ("御見積金額", "税込合計")))
+    if parsed.total_before_tax is None:
+        parsed.total_before_tax = _parse_yen(_value_right_of(words, ("税抜合計",)))
+    if parsed.tax is None:
+        parsed.tax = _parse_yen(_value_right_of(words, ("消費税",)))
+
+
+def _read_detail_rows(rows: list, columns: dict, category: str,
+                      parsed: ParsedEstimate) -> str:
+    """明細表の行を parsed.items に追加する。表末尾時点のカテゴリを返す（次ページへ継続）。
+
+    - 1セルだけのカテゴリ名行 → 以降のカテゴリを切替
+    - No.・摘要・数値が空で備考だけの行 → 直前明細の備考2行目
+    - 「小計」「お値引き」等の集計行 → _apply_summary_row（「材料費 小計」等のカテゴリ小計は無視）
+    """
+    def cell(row, key) -> str:
+        idx = columns.get(key)
+        if idx is None or idx >= len(row):
+            return ""
+        return str(row[idx] or "").strip()
+
+    for row in rows:
+        texts = [str(c).strip() for c in row if c is not None and str(c).strip()]
+        if not texts:
+            continue
+        if len(texts) == 1 and _normalize_category(texts[0]):
+            category = _normalize_category(texts[0])
+            continue
+        desc = _join_wrapped(cell(row, "description"))
+        remarks = _join_wrapped(cell(row, "remarks"))
+        qty, price, amount = cell(row, "quantity"), cell(row, "unit_price"), cell(row, "amount")
+        no = cell(row, "no")
+        if not (desc or no or qty or price or amount):
+            if remarks and parsed.items:
+                last = parsed.items[-1]
+                last.remarks = f"{last.remarks}\n{remarks}" if last.remarks else remarks
+            continue
+        label = desc or texts[0]
+        if _SUMMARY_ROW_RE.search(label) and not price:
+            if not any(label.startswith(cat) for cat in ESTIMATE_CATEGORIES):
+                _apply_summary_row(parsed, label, amount or texts[-1])
+            continue
+        if not desc:
+            continue
+        unit = cell(row, "unit")
+        if unit:
+            quantity_value, quantity_unit = _opt_float(qty), unit
+        else:
+            quantity_value, quantity_unit = _split_quantity(qty)
+        parsed.items.append(ParsedLineItem(
+            category=category,
+            no=_safe_int(no),
+            description=desc,
+            remarks=remarks,
+            quantity_value=quantity_value,
+            quantity_unit=quantity_unit,
+            unit_price=_parse_yen(price),
+            amount=_parse_yen(amount),
+        ))
+    return category
+
+
+def _parse_pdf_structured(pdf_path: Path, source: str) -> Optional[ParsedEstimate]:
+    """罫線付き明細表を PyMuPDF の find_tables で直接読み、ParsedEstimate にする。
+
+    見出し行（摘要・数量・金額 等）を持つ表だけを明細表とみなし、見出しが無い
+    表は直前の明細表と同じ列数なら続きの表（改ページ）として読む。
+    「分類・見積額」だけの表（見積内訳書）は集計行のみ読む。
+    表が無い・明細が1行も取れない場合は None（呼び出し側で Claude にフォールバック）。
+    """
+    try:
+        doc = fitz.open(str(pdf_path))
+    except Exception as e:
+        logger.warning("見積PDFを開けませんでした（構造パース不可）: %s", e)
+        return None
+
+    parsed = ParsedEstimate(source=source, origin="pdf", file_name=pdf_path.name)
+    category = ""
+    detail_columns: Optional[dict] = None
+    detail_width = 0
+    try:
+        for page in doc:
+            words = page.get_text("words")
+            _read_page_fields(words, parsed)
+            title = _DETAIL_TITLE_RE.search(page.get_text())
+            if title and _normalize_category(title.group(1)):
+                category = _normalize_category(title.group(1))
+            try:
+                tables = page.find_tables().tables
+            except Exception as e:
+                logger.warning("表抽出に失敗（ページスキップ）: %s", e)
+                continue
+            for table in tables:
+                rows = table.extract()
+                if not rows:
+                    continue
+                columns = _header_columns(rows[0])
+                if columns is not None and "description" not in columns:
+                    # 見積内訳書（分類・見積額）: 集計行のみ
+                    label_idx = columns.get("category", 0)
+                    for row in rows[1:]:
+                        label = str(row[label_idx] or "").strip() if label_idx < len(row) else ""
+                        if _SUMMARY_ROW_RE.search(label):
+                            _apply_summary_row(parsed, label, row[columns["amount"]])
+                    continue
+                if columns is not None:
+                    detail_columns, detail_width = columns, len(rows[0])
+                    rows = rows[1:]
+                elif detail_columns is None or len(rows[0]) != detail_width:
+                    continue
+                category = _read_detail_rows(rows, detail_columns, category, parsed)
+    except Exception as e:
+        logger.warning("見積PDFの構造パースに失敗（Claudeへフォールバック）: %s", e)
+        return None
+    finally:
+        doc.close()
+
+    return parsed if parsed.items else None
+
+
 def _extract_pdf_text(pdf_path: Path) -> str:
     """PyMuPDF で全ページのテキスト層を抽出する。失敗時は ""（Visionへフォールバック）。"""
     try:
@@ -326,7 +570,8 @@ def _call_claude_with_retry(content: list[dict]) -> dict:
     attempt = 1
     while attempt <= MAX_RETRIES:
         try:
-            client = anthropic.Anthropic(api_key=get_api_key())
+            client = api_replay.client(
+                lambda: api_client.shared_client(anthropic, get_api_key), "estimate")
             with client.messages.stream(
                 model=CLAUDE_MODEL,
                 max_tokens=max_tokens,
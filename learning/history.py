@@ -160,6 +160,36 @@ def load_estimate_history(path: Union[str, Path]) -> Optional[EstimateData]:
         return None
 
 
+def load_estimate_history_payloads(paths: list) -> dict:
+    """複数の見積履歴の生 payload（{"saved_at", "estimate"}）をまとめて読む。
+
+    一括学習用。Supabase 上の履歴はテーブルごとに select_payloads で
+    まとめて取得し、1件ずつの往復を避ける。戻り値は {path文字列: payload}。
+    読めなかった履歴は欠落する（呼び出し側で未処理扱い）。
+    """
+    results: dict = {}
+    remote: dict = {}
+    for path in paths:
+        sb = _parse_supabase_path(path)
+        if sb:
+            remote.setdefault(sb[0], []).append(sb[1])
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                results[str(path)] = json.load(f)
+        except Exception as e:
+            logger.warning("見積履歴の読込に失敗（%s）: %s", path, e)
+    if remote:
+        try:
+            from learning.storage_backend import select_payloads
+            for table, ids in remote.items():
+                for row_id, payload in select_payloads(table, ids).items():
+                    results[f"supabase://{table}/{row_id}"] = payload
+        except Exception as e:
+            logger.warning("見積履歴のSupabase一括読込に失敗: %s", e)
+    return results
+
+
 def estimate_to_parsed(estimate: EstimateData, file_name: str = "") -> ParsedEstimate:
     """EstimateData → ParsedEstimate のロスレス変換（AI見積側の入力）。"""
     items = []
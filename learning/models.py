@@ -78,3 +78,30 @@ class DrawingDiffItem(BaseModel):
     summary: str = Field(default="")
     learnable: bool = Field(default=True)
     proposed_rule: Optional[dict] = Field(default=None)
+
+
+class RuleCandidate(BaseModel):
+    """一括学習（batch_learning）で複数案件から集約したルール候補1件。"""
+    kind: str = Field(default="", description='"unit_price_override"|"item_add"|"item_suppress"')
+    category: str = Field(default="")
+    description: str = Field(default="", description="表示用の摘要")
+    support: int = Field(default=0, description="この差分が出た案件数")
+    support_ratio: float = Field(default=0.0, description="support / 処理できたペア数")
+    consistency: float = Field(default=0.0, description="最頻の提案内容に一致した割合")
+    price_min: Optional[int] = Field(default=None)
+    price_median: Optional[int] = Field(default=None)
+    price_max: Optional[int] = Field(default=None)
+    price_mean: Optional[float] = Field(default=None)
+    score: float = Field(default=0.0, description="並び順のスコア（大きいほど有力）")
+    projects: list[str] = Field(default_factory=list, description="根拠となった案件名")
+    proposed_rule: Optional[dict] = Field(default=None, description="採用時に store.add_rules へ渡す")
+
+
+class BatchLearningReport(BaseModel):
+    """一括学習の結果レポート（候補はスコア降順）。"""
+    total_pairs: int = Field(default=0)
+    processed_pairs: int = Field(default=0)
+    failed_pairs: list[str] = Field(default_factory=list, description='"ラベル: エラー内容"')
+    unmatched_csvs: list[str] = Field(default_factory=list, description="履歴と対応付かなかったCSV")
+    candidates: list[RuleCandidate] = Field(default_factory=list)
+    elapsed_sec: float = Field(default=0.0)
@@ -172,3 +172,30 @@ def get_payload(table: str, row_id: str) -> Optional[dict]:
     except Exception as e:
         logger.warning("Supabase get_payload(%s, %s) 失敗: %s", table, row_id, e)
         return None
+
+
+def select_payloads(table: str, row_ids: list, chunk: int = 100) -> dict:
+    """履歴テーブルの複数行の payload を id=in.(...) でまとめて取得する。
+
+    一括学習で1行ずつ get_payload すると件数分の往復になるため、
+    chunk 件ずつ1リクエストで読む。戻り値は {str(id): payload}。失敗分は欠落。
+    """
+    url, key = _creds()
+    if not (url and key) or not row_ids:
+        return {}
+    payloads: dict = {}
+    ids = [str(i) for i in row_ids]
+    for start in range(0, len(ids), chunk):
+        part = ids[start:start + chunk]
+        try:
+            r = requests.get(
+                f"{url}/rest/v1/{table}",
+                params={"id": f"in.({','.join(part)})", "select": "id,payload"},
+                headers=_headers(key), timeout=_TIMEOUT)
+            r.raise_for_status()
+            for row in r.json() or []:
+                if isinstance(row.get("payload"), dict):
+                    payloads[str(row.get("id"))] = row["payload"]
+        except Exception as e:
+            logger.warning("Supabase select_payloads(%s) 失敗: %s", table, e)
+    return payloads
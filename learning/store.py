@@ -8,6 +8,7 @@ Supabase（learning/storage_backend.py）が構成されている場合は
 Supabase を正として読み書きし、ローカルファイルは並行保存する
 （Streamlit Cloud はコンテナ再起動で実行時ファイルが消えるため）。
 """
+import hashlib
 import json
 import logging
 import os
@@ -21,9 +22,14 @@ logger = logging.getLogger(__name__)
 ESTIMATE_RULES_PATH = KNOWLEDGE_DIR / "learned_estimate_rules.json"
 DRAWING_RULES_PATH = KNOWLEDGE_DIR / "learned_drawing_rules.json"
 LEARNING_LOG_PATH = KNOWLEDGE_DIR / "learning_history.json"
+DRAWING_STATS_PATH = KNOWLEDGE_DIR / "learned_drawing_stats.json"
 
 _VALID_TARGETS = ("estimate", "drawing")
 
+# このプロセス内でのルール保存回数（target別）。プロンプト等のキャッシュが
+# ストアを読み直さずに「自プロセスでの更新」を検知するためのカウンタ。
+_LOCAL_REVISION = {t: 0 for t in _VALID_TARGETS}
+
 
 def _rules_path(target: str) -> Path:
     if target not in _VALID_TARGETS:
@@ -92,11 +98,28 @@ def enabled_rules(target: str) -> list[dict]:
     return [r for r in load_rules(target) if r.get("enabled", True)]
 
 
+def rules_version(rules: list[dict]) -> str:
+    """ルール集合の内容ハッシュ。適用側のコンパイル結果キャッシュのキーに使う。
+
+    保存のたびに変わる updated_at ではなく内容で判定するため、Supabase と
+    ローカルのどちらから読んでも同じルール集合なら同じ値になる。
+    """
+    raw = json.dumps(rules, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
 def save_rules(target: str, rules: list[dict]) -> None:
     _save_doc(_rules_path(target), {
         "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "rules": rules,
     })
+    _LOCAL_REVISION[target] += 1
+
+
+def local_revision(target: str) -> int:
+    """このプロセスで target のルールを保存した回数（他プロセスの更新は含まない）。"""
+    _rules_path(target)
+    return _LOCAL_REVISION[target]
 
 
 def _dedup_key(rule: dict) -> tuple:
@@ -172,3 +195,15 @@ def append_learning_log(entry: dict) -> None:
 
 def load_learning_log() -> list[dict]:
     return _load_doc_list(LEARNING_LOG_PATH, "logs")
+
+
+def load_drawing_stats() -> list[dict]:
+    """図面学習の集計統計（learning/drawing_stats.py の群レコード）を返す。"""
+    return _load_doc_list(DRAWING_STATS_PATH, "groups")
+
+
+def save_drawing_stats(groups: list[dict]) -> None:
+    _save_doc(DRAWING_STATS_PATH, {
+        "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "groups": groups,
+    })
@@ -0,0 +1,292 @@
+"""見積の編集セッション（合計の差分更新・取り消し/やり直し）
+
+Step 3 の手入力・音声編集・単価マスターからの明細追加を1つのセッションで受け、
+明細の追加・変更・削除のたびに「金額の差分」だけをカテゴリ小計と全体小計に
+足し引きする（全カテゴリの calculate_totals をやり直さない）。
+税の設定（tax_rate / tax_rounding_method）と値引き方式（discount_method）は
+pricing_rules.yaml から1度だけ読んで保持する（ファイルが更新されたら読み直す）。
+学習済みルール（learning/apply_estimate）は明細の単価・項目しか変えないため、
+ここでは読まない（HTTP 越しのルール取得を合計の再計算のたびに行わない）。
+
+値引きは従来どおり編集では動かさない（set_discount / set_total_before_tax で
+明示したときだけ変わる）。編集は1件ずつ、または batch() でまとめて1手として
+取り消し履歴に積み、undo() / redo() で戻せる。
+
+    session = EstimateEditSession(estimate)
+    session.update_item(section, item, unit_price=5000, amount=150000)
+    with session.batch("音声編集"):
+        session.delete_item(section, other)
+        session.set_discount(-50000)
+    session.undo()   # 音声編集の2件をまとめて戻す
+"""
+from __future__ import annotations
+
+import logging
+import math
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Optional
+
+import yaml
+
+from config import KNOWLEDGE_DIR, TAX_RATE
+from models.estimate_data import CategorySection, EstimateData, LineItem
+
+logger = logging.getLogger(__name__)
+
+RULES_PATH = KNOWLEDGE_DIR / "pricing_rules.yaml"
+MAX_HISTORY = 100
+
+
+@dataclass(frozen=True)
+class TotalsSettings:
+    """合計の計算に使う pricing_rules.yaml の設定。"""
+    discount_method: str = "round_down_10000"
+    tax_rate: float = TAX_RATE
+    tax_rounding_method: str = "floor"
+
+    @classmethod
+    def from_rules(cls, rules: dict) -> "TotalsSettings":
+        rules = rules or {}
+        return cls(
+            discount_method=rules.get("discount_method", "round_down_10000"),
+            tax_rate=float(rules.get("tax_rate", TAX_RATE) or TAX_RATE),
+            tax_rounding_method=rules.get("tax_rounding_method", "floor"),
+        )
+
+    def auto_total(self, subtotal: int) -> int:
+        """discount_method の端数切捨て後の税抜合計。"""
+        if self.discount_method == "round_down_10000":
+            return (subtotal // 10000) * 10000
+        if self.discount_method == "round_down_100000":
+            return (subtotal // 100000) * 100000
+        return subtotal
+
+    def tax(self, total_before_tax: int) -> int:
+        """税額（estimate_v2.tax_amount と同じ丸め）。"""
+        tax_raw = total_before_tax * self.tax_rate
+        if self.tax_rounding_method == "round":
+            return int(round(tax_raw))
+        if self.tax_rounding_method == "ceil":
+            return int(math.ceil(tax_raw))
+        return int(tax_raw)
+
+
+_SETTINGS_CACHE: dict = {"sig": None, "settings": None}
+
+
+def totals_settings() -> TotalsSettings:
+    """pricing_rules.yaml の税・値引き設定（ファイルの更新時刻が同じ間はキャッシュ）。
+
+    読めない場合は警告して既定値（10%・切捨て・1万円未満切捨て）を返す。
+    """
+    try:
+        st = RULES_PATH.stat()
+        sig = (str(RULES_PATH), st.st_mtime_ns, st.st_size)
+    except OSError:
+        sig = (str(RULES_PATH), None, None)
+    if _SETTINGS_CACHE["sig"] == sig and _SETTINGS_CACHE["settings"] is not None:
+        return _SETTINGS_CACHE["settings"]
+    try:
+        with open(RULES_PATH, "r", encoding="utf-8") as f:
+            settings = TotalsSettings.from_rules(yaml.safe_load(f))
+    except Exception as e:
+        logger.warning(f"pricing_rules.yaml の税・値引き設定を読めないため既定値を使います: {e}")
+        settings = TotalsSettings()
+    _SETTINGS_CACHE.update(sig=sig, settings=settings)
+    return settings
+
+
+@dataclass
+class _Edit:
+    kind: str                      # update / add / delete / discount / cover
+    section: Optional[CategorySection] = None
+    item: Optional[LineItem] = None
+    position: int = 0
+    before: dict = field(default_factory=dict)
+    after: dict = field(default_factory=dict)
+
+
+@dataclass
+class _Step:
+    """取り消し・やり直しの1手（batch() 内の編集はまとめて1手）。"""
+    label: str
+    edits: list[_Edit] = field(default_factory=list)
+
+
+class EstimateEditSession:
+    """1つの見積に対する編集セッション。
+
+    Args:
+        estimate: 編集対象（その場で書き換える）
+        settings: 税・値引きの設定（省略時は totals_settings()）
+    """
+
+    def __init__(self, estimate: EstimateData, settings: Optional[TotalsSettings] = None):
+        self.estimate = estimate
+        self.settings = settings or totals_settings()
+        self._undo: list[_Step] = []
+        self._redo: list[_Step] = []
+        self._open: Optional[_Step] = None
+        self._recompute_all()
+
+    # --- 合計 ----------------------------------------------------------------
+    def _recompute_all(self) -> None:
+        summary = self.estimate.summary
+        for cat in summary.categories:
+            cat.calculate_totals()
+        summary.subtotal = sum(cat.total for cat in summary.categories)
+        self._finish()
+
+    def refresh(self) -> None:
+        """明細を一括で組み替えた後（支給品の切替など）に合計を作り直す。
+
+        組み替えで明細が差し替わると履歴の対象が無くなるため、履歴も消す。
+        """
+        self._recompute_all()
+        self._undo.clear()
+        self._redo.clear()
+
+    def _shift(self, section: CategorySection, delta: int) -> None:
+        if delta:
+            section.subtotal += delta
+            section.total = section.subtotal
+            self.estimate.summary.subtotal += delta
+
+    def _finish(self) -> None:
+        """小計・値引きから税抜/税/税込を出し、表紙に写す。"""
+        summary = self.estimate.summary
+        summary.total_before_tax = summary.subtotal + summary.discount
+        summary.tax = self.settings.tax(summary.total_before_tax)
+        summary.total_with_tax = summary.total_before_tax + summary.tax
+        cover = self.estimate.cover
+        cover.total_before_tax = summary.total_before_tax
+        cover.tax = summary.tax
+        cover.total_with_tax = summary.total_with_tax
+
+    # --- 編集 ----------------------------------------------------------------
+    def update_item(self, section: CategorySection, item: LineItem, **fields) -> None:
+        """明細の項目（unit_price / amount / quantity / description など）を書き換える。"""
+        before = {k: getattr(item, k) for k in fields}
+        if before == fields:
+            return
+        self._do(_Edit("update", section, item, before=before, after=dict(fields)),
+                 f"{item.description} を変更")
+
+    def add_item(self, section: CategorySection, item: LineItem) -> None:
+        """明細をカテゴリの末尾に追加する。"""
+        self._do(_Edit("add", section, item, position=len(section.items)),
+                 f"{item.description} を追加")
+
+    def delete_item(self, section: CategorySection, item: LineItem) -> None:
+        """明細を削除し、カテゴリ内の行番号を振り直す。"""
+        self._do(_Edit("delete", section, item, position=section.items.index(item)),
+                 f"{item.description} を削除")
+
+    def set_discount(self, discount: int) -> None:
+        """お値引き（負の値）を設定する。"""
+        self._do(_Edit("discount", before={"discount": self.estimate.summary.discount},
+                       after={"discount": int(discount)}), "お値引きを変更")
+
+    def set_total_before_tax(self, total_before_tax: int) -> None:
+        """税抜合計を指定し、小計との差をお値引きにする（「値引き調整」）。"""
+        self.set_discount(int(total_before_tax) - self.estimate.summary.subtotal)
+
+    def set_cover(self, **fields) -> None:
+        """表紙の項目（client_name / project_name / validity_period など）を書き換える。"""
+        cover = self.estimate.cover
+        before = {k: getattr(cover, k) for k in fields}
+        if before == fields:
+            return
+        self._do(_Edit("cover", before=before, after=dict(fields)), "表紙を変更")
+
+    @contextmanager
+    def batch(self, label: str):
+        """ブロック内の編集をまとめて1手として履歴に積む（入れ子は外側にまとめる）。"""
+        if self._open is not None:
+            yield self
+            return
+        self._open = _Step(label)
+        try:
+            yield self
+        finally:
+            step, self._open = self._open, None
+            if step.edits:
+                self._push(step)
+
+    # --- 取り消し / やり直し ------------------------------------------------------
+    @property
+    def can_undo(self) -> bool:
+        return bool(self._undo)
+
+    @property
+    def can_redo(self) -> bool:
+        return bool(self._redo)
+
+    def history(self) -> list[str]:
+        """取り消せる編集の説明（古い順）。"""
+        return [step.label for step in self._undo]
+
+    def undo(self) -> Optional[str]:
+        """直前の1手を取り消し、その説明を返す（無ければ None）。"""
+        if not self._undo:
+            return None
+        step = self._undo.pop()
+        for edit in reversed(step.edits):
+            self._apply(edit, forward=False)
+        self._finish()
+        self._redo.append(step)
+        return step.label
+
+    def redo(self) -> Optional[str]:
+        """取り消した1手をやり直し、その説明を返す（無ければ None）。"""
+        if not self._redo:
+            return None
+        step = self._redo.pop()
+        for edit in step.edits:
+            self._apply(edit, forward=True)
+        self._finish()
+        self._undo.append(step)
+        return step.label
+
+    # --- 内部 ----------------------------------------------------------------
+    def _do(self, edit: _Edit, label: str) -> None:
+        self._apply(edit, forward=True)
+        self._finish()
+        self._redo.clear()
+        if self._open is not None:
+            self._open.edits.append(edit)
+        else:
+            self._push(_Step(label, [edit]))
+
+    def _push(self, step: _Step) -> None:
+        self._undo.append(step)
+        del self._undo[:-MAX_HISTORY]
+
+    def _apply(self, edit: _Edit, forward: bool) -> None:
+        section, item = edit.section, edit.item
+        if edit.kind == "update":
+            old_amount = item.amount
+            for k, v in (edit.after if forward else edit.before).items():
+                setattr(item, k, v)
+            self._shift(section, item.amount - old_amount)
+        elif edit.kind == "discount":
+            self.estimate.summary.discount = (edit.after if forward else edit.before)["discount"]
+        elif edit.kind == "cover":
+            for k, v in (edit.after if forward else edit.before).items():
+                setattr(self.estimate.cover, k, v)
+        elif (edit.kind == "add") == forward:   # add の実行 / delete の取り消し
+            section.items.insert(edit.position, item)
+            if edit.kind == "delete":
+                _renumber(section)
+            self._shift(section, item.amount)
+        else:                                   # delete の実行 / add の取り消し
+            section.items.remove(item)
+            if edit.kind == "delete":
+                _renumber(section)
+            self._shift(section, -item.amount)
+
+
+def _renumber(section: CategorySection) -> None:
+    for i, it in enumerate(section.items, start=1):
+        it.no = i
@@ -276,28 +276,18 @@ def _recompute_discount_and_totals(estimate: EstimateData) -> None:
     （Codexレビュー指摘: 支給品切替で手動値引きが消えていた）。
     """
     summary = estimate.summary
-    try:
-        from pricing.knowledge_base import load_pricing_rules
-        rules = load_pricing_rules()
-    except Exception:
-        rules = {}
-    method = rules.get("discount_method", "round_down_10000")
-
-    def _auto_total(sub: int) -> int:
-        if method == "round_down_10000":
-            return (sub // 10000) * 10000
-        if method == "round_down_100000":
-            return (sub // 100000) * 100000
-        return sub
+    # 税・値引き方式だけを使うため、学習ルール込みの load_pricing_rules ではなく
+    # pricing_rules.yaml の設定をキャッシュから引く（編集のたびに読み直さない）
+    from pricing.edit_session import totals_settings
+    settings = totals_settings()
 
     was_auto = summary.discount == \
-        _auto_total(summary.subtotal) - summary.subtotal
+        settings.auto_total(summary.subtotal) - summary.subtotal
     summary.subtotal = sum(c.total for c in summary.categories)
     if was_auto:
-        summary.discount = _auto_total(summary.subtotal) - summary.subtotal
+        summary.discount = settings.auto_total(summary.subtotal) - summary.subtotal
     summary.total_before_tax = summary.subtotal + summary.discount
-    from pricing.estimate_v2 import tax_amount
-    summary.tax = tax_amount(summary.total_before_tax, rules)
+    summary.tax = settings.tax(summary.total_before_tax)
     summary.total_with_tax = summary.total_before_tax + summary.tax
     estimate.cover.total_before_tax = summary.total_before_tax
     estimate.cover.tax = summary.tax
@@ -4,6 +4,11 @@
 Claude Vision API で読み取り、メーカー・型式・寸法・電気特性・保証情報などを
 構造化JSONとして返す。
 
+テキスト層のあるPDF（メーカー仕様書の多く）は、まずテキストから仕様表を読み
+（product/catalog_text）、読めなかった項目だけをテキストのまま Claude に問い合わせる。
+画像化して Vision に送るのは、テキスト層が無い・仕様表が読めないPDFと画像だけ。
+結果の field_sources に項目ごとの取得経路（text / text_model / vision）を入れる。
+
 使い方:
     from product.catalog_extractor import extract_product_catalog
     info = extract_product_catalog("/path/to/module_catalog.pdf")
@@ -24,7 +29,9 @@ from typing import Optional
 import anthropic
 
 from config import CLAUDE_MODEL, get_api_key
-from extraction.pdf_reader import pdf_to_images
+from extraction import api_client, api_replay
+from extraction.pdf_reader import pdf_page_count, pdf_to_images, select_pages_by_text
+from product import catalog_text
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +45,24 @@ MAX_PAGES = 6
 # サムネイル切り出し時のサイズ
 THUMBNAIL_MAX_PX = 800
 
+# サムネイルの保存先
+THUMBNAIL_DIR = Path(__file__).resolve().parent.parent / "knowledge" / "product_thumbnails"
+
+# MAX_PAGES を超えるカタログで仕様表のページを選ぶ手がかり（テキスト層を検索）
+SPEC_KEYWORDS = (
+    "仕様", "公称最大出力", "定格出力", "最大出力", "開放電圧", "短絡電流",
+    "最大動作電圧", "最大動作電流", "変換効率", "寸法", "質量", "重量", "保証",
+    "pmax", "voc", "isc", "vmp", "imp", "efficiency", "dimensions", "weight",
+)
+
+# テキスト経路でモデルに渡すテキストの上限（文字）
+TEXT_PROMPT_MAX_CHARS = 12000
+
+# field_sources の値（項目をどの経路で得たか）
+SOURCE_TEXT = "text"              # テキスト層を正規表現で読んだ
+SOURCE_TEXT_MODEL = "text_model"  # テキストを Claude に渡して読んだ
+SOURCE_VISION = "vision"          # ページ画像を Claude Vision で読んだ
+
 
 def _build_extraction_prompt() -> str:
     """製品カタログ抽出専用プロンプトを生成する。
@@ -113,11 +138,12 @@ def _build_extraction_prompt() -> str:
 """
 
 
-def extract_product_catalog(pdf_or_image_path: str) -> dict:
+def extract_product_catalog(pdf_or_image_path: str, use_text_layer: bool = True) -> dict:
     """カタログPDFや画像から製品情報を構造化抽出する。
 
     Args:
         pdf_or_image_path: PDFまたは画像（PNG/JPEG）ファイルパス
+        use_text_layer: False ならテキスト層を使わず、常にページ画像から読む
 
     Returns:
         dict: 製品情報（仕様参照: モジュールdocstring）
@@ -135,17 +161,28 @@ def extract_product_catalog(pdf_or_image_path: str) -> dict:
 
     try:
         if suffix == ".pdf":
-            pages = pdf_to_images(str(src_path), dpi=200)
-            if not pages:
-                return _empty_result(warnings=[f"PDFからページを取得できませんでした: {src_path}"])
-            if len(pages) > MAX_PAGES:
+            # ページ数が多いカタログは、テキスト層から仕様表らしいページだけを選んで
+            # レンダリングする（全ページを描いてから捨てない）
+            page_count = pdf_page_count(str(src_path))
+            selected = None
+            if page_count > MAX_PAGES:
+                selected = select_pages_by_text(str(src_path), MAX_PAGES, keywords=SPEC_KEYWORDS)
                 warnings.append(
-                    f"カタログPDFが{len(pages)}ページあるため、先頭{MAX_PAGES}ページのみ解析します"
+                    f"カタログPDFが{page_count}ページあるため、仕様の載っていそうな"
+                    f"{MAX_PAGES}ページ（p.{', '.join(str(p) for p in selected)}）のみ解析します"
                 )
-                pages = pages[:MAX_PAGES]
-            # サムネイル抽出（先頭ページから）
+            if use_text_layer:
+                text_result = _extract_from_text_layer(src_path, selected, warnings)
+                if text_result is not None:
+                    return text_result
+            pages = pdf_to_images(str(src_path), dpi=200, pages=selected, keep_original=(1,))
+            if not pages:
+                return _empty_result(warnings=[f"PDFからページを取得できませんでした: {src_path}"])
+            # サムネイル抽出（先頭ページのコントラスト強調前の画像を使い回す）
             try:
-                catalog_image_path = extract_catalog_thumbnail(str(src_path))
+                first = pages[0] if pages[0]["page"] == 1 else {}
+                catalog_image_path = extract_catalog_thumbnail(
+                    str(src_path), image_bytes=first.get("original_bytes"))
             except Exception as e:
                 logger.debug(f"サムネイル抽出失敗（無視）: {e}")
         elif suffix in (".png", ".jpg", ".jpeg", ".webp"):
@@ -214,14 +251,99 @@ def extract_product_catalog(pdf_or_image_path: str) -> dict:
         result.setdefault("extracted_warnings", []).extend(warnings)
     if catalog_image_path:
         result["catalog_image_path"] = catalog_image_path
+    result["field_sources"] = {f: SOURCE_VISION for f in _filled_fields(result)}
+    result["extraction_path"] = SOURCE_VISION
 
     return result
 
 
+def _extract_from_text_layer(
+    src_path: Path, pages: Optional[list[int]], warnings: list[str]
+) -> Optional[dict]:
+    """テキスト層から抽出する。使えない（スキャンPDF・仕様表が画像・モジュール以外）なら None を返す。
+
+    正規表現で読めた項目はそのまま採用し、足りない項目（メーカー・型式など）だけを
+    テキストのまま Claude に問い合わせる。問い合わせに失敗したら None（Vision へ回す）。
+    """
+    try:
+        text = catalog_text.extract_text_layer(str(src_path), pages)
+    except Exception as e:
+        logger.warning(f"テキスト層の取得に失敗（画像から読みます）: {e}")
+        return None
+    if not catalog_text.has_usable_text(text):
+        return None
+    text_raw, found = catalog_text.parse_spec_text(text)
+    if len([f for f in found if f != "product_type"]) < catalog_text.MIN_TEXT_FIELDS:
+        logger.info("テキスト層から仕様表を読めないため、画像から読みます")
+        return None
+    if not catalog_text.is_module_spec(found):
+        # パワコン・蓄電池の仕様表をモジュールの正規表現で読むと値を取り違える
+        logger.info("モジュールの仕様表（Pmax・Voc/Isc）ではないため、画像から読みます")
+        return None
+
+    missing = catalog_text.missing_fields(found)
+    model_raw: Optional[dict] = None
+    if missing:
+        content = [{"type": "text", "text": _build_text_prompt(text, text_raw, found, missing)}]
+        for attempt in range(1, MAX_RETRIES + 1):
+            try:
+                model_raw = _call_claude_api(content, attempt)
+                break
+            except Exception as e:
+                logger.warning(f"カタログ（テキスト）抽出失敗 試行{attempt}: {e}")
+            if attempt < MAX_RETRIES:
+                time.sleep(RETRY_DELAY_SEC * attempt)
+        if model_raw is None:
+            return None
+
+    result = _normalize_extracted(catalog_text.merge_fields(model_raw, text_raw, found))
+    if not result["raw_text_excerpt"]:
+        result["raw_text_excerpt"] = text[:500]
+    if warnings:
+        result.setdefault("extracted_warnings", []).extend(warnings)
+    # テキスト経路ではサムネイル用に1ページ目だけを描く
+    result["catalog_image_path"] = extract_catalog_thumbnail(str(src_path)) or ""
+    result["field_sources"] = {
+        f: SOURCE_TEXT if f in found else SOURCE_TEXT_MODEL for f in _filled_fields(result)
+    }
+    result["extraction_path"] = "text+model" if missing else SOURCE_TEXT
+    logger.info(
+        f"カタログをテキスト層から抽出: 正規表現{len(found)}項目 / "
+        f"モデル問い合わせ{len(missing)}項目"
+    )
+    return result
+
+
+def _build_text_prompt(text: str, text_raw: dict, found: list[str], missing: list[str]) -> str:
+    """テキスト経路用のプロンプト（読み取り済みの値を示し、不足項目だけを求める）。"""
+    known = {f: catalog_text.get_field(text_raw, f) for f in found}
+    return (
+        "以下は製品カタログPDFのテキスト層です（表の行はラベルと値を1行にまとめています）。\n"
+        f"次の項目はテキストから読み取り済みです: {json.dumps(known, ensure_ascii=False)}\n"
+        f"不足している項目（{', '.join(missing)}）を読み取り、下記の形式のJSONで返してください。"
+        "読み取り済みの項目は null で構いません。\n\n"
+        f"--- カタログテキスト ---\n{text[:TEXT_PROMPT_MAX_CHARS]}\n--- ここまで ---\n\n"
+        + _build_extraction_prompt()
+    )
+
+
+def _filled_fields(result: dict) -> list[str]:
+    """正規化済み結果のうち値が入っている項目（ドット区切り）。"""
+    fields = [f for f in ("maker", "model", "output_w") if result.get(f) not in (None, "")]
+    if result.get("product_type") not in (None, "", "other"):
+        fields.insert(0, "product_type")
+    for group in ("physical", "electrical", "warranty"):
+        for key, value in (result.get(group) or {}).items():
+            if value is not None:
+                fields.append(f"{group}.{key}")
+    return fields
+
+
 def extract_catalog_thumbnail(
     pdf_path: str,
     page: int = 0,
     output_path: Optional[str] = None,
+    image_bytes: Optional[bytes] = None,
 ) -> Optional[str]:
     """PDFの指定ページから製品写真と思しきサムネイルを切り出して保存する。
 
@@ -231,7 +353,8 @@ def extract_catalog_thumbnail(
     Args:
         pdf_path: 対象PDFパス
         page: サムネイルを取り出すページ番号（0-origin、デフォルト0）
-        output_path: 出力先パス。Noneなら knowledge/product_thumbnails/ に保存
+        output_path: 出力先パス。Noneなら THUMBNAIL_DIR（knowledge/product_thumbnails/）に保存
+        image_bytes: そのページをレンダリング済みならその画像（コントラスト強調前。PDFを開き直さない）
 
     Returns:
         保存先パス（成功時） / None（失敗時）
@@ -244,22 +367,25 @@ def extract_catalog_thumbnail(
         if not src_path.exists():
             return None
 
-        doc = fitz.open(str(src_path))
-        try:
-            if len(doc) == 0:
-                return None
-            page_index = max(0, min(page, len(doc) - 1))
-            pix = doc[page_index].get_pixmap(dpi=150)
-            img_bytes = pix.tobytes("png")
-        finally:
-            doc.close()
+        if image_bytes is not None:
+            img_bytes = image_bytes
+        else:
+            doc = fitz.open(str(src_path))
+            try:
+                if len(doc) == 0:
+                    return None
+                page_index = max(0, min(page, len(doc) - 1))
+                pix = doc[page_index].get_pixmap(dpi=150)
+                img_bytes = pix.tobytes("png")
+            finally:
+                doc.close()
 
         img = Image.open(io.BytesIO(img_bytes))
         # アスペクト比を保ちつつ THUMBNAIL_MAX_PX に収める
         img.thumbnail((THUMBNAIL_MAX_PX, THUMBNAIL_MAX_PX))
 
         if output_path is None:
-            base_dir = Path(__file__).resolve().parent.parent / "knowledge" / "product_thumbnails"
+            base_dir = THUMBNAIL_DIR
             base_dir.mkdir(parents=True, exist_ok=True)
             safe_stem = re.sub(r"[^A-Za-z0-9_\-]+", "_", src_path.stem)[:80] or "catalog"
             output_path = str(base_dir / f"{safe_stem}.png")
@@ -282,7 +408,8 @@ def _call_claude_api(content: list[dict], attempt: int) -> dict:
     前置きやコードフェンス混じりの応答は _extract_json で除去する
     （Sonnet 4.6 以降は assistant プリフィルが 400 になるため使用しない）。
     """
-    client = anthropic.Anthropic(api_key=get_api_key())
+    client = api_replay.client(
+        lambda: api_client.shared_client(anthropic, get_api_key), "catalog")
     response = client.messages.create(
         model=CLAUDE_MODEL,
         max_tokens=4096,
@@ -0,0 +1,186 @@
+"""カタログPDFのテキスト層からの仕様抽出（画像化しない高速経路）
+
+メーカーの仕様書PDFはほとんどがテキスト層を持つ（スキャンではない）ため、
+画像化して Vision に送る前に、テキスト層から仕様表（Pmax・Voc・Isc・寸法・重量・
+保証）を正規表現で読む。catalog_extractor はここで読めなかった項目だけを
+テキストのまま Claude に問い合わせる（画像よりはるかに安い）。
+
+- extract_text_layer(): 単語の座標から表の行を組み立てたテキスト（ラベルと値が1行に並ぶ）
+- has_usable_text(): テキスト層が使えるか（文字数と文字化けの割合）
+- parse_spec_text(): _normalize_extracted と同じ形の dict と、読めた項目（ドット区切り）
+- is_module_spec(): 読めた項目にモジュールの証拠（Pmax と Voc / Isc）があるか
+- missing_fields() / merge_fields() / get_field(): 不足項目の列挙、モデル応答への上書き、値の参照
+
+値は項目ごとの妥当範囲で検査し、温度係数（-0.34 %/°C 等）のような同じラベルの
+別の数値は次の候補へ進んで読み飛ばす。パワコン・蓄電池のカタログにも「定格出力」
+「質量」「製品保証」は載っているため、テキスト経路はモジュールの証拠（Pmax と
+Voc / Isc）が揃ったときだけ使う（is_module_spec()）。
+"""
+from __future__ import annotations
+
+import copy
+import logging
+import re
+from typing import Iterable, Optional
+
+import fitz  # PyMuPDF
+
+logger = logging.getLogger(__name__)
+
+# テキスト層を「使える」とみなす最小文字数（空白除く）と、文字化け（U+FFFD）の許容割合
+MIN_TEXT_CHARS = 200
+MAX_GARBLED_RATIO = 0.05
+
+# テキスト経路を採用する最小の読み取り項目数（仕様表が画像のカタログは Vision へ回す）
+MIN_TEXT_FIELDS = 3
+
+# 同じ行とみなす単語の縦位置の差（pt）
+ROW_TOLERANCE_PT = 3.0
+
+# モジュールで揃えたい項目（この中で読めなかったものをモデルに問い合わせる）
+MODULE_FIELDS = (
+    "product_type", "maker", "model", "output_w",
+    "physical.length_mm", "physical.width_mm", "physical.thickness_mm", "physical.weight_kg",
+    "electrical.vmp", "electrical.imp", "electrical.voc", "electrical.isc",
+    "electrical.efficiency_pct",
+    "warranty.product_years", "warranty.output_years",
+)
+
+# (項目, ラベルの正規表現, 妥当範囲)。出力のラベルは「定格出力電圧」のような
+# 電圧・電流・周波数の行（パワコンの仕様表）には当てない
+_NUMBER_FIELDS = (
+    ("output_w",
+     r"(?:公称最大出力|最大出力|定格出力|maximum\s+power|nominal\s+(?:max(?:imum)?\.?\s+)?power"
+     r"|rated\s+power|\bpmax\b)(?!\s*(?:動作)?(?:電圧|電流|周波数|voltage|current|frequency))",
+     (100, 1000)),
+    ("electrical.vmp",
+     r"最大出力動作電圧|最大動作電圧|最適動作電圧|\bvmpp?\b|maximum\s+power\s+voltage"
+     r"|optimum\s+operating\s+voltage", (10, 100)),
+    ("electrical.imp",
+     r"最大出力動作電流|最大動作電流|最適動作電流|\bimpp?\b|maximum\s+power\s+current"
+     r"|optimum\s+operating\s+current", (1, 30)),
+    ("electrical.voc", r"開放電圧|\bvoc\b|open[\s-]circuit\s+voltage", (10, 100)),
+    ("electrical.isc", r"短絡電流|\bisc\b|short[\s-]circuit\s+current", (1, 30)),
+    ("electrical.efficiency_pct", r"変換効率|module\s+efficiency|\befficiency\b", (10, 30)),
+    ("physical.weight_kg", r"質量|重量|\bweight\b", (5, 60)),
+    ("warranty.product_years",
+     r"製品保証|product\s+warranty|materials?\s+(?:and|&)\s+workmanship", (1, 40)),
+    ("warranty.output_years",
+     r"出力保証|(?:linear\s+)?(?:power|performance|power\s+output)\s+warranty", (1, 40)),
+)
+
+_LABEL_VALUE = r"(?:{label})[^\d\n]{{0,40}}?(\d+(?:\.\d+)?)"
+_COMPILED = [(path, re.compile(_LABEL_VALUE.format(label=label), re.IGNORECASE), rng)
+             for path, label, rng in _NUMBER_FIELDS]
+
+# 寸法: 2384 × 1303 × 35 mm（長さ×幅×厚さ）
+_DIMENSIONS = re.compile(
+    r"(\d{3,4}(?:\.\d+)?)\s*[x×X*＊]\s*(\d{3,4}(?:\.\d+)?)\s*[x×X*＊]\s*(\d{1,3}(?:\.\d+)?)\s*mm",
+    re.IGNORECASE)
+
+
+def extract_text_layer(pdf_path: str, pages: Optional[Iterable[int]] = None) -> str:
+    """テキスト層を行単位で取り出す（pages は1始まり、None なら全ページ）。
+
+    表のセルは別ブロックになることが多いため、単語の縦位置で行をまとめ直し、
+    左から並べる（「開放電圧 Voc」と「46.0 V」が同じ行に来る）。
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        if pages is None:
+            indexes = range(len(doc))
+        else:
+            indexes = sorted({p - 1 for p in pages if 1 <= p <= len(doc)})
+        lines: list[str] = []
+        for i in indexes:
+            lines.extend(_page_lines(doc[i]))
+        return "\n".join(lines)
+    finally:
+        doc.close()
+
+
+def _page_lines(page) -> list[str]:
+    words = page.get_text("words")  # (x0, y0, x1, y1, word, block, line, word_no)
+    rows: list[tuple[float, list]] = []
+    for w in sorted(words, key=lambda w: ((w[1] + w[3]) / 2, w[0])):
+        center = (w[1] + w[3]) / 2
+        if rows and abs(rows[-1][0] - center) <= ROW_TOLERANCE_PT:
+            rows[-1][1].append(w)
+        else:
+            rows.append((center, [w]))
+    return [" ".join(w[4] for w in sorted(ws, key=lambda w: w[0])) for _, ws in rows]
+
+
+def has_usable_text(text: str) -> bool:
+    """テキスト層が仕様抽出に使えるか（スキャンPDF・フォント埋め込み不備は False）。"""
+    chars = re.sub(r"\s+", "", text or "")
+    if len(chars) < MIN_TEXT_CHARS:
+        return False
+    return chars.count("�") / len(chars) <= MAX_GARBLED_RATIO
+
+
+def parse_spec_text(text: str) -> tuple[dict, list[str]]:
+    """テキストから仕様表の数値を読む。
+
+    Returns:
+        (_normalize_extracted と同じ形の raw dict, 読めた項目のリスト（ドット区切り）)
+    """
+    raw: dict = {"physical": {}, "electrical": {}, "warranty": {}}
+    found: list[str] = []
+    for path, pattern, (low, high) in _COMPILED:
+        for m in pattern.finditer(text):
+            value = float(m.group(1))
+            if low <= value <= high:
+                _set_path(raw, path, value)
+                found.append(path)
+                break
+
+    for m in _DIMENSIONS.finditer(text):
+        length, width, thickness = (float(g) for g in m.groups())
+        if 1000 <= length <= 3000 and 500 <= width <= 2000 and 20 <= thickness <= 60:
+            raw["physical"].update(length_mm=length, width_mm=width, thickness_mm=thickness)
+            found.extend(["physical.length_mm", "physical.width_mm", "physical.thickness_mm"])
+            break
+
+    if is_module_spec(found):
+        raw["product_type"] = "module"
+        found.append("product_type")
+    return raw, found
+
+
+def is_module_spec(found: Iterable[str]) -> bool:
+    """読めた項目がモジュールの仕様表らしいか（Pmax と Voc / Isc が揃っている）。"""
+    have = set(found)
+    return "output_w" in have and ("electrical.voc" in have or "electrical.isc" in have)
+
+
+def missing_fields(found: Iterable[str]) -> list[str]:
+    """MODULE_FIELDS のうち、テキストから読めなかった項目。"""
+    have = set(found)
+    return [f for f in MODULE_FIELDS if f not in have]
+
+
+def merge_fields(model_raw: Optional[dict], text_raw: dict, found: Iterable[str]) -> dict:
+    """モデル応答（不足項目）に、テキストから読めた値を上書きした raw dict を返す。"""
+    merged = copy.deepcopy(model_raw) if isinstance(model_raw, dict) else {}
+    for path in found:
+        _set_path(merged, path, get_field(text_raw, path))
+    return merged
+
+
+def _set_path(d: dict, path: str, value) -> None:
+    keys = path.split(".")
+    for k in keys[:-1]:
+        if not isinstance(d.get(k), dict):
+            d[k] = {}
+        d = d[k]
+    d[keys[-1]] = value
+
+
+def get_field(d: dict, path: str):
+    """ドット区切りの項目名で値を取り出す（無ければ None）。"""
+    for k in path.split("."):
+        if not isinstance(d, dict):
+            return None
+        d = d.get(k)
+    return d
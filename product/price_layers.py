@@ -0,0 +1,208 @@
+"""単価の重ね合わせ（仕入先カタログ・お客様修正・期間限定キャンペーン）
+
+単価マスター（product/price_master）の各行の単価を、次の優先順で決める（上ほど強い）:
+    1. campaign  期間限定のキャンペーン単価（開始日〜終了日のみ有効・複数なら最安）
+    2. customer  お客様が単価マスタで修正した単価
+    3. supplier  仕入先カタログの単価（価格表本体と、仕入先別の価格表のうち最安）
+
+上書きのある製品だけを product_id → 各層の勝ち値 の辞書（合成済み索引）に持つため、
+1行の単価決定は辞書を1回引くだけで済み、マスターの件数にもよらない。
+お客様修正やキャンペーンが1件変わったときは、その製品の項目だけを作り直す。
+キャンペーンの開始・終了日をまたいだら、キャンペーン分だけを作り直す。
+
+    layers = PriceLayers("価格表A", supplier_prices, customer, campaigns)
+    layers.apply(product)   # unit_price と price_layer / price_source を書き込む
+"""
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Callable, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+LAYER_SUPPLIER = "supplier"
+LAYER_CUSTOMER = "customer"
+LAYER_CAMPAIGN = "campaign"
+
+CUSTOMER_SOURCE = "お客様修正"
+CAMPAIGN_SOURCE = "キャンペーン"
+
+
+@dataclass(frozen=True)
+class Campaign:
+    """期間限定のキャンペーン単価（start〜end の両端を含む）。"""
+    id: str
+    product_id: str
+    unit_price: int
+    start: date
+    end: date
+    name: str = ""
+
+    def active(self, day: date) -> bool:
+        return self.start <= day <= self.end
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "product_id": self.product_id,
+            "unit_price": self.unit_price,
+            "start": self.start.isoformat(),
+            "end": self.end.isoformat(),
+            "name": self.name,
+        }
+
+
+def parse_campaigns(raw: Iterable) -> list[Campaign]:
+    """保存形式（dict のリスト）からキャンペーンを読む。壊れた項目は警告して飛ばす。"""
+    campaigns: list[Campaign] = []
+    for item in raw or []:
+        try:
+            c = Campaign(
+                id=str(item["id"]),
+                product_id=str(item["product_id"]),
+                unit_price=int(item["unit_price"]),
+                start=date.fromisoformat(str(item["start"])),
+                end=date.fromisoformat(str(item["end"])),
+                name=str(item.get("name") or ""),
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"キャンペーン単価の形式が不正なため無視します: {item!r} ({e})")
+            continue
+        if c.end < c.start:
+            logger.warning(f"キャンペーンの終了日が開始日より前のため無視します: {c.id}")
+            continue
+        campaigns.append(c)
+    return campaigns
+
+
+class PriceLayers:
+    """製品ごとの単価の層を合成した索引。
+
+    Args:
+        base_source: 価格表本体の名称（price_source に使う）
+        supplier_prices: {product_id: [(単価, 仕入先名), ...]} 仕入先別の価格表
+        customer: {product_id: 単価} お客様修正
+        campaigns: キャンペーン単価
+        today: 今日の日付を返す関数（テストで差し替える）
+    """
+
+    def __init__(
+        self,
+        base_source: str,
+        supplier_prices: dict[str, list[tuple[int, str]]],
+        customer: dict[str, int],
+        campaigns: Iterable[Campaign] = (),
+        today: Callable[[], date] = date.today,
+    ):
+        self.base_source = base_source
+        self._today = today
+        self._supplier = {pid: min(entries) for pid, entries in supplier_prices.items() if entries}
+        self._customer = dict(customer)
+        self._campaigns: dict[str, list[Campaign]] = {}
+        for c in campaigns:
+            self._campaigns.setdefault(c.product_id, []).append(c)
+        self._merged: dict[str, dict] = {}
+        self._day = today()
+        self._next_change: Optional[date] = None
+        for pid in set(self._supplier) | set(self._customer) | set(self._campaigns):
+            self._merge(pid)
+        self._schedule()
+
+    # --- 索引の更新 --------------------------------------------------------
+    def _merge(self, pid: str) -> None:
+        """1製品分の合成値を作り直す。"""
+        active = [c for c in self._campaigns.get(pid, ()) if c.active(self._day)]
+        entry = {
+            LAYER_SUPPLIER: self._supplier.get(pid),
+            LAYER_CUSTOMER: self._customer.get(pid),
+            LAYER_CAMPAIGN: min(active, key=lambda c: c.unit_price) if active else None,
+        }
+        if any(v is not None for v in entry.values()):
+            self._merged[pid] = entry
+        else:
+            self._merged.pop(pid, None)
+
+    def _schedule(self) -> None:
+        """次にキャンペーンの有効/無効が切り替わる日を求める。"""
+        boundaries = []
+        for campaigns in self._campaigns.values():
+            for c in campaigns:
+                if c.start > self._day:
+                    boundaries.append(c.start)
+                if c.end >= self._day:
+                    boundaries.append(c.end + timedelta(days=1))
+        self._next_change = min(boundaries) if boundaries else None
+
+    def _refresh(self) -> None:
+        today = self._today()
+        if today == self._day:
+            return
+        crossed = self._next_change is not None and today >= self._next_change
+        self._day = today
+        if crossed:
+            for pid in list(self._campaigns):
+                self._merge(pid)
+        self._schedule()
+
+    def set_customer(self, product_id: str, unit_price: Optional[int]) -> None:
+        """お客様修正を1件更新する（None で解除）。その製品だけを作り直す。"""
+        pid = str(product_id)
+        if unit_price is None:
+            self._customer.pop(pid, None)
+        else:
+            self._customer[pid] = int(unit_price)
+        self._merge(pid)
+
+    def set_campaigns(self, campaigns: Iterable[Campaign]) -> None:
+        """キャンペーンを差し替える。増減のあった製品だけを作り直す。"""
+        grouped: dict[str, list[Campaign]] = {}
+        for c in campaigns:
+            grouped.setdefault(c.product_id, []).append(c)
+        changed = {pid for pid in set(grouped) | set(self._campaigns)
+                   if grouped.get(pid) != self._campaigns.get(pid)}
+        self._campaigns = grouped
+        for pid in changed:
+            self._merge(pid)
+        self._schedule()
+
+    # --- 参照 --------------------------------------------------------------
+    def layer_of(self, product_id: str) -> Optional[dict]:
+        """製品の合成値（上書きが無ければ None）。"""
+        self._refresh()
+        return self._merged.get(str(product_id))
+
+    def apply(self, p: dict) -> dict:
+        """製品 dict に有効単価と勝った層を書き込んで返す。
+
+        上書きで単価が変わったときは元の単価を base_unit_price に残す。
+        お客様修正がある製品は price_overridden=True（キャンペーンが勝っていても）。
+        """
+        base = p.get("unit_price")
+        p["price_layer"] = LAYER_SUPPLIER
+        p["price_source"] = self.base_source
+        entry = self.layer_of(p.get("id", ""))
+        if entry is None:
+            return p
+        supplier = entry[LAYER_SUPPLIER]
+        if supplier is not None and (base is None or supplier[0] < base):
+            p["base_unit_price"] = base
+            p["unit_price"] = supplier[0]
+            p["price_source"] = p["supplier"] = supplier[1]
+        customer = entry[LAYER_CUSTOMER]
+        if customer is not None:
+            p["base_unit_price"] = base
+            p["unit_price"] = customer
+            p["price_overridden"] = True
+            p["price_layer"] = LAYER_CUSTOMER
+            p["price_source"] = CUSTOMER_SOURCE
+        campaign = entry[LAYER_CAMPAIGN]
+        if campaign is not None:
+            p["base_unit_price"] = base
+            p["unit_price"] = campaign.unit_price
+            p["price_layer"] = LAYER_CAMPAIGN
+            p["price_source"] = campaign.name or CAMPAIGN_SOURCE
+            p["campaign_id"] = campaign.id
+            p["campaign_end"] = campaign.end.isoformat()
+        return p
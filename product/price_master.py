@@ -6,26 +6,44 @@
 製品カタログ（product_registry.py: モジュール/PCS等の詳細スペック）とは別系統で、
 こちらは「部材ごとの単価表」を扱う。見積明細への単価自動引き当てに使う。
 
+参照は JSON を毎回全件読むのではなく、同じ内容を索引つきで持つ SQLite
+（`knowledge/price_master.sqlite`。build_price_master.py が JSON と一緒に書き出す）に
+その都度問い合わせる。ファイルはメモリマップで開くため、起動時の読み込みは
+マスターの件数によらない。SQLite が無い・JSON と内容が食い違う（JSON の
+ハッシュで判定）場合は、初回参照時に JSON から作り直す（書けなければメモリ上に作る）。
+
+返す製品の unit_price は、価格表本体・仕入先別の価格表（knowledge/price_suppliers/）・
+お客様修正・期間限定キャンペーンを重ね合わせた有効単価で、勝った層を price_layer
+（supplier / customer / campaign）と price_source に入れる（product/price_layers）。
+
 主な公開関数:
-    - load_price_master()           マスター全体(dict)を読み込み（キャッシュ）
+    - load_price_master()           マスター全体(dict)を組み立てる（全件を読むため重い）
     - get_products()                製品リスト
     - get_categories() / get_makers()
     - get_conditions() / get_meta()
     - search(query, ...)            横断検索
     - find_by_code(code)            商品コード完全一致
     - find_by_model(model, fuzzy)   型番一致（スコア順）
-    - find_price(maker, model, ...) 単価参照（canonical優先の1件）
+    - find_price(maker, model, ...) 単価参照（canonical優先の1件・勝った層つき）
+    - set_price_override() / set_campaign_price() / remove_campaign()  単価の上書き
     - format_price(value)           表示用フォーマット
 """
 from __future__ import annotations
 
+import hashlib
 import json
 import logging
 import re
+import sqlite3
+import threading
 import unicodedata
+import uuid
+from datetime import date
 from pathlib import Path
 from typing import Any, Optional
 
+from product import price_layers
+
 logger = logging.getLogger(__name__)
 
 MASTER_PATH = (
@@ -40,63 +58,264 @@ OVERRIDES_PATH = (
 )
 OVERRIDES_KEY = "price_master_overrides"  # Supabase app_storage のキー
 
-# 読み込みキャッシュ（mtime+sizeのシグネチャで自動失効）
-_CACHE: dict[str, Any] = {"sig": None, "data": None}
-_OVERRIDES_CACHE: dict[str, Any] = {"loaded": False, "overrides": {}}
+# 仕入先別の価格表（価格表本体の製品に対する仕入先ごとの単価）の置き場所
+SUPPLIERS_DIR = (
+    Path(__file__).resolve().parent.parent / "knowledge" / "price_suppliers"
+)
+
+# 索引つきの保存形式（SQLite）。DB_FORMAT_VERSION はテーブル構成を変えたら上げる
+DB_PATH = MASTER_PATH.with_suffix(".sqlite")
+DB_FORMAT_VERSION = 1
+
+# メモリマップで読む上限（バイト）
+_MMAP_BYTES = 256 * 1024 * 1024
+
+# meta テーブルに JSON で持つマスター情報
+_META_KEYS = (
+    "schema_version", "source", "source_date", "currency", "tax_included",
+    "updated_at", "categories", "makers", "conditions", "product_count",
+)
 
+# 開いている SQLite（JSON / SQLite の mtime+size のシグネチャで自動失効）。
+# data は load_price_master() が組み立てた全体 dict
+_CACHE: dict[str, Any] = {"sig": None, "store": None, "data": None, "layers": None}
+_OPEN_LOCK = threading.Lock()
+_OVERRIDES_CACHE: dict[str, Any] = {"loaded": False, "overrides": {}, "campaigns": []}
 
-def _file_signature() -> Optional[tuple]:
-    """ファイル変更検知用シグネチャ (mtime, size)。無ければ None。"""
+
+def _stat_sig(path: Path) -> Optional[tuple]:
     try:
-        st = MASTER_PATH.stat()
+        st = path.stat()
         return (st.st_mtime, st.st_size)
     except OSError:
         return None
 
 
+def _file_signature() -> tuple:
+    """ファイル変更検知用シグネチャ（JSON・SQLite・仕入先別価格表の (mtime, size)）。"""
+    suppliers = tuple(
+        (p.name, _stat_sig(p)) for p in sorted(SUPPLIERS_DIR.glob("*.json"))
+    ) if SUPPLIERS_DIR.is_dir() else ()
+    return (_stat_sig(MASTER_PATH), _stat_sig(DB_PATH), suppliers)
+
+
+# ---------------------------------------------------------------------------
+# 保存形式（SQLite）
+# ---------------------------------------------------------------------------
+def json_source_hash(path: Optional[Path] = None) -> str:
+    """JSON の内容ハッシュ（SQLite がどの JSON から作られたかの照合に使う）。"""
+    return hashlib.sha256(Path(path or MASTER_PATH).read_bytes()).hexdigest()
+
+
+def _model_tokens(model_norm: str) -> set[str]:
+    return {t for t in re.split(r"[\s\-_/]+", model_norm) if t}
+
+
+def _haystack(p: dict) -> str:
+    return " ".join([
+        str(p.get("product_code") or ""),
+        str(p.get("model") or ""),
+        str(p.get("name") or ""),
+        str(p.get("remarks") or ""),
+        str(p.get("maker") or ""),
+    ]).lower()
+
+
+def _fill_db(conn: sqlite3.Connection, master: dict, source_hash: str) -> None:
+    conn.executescript("""
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        CREATE TABLE products (
+            rowid INTEGER PRIMARY KEY,
+            category TEXT NOT NULL,
+            maker_lc TEXT NOT NULL,
+            code_lc TEXT NOT NULL,
+            model_norm TEXT NOT NULL,
+            item_kind TEXT NOT NULL,
+            is_canonical INTEGER NOT NULL,
+            source_page INTEGER NOT NULL,
+            haystack TEXT NOT NULL,
+            doc TEXT NOT NULL
+        );
+        CREATE TABLE model_tokens (token TEXT NOT NULL, product INTEGER NOT NULL);
+    """)
+    products = master.get("products", [])
+    meta = {k: master.get(k) for k in _META_KEYS}
+    meta.update(format_version=DB_FORMAT_VERSION, source_hash=source_hash)
+    conn.executemany("INSERT INTO meta VALUES (?, ?)",
+                     [(k, json.dumps(v, ensure_ascii=False)) for k, v in meta.items()])
+    rows, tokens = [], []
+    for i, p in enumerate(products):
+        model_norm = _normalize_model(p.get("model", ""))
+        rows.append((
+            i, p.get("category") or "", (p.get("maker") or "").lower(),
+            (p.get("product_code") or "").strip().lower(), model_norm,
+            p.get("item_kind") or "", int(bool(p.get("is_canonical", True))),
+            int(p.get("source_page") or 0), _haystack(p),
+            json.dumps(p, ensure_ascii=False),
+        ))
+        tokens.extend((t, i) for t in _model_tokens(model_norm))
+    conn.executemany("INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.executemany("INSERT INTO model_tokens VALUES (?, ?)", tokens)
+    conn.executescript("""
+        CREATE INDEX idx_products_code ON products (code_lc);
+        CREATE INDEX idx_products_model ON products (model_norm);
+        CREATE INDEX idx_products_category ON products (category);
+        CREATE INDEX idx_model_tokens ON model_tokens (token);
+    """)
+    # 3文字以上のキーワードは trigram の全文索引で候補を絞る（無い環境では全走査）
+    try:
+        conn.executescript("""
+            CREATE VIRTUAL TABLE products_fts USING fts5(
+                haystack, content='products', content_rowid='rowid', tokenize='trigram');
+            INSERT INTO products_fts (products_fts) VALUES ('rebuild');
+        """)
+        fts = True
+    except sqlite3.OperationalError as e:
+        logger.info(f"SQLite の trigram 全文索引が使えないため全走査で検索します: {e}")
+        fts = False
+    conn.execute("INSERT INTO meta VALUES ('fts', ?)", (json.dumps(fts),))
+
+
+def write_master_db(master: dict, path: Optional[Path] = None, source_hash: str = "") -> Path:
+    """マスター dict（JSON と同じ形）を索引つき SQLite に書き出す（一時ファイル経由）。"""
+    path = Path(path or DB_PATH)
+    tmp = path.with_suffix(".sqlite.tmp")
+    tmp.unlink(missing_ok=True)
+    conn = sqlite3.connect(str(tmp))
+    try:
+        _fill_db(conn, _normalize_master(master), source_hash)
+        conn.commit()
+    finally:
+        conn.close()
+    tmp.replace(path)
+    return path
+
+
+def build_master_db(json_path: Optional[Path] = None, db_path: Optional[Path] = None) -> Path:
+    """JSON マスターから SQLite を作り直す（build_price_master.py から呼ぶ）。"""
+    json_path = Path(json_path or MASTER_PATH)
+    with open(json_path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    return write_master_db(raw, db_path or DB_PATH, source_hash=json_source_hash(json_path))
+
+
+class _MasterStore:
+    """SQLite のマスター1つ分（接続・meta・問い合わせ）。スレッド間で共有する。"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+        self._lock = threading.Lock()
+        self.meta = {k: json.loads(v) for k, v in conn.execute("SELECT key, value FROM meta")}
+
+    @classmethod
+    def open(cls, path: Path) -> "_MasterStore":
+        conn = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True,
+                               check_same_thread=False)
+        conn.execute(f"PRAGMA mmap_size = {_MMAP_BYTES}")
+        return cls(conn)
+
+    @classmethod
+    def in_memory(cls, master: dict, source_hash: str) -> "_MasterStore":
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        _fill_db(conn, _normalize_master(master), source_hash)
+        return cls(conn)
+
+    def docs(self, where: str = "", params: tuple = (), order: str = "rowid",
+             limit: Optional[int] = None) -> list[tuple[int, dict]]:
+        sql = "SELECT rowid, doc FROM products"
+        if where:
+            sql += f" WHERE {where}"
+        sql += f" ORDER BY {order}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params = params + (limit,)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [(rowid, json.loads(doc)) for rowid, doc in rows]
+
+    def model_token_rows(self, tokens: set[str]) -> list[int]:
+        if not tokens:
+            return []
+        marks = ", ".join("?" for _ in tokens)
+        with self._lock:
+            return [r for (r,) in self._conn.execute(
+                f"SELECT DISTINCT product FROM model_tokens WHERE token IN ({marks})",
+                tuple(tokens))]
+
+
+def _read_json_master() -> dict:
+    if not MASTER_PATH.exists():
+        logger.warning(f"price_master.json が見つかりません: {MASTER_PATH}")
+        return _empty_master()
+    try:
+        with open(MASTER_PATH, "r", encoding="utf-8") as f:
+            return _normalize_master(json.load(f))
+    except (json.JSONDecodeError, OSError) as e:
+        logger.warning(f"price_master.json 読み込み失敗: {e}")
+        return _empty_master()
+
+
+def _open_store() -> _MasterStore:
+    source_hash = json_source_hash() if MASTER_PATH.exists() else ""
+    if DB_PATH.exists():
+        try:
+            store = _MasterStore.open(DB_PATH)
+            if (store.meta.get("format_version") == DB_FORMAT_VERSION
+                    and (not source_hash or store.meta.get("source_hash") == source_hash)):
+                return store
+            logger.info("price_master.sqlite が JSON と一致しないため作り直します")
+        except sqlite3.Error as e:
+            logger.warning(f"price_master.sqlite を開けません（作り直します）: {e}")
+    master = _read_json_master()
+    try:
+        write_master_db(master, DB_PATH, source_hash=source_hash)
+        return _MasterStore.open(DB_PATH)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"price_master.sqlite を書けないためメモリ上に作ります: {e}")
+        return _MasterStore.in_memory(master, source_hash)
+
+
+def _store() -> _MasterStore:
+    """内部用: 現在のマスターの SQLite（ファイルが変わっていれば開き直す）。"""
+    sig = _file_signature()
+    store = _CACHE["store"]
+    if store is not None and _CACHE["sig"] == sig:
+        return store
+    with _OPEN_LOCK:
+        if _CACHE["store"] is None or _CACHE["sig"] != sig:
+            _CACHE["store"] = _open_store()
+            _CACHE["sig"] = _file_signature()
+            _CACHE["data"] = None
+            _CACHE["layers"] = None
+        return _CACHE["store"]
+
+
 # ---------------------------------------------------------------------------
 # ロード
 # ---------------------------------------------------------------------------
 def load_price_master(force: bool = False) -> dict:
-    """単価マスターJSONを読み込む（mtime+sizeベースのキャッシュ付き）。
+    """単価マスター全体を JSON と同じ形の dict で返す（顧客の単価上書き適用済み）。
 
+    全件を組み立てるため、検索・単価参照はこれを使わず各関数が SQLite に問い合わせる。
     ファイルが無い/壊れている場合は空のマスターを返す。
     """
-    sig = _file_signature()
-
-    if not force and _CACHE["data"] is not None and _CACHE["sig"] == sig:
+    if force:
+        _CACHE["sig"] = None
+    store = _store()
+    if _CACHE["data"] is not None:
         return _CACHE["data"]
-
-    if not MASTER_PATH.exists():
-        logger.warning(f"price_master.json が見つかりません: {MASTER_PATH}")
-        data = _empty_master()
-    else:
-        try:
-            with open(MASTER_PATH, "r", encoding="utf-8") as f:
-                raw = json.load(f)
-            data = _normalize_master(raw)
-        except (json.JSONDecodeError, OSError) as e:
-            logger.warning(f"price_master.json 読み込み失敗: {e}")
-            data = _empty_master()
-
-    data = _apply_price_overrides(data)
+    data = _empty_master()
+    data.update({k: store.meta.get(k, data[k]) for k in _META_KEYS})
+    data["products"] = get_products()
     _CACHE["data"] = data
-    _CACHE["sig"] = sig
     return data
 
 
 # ---------------------------------------------------------------------------
-# 顧客側の単価上書き（お客様が単価マスタを修正できるようにする）
+# 顧客側の単価上書き・キャンペーン単価（お客様が単価マスタを修正できるようにする）
 # ---------------------------------------------------------------------------
-def get_price_overrides(force: bool = False) -> dict:
-    """{product_id: unit_price} の上書き辞書を返す（キャッシュ付き）。
-
-    Supabase（app_storage）→ ローカルファイルの順で読む。
-    Streamlit Cloud はコンテナ再起動でローカルファイルが消えるため、
-    本番の永続化は Supabase が正。
-    """
-    if _OVERRIDES_CACHE["loaded"] and not force:
-        return _OVERRIDES_CACHE["overrides"]
+def _load_overrides_doc() -> Optional[dict]:
+    """上書きの保存内容を Supabase（app_storage）→ ローカルファイルの順で読む。"""
     doc = None
     try:
         from learning.storage_backend import is_enabled, kv_get
@@ -111,33 +330,47 @@ def get_price_overrides(force: bool = False) -> dict:
                     doc = json.load(f)
         except (json.JSONDecodeError, OSError) as e:
             logger.warning(f"単価上書きのローカル読込に失敗: {e}")
+    return doc if isinstance(doc, dict) else None
+
+
+def _load_overrides(force: bool = False) -> None:
+    if _OVERRIDES_CACHE["loaded"] and not force:
+        return
+    doc = _load_overrides_doc() or {}
     overrides = {}
-    if isinstance(doc, dict):
-        for pid, price in (doc.get("overrides") or {}).items():
-            try:
-                overrides[str(pid)] = int(price)
-            except (TypeError, ValueError):
-                continue
+    for pid, price in (doc.get("overrides") or {}).items():
+        try:
+            overrides[str(pid)] = int(price)
+        except (TypeError, ValueError):
+            continue
     _OVERRIDES_CACHE["overrides"] = overrides
+    _OVERRIDES_CACHE["campaigns"] = price_layers.parse_campaigns(doc.get("campaigns") or [])
     _OVERRIDES_CACHE["loaded"] = True
-    return overrides
 
 
-def set_price_override(product_id: str, unit_price: Optional[int]) -> bool:
-    """1製品の単価上書きを保存する（unit_price=None で上書き解除）。
+def get_price_overrides(force: bool = False) -> dict:
+    """{product_id: unit_price} の上書き辞書を返す（キャッシュ付き）。
 
-    Supabase とローカルファイルの両方へ保存し、マスターのキャッシュを
-    無効化して次回参照から反映させる。成功で True。
+    Supabase（app_storage）→ ローカルファイルの順で読む。
+    Streamlit Cloud はコンテナ再起動でローカルファイルが消えるため、
+    本番の永続化は Supabase が正。
     """
+    _load_overrides(force)
+    return _OVERRIDES_CACHE["overrides"]
+
+
+def get_campaigns(force: bool = False) -> list[price_layers.Campaign]:
+    """期間限定のキャンペーン単価（お客様修正と同じ保存先に持つ）。"""
+    _load_overrides(force)
+    return list(_OVERRIDES_CACHE["campaigns"])
+
+
+def _save_overrides(overrides: dict, campaigns: list[price_layers.Campaign]) -> bool:
+    """上書きとキャンペーンを Supabase とローカルファイルの両方へ保存する。成功で True。"""
     from datetime import datetime
-    overrides = dict(get_price_overrides(force=True))
-    pid = str(product_id)
-    if unit_price is None:
-        overrides.pop(pid, None)
-    else:
-        overrides[pid] = int(unit_price)
     doc = {
         "overrides": overrides,
+        "campaigns": [c.to_dict() for c in campaigns],
         "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
     }
     ok_local = False
@@ -157,30 +390,131 @@ def set_price_override(product_id: str, unit_price: Optional[int]) -> bool:
             ok_remote = kv_set(OVERRIDES_KEY, doc)
     except Exception as e:
         logger.warning(f"単価上書きのSupabase保存に失敗: {e}")
-    # キャッシュ更新 + マスターキャッシュ無効化（次回 load で上書き再適用）
-    _OVERRIDES_CACHE["overrides"] = overrides
-    _OVERRIDES_CACHE["loaded"] = True
-    _CACHE["sig"] = None
+    _OVERRIDES_CACHE.update(overrides=overrides, campaigns=list(campaigns), loaded=True)
+    _CACHE["data"] = None
     return ok_local or ok_remote
 
 
-def _apply_price_overrides(data: dict) -> dict:
-    """マスター dict に顧客の単価上書きを適用する（元単価は base_unit_price に保持）。"""
-    overrides = get_price_overrides()
-    if not overrides:
-        return data
-    products = []
-    for p in data.get("products", []):
-        pid = str(p.get("id", ""))
-        if pid in overrides:
-            p = dict(p)
-            p["base_unit_price"] = p.get("unit_price")
-            p["unit_price"] = overrides[pid]
-            p["price_overridden"] = True
-        products.append(p)
-    data = dict(data)
-    data["products"] = products
-    return data
+def set_price_override(product_id: str, unit_price: Optional[int]) -> bool:
+    """1製品の単価上書きを保存する（unit_price=None で上書き解除）。
+
+    Supabase とローカルファイルの両方へ保存し、単価の合成索引はその製品の
+    項目だけを作り直す（次回参照から反映）。成功で True。
+    """
+    overrides = dict(get_price_overrides(force=True))
+    pid = str(product_id)
+    if unit_price is None:
+        overrides.pop(pid, None)
+    else:
+        overrides[pid] = int(unit_price)
+    ok = _save_overrides(overrides, _OVERRIDES_CACHE["campaigns"])
+    if _CACHE["layers"] is not None:
+        _CACHE["layers"].set_customer(pid, overrides.get(pid))
+    return ok
+
+
+def set_campaign_price(
+    product_id: str, unit_price: int, start: date, end: date, name: str = ""
+) -> Optional[str]:
+    """期間限定のキャンペーン単価を追加する（start〜end の両端を含む）。
+
+    Returns:
+        追加したキャンペーンの id（保存失敗・期間が不正なら None）
+    """
+    if end < start:
+        return None
+    campaigns = get_campaigns(force=True)
+    campaign = price_layers.Campaign(
+        id=uuid.uuid4().hex[:12], product_id=str(product_id), unit_price=int(unit_price),
+        start=start, end=end, name=name)
+    campaigns.append(campaign)
+    if not _save_overrides(dict(_OVERRIDES_CACHE["overrides"]), campaigns):
+        return None
+    if _CACHE["layers"] is not None:
+        _CACHE["layers"].set_campaigns(campaigns)
+    return campaign.id
+
+
+def remove_campaign(campaign_id: str) -> bool:
+    """キャンペーン単価を削除する。該当が無ければ False。"""
+    campaigns = get_campaigns(force=True)
+    kept = [c for c in campaigns if c.id != campaign_id]
+    if len(kept) == len(campaigns):
+        return False
+    ok = _save_overrides(dict(_OVERRIDES_CACHE["overrides"]), kept)
+    if _CACHE["layers"] is not None:
+        _CACHE["layers"].set_campaigns(kept)
+    return ok
+
+
+# ---------------------------------------------------------------------------
+# 仕入先別の価格表と単価の合成（product/price_layers）
+# ---------------------------------------------------------------------------
+def _load_supplier_prices(store: "_MasterStore") -> dict[str, list[tuple[int, str]]]:
+    """SUPPLIERS_DIR の仕入先別価格表を読み、マスターの製品 id ごとの単価にする。
+
+    各ファイルは {"supplier": 仕入先名, "prices": [{"product_code" | "maker"+"model",
+    "unit_price"}, ...]}。マスターに無い製品は警告して無視する。
+    """
+    prices: dict[str, list[tuple[int, str]]] = {}
+    for path in sorted(SUPPLIERS_DIR.glob("*.json")) if SUPPLIERS_DIR.is_dir() else []:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                doc = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"仕入先価格表を読めません（無視）: {path.name}: {e}")
+            continue
+        supplier = str(doc.get("supplier") or path.stem)
+        unmatched = 0
+        for item in doc.get("prices") or []:
+            try:
+                price = int(item["unit_price"])
+            except (KeyError, TypeError, ValueError):
+                unmatched += 1
+                continue
+            ids = _match_product_ids(store, item)
+            if not ids:
+                unmatched += 1
+            for pid in ids:
+                prices.setdefault(pid, []).append((price, supplier))
+        if unmatched:
+            logger.warning(f"仕入先価格表 {path.name}: マスターに無い・不正な行 {unmatched}件を無視")
+    return prices
+
+
+def _match_product_ids(store: "_MasterStore", item: dict) -> list[str]:
+    code = str(item.get("product_code") or "").strip().lower()
+    if code:
+        return [str(p.get("id", "")) for _, p in store.docs("code_lc = ?", (code,))]
+    model = _normalize_model(item.get("model", ""))
+    if not model:
+        return []
+    maker = str(item.get("maker") or "").strip().lower()
+    return [str(p.get("id", "")) for _, p in store.docs("model_norm = ?", (model,))
+            if not maker or maker in (p.get("maker") or "").lower()]
+
+
+def _layers() -> price_layers.PriceLayers:
+    """内部用: 現在のマスターに対する単価の合成索引（マスターを開き直したら作り直す）。"""
+    store = _store()
+    layers = _CACHE["layers"]
+    if layers is None:
+        layers = price_layers.PriceLayers(
+            store.meta.get("source") or "単価マスター",
+            _load_supplier_prices(store),
+            get_price_overrides(),
+            get_campaigns(),
+        )
+        _CACHE["layers"] = layers
+    return layers
+
+
+def _resolve_prices(products: list[dict]) -> list[dict]:
+    """製品に有効単価と勝った層（price_layer / price_source）を書き込む。"""
+    layers = _layers()
+    for p in products:
+        layers.apply(p)
+    return products
 
 
 def _empty_master() -> dict:
@@ -242,39 +576,41 @@ def _derive(products: list[dict], key: str) -> list[str]:
 # ---------------------------------------------------------------------------
 # 取得系
 # ---------------------------------------------------------------------------
-def _products() -> list[dict]:
-    """内部用: キャッシュ内の製品リスト（読み取り専用・コピーしない）。"""
-    return load_price_master().get("products", [])
+def _query(where: str = "", params: tuple = (), order: str = "rowid",
+           limit: Optional[int] = None) -> list[dict]:
+    """内部用: SQLite から製品を取り出し、単価上書きを適用して返す（毎回新しい dict）。"""
+    rows = _store().docs(where, params, order=order, limit=limit)
+    return _resolve_prices([p for _, p in rows])
 
 
 def get_products() -> list[dict]:
-    """製品リスト（呼び出し側の破壊的変更がキャッシュを汚さないようコピーを返す）。"""
-    return list(_products())
+    """製品リスト（毎回新しい dict を返すため、呼び出し側で変更してよい）。"""
+    return _query()
 
 
 def get_categories() -> list[str]:
-    return load_price_master().get("categories", [])
+    return list(_store().meta.get("categories") or [])
 
 
 def get_makers() -> list[str]:
-    return load_price_master().get("makers", [])
+    return list(_store().meta.get("makers") or [])
 
 
 def get_conditions() -> list[str]:
-    return load_price_master().get("conditions", [])
+    return list(_store().meta.get("conditions") or [])
 
 
 def get_meta() -> dict:
-    m = load_price_master()
+    m = _store().meta
     return {
         "source": m.get("source", ""),
         "source_date": m.get("source_date", ""),
         "currency": m.get("currency", "JPY"),
         "tax_included": m.get("tax_included", False),
         "updated_at": m.get("updated_at", ""),
-        "product_count": m.get("product_count", len(m.get("products", []))),
-        "category_count": len(m.get("categories", [])),
-        "maker_count": len(m.get("makers", [])),
+        "product_count": m.get("product_count", 0),
+        "category_count": len(m.get("categories") or []),
+        "maker_count": len(m.get("makers") or []),
     }
 
 
@@ -285,15 +621,9 @@ def find_by_code(code: str) -> Optional[dict]:
     """商品コード完全一致（大文字小文字無視）。重複時は canonical を優先。"""
     if not code:
         return None
-    target = code.strip().lower()
-    hits = [
-        p for p in _products()
-        if (p.get("product_code") or "").strip().lower() == target
-    ]
-    if not hits:
-        return None
-    hits.sort(key=lambda p: (not p.get("is_canonical", True), p.get("source_page", 99)))
-    return hits[0]
+    hits = _query("code_lc = ?", (code.strip().lower(),),
+                  order="is_canonical DESC, source_page, rowid", limit=1)
+    return hits[0] if hits else None
 
 
 def find_by_model(model: str, fuzzy: bool = True) -> list[dict]:
@@ -303,8 +633,17 @@ def find_by_model(model: str, fuzzy: bool = True) -> list[dict]:
     query = _normalize_model(model)
     if not query:
         return []
+    if not fuzzy:
+        return _query("model_norm = ?", (query,), order="is_canonical DESC, rowid")
+
+    # 部分一致・包含・型番トークンの重なりのいずれかがある行だけを採点する
+    store = _store()
+    ids = set(store.model_token_rows(_model_tokens(query)))
+    where = "instr(model_norm, ?) > 0 OR (model_norm != '' AND instr(?, model_norm) > 0)"
+    if ids:
+        where += f" OR rowid IN ({', '.join(str(i) for i in sorted(ids))})"
     scored: list[tuple[float, dict]] = []
-    for p in _products():
+    for p in _resolve_prices([p for _, p in store.docs(where, (query, query))]):
         score = _score_model(p.get("model", ""), query, fuzzy)
         if score > 0:
             scored.append((score, p))
@@ -332,36 +671,34 @@ def search(
     """
     if limit is not None and limit <= 0:
         return []
-    products = _products()
+    store = _store()
     tokens = [t for t in re.split(r"\s+", (query or "").strip().lower()) if t]
     cat = (category or "").strip()
     mk = (maker or "").strip().lower()
     kd = (kind or "").strip()
 
-    results: list[dict] = []
-    for p in products:
-        if cat and (p.get("category") or "") != cat:
-            continue
-        if mk and mk not in (p.get("maker") or "").lower():
-            continue
-        if kd and (p.get("item_kind") or "") != kd:
-            continue
-        if canonical_only and not p.get("is_canonical", True):
-            continue
-        if tokens:
-            haystack = " ".join([
-                str(p.get("product_code") or ""),
-                str(p.get("model") or ""),
-                str(p.get("name") or ""),
-                str(p.get("remarks") or ""),
-                str(p.get("maker") or ""),
-            ]).lower()
-            if not all(tok in haystack for tok in tokens):
-                continue
-        results.append(p)
-        if limit is not None and len(results) >= limit:
-            break
-    return results
+    clauses: list[str] = []
+    params: list = []
+    if cat:
+        clauses.append("category = ?")
+        params.append(cat)
+    if mk:
+        clauses.append("instr(maker_lc, ?) > 0")
+        params.append(mk)
+    if kd:
+        clauses.append("item_kind = ?")
+        params.append(kd)
+    if canonical_only:
+        clauses.append("is_canonical = 1")
+    long_tokens = [t for t in tokens if len(t) >= 3]
+    if long_tokens and store.meta.get("fts"):
+        clauses.append("rowid IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?)")
+        params.append(" AND ".join('"' + t.replace('"', '""') + '"' for t in long_tokens))
+    # 全文索引は候補の絞り込みだけに使い、一致判定は従来どおりの部分一致
+    for tok in tokens:
+        clauses.append("instr(haystack, ?) > 0")
+        params.append(tok)
+    return _query(" AND ".join(clauses), tuple(params), limit=limit)
 
 
 def find_price(
@@ -383,6 +720,7 @@ def find_price(
         - allow_fuzzy=False（既定）では曖昧な部分一致を確定単価として返さない
 
     返り値の "unit_price" が None の場合は「別途問合せ」等で価格未定。
+    "price_layer" / "price_source" にその単価を決めた層と出典が入る。
     """
     if code:
         hit = find_by_code(code)
@@ -394,11 +732,10 @@ def find_price(
         return None
     maker_q = (maker or "").strip().lower()
 
-    candidates = find_by_model(model, fuzzy=True)
-
-    # 1) 型番完全一致を最優先。無ければ allow_fuzzy 時のみ部分一致を許容。
-    exact = [c for c in candidates if _normalize_model(c.get("model", "")) == model_q]
-    pool = exact if exact else (candidates if allow_fuzzy else [])
+    # 1) 型番完全一致（索引）を最優先。無ければ allow_fuzzy 時のみ部分一致を許容。
+    pool = find_by_model(model, fuzzy=False)
+    if not pool and allow_fuzzy:
+        pool = find_by_model(model, fuzzy=True)
     if not pool:
         return None
 
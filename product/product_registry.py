@@ -17,12 +17,22 @@ Streamlit Cloud はコンテナ再起動で実行時ファイルが消えるた
     - find_by_model(model, fuzzy=True)
     - find_by_maker_and_model(maker, model)
     - get_active_module_for_estimate(estimate_or_survey)
+    - registry_version() / invalidate_cache()
+
+読み込んだレジストリはプロセス内にキャッシュし、メーカー・型式・別名の
+正規化済み索引と一緒に保持する（検索はメモリだけで完結）。保存のたびに版
+（payload の version）が 1 増え、保存時は読み込んだ版と保存先の版を比べる
+（compare-and-swap。競合したら add_product / delete_product は読み直して再試行）。
 """
 from __future__ import annotations
 
+import copy
 import json
 import logging
 import re
+import threading
+import time
+import unicodedata
 import uuid
 from datetime import datetime, timezone
 from pathlib import Path
@@ -42,6 +52,18 @@ SCHEMA_VERSION = 1
 STORAGE_KEY = "products_registry"
 
 
+# プロセス内キャッシュの有効期間（秒）。Supabase 構成時は他プロセスの更新を
+# この間隔で取り込む（ローカルJSONはファイルの更新時刻で即座に検知する）
+CACHE_TTL_SEC = 60.0
+
+# 保存時に版が競合した（他の更新が先に入った）場合に読み直して再試行する回数
+SAVE_RETRIES = 3
+
+
+class RegistryConflictError(RuntimeError):
+    """保存しようとした版が保存先の最新版と一致しない（他の更新が先に保存された）。"""
+
+
 # ----------------------------------------------------------------------------
 # Public API
 # ----------------------------------------------------------------------------
@@ -52,49 +74,69 @@ def load_registry() -> list[dict]:
     Supabase 側が未登録でローカルJSONに既存データがあれば初回移行する。
     Supabase 未構成・障害時は従来通りローカルファイルから読む。
     ファイルが存在しない、または読み込めない場合は空リストを返す。
+
+    読み込んだ内容はプロセス内にキャッシュし、保存先の版が変わるまで
+    （ローカルJSONは更新時刻、Supabase は CACHE_TTL_SEC ごと）再利用する。
     """
-    try:
-        from learning.storage_backend import is_enabled, kv_get
-        if is_enabled():
-            doc = kv_get(STORAGE_KEY)
-            if isinstance(doc, dict):
-                products = doc.get("products", [])
-                if isinstance(products, list):
-                    return [p for p in products if isinstance(p, dict)]
-            elif doc is None:
-                # 初回移行: Supabase 未登録でローカルに既存データがあれば取り込む
-                local = _load_local_registry()
-                if local:
-                    _kv_sync(_build_payload(local))
-                return local
-    except Exception as e:
-        logger.warning("Supabase読込に失敗、ローカルにフォールバック: %s", e)
-    return _load_local_registry()
+    return copy.deepcopy(_snapshot().products)
+
+
+def registry_version() -> int:
+    """現在のレジストリの版（保存のたびに 1 増える。未保存・旧形式は 0）。"""
+    return _snapshot().version
 
 
-def save_registry(products: list[dict]) -> None:
+def invalidate_cache() -> None:
+    """プロセス内キャッシュを破棄する（次の参照で保存先から読み直す）。"""
+    global _cache
+    with _cache_lock:
+        _cache = None
+
+
+def save_registry(products: list[dict], expected_version: Optional[int] = None) -> int:
     """全製品リストを保存する。
 
     ローカルJSONファイルには常に保存（tmp + replace のアトミック書込。
     親ディレクトリが無ければ作成。UTF-8、indent=2、ensure_ascii=False）。
     Supabase 構成時は同内容を app_storage に upsert する。
+
+    Args:
+        products: 全製品
+        expected_version: 読み込んだときの版。指定すると保存先の最新版と比べ、
+            違えば（他の更新が先に入っていれば）保存せず RegistryConflictError
+            （compare-and-swap）。Supabase の KV は条件付き更新が無いため、
+            直前に読み直して比べる（同一プロセス内はロックで直列化）。
+
+    Returns:
+        保存後の版
     """
     if not isinstance(products, list):
         raise TypeError("products は list である必要があります")
 
-    REGISTRY_PATH.parent.mkdir(parents=True, exist_ok=True)
-    payload = _build_payload(products)
-    tmp_path = REGISTRY_PATH.with_suffix(REGISTRY_PATH.suffix + ".tmp")
-    with open(tmp_path, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
-    tmp_path.replace(REGISTRY_PATH)
-    _kv_sync(payload)
+    with _write_lock:
+        _, current = _load_from_source()
+        if expected_version is not None and current != expected_version:
+            invalidate_cache()
+            raise RegistryConflictError(
+                f"製品レジストリが他で更新されています（読込時 v{expected_version} / 最新 v{current}）")
+        version = current + 1
+        REGISTRY_PATH.parent.mkdir(parents=True, exist_ok=True)
+        payload = _build_payload(products, version)
+        tmp_path = REGISTRY_PATH.with_suffix(REGISTRY_PATH.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        tmp_path.replace(REGISTRY_PATH)
+        _kv_sync(payload)
+        # 書いた内容でキャッシュを差し替える（読み直し不要）
+        _store_snapshot(_Snapshot(payload["products"], version, _source_key(), _local_stamp()))
+    return version
 
 
 def add_product(product: dict) -> dict:
     """製品を登録する。同じ maker + model が既にあれば更新。
 
     自動で id (uuid)、registered_at、updated_at を付与する。
+    保存時に版が競合したら最新を読み直して再試行する。
 
     Returns:
         登録/更新後の製品dict（idが付与済み）
@@ -102,48 +144,58 @@ def add_product(product: dict) -> dict:
     if not isinstance(product, dict):
         raise TypeError("product は dict である必要があります")
 
-    products = load_registry()
-
-    new_product = dict(product)
-    maker = _safe_str(new_product.get("maker"))
-    model = _safe_str(new_product.get("model"))
+    maker = _safe_str(product.get("maker"))
+    model = _safe_str(product.get("model"))
+
+    for attempt in range(SAVE_RETRIES):
+        snap = _snapshot()
+        products = list(snap.products)
+        new_product = dict(product)
+        now_iso = _now_iso()
+        existing_index = -1
+        if maker and model:
+            existing_index = snap.by_maker_model.get((maker.lower(), model.lower()), -1)
+
+        if existing_index >= 0:
+            existing = products[existing_index]
+            # 既存のid・registered_at は維持
+            new_product["id"] = existing.get("id") or _new_id()
+            new_product["registered_at"] = existing.get("registered_at") or now_iso
+            new_product["updated_at"] = now_iso
+            products[existing_index] = new_product
+        else:
+            new_product["id"] = new_product.get("id") or _new_id()
+            new_product["registered_at"] = new_product.get("registered_at") or now_iso
+            new_product["updated_at"] = now_iso
+            products.append(new_product)
 
-    now_iso = _now_iso()
-    existing_index = -1
-    if maker and model:
-        for i, p in enumerate(products):
-            if _safe_str(p.get("maker")).lower() == maker.lower() and \
-               _safe_str(p.get("model")).lower() == model.lower():
-                existing_index = i
-                break
-
-    if existing_index >= 0:
-        existing = products[existing_index]
-        # 既存のid・registered_at は維持
-        new_product["id"] = existing.get("id") or _new_id()
-        new_product["registered_at"] = existing.get("registered_at") or now_iso
-        new_product["updated_at"] = now_iso
-        products[existing_index] = new_product
-    else:
-        new_product["id"] = new_product.get("id") or _new_id()
-        new_product["registered_at"] = new_product.get("registered_at") or now_iso
-        new_product["updated_at"] = now_iso
-        products.append(new_product)
-
-    save_registry(products)
-    return new_product
+        try:
+            save_registry(products, expected_version=snap.version)
+            return new_product
+        except RegistryConflictError as e:
+            if attempt == SAVE_RETRIES - 1:
+                raise
+            logger.warning("製品レジストリの保存が競合、読み直して再試行: %s", e)
+    raise RegistryConflictError("製品レジストリを保存できませんでした")
 
 
 def delete_product(product_id: str) -> bool:
     """指定IDの製品を削除する。成功なら True、見つからなければ False。"""
     if not product_id:
         return False
-    products = load_registry()
-    new_products = [p for p in products if p.get("id") != product_id]
-    if len(new_products) == len(products):
-        return False
-    save_registry(new_products)
-    return True
+    for attempt in range(SAVE_RETRIES):
+        snap = _snapshot()
+        if product_id not in snap.by_id:
+            return False
+        new_products = [p for p in snap.products if p.get("id") != product_id]
+        try:
+            save_registry(new_products, expected_version=snap.version)
+            return True
+        except RegistryConflictError as e:
+            if attempt == SAVE_RETRIES - 1:
+                raise
+            logger.warning("製品レジストリの保存が競合、読み直して再試行: %s", e)
+    return False
 
 
 def find_by_model(model: str, fuzzy: bool = True) -> list[dict]:
@@ -158,46 +210,63 @@ def find_by_model(model: str, fuzzy: bool = True) -> list[dict]:
     """
     if not model:
         return []
-    products = load_registry()
     query = _normalize_model(model)
     if not query:
         return []
 
-    scored: list[tuple[float, dict]] = []
-    for p in products:
-        score = _score_model_match(p, query, fuzzy=fuzzy)
-        if score > 0:
-            scored.append((score, p))
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return [p for _, p in scored]
+    snap = _snapshot()
+    key = ("model", query, fuzzy)
+    hits = snap.memo.get(key)
+    if hits is None:
+        if not fuzzy:
+            # 完全一致は正規化型式の索引だけで引ける
+            hits = list(snap.by_model.get(query, []))
+        else:
+            scored: list[tuple[float, int]] = []
+            for i, cands in enumerate(snap.candidates):
+                score = _score_candidates(cands, query, fuzzy=True)
+                if score > 0:
+                    scored.append((score, i))
+            scored.sort(key=lambda x: x[0], reverse=True)
+            hits = [i for _, i in scored]
+        snap.remember(key, hits)
+    return [copy.deepcopy(snap.products[i]) for i in hits]
 
 
 def find_by_maker_and_model(maker: str, model: str) -> Optional[dict]:
     """メーカー + 型式の組合せで最も一致度の高い1件を返す。"""
     if not maker and not model:
         return None
-    products = load_registry()
-    if not products:
+    snap = _snapshot()
+    if not snap.products:
         return None
 
     maker_norm = _safe_str(maker).lower()
     model_query = _normalize_model(model)
 
-    best: Optional[tuple[float, dict]] = None
-    for p in products:
-        score = 0.0
-        p_maker = _safe_str(p.get("maker")).lower()
-        if maker_norm and p_maker:
-            if maker_norm == p_maker:
-                score += 5.0
-            elif maker_norm in p_maker or p_maker in maker_norm:
-                score += 2.5
-        if model_query:
-            score += _score_model_match(p, model_query, fuzzy=True)
-        if score > 0 and (best is None or score > best[0]):
-            best = (score, p)
-
-    return best[1] if best else None
+    key = ("maker_model", maker_norm, model_query)
+    best_index = snap.memo.get(key)
+    if best_index is None:
+        # メーカーの一致度は登録メーカーの種類ごとに1回だけ計算する
+        maker_scores: dict[str, float] = {}
+        if maker_norm:
+            for p_maker in snap.by_maker:
+                if maker_norm == p_maker:
+                    maker_scores[p_maker] = 5.0
+                elif p_maker and (maker_norm in p_maker or p_maker in maker_norm):
+                    maker_scores[p_maker] = 2.5
+
+        best: Optional[tuple[float, int]] = None
+        for i, p in enumerate(snap.products):
+            score = maker_scores.get(snap.makers[i], 0.0)
+            if model_query:
+                score += _score_candidates(snap.candidates[i], model_query, fuzzy=True)
+            if score > 0 and (best is None or score > best[0]):
+                best = (score, i)
+        best_index = best[1] if best else -1
+        snap.remember(key, best_index)
+
+    return copy.deepcopy(snap.products[best_index]) if best_index >= 0 else None
 
 
 def get_active_module_for_estimate(estimate_or_survey: Any) -> Optional[dict]:
@@ -238,34 +307,162 @@ def get_active_module_for_estimate(estimate_or_survey: Any) -> Optional[dict]:
     return None
 
 
+# ----------------------------------------------------------------------------
+# Cache / index
+# ----------------------------------------------------------------------------
+# 1つの版あたりの検索結果メモの上限（超えたら捨てて作り直す）
+_MEMO_LIMIT = 1024
+
+
+class _Snapshot:
+    """ある版のレジストリと検索用の索引（作成後は変更しない。memo のみ追記）。"""
+
+    def __init__(self, products: list[dict], version: int, source: tuple,
+                 stamp: Optional[int]):
+        self.products = products
+        self.version = version
+        self.source = source  # (REGISTRY_PATH, Supabase 有効か)
+        self.stamp = stamp  # ローカルJSONの更新時刻（ns）
+        self.loaded_at = time.monotonic()
+        self.by_id: dict[str, int] = {}
+        self.by_maker_model: dict[tuple[str, str], int] = {}
+        self.by_model: dict[str, list[int]] = {}  # 正規化型式（別名は含まない）→ 位置
+        self.by_maker: dict[str, list[int]] = {}  # 小文字メーカー → 位置
+        self.makers: list[str] = []
+        self.candidates: list[tuple[list[str], list[str]]] = []  # (型式のみ, 型式+別名)
+        self.memo: dict = {}
+        for i, p in enumerate(products):
+            pid = p.get("id")
+            if pid:
+                self.by_id.setdefault(pid, i)
+            maker = _safe_str(p.get("maker")).lower()
+            model = _safe_str(p.get("model")).lower()
+            if maker and model:
+                self.by_maker_model.setdefault((maker, model), i)
+            self.makers.append(maker)
+            self.by_maker.setdefault(maker, []).append(i)
+            cands = (_model_candidates(p, fuzzy=False), _model_candidates(p, fuzzy=True))
+            self.candidates.append(cands)
+            for n in cands[0]:
+                self.by_model.setdefault(n, []).append(i)
+
+    def remember(self, key, value) -> None:
+        if len(self.memo) >= _MEMO_LIMIT:
+            self.memo.clear()
+        self.memo[key] = value
+
+
+_cache: Optional[_Snapshot] = None
+_cache_lock = threading.Lock()
+_write_lock = threading.RLock()
+
+
+def _backend_enabled() -> bool:
+    try:
+        from learning.storage_backend import is_enabled
+        return bool(is_enabled())
+    except Exception:
+        return False
+
+
+def _source_key() -> tuple:
+    return (str(REGISTRY_PATH), _backend_enabled())
+
+
+def _local_stamp() -> Optional[int]:
+    try:
+        return REGISTRY_PATH.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def _is_fresh(snap: _Snapshot) -> bool:
+    if snap.source[1]:
+        return time.monotonic() - snap.loaded_at < CACHE_TTL_SEC
+    return snap.stamp == _local_stamp()
+
+
+def _store_snapshot(snap: _Snapshot) -> None:
+    global _cache
+    with _cache_lock:
+        _cache = snap
+
+
+def _snapshot() -> _Snapshot:
+    """キャッシュ済みの版（保存先が変わった・古くなった場合は読み直す）。"""
+    source = _source_key()
+    with _cache_lock:
+        snap = _cache
+    if snap is not None and snap.source == source and _is_fresh(snap):
+        return snap
+    products, version = _load_from_source()
+    snap = _Snapshot(products, version, source, _local_stamp())
+    _store_snapshot(snap)
+    return snap
+
+
+def _load_from_source() -> tuple[list[dict], int]:
+    """保存先（Supabase 優先、ローカルJSON）から (全製品, 版) を読む（キャッシュなし）。"""
+    try:
+        from learning.storage_backend import is_enabled, kv_get
+        if is_enabled():
+            doc = kv_get(STORAGE_KEY)
+            if isinstance(doc, dict):
+                products = doc.get("products", [])
+                if isinstance(products, list):
+                    return [p for p in products if isinstance(p, dict)], _doc_version(doc)
+            elif doc is None:
+                # 初回移行: Supabase 未登録でローカルに既存データがあれば取り込む
+                local, version = _load_local_doc()
+                if local:
+                    _kv_sync(_build_payload(local, version))
+                return local, version
+    except Exception as e:
+        logger.warning("Supabase読込に失敗、ローカルにフォールバック: %s", e)
+    return _load_local_doc()
+
+
 # ----------------------------------------------------------------------------
 # Internal helpers
 # ----------------------------------------------------------------------------
 def _load_local_registry() -> list[dict]:
     """ローカルJSONファイルから全製品を読み込む（従来動作）。"""
+    return _load_local_doc()[0]
+
+
+def _load_local_doc() -> tuple[list[dict], int]:
+    """ローカルJSONファイルから (全製品, 版) を読み込む。"""
     if not REGISTRY_PATH.exists():
-        return []
+        return [], 0
     try:
         with open(REGISTRY_PATH, "r", encoding="utf-8") as f:
             data = json.load(f)
     except (json.JSONDecodeError, OSError) as e:
         logger.warning(f"products_registry.json 読み込み失敗: {e}")
-        return []
+        return [], 0
 
     if isinstance(data, list):
         # 旧形式（リストのみ）
-        return [p for p in data if isinstance(p, dict)]
+        return [p for p in data if isinstance(p, dict)], 0
     if isinstance(data, dict):
         products = data.get("products", [])
         if isinstance(products, list):
-            return [p for p in products if isinstance(p, dict)]
-    return []
+            return [p for p in products if isinstance(p, dict)], _doc_version(data)
+    return [], 0
+
+
+def _doc_version(doc: dict) -> int:
+    try:
+        return int(doc.get("version") or 0)
+    except (TypeError, ValueError):
+        return 0
 
 
-def _build_payload(products: list[dict]) -> dict:
+def _build_payload(products: list[dict], version: int = 0) -> dict:
     """保存用payload（ローカルJSON・Supabase KV 共通形式）を作る。"""
     return {
         "schema_version": SCHEMA_VERSION,
+        "version": version,
         "updated_at": _now_iso(),
         "products": [_jsonable(p) for p in products],
     }
@@ -326,8 +523,8 @@ def _normalize_model(model: str) -> str:
     """型式の比較用に正規化する（小文字化・記号統一）。"""
     if not model:
         return ""
-    s = str(model).strip().lower()
-    # 全角→半角の代表的な変換
+    s = unicodedata.normalize("NFKC", str(model)).strip().lower()
+    # 全角→半角の代表的な変換（NFKC で残る長音・マイナス記号も揃える）
     s = s.translate(str.maketrans({
         "０": "0", "１": "1", "２": "2", "３": "3", "４": "4",
         "５": "5", "６": "6", "７": "7", "８": "8", "９": "9",
@@ -340,8 +537,12 @@ def _normalize_model(model: str) -> str:
 
 def _score_model_match(product: dict, query: str, fuzzy: bool) -> float:
     """1製品とクエリ型式のマッチスコアを返す。0なら不一致。"""
-    if not query:
-        return 0.0
+    return _score_candidates(
+        (_model_candidates(product, False), _model_candidates(product, True)), query, fuzzy)
+
+
+def _model_candidates(product: dict, fuzzy: bool) -> list[str]:
+    """照合に使う正規化済みの型式（fuzzy なら model_aliases を含む）。"""
     candidates: list[str] = []
     model = _normalize_model(product.get("model", ""))
     if model:
@@ -351,6 +552,14 @@ def _score_model_match(product: dict, query: str, fuzzy: bool) -> float:
             n = _normalize_model(alias)
             if n:
                 candidates.append(n)
+    return candidates
+
+
+def _score_candidates(cands: tuple[list[str], list[str]], query: str, fuzzy: bool) -> float:
+    """正規化済みの候補（型式のみ, 型式+別名）とクエリ型式のマッチスコア。"""
+    if not query:
+        return 0.0
+    candidates = cands[1] if fuzzy else cands[0]
     if not candidates:
         return 0.0
 
@@ -15,17 +15,33 @@ OpenStreetMap Nominatim + Esri World Imagery タイルへフォールバック
             f"Lat/Lng: {view['lat']}, {view['lng']}, "
             f"Scale: {view['scale_meter_per_pixel']:.3f} m/px"
         )
+
+キャッシュ:
+    Esri タイルは (z, x, y) ごとにディスクへ保存し（合計サイズの上限を超えたら
+    最終利用が古いものから削除する LRU）、住所のジオコーディング結果は正規化した
+    住所ごとにメモリとディスクへ保存する。同じ住所で画面が再実行されても
+    外部 API は呼ばない。保存先は環境変数 SANEI_TILE_CACHE_DIR（既定は一時ディレクトリ）。
 """
 
 from __future__ import annotations
 
 import io
+import json
+import logging
 import math
 import os
+import re
+import tempfile
+import threading
+import unicodedata
 import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 from typing import Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 
 try:
     from PIL import Image
@@ -52,6 +68,21 @@ _ESRI_TILE_URL = (
 
 _TILE_SIZE = 256  # Esriタイルの1辺ピクセル数
 
+# タイル合成の並び（grid×grid）。2 が標準、大規模な工場・倉庫は 3〜4
+DEFAULT_GRID = 2
+MAX_GRID = 4
+# build_bbox_mosaic のタイル数上限（z20 で 16×16 タイル、一辺 500m 前後）
+MAX_MOSAIC_TILES = 256
+# タイルの同時取得数（接続プールの大きさも兼ねる）
+_TILE_WORKERS = 8
+
+# キャッシュ（保存先・タイルの合計上限・ジオコーディングの件数上限）
+_CACHE_DIR_ENV = "SANEI_TILE_CACHE_DIR"
+_TILE_CACHE_MAX_BYTES = int(os.environ.get("SANEI_TILE_CACHE_MB", "200") or 200) * 1024 * 1024
+_GEOCODE_CACHE_SIZE = 512
+
+logger = logging.getLogger(__name__)
+
 
 # ---------------------------------------------------------------------------
 # 補助関数
@@ -86,6 +117,193 @@ def _get_google_api_key() -> Optional[str]:
     return None
 
 
+def _cache_dir() -> Path:
+    value = os.environ.get(_CACHE_DIR_ENV)
+    if value:
+        return Path(value)
+    return Path(tempfile.gettempdir()) / "sanei-estimate-ai"
+
+
+class TileCache:
+    """(z, x, y) をキーにしたタイル画像のディスクキャッシュ（LRU）。
+
+    ファイルの更新時刻を最終利用時刻として扱い、合計サイズが max_bytes を
+    超えたら古いものから削除する。読み書きの失敗は警告だけで取得処理は続ける。
+    """
+
+    def __init__(self, directory, max_bytes: int = _TILE_CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index: Optional[OrderedDict] = None  # パス → サイズ（最終利用が古い順）
+        self._total = 0
+
+    def _path(self, z: int, x: int, y: int) -> Path:
+        return self.directory / str(z) / str(x) / f"{y}.tile"
+
+    def _load_index(self) -> OrderedDict:
+        if self._index is None:
+            entries = []
+            if self.directory.exists():
+                for path in self.directory.rglob("*.tile"):
+                    try:
+                        st_ = path.stat()
+                    except OSError:
+                        continue
+                    entries.append((st_.st_mtime, str(path), st_.st_size))
+            entries.sort()
+            self._index = OrderedDict((p, size) for _, p, size in entries)
+            self._total = sum(self._index.values())
+        return self._index
+
+    def get(self, z: int, x: int, y: int) -> Optional[bytes]:
+        path = self._path(z, x, y)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        with self._lock:
+            index = self._load_index()
+            if str(path) in index:
+                index.move_to_end(str(path))
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, z: int, x: int, y: int, data: bytes) -> None:
+        path = self._path(z, x, y)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{threading.get_ident()}.part")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"タイルキャッシュに保存できません（続行）: {e}")
+            return
+        with self._lock:
+            index = self._load_index()
+            self._total -= index.pop(str(path), 0)
+            index[str(path)] = len(data)
+            self._total += len(data)
+            while self._total > self.max_bytes and len(index) > 1:
+                old, size = index.popitem(last=False)
+                self._total -= size
+                try:
+                    os.unlink(old)
+                except OSError:
+                    pass
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            self._load_index()
+            return self._total
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._load_index())
+
+
+class GeocodeCache:
+    """正規化した住所をキーにしたジオコーディング結果のキャッシュ（メモリ LRU + JSON）。"""
+
+    def __init__(self, path, max_entries: int = _GEOCODE_CACHE_SIZE):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Optional[OrderedDict] = None
+
+    def _load(self) -> OrderedDict:
+        if self._entries is None:
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                data = {}
+            self._entries = OrderedDict(data if isinstance(data, dict) else {})
+        return self._entries
+
+    def get(self, address: str) -> Optional[dict]:
+        key = normalize_address(address)
+        with self._lock:
+            entries = self._load()
+            if key not in entries:
+                return None
+            entries.move_to_end(key)
+            return dict(entries[key])
+
+    def put(self, address: str, result: dict) -> None:
+        key = normalize_address(address)
+        with self._lock:
+            entries = self._load()
+            entries[key] = dict(result)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            snapshot = json.dumps(entries, ensure_ascii=False)
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(f".{threading.get_ident()}.part")
+            tmp.write_text(snapshot, encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"ジオコーディングのキャッシュを保存できません（続行）: {e}")
+
+
+def normalize_address(address: str) -> str:
+    """キャッシュキー用に住所を正規化する（全角英数・空白・ハイフンの揺れを吸収）。"""
+    text = unicodedata.normalize("NFKC", address or "").strip().lower()
+    text = re.sub(r"[‐‑‒–—―−ｰ]", "-", text)
+    text = re.sub(r"(?<=\d)ー(?=\d)", "-", text)
+    return re.sub(r"\s+", "", text)
+
+
+_tile_cache: Optional[TileCache] = None
+_geocode_cache: Optional[GeocodeCache] = None
+_session: Optional[requests.Session] = None
+_state_lock = threading.Lock()
+
+
+def get_tile_cache() -> TileCache:
+    global _tile_cache
+    with _state_lock:
+        if _tile_cache is None:
+            _tile_cache = TileCache(_cache_dir() / "tiles")
+        return _tile_cache
+
+
+def get_geocode_cache() -> GeocodeCache:
+    global _geocode_cache
+    with _state_lock:
+        if _geocode_cache is None:
+            _geocode_cache = GeocodeCache(_cache_dir() / "geocode.json")
+        return _geocode_cache
+
+
+def _get_session() -> requests.Session:
+    """タイル取得用の共有セッション（同時取得数ぶんの接続を使い回す）。"""
+    global _session
+    with _state_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=_TILE_WORKERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["User-Agent"] = _USER_AGENT
+            _session = session
+        return _session
+
+
+def reset_caches() -> None:
+    """キャッシュと共有セッションを作り直す（保存先の変更・テスト用）。"""
+    global _tile_cache, _geocode_cache, _session
+    with _state_lock:
+        if _session is not None:
+            _session.close()
+        _tile_cache = _geocode_cache = _session = None
+
+
 def _zoom_to_meter_per_pixel(lat: float, zoom: int) -> float:
     """ズームレベルから 1ピクセルあたりのメートル数を計算する。
 
@@ -133,53 +351,85 @@ def _lat_lng_to_tile_pixel(
     return tx, ty, fx - tx, fy - ty
 
 
-def _compose_tiles_from_esri(lat: float, lng: float, zoom: int) -> bytes:
-    """Esri World Imagery のタイルを 2x2 で取得し、PNGバイト列にして返す。
+def _lat_lng_to_global_pixel(lat: float, lng: float, zoom: int) -> Tuple[float, float]:
+    """緯度経度→ズーム zoom の世界座標（ピクセル、左上原点）。"""
+    tx, ty, fx, fy = _lat_lng_to_tile_pixel(lat, lng, zoom)
+    return (tx + fx) * _TILE_SIZE, (ty + fy) * _TILE_SIZE
+
+
+def _fetch_tile(z: int, x: int, y: int) -> bytes:
+    """タイル1枚を取得する（キャッシュ優先、取得できたものはキャッシュへ保存）。"""
+    cache = get_tile_cache()
+    data = cache.get(z, x, y)
+    if data is not None:
+        return data
+    url = _ESRI_TILE_URL.format(z=z, x=x, y=y)
+    resp = _get_session().get(url, timeout=_DEFAULT_TIMEOUT)
+    resp.raise_for_status()
+    data = resp.content
+    Image.open(io.BytesIO(data)).verify()  # 壊れた応答はキャッシュしない
+    cache.put(z, x, y, data)
+    return data
+
+
+def _compose_tiles_from_esri(lat: float, lng: float, zoom: int, grid: int = DEFAULT_GRID) -> bytes:
+    """Esri World Imagery のタイルを grid×grid で取得し、PNGバイト列にして返す。
 
     ターゲット地点ができるだけ中心に来るよう、サブピクセル位置から
-    左上タイルのオフセットを決定し、512x512 にクロップする。
+    左上タイルのオフセットを決定し、(grid*256)px 四方にクロップする。
+    タイルはキャッシュを引いたうえで、残りを共有セッションで並列に取得する。
     """
+    grid = max(1, min(MAX_GRID, int(grid)))
     tx, ty, fx, fy = _lat_lng_to_tile_pixel(lat, lng, zoom)
 
-    # 中心地点を画像中央に置きたいので、左上タイルを (tx-1 or tx) / (ty-1 or ty)
-    # から選ぶ。サブピクセル位置が 0.5 未満なら左上を一つ前のタイルにする。
-    base_x = tx - 1 if fx < 0.5 else tx
-    base_y = ty - 1 if fy < 0.5 else ty
+    # 中心地点を画像中央に置きたいので、左上タイルは中心から grid/2 タイル戻った位置。
+    # grid=2 ならサブピクセル位置が 0.5 未満のとき一つ前のタイルになる。
+    base_x = int(math.floor(tx + fx - grid / 2.0))
+    base_y = int(math.floor(ty + fy - grid / 2.0))
 
-    # 4タイル取得
-    canvas = Image.new("RGB", (_TILE_SIZE * 2, _TILE_SIZE * 2), (0, 0, 0))
-    headers = {"User-Agent": _USER_AGENT}
+    size = _TILE_SIZE * grid
+    canvas = Image.new("RGB", (size, size), (0, 0, 0))
     last_error: Optional[str] = None
     fetched = 0
 
-    for dy in range(2):
-        for dx in range(2):
-            x = base_x + dx
-            y = base_y + dy
-            url = _ESRI_TILE_URL.format(z=zoom, x=x, y=y)
-            try:
-                resp = requests.get(url, headers=headers, timeout=_DEFAULT_TIMEOUT)
-                resp.raise_for_status()
-                tile_img = Image.open(io.BytesIO(resp.content)).convert("RGB")
-                canvas.paste(tile_img, (dx * _TILE_SIZE, dy * _TILE_SIZE))
-                fetched += 1
-            except Exception as e:
-                last_error = f"tile ({x},{y},z={zoom}) fetch failed: {e}"
+    coords = [(base_x + dx, base_y + dy) for dy in range(grid) for dx in range(grid)]
+
+    def _get(xy):
+        x, y = xy
+        try:
+            return xy, _fetch_tile(zoom, x, y), None
+        except Exception as e:
+            return xy, None, f"tile ({x},{y},z={zoom}) fetch failed: {e}"
+
+    with ThreadPoolExecutor(max_workers=min(_TILE_WORKERS, len(coords))) as pool:
+        results = list(pool.map(_get, coords))
+
+    for (x, y), data, error in results:
+        if data is None:
+            last_error = error
+            continue
+        try:
+            tile_img = Image.open(io.BytesIO(data)).convert("RGB")
+        except Exception as e:
+            last_error = f"tile ({x},{y},z={zoom}) decode failed: {e}"
+            continue
+        canvas.paste(tile_img, ((x - base_x) * _TILE_SIZE, (y - base_y) * _TILE_SIZE))
+        fetched += 1
 
     if fetched == 0:
         raise RuntimeError(f"Esri タイル取得に全て失敗: {last_error}")
 
-    # 中心が画像中央(512,512)に来るようクロップ。
+    # 中心が画像中央に来るようクロップ。
     # 中心地点はキャンバス上で
     #   center_px_x = (tx - base_x + fx) * TILE_SIZE
     #   center_px_y = (ty - base_y + fy) * TILE_SIZE
     center_px_x = int((tx - base_x + fx) * _TILE_SIZE)
     center_px_y = int((ty - base_y + fy) * _TILE_SIZE)
 
-    crop_size = 512
+    crop_size = size
     half = crop_size // 2
-    left = max(0, min(_TILE_SIZE * 2 - crop_size, center_px_x - half))
-    top = max(0, min(_TILE_SIZE * 2 - crop_size, center_px_y - half))
+    left = max(0, min(size - crop_size, center_px_x - half))
+    top = max(0, min(size - crop_size, center_px_y - half))
     cropped = canvas.crop((left, top, left + crop_size, top + crop_size))
 
     buf = io.BytesIO()
@@ -195,6 +445,9 @@ def _compose_tiles_from_esri(lat: float, lng: float, zoom: int) -> bytes:
 def geocode_address(address: str) -> dict:
     """住所文字列を緯度経度に変換する。
 
+    成功した結果は正規化した住所ごとにキャッシュし、同じ住所では外部 API を
+    呼ばない（失敗はキャッシュせず、次回また問い合わせる）。
+
     Args:
         address: 住所文字列（例: "東京都新宿区西新宿2-8-1"）
 
@@ -221,6 +474,17 @@ def geocode_address(address: str) -> dict:
 
     address = address.strip()
 
+    cached = get_geocode_cache().get(address)
+    if cached is not None:
+        return cached
+    result = _geocode_uncached(address, result)
+    if result.get("error") is None and result.get("lat") is not None:
+        get_geocode_cache().put(address, result)
+    return result
+
+
+def _geocode_uncached(address: str, result: dict) -> dict:
+    """Google Geocoding → Nominatim の順に問い合わせる（キャッシュなし）。"""
     # 1) Google Geocoding API
     api_key = _get_google_api_key()
     if api_key:
@@ -305,6 +569,7 @@ def fetch_satellite_image(
     lng: float,
     zoom: int = 20,
     size: Tuple[int, int] = (640, 640),
+    grid: int = DEFAULT_GRID,
 ) -> dict:
     """緯度経度から衛星画像を取得する。
 
@@ -313,6 +578,8 @@ def fetch_satellite_image(
         lng: 経度
         zoom: ズームレベル（20で約 0.15m/px）
         size: 画像サイズ (幅, 高さ)。Google Static Maps のとき有効
+        grid: Esri タイルの並び（grid×grid、最大4）。3以上は Google Static Maps
+            （最大640px）では範囲が足りないため、最初から Esri タイルで合成する
 
     Returns:
         {
@@ -335,7 +602,7 @@ def fetch_satellite_image(
 
     # 1) Google Static Maps API
     api_key = _get_google_api_key()
-    if api_key:
+    if api_key and grid <= DEFAULT_GRID:
         try:
             w, h = size
             # Google Static Maps は最大640x640（無料枠）
@@ -371,7 +638,7 @@ def fetch_satellite_image(
 
     # 2) Esri World Imagery タイル合成（無料）
     try:
-        png_bytes = _compose_tiles_from_esri(lat, lng, zoom)
+        png_bytes = _compose_tiles_from_esri(lat, lng, zoom, grid=grid)
         return {
             "image_bytes": png_bytes,
             "media_type": "image/png",
@@ -388,12 +655,125 @@ def fetch_satellite_image(
         return result
 
 
-def get_roof_view(address: str, zoom: int = 20) -> dict:
+def bbox_around(lat: float, lng: float, width_m: float, height_m: float) -> Tuple[float, float, float, float]:
+    """中心と東西・南北の長さ（m）から (south, west, north, east) を返す。"""
+    dlat = (height_m / 2.0) / 111_320.0
+    dlng = (width_m / 2.0) / (111_320.0 * max(1e-6, math.cos(math.radians(lat))))
+    return lat - dlat, lng - dlng, lat + dlat, lng + dlng
+
+
+def build_bbox_mosaic(
+    south: float,
+    west: float,
+    north: float,
+    east: float,
+    zoom: int = 20,
+    pyramid_min_size: int = 512,
+    max_tiles: int = MAX_MOSAIC_TILES,
+) -> dict:
+    """任意の範囲（緯度経度の矩形）を1つのズームでタイル合成し、縮小ピラミッドを作る。
+
+    100m 超の工場屋根のように fetch_satellite_image（最大 640px）に収まらない範囲向け。
+    キャンバスは範囲ぴったりの大きさで1枚だけ確保し、タイルは取得できた順に
+    該当位置へ直接貼り付ける（タイル単位のキャンバスや全体のコピーは作らない）。
+    タイルはキャッシュを優先し、残りを並列に取得する。
+
+    Args:
+        south, west, north, east: 範囲（度）
+        zoom: 合成するズームレベル
+        pyramid_min_size: 縮小を止める長辺のピクセル数（UI 表示用の最小レベル）
+        max_tiles: タイル数の上限（超える場合は ValueError。ズームを下げる）
+
+    Returns:
+        {
+            "image": PIL.Image（level 0 と同じ）,
+            "zoom": int,
+            "bbox": (south, west, north, east),
+            "scale_meter_per_pixel": float（範囲中心の緯度での値）,
+            "levels": [{"level", "zoom", "image", "width", "height",
+                        "scale_meter_per_pixel"}, ...]（level 0 が原寸、以降 1/2 ずつ）,
+            "tiles": 取得対象のタイル数,
+            "missing": 取得できなかったタイルの (x, y) のリスト,
+        }
+    """
+    if not (south < north and west < east):
+        raise ValueError(f"範囲が不正です: south={south}, west={west}, north={north}, east={east}")
+
+    left, top = _lat_lng_to_global_pixel(north, west, zoom)
+    right, bottom = _lat_lng_to_global_pixel(south, east, zoom)
+    px0, py0 = int(math.floor(left)), int(math.floor(top))
+    width = max(1, int(math.ceil(right)) - px0)
+    height = max(1, int(math.ceil(bottom)) - py0)
+
+    x0, x1 = px0 // _TILE_SIZE, (px0 + width - 1) // _TILE_SIZE
+    y0, y1 = py0 // _TILE_SIZE, (py0 + height - 1) // _TILE_SIZE
+    coords = [(x, y) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)]
+    if len(coords) > max_tiles:
+        raise ValueError(
+            f"タイル数 {len(coords)} が上限 {max_tiles} を超えます。ズームを下げてください")
+
+    canvas = Image.new("RGB", (width, height), (0, 0, 0))
+    missing = []
+
+    def _get(xy):
+        try:
+            return xy, _fetch_tile(zoom, *xy)
+        except Exception as e:
+            logger.warning(f"tile ({xy[0]},{xy[1]},z={zoom}) fetch failed: {e}")
+            return xy, None
+
+    with ThreadPoolExecutor(max_workers=min(_TILE_WORKERS, len(coords))) as pool:
+        # 取得できた順に貼り付け、デコードしたタイルはすぐ手放す
+        for future in as_completed([pool.submit(_get, xy) for xy in coords]):
+            (x, y), data = future.result()
+            if data is None:
+                missing.append((x, y))
+                continue
+            try:
+                with Image.open(io.BytesIO(data)) as tile_img:
+                    canvas.paste(tile_img.convert("RGB"),
+                                 (x * _TILE_SIZE - px0, y * _TILE_SIZE - py0))
+            except Exception as e:
+                logger.warning(f"tile ({x},{y},z={zoom}) decode failed: {e}")
+                missing.append((x, y))
+
+    if len(missing) == len(coords):
+        raise RuntimeError(f"Esri タイル取得に全て失敗（{len(coords)}枚）")
+
+    center_lat = (south + north) / 2.0
+    levels = [{
+        "level": 0, "zoom": zoom, "image": canvas, "width": width, "height": height,
+        "scale_meter_per_pixel": _zoom_to_meter_per_pixel(center_lat, zoom),
+    }]
+    current = canvas
+    while max(current.size) > pyramid_min_size and min(current.size) >= 2:
+        # 直前のレベルから 1/2 に縮小する（原寸から毎回作り直さない）
+        current = current.reduce(2)
+        level = len(levels)
+        levels.append({
+            "level": level, "zoom": zoom - level, "image": current,
+            "width": current.width, "height": current.height,
+            "scale_meter_per_pixel": _zoom_to_meter_per_pixel(center_lat, zoom - level),
+        })
+
+    return {
+        "image": canvas,
+        "zoom": zoom,
+        "bbox": (south, west, north, east),
+        "scale_meter_per_pixel": levels[0]["scale_meter_per_pixel"],
+        "levels": levels,
+        "tiles": len(coords),
+        "missing": missing,
+    }
+
+
+def get_roof_view(address: str, zoom: int = 20, grid: int = DEFAULT_GRID) -> dict:
     """住所から屋根の衛星画像を取得する（geocode + 衛星画像取得）。
 
     Args:
         address: 住所文字列
         zoom: ズームレベル（デフォルト20、約 0.15m/px）
+        grid: タイル合成の並び（fetch_satellite_image を参照）
 
     Returns:
         {
@@ -428,7 +808,7 @@ def get_roof_view(address: str, zoom: int = 20) -> dict:
     out["lng"] = geo["lng"]
     out["address"] = geo.get("formatted_address") or address
 
-    img = fetch_satellite_image(geo["lat"], geo["lng"], zoom=zoom)
+    img = fetch_satellite_image(geo["lat"], geo["lng"], zoom=zoom, grid=grid)
     if img.get("error") or img.get("image_bytes") is None:
         out["error"] = f"fetch_satellite_image failed: {img.get('error')}"
         out["source"] = f"{geo['source']}+error"
@@ -0,0 +1,320 @@
+"""記録済み API 応答によるオフライン精度・レイテンシ評価CLI。
+
+extraction/api_replay で記録した現調シートの応答（fixture）を、実APIを呼ばずに
+抽出後段のパイプラインへ再生し、ステージ別のレイテンシと正解データとの
+フィールド単位の精度を測る。
+
+    _extract_json → (複数サンプルなら) merge_extractions → validate_and_correct
+    → _parse_raw_data → validate_survey_data → compare_survey_data（eval_accuracy）
+
+fixture の構成（1ケース = 1ディレクトリ）:
+    tests/fixtures/api/<ケース名>/
+        ground_truth.json       SurveyData の model_dump（正解）
+        case.json               {"case_name", "pdfs"}（--e2e 用・任意。相対パスはケース基準）
+        0001-survey-xxxx.json   api_replay の記録（classifier 等も同居してよい）
+
+手で作った合成の fixture は "synthetic": true とし、latency_sec を持たせない
+（記録時の API 所要時間は実測のときだけ集計する）。
+
+使い方:
+    python3 tests/bench_extraction.py                    # 記録済みケースを再生して評価
+    python3 tests/bench_extraction.py --repeat 20        # 反復してレイテンシを安定させる
+    python3 tests/bench_extraction.py --e2e              # PDFがあれば抽出全体も再生
+    python3 tests/bench_extraction.py --record --api     # 正解Excelの各ケースを実APIで記録
+    python3 tests/bench_extraction.py --output bench.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+PROJECT_ROOT = Path(__file__).parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from extraction import api_replay  # noqa: E402
+from extraction.post_validators import validate_and_correct  # noqa: E402
+from extraction.self_consistency import merge_extractions  # noqa: E402
+from extraction.survey_extractor import _extract_json, _parse_raw_data  # noqa: E402
+from extraction.survey_validator import validate_survey_data  # noqa: E402
+from models.survey_data import ConfidenceLevel, SurveyData  # noqa: E402
+from tests.eval_accuracy import (  # noqa: E402
+    BOLD, RESET, compare_survey_data, print_accuracy_report,
+)
+
+STAGES = ("extract_json", "merge_extractions", "validate_and_correct",
+          "parse_raw_data", "validate_survey_data")
+PERCENTILES = (50, 90, 99)
+
+
+# ----------------------------------------------------------------------
+# 計測
+# ----------------------------------------------------------------------
+
+def percentile(samples: list[float], pct: float) -> float:
+    """最近順位法のパーセンタイル（samples が空なら 0.0）。"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def latency_summary(timings: dict[str, list[float]]) -> dict:
+    """ステージ → {"n", "mean_ms", "p50_ms", "p90_ms", "p99_ms"}。"""
+    out = {}
+    for stage, samples in timings.items():
+        if not samples:
+            continue
+        row = {"n": len(samples), "mean_ms": sum(samples) / len(samples) * 1000}
+        for pct in PERCENTILES:
+            row[f"p{pct}_ms"] = percentile(samples, pct) * 1000
+        out[stage] = {k: round(v, 3) if isinstance(v, float) else v for k, v in row.items()}
+    return out
+
+
+def replay_stages(texts: list[str], timings: dict[str, list[float]]) -> SurveyData:
+    """応答テキスト群を抽出後段のパイプラインに通し、ステージ別の所要時間を加える。
+
+    survey_extractor.extract_survey_data_multi と同じ順序・同じ関数を使う
+    （JSON を読めない応答はリトライ相当として捨て、1件も読めなければ ValueError）。
+    """
+    t0 = time.perf_counter()
+    raws = []
+    for text in texts:
+        try:
+            raws.append(json.loads(_extract_json(text)))
+        except (json.JSONDecodeError, ValueError):
+            continue
+    timings.setdefault("extract_json", []).append(time.perf_counter() - t0)
+    if not raws:
+        raise ValueError("再生した応答からJSONを1件も読めませんでした")
+
+    sc_confs: dict = {}
+    if len(raws) > 1:
+        t0 = time.perf_counter()
+        merged, sc_confs = merge_extractions(raws)
+        timings.setdefault("merge_extractions", []).append(time.perf_counter() - t0)
+    else:
+        merged = raws[0]
+
+    t0 = time.perf_counter()
+    merged, validator_warnings, validator_confs = validate_and_correct(merged)
+    timings.setdefault("validate_and_correct", []).append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    survey = _parse_raw_data(merged)
+    timings.setdefault("parse_raw_data", []).append(time.perf_counter() - t0)
+    survey.extraction_warnings.extend(validator_warnings)
+    for k, v in {**sc_confs, **validator_confs}.items():
+        new_level = ConfidenceLevel(v) if isinstance(v, str) else v
+        if k not in survey.field_confidences or new_level == ConfidenceLevel.LOW:
+            survey.field_confidences[k] = new_level
+
+    t0 = time.perf_counter()
+    validate_survey_data(survey)
+    timings.setdefault("validate_survey_data", []).append(time.perf_counter() - t0)
+    return survey
+
+
+# ----------------------------------------------------------------------
+# ケース
+# ----------------------------------------------------------------------
+
+def discover_cases(root: Path, case_filter: Optional[str] = None) -> list[Path]:
+    """ground_truth.json を持つケースディレクトリの一覧。"""
+    if not root.is_dir():
+        return []
+    cases = sorted(p.parent for p in root.glob("*/ground_truth.json"))
+    if case_filter:
+        cases = [c for c in cases if case_filter.lower() in c.name.lower()]
+    return cases
+
+
+def _case_name(case_dir: Path) -> str:
+    meta = case_dir / "case.json"
+    if meta.exists():
+        try:
+            return json.loads(meta.read_text(encoding="utf-8")).get("case_name") or case_dir.name
+        except (OSError, json.JSONDecodeError):
+            pass
+    return case_dir.name
+
+
+def case_pdfs(case_dir: Path) -> list[Path]:
+    """case.json の PDF（相対パスはケースのディレクトリ基準）。"""
+    meta = case_dir / "case.json"
+    if not meta.exists():
+        return []
+    pdfs = json.loads(meta.read_text(encoding="utf-8")).get("pdfs", [])
+    return [p if p.is_absolute() else case_dir / p for p in map(Path, pdfs)]
+
+
+def run_case(case_dir: Path, repeat: int = 1, e2e: bool = False) -> dict:
+    """1ケースを再生して {"case_name", "compare", "timings", ...} を返す。"""
+    name = _case_name(case_dir)
+    gt = SurveyData.model_validate_json(
+        (case_dir / "ground_truth.json").read_text(encoding="utf-8"))
+    fixtures = api_replay.load_fixtures(case_dir, label="survey")
+    texts = ["".join(fx["response"].get("texts") or []) for fx in fixtures]
+    recorded = [fx.get("latency_sec") for fx in fixtures
+                if fx.get("latency_sec") and not fx.get("synthetic")]
+    result: dict = {"case_name": name, "fixtures": len(fixtures),
+                    "synthetic": any(fx.get("synthetic") for fx in fixtures),
+                    "recorded_api_sec": round(sum(recorded), 3) if recorded else None}
+    if not texts:
+        result["error"] = "survey の fixture がありません"
+        return result
+
+    timings: dict[str, list[float]] = {}
+    try:
+        predicted = None
+        for _ in range(max(1, repeat)):
+            predicted = replay_stages(texts, timings)
+    except Exception as e:
+        result["error"] = f"replay: {e}"
+        return result
+
+    if e2e:
+        e2e_sec = _replay_end_to_end(case_dir)
+        if e2e_sec is not None:
+            timings["end_to_end"] = [e2e_sec]
+
+    result.update({
+        "ground_truth": gt.model_dump(mode="json"),
+        "predicted": predicted.model_dump(mode="json"),
+        "compare": compare_survey_data(predicted, gt),
+        "timings": timings,
+    })
+    return result
+
+
+def _replay_end_to_end(case_dir: Path) -> Optional[float]:
+    """case.json の PDF があれば extract_survey_data_multi 全体を再生する（秒）。"""
+    pdfs = [str(p) for p in case_pdfs(case_dir) if p.exists()]
+    if not pdfs:
+        return None
+    from extraction.survey_extractor import extract_survey_data_multi
+    t0 = time.perf_counter()
+    with api_replay.use("replay", case_dir):
+        extract_survey_data_multi(pdfs, use_self_consistency=False)
+    return time.perf_counter() - t0
+
+
+def run_benchmark(root: Path, repeat: int = 1, case_filter: Optional[str] = None,
+                  e2e: bool = False) -> dict:
+    """全ケースを再生し、ケース別結果・ステージ別レイテンシ・全体精度をまとめる。"""
+    results = [run_case(c, repeat=repeat, e2e=e2e) for c in discover_cases(root, case_filter)]
+    all_timings: dict[str, list[float]] = {}
+    for r in results:
+        for stage, samples in (r.get("timings") or {}).items():
+            all_timings.setdefault(stage, []).extend(samples)
+    correct = sum(r["compare"]["correct"] for r in results if r.get("compare"))
+    total = sum(r["compare"]["total"] for r in results if r.get("compare"))
+    return {
+        "cases": results,
+        "latency": latency_summary(all_timings),
+        "accuracy": correct / total if total else 0.0,
+        "correct": correct,
+        "total": total,
+    }
+
+
+def print_latency_report(latency: dict) -> None:
+    print(f"\n{BOLD}ステージ別レイテンシ（ms）{RESET}")
+    print(f"  {'stage':<22} {'n':>5} {'mean':>9} " +
+          " ".join(f"{'p' + str(p):>9}" for p in PERCENTILES))
+    for stage in (*STAGES, "end_to_end"):
+        row = latency.get(stage)
+        if not row:
+            continue
+        print(f"  {stage:<22} {row['n']:>5} {row['mean_ms']:>9.3f} " +
+              " ".join(f"{row[f'p{p}_ms']:>9.3f}" for p in PERCENTILES))
+
+
+# ----------------------------------------------------------------------
+# 記録
+# ----------------------------------------------------------------------
+
+def record_cases(root: Path, base_dir: str, case_filter: Optional[str] = None) -> int:
+    """正解Excelの各ケースを実APIで抽出し、応答と正解を fixture として保存する。"""
+    from extraction.survey_extractor import extract_survey_data_multi
+    from tests.eval_accuracy import _filter_cases, case_fixture_dir
+    from tests.ground_truth import discover_ground_truth_dir, find_pdf_for_xlsx, load_ground_truth
+
+    recorded = 0
+    for case_name, xlsx in _filter_cases(discover_ground_truth_dir(base_dir), case_filter):
+        pdfs = find_pdf_for_xlsx(xlsx)
+        if not pdfs:
+            print(f"  [{case_name}] PDFが見つかりません。スキップ")
+            continue
+        case_dir = case_fixture_dir(root, case_name)
+        if any(case_dir.glob("[0-9][0-9][0-9][0-9]-*.json")):
+            print(f"  [{case_name}] 記録済み。スキップ（再記録はディレクトリを削除）")
+            continue
+        print(f">>> [{case_name}] 記録中...")
+        try:
+            gt = load_ground_truth(xlsx)
+            with api_replay.use("record", case_dir):
+                extract_survey_data_multi(pdfs)
+        except Exception as e:
+            print(f"  記録ERROR: {e}")
+            continue
+        (case_dir / "ground_truth.json").write_text(
+            gt.model_dump_json(indent=2), encoding="utf-8")
+        (case_dir / "case.json").write_text(json.dumps(
+            {"case_name": case_name, "pdfs": pdfs}, ensure_ascii=False, indent=2),
+            encoding="utf-8")
+        recorded += 1
+    return recorded
+
+
+# ----------------------------------------------------------------------
+# CLI
+# ----------------------------------------------------------------------
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="記録済みAPI応答による精度・レイテンシ評価")
+    parser.add_argument("--fixtures", type=str, default=str(api_replay.DEFAULT_FIXTURE_DIR),
+                        help="fixture のルート（ケースごとのサブディレクトリ）")
+    parser.add_argument("--case", type=str, default=None, help="ケース名でフィルタ(部分一致)")
+    parser.add_argument("--repeat", type=int, default=5, help="レイテンシ計測の反復回数")
+    parser.add_argument("--e2e", action="store_true", help="PDFがあれば抽出全体も再生する")
+    parser.add_argument("--record", action="store_true",
+                        help="正解Excelの各ケースを実APIで抽出して記録する（--api 必須）")
+    parser.add_argument("--api", action="store_true", help="実APIの呼び出しを許可する")
+    parser.add_argument("--base-dir", type=str, default="見積AI入力資料/入力済み",
+                        help="入力済みディレクトリ（--record 用）")
+    parser.add_argument("--output", type=str, default=None, help="JSON出力先パス")
+    args = parser.parse_args(argv)
+
+    root = Path(args.fixtures)
+    if args.record:
+        if not args.api:
+            print("--record は実APIを呼ぶため --api も指定してください")
+            return 1
+        print(f"記録: {record_cases(root, args.base_dir, args.case)}件")
+
+    report = run_benchmark(root, repeat=args.repeat, case_filter=args.case, e2e=args.e2e)
+    if not report["cases"]:
+        print(f"再生できるケースがありません: {root}")
+        return 1
+    print_accuracy_report(report["cases"])
+    print_latency_report(report["latency"])
+
+    if args.output:
+        out_path = Path(args.output)
+        with out_path.open("w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        print(f"\nJSON出力: {out_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
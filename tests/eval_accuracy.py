@@ -3,33 +3,51 @@
 入力済みExcelを正解(ground truth)、現調シートPDFをLLM抽出結果として
 比較し、フィールド単位の正解率を計算する。
 
+ケースは --workers 件ずつ並列に抽出し、レート制限（429/529）を受けたら
+全ワーカーの開始を遅らせて指数バックオフで再試行する。--output の JSON は
+1件終わるごとに書き出すので、--resume で中断した評価を続きから再開できる。
+--diff で前回のレポートと比較し、フィールド別精度と処理時間の悪化を表示する。
+
 使い方:
     python3 tests/eval_accuracy.py             # 正解データ表示のみ
     python3 tests/eval_accuracy.py --api       # 実APIで精度評価
+    python3 tests/eval_accuracy.py --api --workers 6 --output report.json
+    python3 tests/eval_accuracy.py --api --output report.json --resume
+    python3 tests/eval_accuracy.py --api --output new.json --diff report.json
+    python3 tests/eval_accuracy.py --replay    # 記録済み応答で評価（API不要）
+    python3 tests/eval_accuracy.py --api --record tests/fixtures/api
     python3 tests/eval_accuracy.py --case 三精産業
-    python3 tests/eval_accuracy.py --output report.json
 """
 
 from __future__ import annotations
 
 import argparse
+import contextlib
 import json
+import logging
+import os
+import random
+import re
 import sys
+import threading
+import time
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Callable, Optional
 
 # プロジェクトルートをパスに追加
 PROJECT_ROOT = Path(__file__).parent.parent
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
+from extraction import api_replay  # noqa: E402
 from models.survey_data import SurveyData  # noqa: E402
-from tests.ground_truth import (  # noqa: E402
-    discover_ground_truth_dir,
-    find_pdf_for_xlsx,
-    load_ground_truth,
-)
+
+logger = logging.getLogger(__name__)
+
+# tests.ground_truth（openpyxl 依存）は正解Excelを読む関数内で遅延import する。
+# 比較・レポート部分は記録済み応答の評価（bench_extraction）からも使うため。
 
 
 # ----------------------------------------------------------------------
@@ -265,6 +283,353 @@ def print_accuracy_report(results: list[dict]) -> None:
             print(f" {tag} {key:<42}  {correct}/{total}  {ratio*100:5.1f}%")
 
 
+# ----------------------------------------------------------------------
+# 前回レポートとの差分
+# ----------------------------------------------------------------------
+
+# 処理時間の悪化とみなす閾値（前回比 +20% かつ +2秒以上）
+LATENCY_REGRESSION_RATIO = 0.2
+LATENCY_REGRESSION_MIN_SEC = 2.0
+
+
+def load_report(path: str) -> list[dict]:
+    """--output のレポート（ケースのリスト、または {"cases": [...]}）を読む."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("cases", [])
+    return [r for r in data if isinstance(r, dict) and r.get("case_name")]
+
+
+def field_accuracy(results: list[dict]) -> dict[str, tuple[int, int]]:
+    """フィールド → (正解ケース数, 比較ケース数)."""
+    out: dict[str, tuple[int, int]] = {}
+    for r in results:
+        for key, fr in (r.get("compare") or {}).get("field_results", {}).items():
+            correct, total = out.get(key, (0, 0))
+            out[key] = (correct + (1 if fr.get("correct") else 0), total + 1)
+    return out
+
+
+def diff_reports(
+    previous: list[dict],
+    current: list[dict],
+    latency_ratio: float = LATENCY_REGRESSION_RATIO,
+    latency_min_sec: float = LATENCY_REGRESSION_MIN_SEC,
+) -> dict:
+    """前回と今回のレポートを比較する（両方で比較できたケースだけを対象）."""
+    prev_by = {r["case_name"]: r for r in previous if r.get("compare")}
+    cur_by = {r["case_name"]: r for r in current if r.get("compare")}
+    common = [name for name in cur_by if name in prev_by]
+
+    prev_acc = field_accuracy([prev_by[n] for n in common])
+    cur_acc = field_accuracy([cur_by[n] for n in common])
+    fields = []
+    for key in sorted(set(prev_acc) | set(cur_acc)):
+        pc, pt = prev_acc.get(key, (0, 0))
+        cc, ct = cur_acc.get(key, (0, 0))
+        prev_ratio = pc / pt if pt else None
+        cur_ratio = cc / ct if ct else None
+        delta = (cur_ratio - prev_ratio) if prev_ratio is not None and cur_ratio is not None else None
+        fields.append({"field": key, "previous": prev_ratio, "current": cur_ratio,
+                       "delta": delta, "important": key in IMPORTANT_FIELDS})
+
+    flipped = []
+    latency = []
+    for name in common:
+        prev_fr = prev_by[name]["compare"]["field_results"]
+        for key, fr in cur_by[name]["compare"]["field_results"].items():
+            before = prev_fr.get(key)
+            if before and before.get("correct") and not fr.get("correct"):
+                flipped.append({"case_name": name, "field": key,
+                                "previous": before.get("predicted"),
+                                "current": fr.get("predicted"),
+                                "expected": fr.get("expected")})
+        prev_sec = prev_by[name].get("latency_sec")
+        cur_sec = cur_by[name].get("latency_sec")
+        if prev_sec and cur_sec:
+            regressed = (cur_sec > prev_sec * (1 + latency_ratio)
+                         and cur_sec - prev_sec >= latency_min_sec)
+            latency.append({"case_name": name, "previous": prev_sec, "current": cur_sec,
+                            "delta": round(cur_sec - prev_sec, 2), "regressed": regressed})
+
+    def _overall(by: dict) -> Optional[float]:
+        correct = sum(by[n]["compare"]["correct"] for n in common)
+        total = sum(by[n]["compare"]["total"] for n in common)
+        return correct / total if total else None
+
+    return {
+        "cases": common,
+        "only_previous": sorted(set(prev_by) - set(cur_by)),
+        "only_current": sorted(set(cur_by) - set(prev_by)),
+        "overall": {"previous": _overall(prev_by), "current": _overall(cur_by)},
+        "fields": fields,
+        "regressed_fields": [f["field"] for f in fields if f["delta"] is not None and f["delta"] < 0],
+        "flipped": flipped,
+        "latency": latency,
+        "latency_regressions": [x["case_name"] for x in latency if x["regressed"]],
+    }
+
+
+def _pct(v: Optional[float]) -> str:
+    return "   -  " if v is None else f"{v*100:5.1f}%"
+
+
+def print_diff_report(diff: dict) -> None:
+    """差分レポートを標準出力に印字（悪化は赤、改善は緑）."""
+    print()
+    print("=" * 78)
+    print(f"{BOLD}前回レポートとの差分{RESET}  (共通 {len(diff['cases'])}件)")
+    print("=" * 78)
+    overall = diff["overall"]
+    print(f"  全体精度: {_pct(overall['previous'])} → {_pct(overall['current'])}")
+    if diff["only_previous"]:
+        print(f"  {DIM}前回のみ: {', '.join(diff['only_previous'])}{RESET}")
+    if diff["only_current"]:
+        print(f"  {DIM}今回のみ: {', '.join(diff['only_current'])}{RESET}")
+
+    changed = [f for f in diff["fields"] if f["delta"]]
+    print(f"\n{BOLD}フィールド別精度の変化{RESET}" + ("" if changed else f"  {DIM}(変化なし){RESET}"))
+    for f in sorted(changed, key=lambda x: x["delta"]):
+        color = RED if f["delta"] < 0 else GREEN
+        tag = f" {BOLD}*{RESET}" if f["important"] else "  "
+        print(f" {tag} {f['field']:<42}  {_pct(f['previous'])} → "
+              f"{color}{_pct(f['current'])}{RESET}")
+
+    if diff["flipped"]:
+        print(f"\n{BOLD}{RED}正解 → 不正解になった項目{RESET}")
+        for x in diff["flipped"]:
+            print(f"  {x['case_name']}  {x['field']}: '{_truncate(x['previous'], 24)}' → "
+                  f"'{_truncate(x['current'], 24)}'  (exp='{_truncate(x['expected'], 24)}')")
+
+    regressions = [x for x in diff["latency"] if x["regressed"]]
+    if diff["latency"]:
+        prev_total = sum(x["previous"] for x in diff["latency"])
+        cur_total = sum(x["current"] for x in diff["latency"])
+        print(f"\n{BOLD}処理時間{RESET}: 合計 {prev_total:.1f}秒 → {cur_total:.1f}秒")
+    for x in regressions:
+        print(f"  {RED}悪化{RESET}  {x['case_name']}: {x['previous']:.1f}秒 → "
+              f"{x['current']:.1f}秒 (+{x['delta']:.1f}秒)")
+
+
+# ----------------------------------------------------------------------
+# 並列実行
+# ----------------------------------------------------------------------
+
+DEFAULT_WORKERS = 4
+# レート制限時の再試行（ケース単位。抽出内部のリトライとは別）
+RATE_LIMIT_RETRIES = 4
+BACKOFF_BASE_SEC = 15.0
+BACKOFF_MAX_SEC = 120.0
+
+_RATE_LIMIT_PATTERN = re.compile(r"\b(429|529)\b|rate.?limit|overloaded", re.IGNORECASE)
+
+
+def _is_rate_limited(exc: BaseException) -> bool:
+    """レート制限・過負荷によるエラーか（抽出側で文字列化されたものも含む）."""
+    seen = set()
+    cur: Optional[BaseException] = exc
+    while cur is not None and id(cur) not in seen:
+        seen.add(id(cur))
+        if getattr(cur, "status_code", None) in (429, 529):
+            return True
+        if type(cur).__name__ in ("RateLimitError", "OverloadedError"):
+            return True
+        if _RATE_LIMIT_PATTERN.search(str(cur)):
+            return True
+        cur = cur.__cause__ or cur.__context__
+    return False
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    """retry-after ヘッダの秒数（無ければ None）."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    try:
+        value = headers.get("retry-after") if headers is not None else None
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff_delay(attempt: int, exc: BaseException) -> float:
+    delay = _retry_after(exc)
+    if delay is None:
+        delay = min(BACKOFF_BASE_SEC * 2 ** (attempt - 1), BACKOFF_MAX_SEC)
+    return delay * (1 + random.uniform(0, 0.25))
+
+
+class _RateLimitGate:
+    """全ワーカー共通の待機。1件がレート制限を受けたら他のワーカーの次の開始も遅らせる."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._until = 0.0
+
+    def wait(self) -> None:
+        while True:
+            with self._lock:
+                remaining = self._until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 5.0))
+
+    def trip(self, seconds: float) -> None:
+        with self._lock:
+            self._until = max(self._until, time.monotonic() + seconds)
+
+
+def _safe_dir_name(name: str) -> str:
+    return re.sub(r'[\\/:*?"<>|\s]+', "_", name).strip("_") or "case"
+
+
+def case_fixture_dir(root: Path, case_name: str, source: str = "") -> Path:
+    """ケースの記録・再生用ディレクトリ（fixture の ground_truth.json ならその場所）."""
+    if source.endswith(".json"):
+        return Path(source).parent
+    return Path(root) / _safe_dir_name(case_name)
+
+
+def discover_fixture_cases(root: Path) -> list[tuple[str, str]]:
+    """記録済みケース（ground_truth.json を持つディレクトリ）の (案件名, jsonパス)."""
+    cases = []
+    for gt_path in sorted(Path(root).glob("*/ground_truth.json")):
+        name = gt_path.parent.name
+        meta = gt_path.parent / "case.json"
+        if meta.exists():
+            try:
+                name = json.loads(meta.read_text(encoding="utf-8")).get("case_name") or name
+            except (OSError, json.JSONDecodeError):
+                pass
+        cases.append((name, str(gt_path)))
+    return cases
+
+
+def _load_case(source: str) -> tuple[SurveyData, list[str]]:
+    """正解と抽出対象PDF。source は正解Excel、または記録済みケースの ground_truth.json."""
+    if source.endswith(".json"):
+        gt = SurveyData.model_validate_json(Path(source).read_text(encoding="utf-8"))
+        case_dir = Path(source).parent
+        meta = case_dir / "case.json"
+        pdfs = json.loads(meta.read_text(encoding="utf-8")).get("pdfs", []) if meta.exists() else []
+        # 相対パスはケースのディレクトリ基準（同梱の見本PDFなど）
+        return gt, [p if Path(p).is_absolute() else str(case_dir / p) for p in pdfs]
+    from tests.ground_truth import find_pdf_for_xlsx, load_ground_truth
+    return load_ground_truth(source), find_pdf_for_xlsx(source)
+
+
+def evaluate_case(
+    case_name: str,
+    source: str,
+    extract: Optional[Callable[[list[str]], SurveyData]] = None,
+    fixture_mode: str = "",
+    fixture_root: Optional[Path] = None,
+    gate: Optional[_RateLimitGate] = None,
+) -> dict:
+    """1ケースを抽出して比較する（レート制限は待って再試行、他のエラーは結果に記録）."""
+    try:
+        gt, pdfs = _load_case(source)
+    except Exception as e:
+        return {"case_name": case_name, "error": f"GT: {e}"}
+    if not pdfs:
+        return {"case_name": case_name, "error": "no PDF"}
+    if extract is None:
+        # 遅延import（API無し時にAPIキーチェックを避ける）
+        from extraction.survey_extractor import extract_survey_data_multi as extract
+    gate = gate or _RateLimitGate()
+
+    fixtures = case_fixture_dir(fixture_root or api_replay.DEFAULT_FIXTURE_DIR, case_name, source)
+    attempt = 0
+    while True:
+        attempt += 1
+        gate.wait()
+        started = time.monotonic()
+        # ワーカーのスレッドごとにコンテキスト変数が別なので、ケースごとに保存先を切り替えられる
+        mode_ctx = (api_replay.use(fixture_mode, fixtures) if fixture_mode
+                    else contextlib.nullcontext())
+        try:
+            with mode_ctx:
+                predicted = extract(pdfs)
+            break
+        except Exception as e:
+            if attempt <= RATE_LIMIT_RETRIES and _is_rate_limited(e):
+                delay = _backoff_delay(attempt, e)
+                gate.trip(delay)
+                logger.warning(f"[{case_name}] レート制限のため {delay:.0f}秒待って再試行 "
+                               f"({attempt}/{RATE_LIMIT_RETRIES}): {e}")
+                continue
+            return {"case_name": case_name, "error": f"extract: {e}",
+                    "rate_limit_retries": attempt - 1}
+    latency = time.monotonic() - started
+
+    result = {
+        "case_name": case_name,
+        "pdfs": pdfs,
+        "ground_truth": gt.model_dump(mode="json"),
+        "predicted": predicted.model_dump(mode="json"),
+        "compare": compare_survey_data(predicted, gt),
+        "latency_sec": round(latency, 2),
+        "rate_limit_retries": attempt - 1,
+    }
+    if source.endswith(".xlsx"):
+        result["xlsx"] = source
+    return result
+
+
+def write_report(path: str, results: list[dict]) -> None:
+    """レポートを書き出す（一時ファイル経由で置き換え、中断しても壊さない）."""
+    out_path = Path(path)
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    # SurveyData は model_dump 済み、辞書化可能なものだけ書き出す
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(tmp_path, out_path)
+
+
+def run_cases(
+    cases: list[tuple[str, str]],
+    workers: int = DEFAULT_WORKERS,
+    extract: Optional[Callable[[list[str]], SurveyData]] = None,
+    fixture_mode: str = "",
+    fixture_root: Optional[Path] = None,
+    done: Optional[list[dict]] = None,
+    on_progress: Optional[Callable[[list[dict]], None]] = None,
+) -> list[dict]:
+    """ケースを並列に評価する.
+
+    Args:
+        cases: (案件名, 正解Excel または ground_truth.json) のリスト
+        workers: 同時に抽出するケース数
+        extract: 抽出関数（省略時は extract_survey_data_multi）
+        fixture_mode: "record" / "replay" ならケースごとの fixture で記録・再生する
+        fixture_root: fixture のルート（ケース名のサブディレクトリを使う）
+        done: 再開時の既存結果。比較済みのケースは再実行しない
+        on_progress: 1件終わるごとに、その時点の結果一覧（ケース順）を渡す
+    """
+    finished = {r["case_name"]: r for r in (done or []) if r.get("compare")}
+    pending = [(n, s) for n, s in cases if n not in finished]
+    if finished:
+        print(f"再開: 評価済み {len(cases) - len(pending)}件をスキップ")
+    order = [n for n, _ in cases] + [n for n in finished if n not in dict(cases)]
+
+    def _ordered() -> list[dict]:
+        return [finished[n] for n in order if n in finished]
+
+    gate = _RateLimitGate()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(evaluate_case, name, source, extract, fixture_mode,
+                               fixture_root, gate) for name, source in pending]
+        for i, future in enumerate(as_completed(futures), 1):
+            r = future.result()
+            finished[r["case_name"]] = r
+            cmp = r.get("compare")
+            status = (f"{cmp['correct']}/{cmp['total']} = {cmp['accuracy']*100:.1f}%  "
+                      f"({r['latency_sec']:.1f}秒)" if cmp else f"ERROR: {r.get('error')}")
+            print(f"  [{i}/{len(pending)}] {r['case_name']}: {status}")
+            if on_progress:
+                on_progress(_ordered())
+    return _ordered()
+
+
 # ----------------------------------------------------------------------
 # CLI
 # ----------------------------------------------------------------------
@@ -281,6 +646,8 @@ def _filter_cases(
 
 def _print_ground_truth_only(cases: list[tuple[str, str]]) -> list[dict]:
     """正解データのみ表示し、結果用の辞書も返す."""
+    from tests.ground_truth import find_pdf_for_xlsx, load_ground_truth
+
     out = []
     print(f"\n{BOLD}正解データ一覧{RESET} ({len(cases)}件)")
     print("=" * 78)
@@ -308,44 +675,6 @@ def _print_ground_truth_only(cases: list[tuple[str, str]]) -> list[dict]:
     return out
 
 
-def _run_with_api(cases: list[tuple[str, str]]) -> list[dict]:
-    """各ケースをLLM抽出して比較."""
-    # 遅延import（API無し時にAPIキーチェックを避ける）
-    from extraction.survey_extractor import extract_survey_data_multi  # noqa
-
-    results = []
-    for case_name, xlsx in cases:
-        print(f"\n>>> [{case_name}] 抽出中...")
-        try:
-            gt = load_ground_truth(xlsx)
-        except Exception as e:
-            print(f"  ground_truth ERROR: {e}")
-            results.append({"case_name": case_name, "error": f"GT: {e}"})
-            continue
-        pdfs = find_pdf_for_xlsx(xlsx)
-        if not pdfs:
-            print("  PDFが見つかりません。スキップ")
-            results.append({"case_name": case_name, "error": "no PDF"})
-            continue
-        try:
-            predicted = extract_survey_data_multi(pdfs)
-        except Exception as e:
-            print(f"  抽出ERROR: {e}")
-            results.append({"case_name": case_name, "error": f"extract: {e}"})
-            continue
-        cmp = compare_survey_data(predicted, gt)
-        results.append({
-            "case_name": case_name,
-            "xlsx": xlsx,
-            "pdfs": pdfs,
-            "ground_truth": gt.model_dump(mode="json"),
-            "predicted": predicted.model_dump(mode="json"),
-            "compare": cmp,
-        })
-        print(f"  {cmp['correct']}/{cmp['total']} = {cmp['accuracy']*100:.1f}%")
-    return results
-
-
 def main(argv: Optional[list[str]] = None) -> int:
     parser = argparse.ArgumentParser(description="現調シートPDF読み取り精度評価")
     parser.add_argument("--api", action="store_true", help="実APIで抽出して比較する")
@@ -357,28 +686,56 @@ def main(argv: Optional[list[str]] = None) -> int:
         default="見積AI入力資料/入力済み",
         help="入力済みディレクトリ",
     )
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"同時に抽出するケース数（既定 {DEFAULT_WORKERS}）")
+    parser.add_argument("--resume", action="store_true",
+                        help="--output の既存レポートで比較済みのケースをスキップする")
+    parser.add_argument("--diff", type=str, default=None, help="比較する前回レポートJSON")
+    parser.add_argument("--replay", type=str, nargs="?", const=str(api_replay.DEFAULT_FIXTURE_DIR),
+                        default=None, help="記録済み応答で評価する（fixture のルート）")
+    parser.add_argument("--record", type=str, nargs="?", const=str(api_replay.DEFAULT_FIXTURE_DIR),
+                        default=None, help="--api の応答をケースごとに記録する（保存先ルート）")
     args = parser.parse_args(argv)
 
-    cases = discover_ground_truth_dir(args.base_dir)
+    if args.replay:
+        # 記録済みケースの ground_truth.json を正解にする（Excel が無くても評価できる）
+        cases = discover_fixture_cases(Path(args.replay))
+        if not cases:
+            from tests.ground_truth import discover_ground_truth_dir
+            cases = discover_ground_truth_dir(args.base_dir)
+    else:
+        from tests.ground_truth import discover_ground_truth_dir
+        cases = discover_ground_truth_dir(args.base_dir)
     cases = _filter_cases(cases, args.case)
     if not cases:
         print("対象ケースが見つかりません")
         return 1
 
-    if args.api:
-        results = _run_with_api(cases)
+    if args.api or args.replay:
+        done = []
+        if args.resume and args.output and Path(args.output).exists():
+            done = load_report(args.output)
+        fixture_mode, fixture_root = "", None
+        if args.replay:
+            fixture_mode, fixture_root = "replay", Path(args.replay)
+        elif args.record:
+            fixture_mode, fixture_root = "record", Path(args.record)
+        results = run_cases(
+            cases, workers=args.workers, fixture_mode=fixture_mode, fixture_root=fixture_root,
+            done=done,
+            on_progress=(lambda rs: write_report(args.output, rs)) if args.output else None,
+        )
         print_accuracy_report(results)
+        if args.diff:
+            print_diff_report(diff_reports(load_report(args.diff), results))
     else:
         results = _print_ground_truth_only(cases)
         print()
         print("(--api オプションでLLM抽出と比較を実行できます)")
 
     if args.output:
-        out_path = Path(args.output)
-        # SurveyData は model_dump 済み、辞書化可能なものだけ書き出す
-        with out_path.open("w", encoding="utf-8") as f:
-            json.dump(results, f, ensure_ascii=False, indent=2, default=str)
-        print(f"\nJSON出力: {out_path}")
+        write_report(args.output, results)
+        print(f"\nJSON出力: {args.output}")
 
     return 0
 
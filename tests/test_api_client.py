@@ -0,0 +1,192 @@
+"""Anthropic クライアントのプロセス共有（extraction/api_client）のテスト（API不要・スクリプト式）
+
+実行: python3 tests/test_api_client.py
+
+カバー範囲:
+- 共有クライアントは使い回され、APIキーは再確認の間隔ごとにだけ読むこと（キー変更で作り直し）
+- 同時実行数のセマフォ（create / stream の with の間）
+- トークンバケット（バースト後は補充速度で待つ）と 429 受信時の一時停止
+- SDK を差し替えた場合（フェイク）は従来どおりその場で生成すること
+
+実リクエストは送らない（クライアント生成と流量制御だけを確認する）。
+"""
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import anthropic
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import extraction.api_client as ac
+
+_REAL_RECHECK = ac.KEY_RECHECK_SEC
+
+
+def teardown_module(module=None):
+    ac.KEY_RECHECK_SEC = _REAL_RECHECK
+    ac.reset()
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class _SlowMessages:
+    """呼び出しの同時実行数を記録するフェイク。"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def _exit(self):
+        with self._lock:
+            self.active -= 1
+
+    def create(self, **kwargs):
+        self._enter()
+        time.sleep(self.delay)
+        self._exit()
+        return "ok"
+
+    def stream(self, **kwargs):
+        outer = self
+
+        class _Stream:
+            def __enter__(self):
+                outer._enter()
+                return self
+
+            def __exit__(self, *exc):
+                outer._exit()
+                return False
+
+        return _Stream()
+
+
+# =============================================================
+# テスト
+# =============================================================
+
+def test_shared_client_reused_and_key_rechecked():
+    """同じクライアントを使い回し、キーは再確認時だけ読み、変われば作り直すこと。"""
+    ac.reset()
+    keys = ["sk-test-1"]
+    reads = []
+
+    def key_fn():
+        reads.append(1)
+        return keys[0]
+
+    try:
+        first = ac.shared_client(anthropic, key_fn)
+        assert ac.shared_client(anthropic, key_fn) is first
+        assert len(reads) == 1, "キーは生成時だけ読む"
+        assert first.api_key == "sk-test-1", "クライアント属性は委譲される"
+
+        ac.KEY_RECHECK_SEC = 0.0
+        assert ac.shared_client(anthropic, key_fn) is first, "同じキーなら作り直さない"
+        keys[0] = "sk-test-2"
+        second = ac.shared_client(anthropic, key_fn)
+        assert second is not first and second.api_key == "sk-test-2"
+    finally:
+        ac.KEY_RECHECK_SEC = _REAL_RECHECK
+        ac.reset()
+
+
+def test_semaphore_limits_concurrency():
+    """create も stream も、同時実行数の上限を超えないこと。"""
+    limiter = ac.Limiter(concurrency=2, rpm=60000)
+    fake = _SlowMessages()
+    messages = ac._ThrottledMessages(fake, limiter)
+
+    def _create():
+        messages.create(model="m")
+
+    def _stream():
+        with messages.stream(model="m"):
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=_create if i % 2 else _stream) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert fake.peak == 2, fake.peak
+    assert limiter.stats["requests"] == 8
+    assert limiter._semaphore.acquire(blocking=False), "全て解放されている"
+
+
+def test_token_bucket_and_rate_limit_pause():
+    """バースト分は即時、以降は補充速度で待ち、429 では retry-after の間止めること。"""
+    clock = _Clock()
+    bucket = ac.TokenBucket(rate_per_sec=2.0, capacity=3, clock=clock)
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert abs(bucket.try_acquire() - 0.5) < 1e-9
+    clock.now += 0.5
+    assert bucket.try_acquire() == 0.0
+
+    limiter = ac.Limiter(concurrency=1, rpm=6000)
+    limiter.bucket = ac.TokenBucket(rate_per_sec=100.0, capacity=10, clock=clock)
+    error = SimpleNamespace(status_code=429,
+                            response=SimpleNamespace(headers={"retry-after": "3"}))
+    limiter.on_error(error)
+    assert abs(limiter.bucket.try_acquire() - 3.0) < 1e-9
+    assert limiter.stats["rate_limited"] == 1
+    limiter.on_error(ValueError("JSON解析エラー"))
+    assert limiter.stats["rate_limited"] == 1, "レート制限以外は止めない"
+    clock.now += 3.0
+    assert limiter.bucket.try_acquire() == 0.0
+
+
+def test_substituted_sdk_builds_directly():
+    """接続プールを持たない SDK（テストのフェイク）は呼び出しごとに生成すること。"""
+    built = []
+    fake_sdk = SimpleNamespace(Anthropic=lambda api_key=None: built.append(api_key) or object())
+    a = ac.shared_client(fake_sdk, lambda: "k")
+    b = ac.shared_client(fake_sdk, lambda: "k")
+    assert a is not b and built == ["k", "k"]
+
+
+def main() -> bool:
+    tests = [
+        test_shared_client_reused_and_key_rechecked,
+        test_semaphore_limits_concurrency,
+        test_token_bucket_and_rate_limit_pause,
+        test_substituted_sdk_builds_directly,
+    ]
+    print("=== API クライアント共有テスト（API不要） ===")
+    ok = True
+    try:
+        for fn in tests:
+            try:
+                fn()
+                print(f"[OK] {fn.__name__}")
+            except AssertionError as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: {e}")
+            except Exception as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: 予期しないエラー: {type(e).__name__}: {e}")
+    finally:
+        teardown_module()
+    print("=== 結果:", "全パス" if ok else "一部失敗", "===")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
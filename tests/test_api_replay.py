@@ -0,0 +1,255 @@
+"""Claude API 応答の記録・再生（extraction/api_replay）とオフライン評価のテスト（API不要・スクリプト式）
+
+実行: python3 tests/test_api_replay.py
+
+カバー範囲:
+- record モードで extract_survey_data_multi の応答が fixture に保存され、
+  replay モードでは Anthropic クライアントを一切作らずに同じ結果を再現すること
+- ストリーミング呼び出し（on_section）も記録・再生できること
+- キー不一致時は同じ label の記録順で再生し、尽きたら ReplayMissError
+- use() がコンテキスト内だけモードを切り替えること
+- bench_extraction が同梱の見本ケース（見本PDF＋合成応答）を再生し、精度と
+  ステージ別パーセンタイルを返すこと（--e2e では見本PDFから抽出全体を再生）
+"""
+import json
+import sys
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import extraction.survey_extractor as se
+from extraction import api_replay
+from tests import bench_extraction
+
+_REAL = (se.anthropic, se.get_api_key, se.CLAUDE_VISION_MODEL, se.pdf_to_images)
+
+_RAW = {"project": {"project_name": "再生テスト工場", "address": "大阪府大阪市北区"},
+        "equipment": {"module_output_w": 660, "planned_panels": 288}}
+
+
+def _restore_module():
+    se.anthropic, se.get_api_key, se.CLAUDE_VISION_MODEL, se.pdf_to_images = _REAL
+
+
+def teardown_module(module=None):
+    _restore_module()
+
+
+class _FakeStream:
+    def __init__(self, message):
+        self._message = message
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        text = self._message.content[0].text
+        for i in range(0, len(text), 7):
+            yield text[i:i + 7]
+
+    def get_final_message(self):
+        return self._message
+
+
+def _patch_live(calls):
+    """実APIの代わりに固定応答を返すフェイクへ差し替える。"""
+    text = json.dumps(_RAW, ensure_ascii=False)
+
+    class _FakeMessages:
+        def _message(self, kwargs):
+            calls.append(kwargs)
+            return SimpleNamespace(content=[SimpleNamespace(type="text", text=text)],
+                                   stop_reason="end_turn",
+                                   usage=SimpleNamespace(input_tokens=1200, output_tokens=80))
+
+        def create(self, **kwargs):
+            return self._message(kwargs)
+
+        def stream(self, **kwargs):
+            return _FakeStream(self._message(kwargs))
+
+    se.anthropic = SimpleNamespace(
+        Anthropic=lambda api_key=None: SimpleNamespace(messages=_FakeMessages()),
+        APIError=type("APIError", (Exception,), {}),
+        BadRequestError=type("BadRequestError", (Exception,), {}),
+        NotFoundError=type("NotFoundError", (Exception,), {}),
+        PermissionDeniedError=type("PermissionDeniedError", (Exception,), {}),
+    )
+    se.get_api_key = lambda: "test-key"
+    se.CLAUDE_VISION_MODEL = "claude-sonnet-4-6"
+    se.pdf_to_images = lambda path, dpi=200: [{
+        "page": 1, "image_base64": "AAAA", "image_bytes": b"", "media_type": "image/png"}]
+
+
+def _patch_offline():
+    """再生時はクライアント生成も API キー取得も失敗させる。"""
+    def _no_client(api_key=None):
+        raise AssertionError("再生モードで Anthropic クライアントが作られた")
+
+    def _no_key():
+        raise AssertionError("再生モードで API キーが参照された")
+
+    se.anthropic = SimpleNamespace(Anthropic=_no_client, APIError=Exception,
+                                   BadRequestError=Exception, NotFoundError=Exception,
+                                   PermissionDeniedError=Exception)
+    se.get_api_key = _no_key
+
+
+def _extract(on_section=None):
+    return se.extract_survey_data_multi(
+        ["dummy.pdf"], category="commercial", use_image_enhancement=False,
+        use_self_consistency=False, on_section=on_section)
+
+
+def _kwargs(text, temperature=0.0):
+    return {"model": "m", "temperature": temperature,
+            "messages": [{"role": "user", "content": [{"type": "text", "text": text}]}]}
+
+
+def _message(text):
+    return SimpleNamespace(content=[SimpleNamespace(type="text", text=text)],
+                           stop_reason="end_turn", usage=None)
+
+
+# =============================================================
+# テスト
+# =============================================================
+
+def test_record_then_replay_roundtrip():
+    """記録した応答だけで、クライアントを作らずに同じ抽出結果を再現すること。"""
+    calls = []
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            _patch_live(calls)
+            with api_replay.use("record", tmp):
+                recorded = _extract()
+            files = sorted(Path(tmp).glob("*.json"))
+            assert len(calls) == 1 and len(files) == 1, (calls, files)
+            fx = json.loads(files[0].read_text(encoding="utf-8"))
+            assert fx["label"] == "survey" and fx["seq"] == 1 and not fx["streamed"]
+            assert fx["response"]["usage"]["input_tokens"] == 1200
+            assert "AAAA" not in files[0].read_text(encoding="utf-8"), "画像は保存しない"
+
+            _patch_offline()
+            with api_replay.use("replay", tmp):
+                replayed = _extract()
+        finally:
+            _restore_module()
+    assert replayed.model_dump() == recorded.model_dump()
+    assert replayed.project.project_name == "再生テスト工場"
+    assert api_replay.mode() == "", "use() の外では既定モードに戻る"
+
+
+def test_streaming_replay():
+    """on_section 付き（ストリーミング）の呼び出しも記録・再生でき、区切りが届くこと。"""
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            _patch_live([])
+            with api_replay.use("record", tmp):
+                _extract(on_section=lambda name, section, warnings: None)
+            fx = api_replay.load_fixtures(tmp, label="survey")
+            assert len(fx) == 1 and fx[0]["streamed"]
+
+            _patch_offline()
+            sections = []
+            with api_replay.use("replay", tmp):
+                survey = _extract(
+                    on_section=lambda name, section, warnings: sections.append(name))
+        finally:
+            _restore_module()
+    assert sections[:2] == ["project", "equipment"], sections
+    assert survey.equipment.planned_panels == 288
+
+
+def test_label_order_fallback_and_miss():
+    """キー不一致は同じ label の記録順で返し、尽きたら ReplayMissError になること。"""
+    with tempfile.TemporaryDirectory() as tmp:
+        api_replay.save_fixture("catalog", _kwargs("a"), _message("first"), 0.1, directory=tmp)
+        api_replay.save_fixture("catalog", _kwargs("b"), _message("second"), 0.1, directory=tmp)
+        api_replay.save_fixture("estimate", _kwargs("a"), _message("other"), 0.1, directory=tmp)
+        with api_replay.use("replay", tmp):
+            client = api_replay.client(lambda: None, "catalog")
+            exact = client.messages.create(**_kwargs("b"))
+            assert exact.content[0].text == "second", "キー一致を優先"
+            fallback = [client.messages.create(**_kwargs("changed")).content[0].text
+                        for _ in range(2)]
+            assert fallback == ["first", "second"], fallback
+            try:
+                client.messages.create(**_kwargs("changed"))
+            except api_replay.ReplayMissError:
+                pass
+            else:
+                raise AssertionError("fixture が尽きたら ReplayMissError")
+        with api_replay.use("replay", tmp):
+            again = api_replay.client(lambda: None, "catalog").messages.create(**_kwargs("x"))
+            assert again.content[0].text == "first", "use() に入り直すと先頭から再生"
+
+
+def test_request_key_ignores_image_bytes_and_model():
+    """キーは画像をハッシュ化し、モデル名・max_tokens の違いでは変わらないこと。"""
+    image = {"type": "image", "source": {"type": "base64", "media_type": "image/png",
+                                          "data": "QUJD" * 1000}}
+    base = {"model": "a", "max_tokens": 100, "temperature": 0.0,
+            "messages": [{"role": "user", "content": [image]}]}
+    assert api_replay.request_key("survey", base) == api_replay.request_key(
+        "survey", {**base, "model": "b", "max_tokens": 32000})
+    assert api_replay.request_key("survey", base) != api_replay.request_key(
+        "survey", {**base, "temperature": 0.3})
+    assert api_replay.request_key("survey", base) != api_replay.request_key("catalog", base)
+
+
+def test_bench_on_sample_fixture():
+    """同梱の見本ケースを再生し、多数決で誤読が直り、パーセンタイルが出ること。"""
+    report = bench_extraction.run_benchmark(api_replay.DEFAULT_FIXTURE_DIR, repeat=3,
+                                            case_filter="sample_commercial", e2e=True)
+    assert len(report["cases"]) == 1
+    case = report["cases"][0]
+    assert case["fixtures"] == 3 and not case.get("error"), case.get("error")
+    assert case["synthetic"] and case["recorded_api_sec"] is None, "合成応答に実測の所要時間は無い"
+    assert report["latency"]["end_to_end"]["n"] == 1, "同梱の見本PDFから抽出全体を再生する"
+    assert case["compare"]["accuracy"] == 1.0, {
+        k: v for k, v in case["compare"]["field_results"].items() if not v["correct"]}
+    assert report["accuracy"] == 1.0
+    for stage in bench_extraction.STAGES:
+        row = report["latency"][stage]
+        assert row["n"] == 3 and row["p50_ms"] <= row["p90_ms"] <= row["p99_ms"], row
+    assert bench_extraction.percentile([3.0, 1.0, 2.0, 4.0], 50) == 2.0
+    assert bench_extraction.percentile([], 90) == 0.0
+
+
+def main() -> bool:
+    tests = [
+        test_record_then_replay_roundtrip,
+        test_streaming_replay,
+        test_label_order_fallback_and_miss,
+        test_request_key_ignores_image_bytes_and_model,
+        test_bench_on_sample_fixture,
+    ]
+    print("=== API記録・再生テスト（API不要） ===")
+    ok = True
+    try:
+        for fn in tests:
+            try:
+                fn()
+                print(f"[OK] {fn.__name__}")
+            except AssertionError as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: {e}")
+            except Exception as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: 予期しないエラー: {type(e).__name__}: {e}")
+    finally:
+        _restore_module()
+    print("=== 結果:", "全パス" if ok else "一部失敗", "===")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,210 @@
+"""見積の一括学習（learning/batch_learning.py）のテスト（API不要・スクリプト式）
+
+実行: python3 tests/test_batch_learning.py
+
+カバー範囲:
+- pair_history_with_csvs: CSVの見積ID行 / ファイル名での対応付け、未対応CSVの報告
+- iter_batch_learning: 順次実行・プロセスプール実行の進捗イベント、失敗ペアの継続
+- aggregate_proposals: 支持案件数・単価分布（中央値採用）・min_support・並び順
+- save_candidates: store への1回保存
+
+履歴・store は一時ディレクトリに差し替えて実行する（実データを汚さない）。
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# 本番Supabase（共有学習データ）への書込をimport前に遮断する（test_learning_estimate と同じ）
+os.environ["SANEI_DISABLE_SUPABASE"] = "1"
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import learning.store as store
+from learning import history
+from learning.batch_learning import (
+    aggregate_proposals, iter_batch_learning, pair_history_with_csvs,
+    run_batch_learning, save_candidates,
+)
+from generation.csv_exporter import export_estimate_to_csv_detailed
+from models.estimate_data import (
+    CategorySection, CategoryType, EstimateCover, EstimateData,
+    EstimateSummary, LineItem,
+)
+
+_TMP = tempfile.TemporaryDirectory()
+_TMP_DIR = Path(_TMP.name)
+store.ESTIMATE_RULES_PATH = _TMP_DIR / "learned_estimate_rules.json"
+store.DRAWING_RULES_PATH = _TMP_DIR / "learned_drawing_rules.json"
+store.LEARNING_LOG_PATH = _TMP_DIR / "learning_history.json"
+history.ESTIMATE_HISTORY_DIR = _TMP_DIR / "estimate_history"
+
+
+def _estimate(eid, project, cable_price, extra_items=()):
+    """施工費2行（ケーブル敷設・試運転）の最小見積。"""
+    items = [
+        LineItem(no=1, description="ケーブル敷設工事", quantity="100m",
+                 quantity_value=100, quantity_unit="m", unit_price=cable_price,
+                 amount=100 * cable_price),
+        LineItem(no=2, description="試運転調整", quantity="1式",
+                 quantity_value=1, quantity_unit="式", unit_price=50000,
+                 amount=50000),
+    ] + list(extra_items)
+    cat = CategorySection(category=CategoryType.CONSTRUCTION,
+                          category_number=3, items=items)
+    cat.calculate_totals()
+    summary = EstimateSummary(categories=[cat])
+    summary.calculate_totals()
+    return EstimateData(
+        cover=EstimateCover(estimate_id=eid, project_name=project), summary=summary)
+
+
+def _write_case(csv_dir, eid, project, ai_price, official_price, name=None):
+    """AI見積を履歴保存し、単価だけ直した正規CSVを csv_dir に置く。"""
+    history.save_estimate_history(_estimate(eid, project, ai_price))
+    official = _estimate(eid, project, official_price)
+    path = Path(csv_dir) / (name or f"{eid}.csv")
+    path.write_bytes(export_estimate_to_csv_detailed(official))
+    return path
+
+
+def _setup(csv_dir):
+    """3案件（全てケーブル単価を修正）+ 未対応CSV1件。"""
+    import shutil
+    shutil.rmtree(history.ESTIMATE_HISTORY_DIR, ignore_errors=True)
+    _write_case(csv_dir, "E-001", "A工場", 1000, 1200)
+    _write_case(csv_dir, "E-002", "B倉庫", 1000, 1300)
+    _write_case(csv_dir, "E-003", "C店舗", 1000, 1250)
+    orphan = _estimate("E-999", "孤児", 1000)
+    (Path(csv_dir) / "orphan.csv").write_bytes(export_estimate_to_csv_detailed(orphan))
+
+
+# =============================================================
+# テスト
+# =============================================================
+
+def test_pairing():
+    """見積ID行で対応付け、履歴の無いCSVは unmatched に入ること。"""
+    with tempfile.TemporaryDirectory() as csv_dir:
+        _setup(csv_dir)
+        pairs, unmatched = pair_history_with_csvs(csv_dir)
+        assert sorted(p.estimate_id for p in pairs) == ["E-001", "E-002", "E-003"]
+        assert unmatched == ["orphan.csv"]
+
+
+def test_pairing_by_file_name():
+    """見積ID行の無いCSVでもファイル名に見積IDがあれば対応付くこと。"""
+    with tempfile.TemporaryDirectory() as csv_dir:
+        _setup(csv_dir)
+        entries = [{"path": "x.json", "estimate_id": "Z-42", "project_name": "Z"}]
+        (Path(csv_dir) / "正規_Z-42.csv").write_bytes(
+            "カテゴリ,No,摘要,備考,数量,単価,金額\n".encode("utf-8"))
+        pairs, _ = pair_history_with_csvs(csv_dir, entries=entries)
+        assert [p.estimate_id for p in pairs] == ["Z-42"]
+
+
+def test_iter_sequential_progress():
+    """順次実行で1ペアごとに done が進み、全ペア ok になること。"""
+    with tempfile.TemporaryDirectory() as csv_dir:
+        _setup(csv_dir)
+        pairs, _ = pair_history_with_csvs(csv_dir)
+        events = list(iter_batch_learning(pairs, max_workers=1))
+        assert [e.done for e in events] == [1, 2, 3]
+        assert all(e.ok and e.total == 3 for e in events)
+        assert all(any(d["diff_type"] == "price_changed" for d in e.diffs)
+                   for e in events)
+
+
+def test_iter_failed_pair_continues():
+    """履歴が読めないペアは ok=False で報告され、他は処理されること。"""
+    with tempfile.TemporaryDirectory() as csv_dir:
+        _setup(csv_dir)
+        pairs, _ = pair_history_with_csvs(csv_dir)
+        pairs[0].history_path = str(_TMP_DIR / "missing.json")
+        events = list(iter_batch_learning(pairs, max_workers=1))
+        assert sum(1 for e in events if not e.ok) == 1
+        assert sum(1 for e in events if e.ok) == 2
+
+
+def test_run_process_pool_and_aggregate():
+    """プロセスプール実行で単価候補が中央値・分布付きで集約されること。"""
+    with tempfile.TemporaryDirectory() as csv_dir:
+        _setup(csv_dir)
+        seen = []
+        report = run_batch_learning(csv_dir, max_workers=2,
+                                    on_progress=lambda ev: seen.append(ev.done))
+        assert report.total_pairs == 3 and report.processed_pairs == 3
+        assert sorted(seen) == [1, 2, 3]
+        assert report.unmatched_csvs == ["orphan.csv"]
+        assert len(report.candidates) == 1, report.candidates
+        cand = report.candidates[0]
+        assert cand.kind == "unit_price_override"
+        assert cand.support == 3 and cand.support_ratio == 1.0
+        assert (cand.price_min, cand.price_median, cand.price_max) == (1200, 1250, 1300)
+        assert cand.proposed_rule["payload"]["unit_price"] == 1250
+        assert sorted(cand.projects) == ["A工場", "B倉庫", "C店舗"]
+
+
+def test_aggregate_min_support_and_ranking():
+    """支持が min_support 未満の提案は落ち、支持率×一貫性の降順に並ぶこと。"""
+    def _diff(desc, price, project):
+        return {"learnable": True, "proposed_rule": {
+            "target": "estimate", "kind": "unit_price_override",
+            "category": "施工費", "match_description": desc, "match_remarks": "",
+            "display_description": desc,
+            "payload": {"unit_price": price, "old_unit_price": 100},
+            "evidence": {"project_name": project}}}
+    diff_lists = [
+        [_diff("a", 200, "P1"), _diff("b", 300, "P1"), _diff("c", 1, "P1")],
+        [_diff("a", 200, "P2"), _diff("b", 900, "P2")],
+        [_diff("a", 200, "P3"), _diff("b", 300, "P3")],
+        [{"learnable": False, "proposed_rule": None}],
+    ]
+    cands = aggregate_proposals(diff_lists, processed_pairs=4, min_support=2)
+    assert [c.description for c in cands] == ["a", "b"], [c.description for c in cands]
+    assert cands[0].consistency == 1.0
+    assert cands[1].consistency < 1.0
+
+
+def test_save_candidates_single_write():
+    """save_candidates で候補ルールが store に保存され、学習ログが1件増えること。"""
+    store.save_rules("estimate", [])
+    with tempfile.TemporaryDirectory() as csv_dir:
+        _setup(csv_dir)
+        report = run_batch_learning(csv_dir, max_workers=1)
+    logs_before = len(store.load_learning_log())
+    assert save_candidates(report.candidates) == 1
+    rules = store.load_rules("estimate")
+    assert len(rules) == 1 and rules[0]["payload"]["unit_price"] == 1250
+    assert len(store.load_learning_log()) == logs_before + 1
+
+
+def main() -> bool:
+    tests = [
+        test_pairing,
+        test_pairing_by_file_name,
+        test_iter_sequential_progress,
+        test_iter_failed_pair_continues,
+        test_run_process_pool_and_aggregate,
+        test_aggregate_min_support_and_ranking,
+        test_save_candidates_single_write,
+    ]
+    print("=== 一括学習テスト（API不要） ===")
+    ok = True
+    for fn in tests:
+        try:
+            fn()
+            print(f"[OK] {fn.__name__}")
+        except AssertionError as e:
+            ok = False
+            print(f"[NG] {fn.__name__}: {e}")
+        except Exception as e:
+            ok = False
+            print(f"[NG] {fn.__name__}: 予期しないエラー: {type(e).__name__}: {e}")
+    print("=== 結果:", "全パス" if ok else "一部失敗", "===")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,241 @@
+"""カタログPDFのテキスト経路（product/catalog_text・product/catalog_extractor）のテスト
+（API不要・スクリプト式）
+
+実行: python3 tests/test_catalog_text.py
+
+カバー範囲:
+- 表のラベルと値が別セル（別ブロック）でも、同じ行にまとめて読めること
+- 温度係数のような同じラベルの範囲外の数値を読み飛ばすこと・日本語の仕様表も読めること
+- テキスト層のあるPDFは画像を送らず、読めなかった項目だけをテキストで問い合わせ、
+  項目ごとの取得経路（field_sources）を返すこと（レンダリングはサムネイルの1回だけ）
+- テキスト層の無いPDFは従来どおり画像から読むこと
+- パワコンの仕様表（定格出力電圧など）は出力と取り違えず、モジュールの証拠
+  （Pmax と Voc / Isc）が無いのでテキスト経路を使わないこと
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+import fitz
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import product.catalog_extractor as ce
+from product import catalog_text
+
+_REAL = (ce._call_claude_api, ce.THUMBNAIL_DIR, fitz.Page.get_pixmap)
+
+
+def teardown_module(module=None):
+    ce._call_claude_api, ce.THUMBNAIL_DIR, fitz.Page.get_pixmap = _REAL
+
+
+_SPEC_ROWS = [
+    ("Temperature Coefficient (Pmax)", "-0.34 %/C"),
+    ("Maximum Power (Pmax)", "660 W"),
+    ("Maximum Power Voltage (Vmp)", "38.5 V"),
+    ("Maximum Power Current (Imp)", "17.15 A"),
+    ("Open Circuit Voltage (Voc)", "45.8 V"),
+    ("Short Circuit Current (Isc)", "18.31 A"),
+    ("Module Efficiency", "21.3 %"),
+    ("Dimensions", "2384 x 1303 x 35 mm"),
+    ("Weight", "33.5 kg"),
+    ("Product Warranty", "12 years"),
+    ("Linear Power Warranty", "30 years"),
+]
+
+
+_PCS_ROWS = [
+    ("定格出力", "5.5 kW"),
+    ("定格出力電圧", "202 V"),
+    ("定格出力電流", "27.2 A"),
+    ("定格出力周波数", "50/60 Hz"),
+    ("最大入力電圧", "450 V"),
+    ("電力変換効率", "96.0 %"),
+    ("外形寸法", "520 x 370 x 185 mm"),
+    ("質量", "18 kg"),
+    ("製品保証", "10 年"),
+]
+
+
+def _spec_pdf(path, rows=_SPEC_ROWS, intro=(
+        "High efficiency bifacial module for utility and C&I projects.",
+        "Excellent low irradiance performance and PID resistance.")):
+    """紹介文 + 2列の仕様表（ラベルと値を別々に配置）のPDFを作る。"""
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    for i, line in enumerate(intro):
+        page.insert_text((60, 60 + i * 16), line, fontsize=10, fontname="japan")
+    for row, (label, value) in enumerate(rows):
+        y = 120 + row * 22
+        page.insert_text((60, y), label, fontsize=11, fontname="japan")
+        page.insert_text((330, y), value, fontsize=11, fontname="japan")
+    doc.save(path)
+    doc.close()
+
+
+def _count_renders():
+    calls = []
+    real = _REAL[2]
+
+    def _get_pixmap(self, *args, **kwargs):
+        calls.append(self.number + 1)
+        return real(self, *args, **kwargs)
+
+    fitz.Page.get_pixmap = _get_pixmap
+    return calls
+
+
+# =============================================================
+# テスト
+# =============================================================
+
+def test_layout_rows_and_parse():
+    """別セルのラベルと値を1行にまとめ、範囲外の数値は読み飛ばすこと。"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "spec.pdf")
+        _spec_pdf(path)
+        text = catalog_text.extract_text_layer(path)
+    assert "Open Circuit Voltage (Voc) 45.8 V" in text.splitlines(), text
+    assert catalog_text.has_usable_text(text)
+    raw, found = catalog_text.parse_spec_text(text)
+    assert raw["output_w"] == 660.0, "温度係数の -0.34 ではなく Pmax の行"
+    assert raw["electrical"] == {"vmp": 38.5, "imp": 17.15, "voc": 45.8, "isc": 18.31,
+                                 "efficiency_pct": 21.3}
+    assert raw["physical"] == {"length_mm": 2384.0, "width_mm": 1303.0, "thickness_mm": 35.0,
+                               "weight_kg": 33.5}
+    assert raw["warranty"] == {"product_years": 12.0, "output_years": 30.0}
+    assert raw["product_type"] == "module"
+    assert catalog_text.missing_fields(found) == ["maker", "model"]
+
+    jp = ("公称最大出力 Pmax 410 W\n最大出力動作電圧 Vmp 31.2 V\n開放電圧 Voc 37.4 V\n"
+          "短絡電流 Isc 13.9 A\n外形寸法 1722×1134×30 mm\n質量 21.5 kg\n出力保証 25年")
+    raw, found = catalog_text.parse_spec_text(jp)
+    assert raw["output_w"] == 410.0 and raw["electrical"]["vmp"] == 31.2
+    assert raw["physical"]["width_mm"] == 1134.0 and raw["warranty"]["output_years"] == 25.0
+    assert "electrical.imp" not in found and not catalog_text.has_usable_text(jp)
+
+
+def test_text_path_asks_only_missing_fields():
+    """画像を送らず、不足項目だけをテキストで問い合わせて経路を記録すること。"""
+    sent = []
+
+    def _fake_api(content, attempt):
+        sent.append(content)
+        # モデルが数値を読み違えても、テキストから読めた値が優先される
+        return {"product_type": "module", "maker": "Canadian Solar", "model": "CS7L-MS",
+                "output_w": 665, "model_aliases": ["CS7L-MS-660"]}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "spec.pdf")
+        _spec_pdf(path)
+        ce._call_claude_api = _fake_api
+        ce.THUMBNAIL_DIR = Path(tmp) / "thumbs"
+        try:
+            renders = _count_renders()
+            result = ce.extract_product_catalog(path)
+        finally:
+            teardown_module()
+        assert Path(result["catalog_image_path"]).exists()
+    assert len(sent) == 1 and [c["type"] for c in sent[0]] == ["text"], "画像は送らない"
+    prompt = sent[0][0]["text"]
+    assert "不足している項目（maker, model）" in prompt and "45.8" in prompt
+    assert renders == [1], f"描くのはサムネイルの1ページ目だけ: {renders}"
+    assert result["maker"] == "Canadian Solar" and result["output_w"] == 660.0
+    assert result["warranty"]["output_years"] == 30
+    assert result["extraction_path"] == "text+model"
+    sources = result["field_sources"]
+    assert sources["output_w"] == ce.SOURCE_TEXT and sources["electrical.voc"] == ce.SOURCE_TEXT
+    assert sources["maker"] == ce.SOURCE_TEXT_MODEL and sources["model"] == ce.SOURCE_TEXT_MODEL
+
+
+def test_scanned_pdf_falls_back_to_vision():
+    """テキスト層が無ければ画像を送り、全項目の経路は vision になること。"""
+    sent = []
+
+    def _fake_api(content, attempt):
+        sent.append([c["type"] for c in content])
+        return {"product_type": "module", "maker": "Longi", "model": "LR5-72HTH",
+                "output_w": 575}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "scan.pdf")
+        doc = fitz.open()
+        doc.new_page()
+        doc.save(path)
+        doc.close()
+        ce._call_claude_api = _fake_api
+        ce.THUMBNAIL_DIR = Path(tmp) / "thumbs"
+        try:
+            result = ce.extract_product_catalog(path)
+        finally:
+            teardown_module()
+    assert sent == [["image", "text"]]
+    assert result["extraction_path"] == ce.SOURCE_VISION
+    assert set(result["field_sources"].values()) == {ce.SOURCE_VISION}
+    assert result["field_sources"]["output_w"] == ce.SOURCE_VISION
+
+
+def test_pcs_spec_uses_model_path():
+    """パワコンの仕様表は出力電圧を出力と取り違えず、テキスト経路を使わないこと。"""
+    sent = []
+
+    def _fake_api(content, attempt):
+        sent.append([c["type"] for c in content])
+        return {"product_type": "pcs", "maker": "オムロン", "model": "KPV-A55-J4",
+                "output_w": 5500}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "pcs.pdf")
+        _spec_pdf(path, _PCS_ROWS, intro=(
+            "マルチストリング型パワーコンディショナ 屋外設置対応 単相3線式 5.5kW",
+            "高効率の電力変換で発電量を最大化。自立運転機能付き、停電時も特定負荷へ給電できます。",
+            "塩害地域・重塩害地域にも設置可能な耐候性の筐体を採用しています。",
+            "Single-phase power conditioner for residential and small commercial systems."))
+        text = catalog_text.extract_text_layer(path)
+        assert catalog_text.has_usable_text(text), text
+        raw, found = catalog_text.parse_spec_text(text)
+        assert "output_w" not in raw, f"定格出力電圧 202V は出力ではない: {raw}"
+        assert {"physical.weight_kg", "warranty.product_years"} <= set(found)
+        assert not catalog_text.is_module_spec(found)
+
+        ce._call_claude_api = _fake_api
+        ce.THUMBNAIL_DIR = Path(tmp) / "thumbs"
+        try:
+            result = ce.extract_product_catalog(path)
+        finally:
+            teardown_module()
+    assert sent == [["image", "text"]], "モジュール以外は画像からモデルで読む"
+    assert result["extraction_path"] == ce.SOURCE_VISION
+    assert result["output_w"] == 5500
+
+
+def main() -> bool:
+    tests = [
+        test_layout_rows_and_parse,
+        test_text_path_asks_only_missing_fields,
+        test_scanned_pdf_falls_back_to_vision,
+        test_pcs_spec_uses_model_path,
+    ]
+    print("=== カタログ テキスト経路テスト（API不要） ===")
+    ok = True
+    try:
+        for fn in tests:
+            try:
+                fn()
+                print(f"[OK] {fn.__name__}")
+            except AssertionError as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: {e}")
+            except Exception as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: 予期しないエラー: {type(e).__name__}: {e}")
+    finally:
+        teardown_module()
+    print("=== 結果:", "全パス" if ok else "一部失敗", "===")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
@@ -28,7 +28,7 @@ sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 from drafting.models import DraftingSpec, PanelSpec, RoofFace
 from drafting.layout_engine import place_panels, _point_in_polygon
-from drafting.spec_extractor import _normalize_parsed, build_user_prompt
+from drafting.spec_extractor import _normalize_parsed, build_system_prompt
 
 
 def _xsol_panel(**kw):
@@ -197,7 +197,7 @@ def test_normalize_kw_mismatch_warning():
 
 def test_prompt_new_rules():
     """プロンプトに新ルールが入り、旧「数値は0」既定ルールが消えていること。"""
-    p = build_user_prompt("layout")
+    p = build_system_prompt()
     assert "キー自体を出力しない" in p, "不明キー省略ルールが無い"
     assert "origin_x_mm" in p, "複数面originの指示が無い"
     assert "検算" in p, "枚数・kW検算の指示が無い"
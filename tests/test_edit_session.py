@@ -0,0 +1,170 @@
+"""見積の編集セッション（pricing/edit_session）のテスト（API不要・スクリプト式）
+
+実行: python3 tests/test_edit_session.py
+
+カバー範囲:
+- 明細の追加・変更・削除で、合計を全カテゴリ再計算せずに差分で保ち、
+  全再計算と同じ結果になること
+- 取り消し・やり直し（音声編集の1回の適用は1手）と、行番号の復元
+- 税・値引き設定は pricing_rules.yaml を1度だけ読み、更新されたら読み直すこと。
+  支給品切替の再計算が学習ルール込みの load_pricing_rules を呼ばないこと
+"""
+import copy
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pricing.knowledge_base as knowledge_base
+from models.estimate_data import CategorySection, LineItem
+from pricing import edit_session as es
+from pricing import supply_selection as ss
+from voice.estimate_editor import apply_commands
+from tests.test_voice_local_parser import _estimate
+
+_REAL = (es.RULES_PATH, CategorySection.calculate_totals, knowledge_base.load_pricing_rules)
+
+
+def teardown_module(module=None):
+    es.RULES_PATH, CategorySection.calculate_totals, knowledge_base.load_pricing_rules = _REAL
+    es._SETTINGS_CACHE.update(sig=None, settings=None)
+
+
+def _totals(estimate):
+    s = estimate.summary
+    return ([c.total for c in s.categories], s.subtotal, s.discount, s.total_before_tax,
+            s.tax, s.total_with_tax, estimate.cover.total_with_tax)
+
+
+def _full_recompute(estimate):
+    fresh = copy.deepcopy(estimate)
+    es.EstimateEditSession(fresh, settings=es.TotalsSettings())
+    return _totals(fresh)
+
+
+# =============================================================
+# テスト
+# =============================================================
+
+def test_incremental_totals_match_full_recompute():
+    """編集中は calculate_totals を呼ばず、合計は全再計算と一致すること。"""
+    estimate = _estimate()
+    session = es.EstimateEditSession(estimate, settings=es.TotalsSettings())
+    supplied, material = estimate.summary.categories
+    calls = []
+    CategorySection.calculate_totals = lambda self: calls.append(self)
+    try:
+        session.update_item(supplied, supplied.items[0], unit_price=50000, amount=288 * 50000)
+        session.add_item(material, LineItem(no=4, description="圧着端子", quantity="100個",
+                                            unit_price=50, amount=5000))
+        session.delete_item(material, material.items[0])
+        session.set_total_before_tax(14_450_000)
+        assert calls == [], "編集ごとに全カテゴリを再計算しない"
+    finally:
+        CategorySection.calculate_totals = _REAL[1]
+
+    assert material.total == 40000 + 12000 + 5000
+    assert estimate.summary.subtotal == 288 * 50000 + 57000
+    assert estimate.summary.total_before_tax == 14_450_000
+    assert estimate.summary.tax == 1_445_000
+    assert _totals(estimate) == _full_recompute(estimate)
+    assert [i.no for i in material.items] == [1, 2, 3]
+
+
+def test_undo_redo_restores_edits():
+    """1手ずつ戻せて、音声編集の1回の適用はまとめて戻ること。"""
+    estimate = _estimate()
+    session = es.EstimateEditSession(estimate, settings=es.TotalsSettings())
+    before = _totals(estimate)
+    material = estimate.summary.categories[1]
+    rows = [(i.no, i.description) for i in material.items]
+
+    session.update_item(material, material.items[1], unit_price=900, amount=45000)
+    new_est, logs = apply_commands(estimate, [
+        {"action": "delete_item", "category": "材料費", "item_match": "ケーブルラック"},
+        {"action": "set_discount", "new_value": -50000},
+        {"action": "set_client_name", "new_value": "株式会社テスト商事"},
+    ], session=session)
+    assert new_est is estimate and all(log.startswith("✅") for log in logs), logs
+    assert session.history() == ["電線管 PF管 を変更", "音声編集"]
+
+    assert session.undo() == "音声編集"
+    assert [(i.no, i.description) for i in material.items] == rows, "行番号も元どおり"
+    assert estimate.cover.client_name == "株式会社サンプル" and estimate.summary.discount == 0
+    assert session.undo() == "電線管 PF管 を変更" and session.undo() is None
+    assert _totals(estimate) == before and material.items[1].unit_price == 800
+
+    assert session.redo() == "電線管 PF管 を変更"
+    assert material.items[1].amount == 45000 and session.can_redo
+    session.set_discount(-10000)
+    assert not session.can_redo, "新しい編集でやり直し履歴は消える"
+    assert _totals(estimate) == _full_recompute(estimate)
+
+    session.refresh()
+    assert not session.can_undo, "一括組み替えの後は履歴を消す"
+
+
+def test_totals_settings_cached_from_rules_file():
+    """税・値引き設定は1度だけ読み、ファイル更新で読み直すこと。"""
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            es.RULES_PATH = Path(tmp) / "pricing_rules.yaml"
+            es.RULES_PATH.write_text(
+                "tax_rate: 0.08\ntax_rounding_method: ceil\ndiscount_method: none\n",
+                encoding="utf-8")
+            es._SETTINGS_CACHE.update(sig=None, settings=None)
+            first = es.totals_settings()
+            assert first == es.TotalsSettings("none", 0.08, "ceil")
+            assert es.totals_settings() is first, "更新が無ければ読み直さない"
+            assert first.tax(1001) == 81 and first.auto_total(123456) == 123456
+
+            es.RULES_PATH.write_text("tax_rate: 0.10\ndiscount_method: round_down_100000\n"
+                                     "# 更新\n", encoding="utf-8")
+            assert es.totals_settings() == es.TotalsSettings("round_down_100000", 0.10, "floor")
+
+            def _no_learned_rules():
+                raise AssertionError("load_pricing_rules を呼ばない")
+
+            knowledge_base.load_pricing_rules = _no_learned_rules
+            estimate = _estimate()
+            estimate.summary.categories[1].items[0].amount = 250000
+            for cat in estimate.summary.categories:
+                cat.calculate_totals()
+            ss._recompute_discount_and_totals(estimate)
+            assert estimate.summary.total_before_tax == 17_500_000, "10万円未満を切捨て"
+
+            es.RULES_PATH = Path(tmp) / "missing.yaml"
+            assert es.totals_settings() == es.TotalsSettings(), "読めなければ既定値"
+        finally:
+            teardown_module()
+
+
+def main() -> bool:
+    tests = [
+        test_incremental_totals_match_full_recompute,
+        test_undo_redo_restores_edits,
+        test_totals_settings_cached_from_rules_file,
+    ]
+    print("=== 見積 編集セッションテスト（API不要） ===")
+    ok = True
+    try:
+        for fn in tests:
+            try:
+                fn()
+                print(f"[OK] {fn.__name__}")
+            except AssertionError as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: {e}")
+            except Exception as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: 予期しないエラー: {type(e).__name__}: {e}")
+    finally:
+        teardown_module()
+    print("=== 結果:", "全パス" if ok else "一部失敗", "===")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,191 @@
+"""見積PDFの構造パース（API不要の高速パス）のテスト（スクリプト式）
+
+実行: python3 tests/test_estimate_parser_structured.py
+
+カバー範囲:
+- generation/pdf_generator の出力PDFを Claude を呼ばずに ParsedEstimate 化できること
+  （明細・備考2行目・折り返し摘要・改ページ続きの表・カテゴリ・集計・表紙情報）
+- EstimateData → estimate_to_parsed（履歴側）と同じ明細になること（差分ゼロ）
+- 明細合計と小計が合わない PDF は Claude パースにフォールバックすること
+- 金額セル（¥・.-・△・負号）と折り返し改行の正規化
+
+Claude 呼び出し（_call_claude_with_retry）はフェイクに差し替えるため API キー不要。
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import learning.estimate_parser as ep
+from generation.pdf_generator import generate_pdf
+from learning.estimate_diff import diff_estimates, normalize_desc
+from learning.history import estimate_to_parsed
+from models.estimate_data import (
+    CategorySection, CategoryType, EstimateCover, EstimateData,
+    EstimateSummary, LineItem,
+)
+
+_REAL_CALL = ep._call_claude_with_retry
+
+
+def teardown_module(module=None):
+    ep._call_claude_with_retry = _REAL_CALL
+
+
+def _estimate(break_totals: bool = False) -> EstimateData:
+    """支給品1行・材料費3行（備考2行・長い摘要）・施工費40行（改ページ）の見積。"""
+    rows_by_cat = [
+        (CategoryType.SUPPLIED, [
+            ("太陽光モジュール", "JAソーラー 455W\n御支給品", 288, "枚", 0)]),
+        (CategoryType.MATERIAL, [
+            ("PVケーブル間", "配管　VE54", 2, "式", 38000),
+            ("その他雑材費", "", 1, "式", 114048),
+            ("とても長い摘要の項目名でセル内で折り返しが発生するかを確認する行",
+             "備考1行目\n備考2行目", 30, "m", 1200)]),
+        (CategoryType.CONSTRUCTION, [
+            (f"工事{i}", "", 1, "式", 1000 * i) for i in range(1, 41)]),
+    ]
+    cats = []
+    for n, (ctype, rows) in enumerate(rows_by_cat, 1):
+        items = [LineItem(no=i + 1, description=d, remarks=r,
+                          quantity=f"{q}{u}", quantity_value=q, quantity_unit=u,
+                          unit_price=p, amount=q * p)
+                 for i, (d, r, q, u, p) in enumerate(rows)]
+        cat = CategorySection(category=ctype, category_number=n, items=items)
+        cat.calculate_totals()
+        cats.append(cat)
+    summary = EstimateSummary(categories=cats, discount=-50000)
+    summary.calculate_totals()
+    if break_totals:
+        summary.subtotal += 12345  # 明細合計と合わない小計（読み取り検算NGの再現）
+    cover = EstimateCover(
+        estimate_id="22730522-4367674", issue_date="2026/10/01",
+        client_name="テスト株式会社", project_name="テスト工場 屋根上PV",
+        total_with_tax=summary.total_with_tax,
+        total_before_tax=summary.total_before_tax, tax=summary.tax)
+    return EstimateData(cover=cover, summary=summary)
+
+
+def _write_pdf(tmp: str, estimate: EstimateData) -> Path:
+    path = Path(tmp) / "estimate.pdf"
+    path.write_bytes(generate_pdf(estimate))
+    return path
+
+
+def _forbid_claude(content):
+    raise AssertionError("構造パースで完結するはずが Claude が呼ばれた")
+
+
+# =============================================================
+# テスト
+# =============================================================
+
+def test_generated_pdf_parsed_without_claude():
+    """本ツール生成PDFは Claude を呼ばずに全明細・集計・表紙情報が読めること。"""
+    ep._call_claude_with_retry = _forbid_claude
+    estimate = _estimate()
+    with tempfile.TemporaryDirectory() as tmp:
+        parsed = ep.parse_estimate_pdf(_write_pdf(tmp, estimate), source="ai")
+    ep._call_claude_with_retry = _REAL_CALL
+
+    assert parsed.origin == "pdf" and parsed.source == "ai"
+    assert parsed.estimate_id == "22730522-4367674"
+    assert parsed.issue_date == "2026/10/01"
+    assert parsed.client_name == "テスト株式会社"
+    assert parsed.project_name == "テスト工場 屋根上PV"
+    s = estimate.summary
+    assert (parsed.subtotal, parsed.discount, parsed.total_before_tax) == \
+        (s.subtotal, s.discount, s.total_before_tax)
+    assert (parsed.tax, parsed.total_with_tax) == (s.tax, s.total_with_tax)
+    assert len(parsed.items) == 44, len(parsed.items)
+    assert not parsed.warnings, parsed.warnings
+
+    by_desc = {it.description: it for it in parsed.items}
+    module = by_desc["太陽光モジュール"]
+    assert module.category == "支給品"
+    assert module.remarks == "JAソーラー 455W\n御支給品", "備考2行目は改行で連結されるはず"
+    assert (module.quantity_value, module.quantity_unit) == (288.0, "枚")
+    long_desc = "とても長い摘要の項目名でセル内で折り返しが発生するかを確認する行"
+    assert by_desc[long_desc].remarks == "備考1行目\n備考2行目"
+    assert by_desc["工事40"].category == "施工費", "改ページ後の続きの表もカテゴリを引き継ぐはず"
+    assert by_desc["工事40"].amount == 40000
+
+
+def test_structured_matches_history_parse():
+    """生成PDFの構造パース結果と履歴側の変換結果で差分が出ないこと。"""
+    ep._call_claude_with_retry = _forbid_claude
+    estimate = _estimate()
+    with tempfile.TemporaryDirectory() as tmp:
+        from_pdf = ep.parse_estimate_pdf(_write_pdf(tmp, estimate), source="official")
+    ep._call_claude_with_retry = _REAL_CALL
+    from_history = estimate_to_parsed(estimate)
+
+    learnable = [d for d in diff_estimates(from_history, from_pdf) if d.learnable]
+    assert not learnable, [d.summary for d in learnable]
+    pdf_keys = sorted((it.category, normalize_desc(it.description),
+                       normalize_desc(it.remarks)) for it in from_pdf.items)
+    hist_keys = sorted((it.category, normalize_desc(it.description),
+                        normalize_desc(it.remarks)) for it in from_history.items)
+    assert pdf_keys == hist_keys
+
+
+def test_totals_mismatch_falls_back_to_claude():
+    """明細合計と小計が合わない場合は構造パースを捨てて Claude でパースすること。"""
+    calls = []
+
+    def _fake_claude(content):
+        calls.append(content)
+        return {"estimate_id": "X", "items": [
+            {"category": "材料費", "no": 1, "description": "A", "unit_price": 1,
+             "amount": 1, "quantity_value": 1, "quantity_unit": "式"}],
+            "subtotal": 1}
+
+    ep._call_claude_with_retry = _fake_claude
+    with tempfile.TemporaryDirectory() as tmp:
+        parsed = ep.parse_estimate_pdf(_write_pdf(tmp, _estimate(break_totals=True)),
+                                       source="official")
+    ep._call_claude_with_retry = _REAL_CALL
+    assert len(calls) == 1, "検算NGなら Claude が1回呼ばれるはず"
+    assert calls[0][0]["type"] == "text", "テキスト層があるのでテキストモードのはず"
+    assert parsed.estimate_id == "X"
+
+
+def test_cell_normalizers():
+    """金額セルと折り返し改行の正規化。"""
+    assert ep._parse_yen("¥956,048.-") == 956048
+    assert ep._parse_yen("-50,000") == -50000
+    assert ep._parse_yen("△50,000") == -50000
+    assert ep._parse_yen("") is None and ep._parse_yen(None) is None
+    assert ep._join_wrapped("PVケーブル\n間") == "PVケーブル間"
+    assert ep._join_wrapped("VE\n54") == "VE 54"
+
+
+def main() -> bool:
+    tests = [
+        test_generated_pdf_parsed_without_claude,
+        test_structured_matches_history_parse,
+        test_totals_mismatch_falls_back_to_claude,
+        test_cell_normalizers,
+    ]
+    print("=== 見積PDF構造パーステスト（API不要） ===")
+    ok = True
+    for fn in tests:
+        try:
+            fn()
+            print(f"[OK] {fn.__name__}")
+        except AssertionError as e:
+            ok = False
+            print(f"[NG] {fn.__name__}: {e}")
+        except Exception as e:
+            ok = False
+            print(f"[NG] {fn.__name__}: 予期しないエラー: {type(e).__name__}: {e}")
+        finally:
+            ep._call_claude_with_retry = _REAL_CALL
+    print("=== 結果:", "全パス" if ok else "一部失敗", "===")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,278 @@
+"""精度評価の並列実行・再開・差分（tests/eval_accuracy）のテスト（API不要・スクリプト式）
+
+実行: python3 tests/test_eval_parallel.py
+
+カバー範囲:
+- ワーカー数ぶん並列に抽出し、結果はケース順・処理時間つきで返ること
+- レート制限（429）は全体で待って再試行し、それ以外のエラーは結果に記録すること
+- 再開時は比較済みのケースを再実行せず、1件ごとにレポートを書き出すこと
+- 前回レポートとの差分（フィールド別精度・正解→不正解・処理時間の悪化）
+- record/replay: ケースごとの fixture に記録し、並列でもケースごとに正しく再生すること
+- --replay の同梱見本ケースは、見本PDFを実際に画像化してから記録済み応答で評価すること
+"""
+import json
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import extraction.survey_extractor as se
+from extraction import api_replay
+from models.survey_data import PlannedEquipment, ProjectInfo, SurveyData
+from tests import eval_accuracy as ea
+
+_REAL = (se.anthropic, se.get_api_key, se.CLAUDE_VISION_MODEL, se.pdf_to_images)
+_REAL_BACKOFF = (ea.BACKOFF_BASE_SEC, ea.BACKOFF_MAX_SEC)
+
+
+def _restore_module():
+    se.anthropic, se.get_api_key, se.CLAUDE_VISION_MODEL, se.pdf_to_images = _REAL
+    ea.BACKOFF_BASE_SEC, ea.BACKOFF_MAX_SEC = _REAL_BACKOFF
+
+
+def teardown_module(module=None):
+    _restore_module()
+
+
+def _survey(name: str, panels: int = 288) -> SurveyData:
+    return SurveyData(project=ProjectInfo(project_name=name),
+                      equipment=PlannedEquipment(module_output_w=660, planned_panels=panels))
+
+
+def _make_cases(root: Path, names: list[str]) -> list[tuple[str, str]]:
+    """記録済みケース形式（ground_truth.json + case.json）のケースを作る。"""
+    for i, name in enumerate(names):
+        case_dir = root / f"case{i}"
+        case_dir.mkdir(parents=True)
+        (case_dir / "ground_truth.json").write_text(_survey(name).model_dump_json(),
+                                                    encoding="utf-8")
+        (case_dir / "case.json").write_text(json.dumps(
+            {"case_name": name, "pdfs": [f"{name}.pdf"]}, ensure_ascii=False), encoding="utf-8")
+    return ea.discover_fixture_cases(root)
+
+
+def _result(name, correct_panels=True, latency=10.0):
+    pred = _survey(name, 288 if correct_panels else 238)
+    return {"case_name": name, "compare": ea.compare_survey_data(pred, _survey(name)),
+            "latency_sec": latency}
+
+
+# =============================================================
+# テスト
+# =============================================================
+
+def test_parallel_run_keeps_case_order():
+    """4件を4ワーカーで並列に処理し、結果はケース順で処理時間を持つこと。"""
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def extract(pdfs):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.2)
+        with lock:
+            active[0] -= 1
+        return _survey(Path(pdfs[0]).stem)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = _make_cases(Path(tmp), ["A社", "B社", "C社", "D社"])
+        started = time.monotonic()
+        results = ea.run_cases(cases, workers=4, extract=extract)
+        elapsed = time.monotonic() - started
+    assert [r["case_name"] for r in results] == ["A社", "B社", "C社", "D社"]
+    assert peak[0] == 4 and elapsed < 0.6, (peak, elapsed)
+    assert all(r["compare"]["accuracy"] == 1.0 and r["latency_sec"] >= 0.2 for r in results)
+
+
+def test_rate_limit_backoff():
+    """429 は待って再試行し、他のエラーは再試行せず結果に記録すること。"""
+    ea.BACKOFF_BASE_SEC, ea.BACKOFF_MAX_SEC = 0.05, 0.05
+    calls = {"A社": 0, "B社": 0}
+
+    def extract(pdfs):
+        name = Path(pdfs[0]).stem
+        calls[name] += 1
+        if name == "A社" and calls[name] == 1:
+            raise RuntimeError("AI読み取りに3回失敗しました。\n詳細エラー: Error code: 429 - "
+                               "{'type': 'error', 'error': {'type': 'rate_limit_error'}}")
+        if name == "B社":
+            raise RuntimeError("PDFが破損しています")
+        return _survey(name)
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            results = ea.run_cases(_make_cases(Path(tmp), ["A社", "B社"]), workers=2,
+                                   extract=extract)
+    finally:
+        _restore_module()
+    a, b = results
+    assert a["compare"]["accuracy"] == 1.0 and a["rate_limit_retries"] == 1
+    assert calls == {"A社": 2, "B社": 1}, calls
+    assert "破損" in b["error"] and not b.get("compare")
+    assert ea._is_rate_limited(SimpleNamespace(status_code=529, __cause__=None,
+                                               __context__=None)) is True
+    assert not ea._is_rate_limited(ValueError("planned_panels=4290"))
+
+
+def test_resume_skips_finished_cases():
+    """比較済みのケースは再実行せず、エラーのケースは再実行して1件ごとに保存すること。"""
+    seen = []
+
+    def extract(pdfs):
+        seen.append(Path(pdfs[0]).stem)
+        return _survey(Path(pdfs[0]).stem)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = _make_cases(Path(tmp) / "cases", ["A社", "B社", "C社"])
+        out = str(Path(tmp) / "report.json")
+        ea.write_report(out, [_result("A社"), {"case_name": "B社", "error": "extract: 429"},
+                              _result("Z社")])
+        snapshots = []
+        results = ea.run_cases(cases, workers=2, extract=extract, done=ea.load_report(out),
+                               on_progress=lambda rs: (ea.write_report(out, rs),
+                                                       snapshots.append(len(rs))))
+        saved = ea.load_report(out)
+    assert sorted(seen) == ["B社", "C社"], seen
+    assert [r["case_name"] for r in results] == ["A社", "B社", "C社", "Z社"]
+    assert snapshots == [3, 4], "1件終わるごとに書き出す"
+    assert [r["case_name"] for r in saved] == ["A社", "B社", "C社", "Z社"]
+
+
+def test_diff_reports():
+    """精度の悪化したフィールド・正解→不正解・処理時間の悪化を検出すること。"""
+    previous = [_result("A社", latency=20.0), _result("B社", latency=30.0),
+                _result("旧案件")]
+    current = [_result("A社", correct_panels=False, latency=21.0),
+               _result("B社", latency=45.0), _result("新案件")]
+    diff = ea.diff_reports(previous, current)
+    assert diff["cases"] == ["A社", "B社"]
+    assert diff["only_previous"] == ["旧案件"] and diff["only_current"] == ["新案件"]
+    assert "equipment.planned_panels" in diff["regressed_fields"]
+    assert diff["flipped"] == [{"case_name": "A社", "field": "equipment.planned_panels",
+                                "previous": 288, "current": 238, "expected": 288}]
+    assert diff["latency_regressions"] == ["B社"], "A社の+1秒は閾値未満"
+    assert diff["overall"]["previous"] == 1.0 > diff["overall"]["current"]
+    ea.print_diff_report(diff)
+
+
+def test_record_and_replay_per_case():
+    """ケースごとの fixture に記録し、並列の再生でも各ケースが自分の応答を使うこと。"""
+    def _live():
+        class _FakeMessages:
+            def create(self, **kwargs):
+                # 画像（ダミーPDF名から作る）でケースを見分けて別々の応答を返す
+                name = kwargs["messages"][0]["content"][0]["source"]["data"]
+                text = json.dumps({"project": {"project_name": name},
+                                   "equipment": {"module_output_w": 660, "planned_panels": 288}},
+                                  ensure_ascii=False)
+                return SimpleNamespace(content=[SimpleNamespace(type="text", text=text)],
+                                       stop_reason="end_turn", usage=None)
+
+        se.anthropic = SimpleNamespace(
+            Anthropic=lambda api_key=None: SimpleNamespace(messages=_FakeMessages()),
+            APIError=type("APIError", (Exception,), {}),
+            BadRequestError=type("BadRequestError", (Exception,), {}),
+            NotFoundError=type("NotFoundError", (Exception,), {}),
+            PermissionDeniedError=type("PermissionDeniedError", (Exception,), {}),
+        )
+        se.get_api_key = lambda: "test-key"
+
+    def _offline():
+        def _no_client(api_key=None):
+            raise AssertionError("再生モードで Anthropic クライアントが作られた")
+        se.anthropic = SimpleNamespace(Anthropic=_no_client, APIError=Exception,
+                                       BadRequestError=Exception, NotFoundError=Exception,
+                                       PermissionDeniedError=Exception)
+
+    def extract(pdfs):
+        return se.extract_survey_data_multi(pdfs, category="commercial",
+                                            use_image_enhancement=False,
+                                            use_self_consistency=False)
+
+    se.CLAUDE_VISION_MODEL = "claude-sonnet-4-6"
+    se.pdf_to_images = lambda path, dpi=200: [{
+        "page": 1, "image_base64": Path(path).stem, "image_bytes": b"",
+        "media_type": "image/png"}]
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            cases = _make_cases(root, ["A社", "B社", "C社"])
+            _live()
+            recorded = ea.run_cases(cases, workers=3, extract=extract,
+                                    fixture_mode="record", fixture_root=root)
+            for i in range(3):
+                assert len(list((root / f"case{i}").glob("0001-survey-*.json"))) == 1
+            _offline()
+            replayed = ea.run_cases(list(reversed(cases)), workers=3, extract=extract,
+                                    fixture_mode="replay", fixture_root=root)
+    finally:
+        _restore_module()
+    assert [r["predicted"]["project"]["project_name"] for r in recorded] == ["A社", "B社", "C社"]
+    assert {r["case_name"]: r["predicted"]["project"]["project_name"] for r in replayed} == {
+        "A社": "A社", "B社": "B社", "C社": "C社"}
+
+
+def test_replay_bundled_sample_case():
+    """同梱の見本ケースを --replay と同じ経路で評価し、見本PDFを画像化すること。"""
+    rendered = []
+
+    def _render(path, dpi=200):
+        pages = _REAL[3](path, dpi=dpi)
+        rendered.append((Path(path).name, len(pages)))
+        return pages
+
+    def _no_client(api_key=None):
+        raise AssertionError("再生モードで Anthropic クライアントが作られた")
+
+    se.anthropic = SimpleNamespace(Anthropic=_no_client, APIError=Exception,
+                                   BadRequestError=Exception, NotFoundError=Exception,
+                                   PermissionDeniedError=Exception)
+    se.pdf_to_images = _render
+    root = api_replay.DEFAULT_FIXTURE_DIR
+    try:
+        cases = [c for c in ea.discover_fixture_cases(root) if "sample_commercial" in c[1]]
+        results = ea.run_cases(cases, workers=2, fixture_mode="replay", fixture_root=root)
+    finally:
+        _restore_module()
+    assert len(results) == 1 and not results[0].get("error"), results
+    assert rendered == [("sample_survey.pdf", 1)], rendered
+    assert results[0]["pdfs"][0].endswith("sample_commercial/sample_survey.pdf")
+    assert results[0]["compare"]["accuracy"] == 1.0
+
+
+def main() -> bool:
+    tests = [
+        test_parallel_run_keeps_case_order,
+        test_rate_limit_backoff,
+        test_resume_skips_finished_cases,
+        test_diff_reports,
+        test_record_and_replay_per_case,
+        test_replay_bundled_sample_case,
+    ]
+    print("=== 精度評価 並列・再開・差分テスト（API不要） ===")
+    ok = True
+    try:
+        for fn in tests:
+            try:
+                fn()
+                print(f"[OK] {fn.__name__}")
+            except AssertionError as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: {e}")
+            except Exception as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: 予期しないエラー: {type(e).__name__}: {e}")
+    finally:
+        _restore_module()
+    print("=== 結果:", "全パス" if ok else "一部失敗", "===")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
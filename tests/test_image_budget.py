@@ -0,0 +1,188 @@
+"""Vision 画像予算（extraction/image_budget）のテスト（API不要・スクリプト式）
+
+実行: python3 tests/test_image_budget.py
+
+カバー範囲:
+- 白い余白の外周トリミング（内容は残り、画素数が減る）
+- インク密度によるページ別解像度（密な表は原寸、写真・白紙は縮小）
+- 合計トークン予算: 先頭打ち切りではなく全ページを残し、密度の低いページから縮小
+- 合計バイト予算・1枚上限、開けない画像の素通し、入力 dict を変更しないこと
+- extract_survey_data_multi が予算適用後の画像を送ること
+"""
+import base64
+import io
+import json
+import random
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import extraction.survey_extractor as se
+from extraction.image_budget import PIXELS_PER_TOKEN, apply_image_budget, crop_to_content
+
+_REAL = (se.anthropic, se.get_api_key, se.CLAUDE_VISION_MODEL, se.pdf_to_images)
+
+
+def _restore_module():
+    se.anthropic, se.get_api_key, se.CLAUDE_VISION_MODEL, se.pdf_to_images = _REAL
+
+
+def teardown_module(module=None):
+    _restore_module()
+
+
+def _page(img: Image.Image, no: int, fmt: str = "PNG") -> dict:
+    buf = io.BytesIO()
+    img.save(buf, format=fmt)
+    data = buf.getvalue()
+    return {"page": no, "image_bytes": data, "media_type": f"image/{fmt.lower()}",
+            "image_base64": base64.standard_b64encode(data).decode("utf-8")}
+
+
+def _dense_table(size=(1654, 2339), margin=300) -> Image.Image:
+    """A4 200dpi 相当。外周に広い余白、中央に細かい罫線と文字状の短線。"""
+    img = Image.new("L", size, 255)
+    d = ImageDraw.Draw(img)
+    rng = random.Random(0)
+    w, h = size
+    for y in range(margin, h - margin, 40):
+        d.line([(margin, y), (w - margin, y)], fill=0, width=2)
+        for x in range(margin + 10, w - margin - 20, 14):
+            if rng.random() < 0.7:
+                d.line([(x, y + 8), (x + rng.randint(3, 9), y + rng.randint(12, 30))],
+                       fill=0, width=2)
+    return img
+
+
+def _photo(size=(1654, 2339)) -> Image.Image:
+    """暗部の塊が多くエッジの少ない写真相当（なだらかな暗いグラデーション）。"""
+    w, h = size
+    grad = Image.linear_gradient("L").resize((w, h)).point(lambda v: 30 + v // 4)
+    return grad.convert("RGB")
+
+
+# =============================================================
+# テスト
+# =============================================================
+
+def test_crop_to_content():
+    """白い外周だけが切り落とされ、内容は残ること。"""
+    img = _dense_table()
+    cropped, box = crop_to_content(img)
+    assert box is not None
+    assert cropped.size[0] < img.size[0] and cropped.size[1] < img.size[1]
+    assert box[0] <= 300 and box[1] <= 300, "内容（300px から）を切らないこと"
+    assert box[0] >= 250, "余白は少しだけ残す"
+    blank = Image.new("L", (800, 800), 255)
+    assert crop_to_content(blank) == (blank, None)
+
+
+def test_per_page_resolution():
+    """密な表は原寸（トリミングのみ）、写真と白紙は縮小されること。"""
+    pages = [_page(_dense_table(), 1), _page(_photo(), 2, "JPEG"),
+             _page(Image.new("L", (1654, 2339), 255), 3)]
+    out, report = apply_image_budget(pages, label="test")
+    info = {p["page"]: p for p in report["pages"]}
+    assert info[1]["class"] == "dense" and info[1]["scale"] == 1.0, info[1]
+    assert info[2]["class"] == "photo" and info[2]["scale"] < 1.0, info[2]
+    assert info[3]["class"] == "blank" and max(info[3]["size"]) < 2339
+    assert out[1]["media_type"] == "image/jpeg"
+    assert report["pixels_after"] < report["pixels_before"]
+    for p in out:
+        assert Image.open(io.BytesIO(base64.b64decode(p["image_base64"]))).size == p["budget"]["size"]
+
+
+def test_token_budget_keeps_all_pages():
+    """予算超過時も全ページを残し、密度の低いページほど強く縮めること。"""
+    pages = [_page(_dense_table(), i) for i in range(1, 4)] + [_page(_photo(), 4, "JPEG")]
+    max_tokens = 8000
+    out, report = apply_image_budget(pages, label="test", max_tokens=max_tokens)
+    assert [p["page"] for p in out] == [1, 2, 3, 4], "先頭打ち切りはしない"
+    assert report["pixels_after"] <= max_tokens * PIXELS_PER_TOKEN * 1.01
+    scales = {p["page"]: p["scale"] for p in report["pages"]}
+    assert scales[4] < scales[1], scales
+    assert all(max(p["size"]) >= 1000 for p in report["pages"]), "長辺の下限を守る"
+
+
+def test_byte_budget_and_passthrough():
+    """合計バイト上限に収まり、開けない画像は素通しし、入力は変更しないこと。"""
+    noisy = Image.effect_noise((1600, 1600), 120).convert("RGB")
+    pages = [_page(noisy, 1), _page(noisy, 2),
+             {"page": 3, "image_base64": "AAAA", "image_bytes": b"", "media_type": "image/png"}]
+    original = dict(pages[0])
+    out, report = apply_image_budget(pages, label="test", max_bytes=600_000,
+                                     max_page_bytes=400_000)
+    assert pages[0] == original, "入力 dict は変更しない"
+    assert report["bytes_after"] <= 600_000 + 3, report["bytes_after"]
+    assert all(len(p["image_bytes"]) <= 400_000 for p in out[:2])
+    assert out[2]["image_base64"] == "AAAA" and "budget" not in out[2]
+
+
+def test_survey_sends_budgeted_images():
+    """extract_survey_data_multi が予算適用後（トリミング済み）の画像を送ること。"""
+    calls = []
+    raw = json.dumps({"project": {"project_name": "予算テスト"}, "equipment": {}},
+                     ensure_ascii=False)
+
+    class _FakeMessages:
+        def create(self, **kwargs):
+            calls.append(kwargs)
+            return SimpleNamespace(content=[SimpleNamespace(type="text", text=raw)],
+                                   stop_reason="end_turn")
+
+    se.anthropic = SimpleNamespace(
+        Anthropic=lambda api_key=None: SimpleNamespace(messages=_FakeMessages()),
+        APIError=type("APIError", (Exception,), {}),
+        BadRequestError=type("BadRequestError", (Exception,), {}),
+        NotFoundError=type("NotFoundError", (Exception,), {}),
+        PermissionDeniedError=type("PermissionDeniedError", (Exception,), {}),
+    )
+    se.get_api_key = lambda: "test-key"
+    se.CLAUDE_VISION_MODEL = "claude-sonnet-4-6"
+    se.pdf_to_images = lambda path, dpi=200: [_page(_dense_table(), 1)]
+    try:
+        survey = se.extract_survey_data_multi(
+            ["dummy.pdf"], category="commercial", use_image_enhancement=False,
+            use_self_consistency=False)
+    finally:
+        _restore_module()
+    image = calls[0]["messages"][0]["content"][0]
+    sent = Image.open(io.BytesIO(base64.b64decode(image["source"]["data"])))
+    assert sent.size[0] < 1654 and sent.size[1] < 2339, sent.size
+    assert survey.project.project_name == "予算テスト"
+
+
+def main() -> bool:
+    tests = [
+        test_crop_to_content,
+        test_per_page_resolution,
+        test_token_budget_keeps_all_pages,
+        test_byte_budget_and_passthrough,
+        test_survey_sends_budgeted_images,
+    ]
+    print("=== 画像予算テスト（API不要） ===")
+    ok = True
+    try:
+        for fn in tests:
+            try:
+                fn()
+                print(f"[OK] {fn.__name__}")
+            except AssertionError as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: {e}")
+            except Exception as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: 予期しないエラー: {type(e).__name__}: {e}")
+    finally:
+        _restore_module()
+    print("=== 結果:", "全パス" if ok else "一部失敗", "===")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,236 @@
+"""抽出ジョブのバックグラウンド実行（extraction/jobs）のテスト（API不要・スクリプト式）
+
+実行: python3 tests/test_jobs.py
+
+カバー範囲:
+- 現調シートのジョブが render → call → validate の段階と先出しセクションを報告し、
+  結果を get(job_id) で取り出せること（記録済み応答の再生で実 API なし）
+- 同じ入力の再投入はキャッシュから即座に完了し、実行中なら同じジョブを返すこと
+- 待機中・実行中のジョブを取り消せること（実行中は次の段階の境目で中断）
+- 失敗したジョブはエラーを記録し、キャッシュしないこと
+- API 失敗時の代替結果（カタログの空の結果・製図の _fallback_spec）はキャッシュせず、
+  再投入で抽出し直すこと。force=True はキャッシュがあっても抽出し直すこと
+"""
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import drafting.spec_extractor as dse
+import extraction.survey_extractor as se
+import product.catalog_extractor as ce
+from extraction import api_replay, jobs
+from tests import test_api_replay as replay_helpers
+
+_REAL = (se.anthropic, se.get_api_key, se.CLAUDE_VISION_MODEL, se.pdf_to_images,
+         ce.extract_product_catalog, dse.extract_drafting_spec)
+
+
+def _restore_module():
+    (se.anthropic, se.get_api_key, se.CLAUDE_VISION_MODEL, se.pdf_to_images,
+     ce.extract_product_catalog, dse.extract_drafting_spec) = _REAL
+
+
+def teardown_module(module=None):
+    _restore_module()
+    jobs.reset()
+
+
+def _wait(job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not job.done and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.done, f"ジョブが終わらない: {job.snapshot()}"
+    return job
+
+
+def _pdf(tmp, name, content=b"%PDF-dummy"):
+    path = Path(tmp) / name
+    path.write_bytes(content)
+    return str(path)
+
+
+# =============================================================
+# テスト
+# =============================================================
+
+def test_survey_job_reports_stages_and_sections():
+    """段階とセクションを報告し、結果を ID から取り出せること。"""
+    jobs.reset()
+    stages = []
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            replay_helpers._patch_live([])
+            with api_replay.use("record", tmp):
+                se.extract_survey_data_multi(
+                    ["dummy.pdf"], category="commercial", use_image_enhancement=False,
+                    use_self_consistency=False, on_section=lambda *a: None,
+                    on_progress=lambda stage, message: stages.append(stage))
+            replay_helpers._patch_offline()
+            with api_replay.use("replay", tmp):
+                job = jobs.submit_survey_extraction(
+                    [_pdf(tmp, "a.pdf")], category="commercial", use_image_enhancement=False,
+                    use_self_consistency=False)
+                _wait(job)
+        finally:
+            _restore_module()
+    assert stages == ["render", "call", "validate"], stages
+    assert job.status == jobs.DONE and job.stage == "done" and job.progress == 100, job.error
+    assert jobs.get(job.id) is job
+    assert job.result.project.project_name == "再生テスト工場"
+    assert list(job.sections)[:2] == ["project", "equipment"], list(job.sections)
+
+
+def test_cache_hit_and_dedupe():
+    """同じ入力はキャッシュから即完了し、実行中の同じ入力は同じジョブを返すこと。"""
+    jobs.reset()
+    calls = []
+    release = threading.Event()
+
+    def run(job):
+        calls.append(1)
+        job.report("call")
+        release.wait(5)
+        return {"panels": 288}
+
+    manager = jobs.get_manager()
+    first = manager.submit("catalog", run, input_hash="h1")
+    assert manager.submit("catalog", run, input_hash="h1") is first, "実行中は同じジョブ"
+    release.set()
+    _wait(first)
+    again = manager.submit("catalog", run, input_hash="h1")
+    assert again.status == jobs.DONE and again.cached and again.id != first.id
+    assert again.result == {"panels": 288} and again.result is not first.result
+    assert len(calls) == 1
+    other = _wait(manager.submit("survey", run, input_hash="h1"))
+    assert not other.cached and len(calls) == 2, "種類が違えば別キャッシュ"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        a = _pdf(tmp, "a.pdf")
+        b = _pdf(tmp, "b.pdf", b"%PDF-other")
+        assert jobs.hash_inputs("survey", [a]) == jobs.hash_inputs("survey", [a])
+        assert jobs.hash_inputs("survey", [a]) != jobs.hash_inputs("survey", [b])
+        assert jobs.hash_inputs("survey", [a], category="commercial") != \
+            jobs.hash_inputs("survey", [a], category="residential")
+
+
+def test_cancel_queued_and_running():
+    """待機中はその場で、実行中は次の report() で取り消されること。"""
+    jobs.reset()
+    manager = jobs.JobManager(max_workers=1)
+    started, release = threading.Event(), threading.Event()
+    reached = []
+
+    def slow(job):
+        job.report("render")
+        started.set()
+        release.wait(5)
+        job.report("call")
+        reached.append("call")
+        return "never"
+
+    try:
+        running = manager.submit("survey", slow, input_hash="r")
+        queued = manager.submit("survey", slow, input_hash="q")
+        assert started.wait(5)
+        assert manager.cancel(queued.id) and queued.status == jobs.CANCELLED
+        assert manager.cancel(running.id) and running.status == jobs.RUNNING
+        release.set()
+        _wait(running)
+    finally:
+        manager.shutdown()
+    assert running.status == jobs.CANCELLED and running.result is None
+    assert reached == [], "取り消し後の段階には進まない"
+    assert not manager.cancel(running.id), "終了済みは取り消せない"
+    assert ("survey", "r") not in manager._cache
+
+
+def test_failed_job_records_error():
+    """例外はジョブのエラーとして記録し、結果はキャッシュしないこと。"""
+    jobs.reset()
+
+    def broken(job):
+        job.report("render")
+        raise RuntimeError("PDFが破損しています")
+
+    manager = jobs.get_manager()
+    job = _wait(manager.submit("survey", broken, input_hash="bad"))
+    assert job.status == jobs.FAILED and "破損" in job.error
+    assert job.snapshot()["status"] == "failed"
+    retry = manager.submit("survey", broken, input_hash="bad")
+    assert not retry.cached, "失敗はキャッシュしない"
+    _wait(retry)
+
+
+def test_fallback_results_are_not_cached():
+    """代替結果はキャッシュせず、再投入で抽出し直すこと。force=True も抽出し直すこと。"""
+    jobs.reset()
+    calls = []
+    replies = [ce._empty_result(warnings=["AI抽出に失敗しました: overloaded"]),
+               {"maker": "Canadian Solar", "extraction_path": ce.SOURCE_VISION},
+               {"maker": "Canadian Solar", "extraction_path": ce.SOURCE_VISION}]
+
+    def _fake_catalog(path):
+        calls.append(path)
+        return replies[len(calls) - 1]
+
+    def _fake_drafting(paths, drawing_type="layout", hint=""):
+        calls.append(tuple(paths))
+        return dse._fallback_spec(drawing_type, "AI 抽出に失敗しました")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = _pdf(tmp, "catalog.pdf")
+        try:
+            ce.extract_product_catalog = _fake_catalog
+            failed = _wait(jobs.submit_catalog_extraction(path))
+            assert failed.status == jobs.DONE and failed.result["extracted_warnings"]
+            retry = _wait(jobs.submit_catalog_extraction(path))
+            assert not retry.cached and len(calls) == 2, "失敗の代替結果は使い回さない"
+            assert retry.result["maker"] == "Canadian Solar"
+            cached = _wait(jobs.submit_catalog_extraction(path))
+            assert cached.cached and len(calls) == 2, "成功した結果はキャッシュする"
+            forced = _wait(jobs.submit_catalog_extraction(path, force=True))
+            assert not forced.cached and len(calls) == 3, "force=True は抽出し直す"
+
+            dse.extract_drafting_spec = _fake_drafting
+            first = _wait(jobs.submit_drafting_extraction([path]))
+            again = _wait(jobs.submit_drafting_extraction([path]))
+            assert first.result.confidence == {"_extraction": "low"}
+            assert not again.cached and len(calls) == 5, "製図の代替 spec も使い回さない"
+        finally:
+            _restore_module()
+
+
+def main() -> bool:
+    tests = [
+        test_survey_job_reports_stages_and_sections,
+        test_cache_hit_and_dedupe,
+        test_cancel_queued_and_running,
+        test_failed_job_records_error,
+        test_fallback_results_are_not_cached,
+    ]
+    print("=== 抽出ジョブ テスト（API不要） ===")
+    ok = True
+    try:
+        for fn in tests:
+            try:
+                fn()
+                print(f"[OK] {fn.__name__}")
+            except AssertionError as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: {e}")
+            except Exception as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: 予期しないエラー: {type(e).__name__}: {e}")
+    finally:
+        teardown_module()
+    print("=== 結果:", "全パス" if ok else "一部失敗", "===")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
@@ -10,7 +10,8 @@
   roof_type 条件（"*" は全面）、2回目適用の冪等性
 - learned_golden_examples: 新しい順・limit
 - store 経由の diff→承認→apply のラウンドトリップ
-- spec_extractor プロンプトへの学習済みお手本注入
+- spec_extractor プロンプトへの学習済みお手本注入・システムプロンプトのキャッシュ
+- drawing_stats: 屋根種別ごとの逐次集計（中央値・最頻の向き・支持件数）と適用
 
 store は一時ディレクトリに差し替えて実行する（実 knowledge/ を汚さない）。
 """
@@ -35,6 +36,7 @@ _TMP_DIR = Path(_TMP.name)
 store.ESTIMATE_RULES_PATH = _TMP_DIR / "learned_estimate_rules.json"
 store.DRAWING_RULES_PATH = _TMP_DIR / "learned_drawing_rules.json"
 store.LEARNING_LOG_PATH = _TMP_DIR / "learning_history.json"
+store.DRAWING_STATS_PATH = _TMP_DIR / "learned_drawing_stats.json"
 
 from drafting import sample_specs
 from drafting.models import (
@@ -42,11 +44,16 @@ from drafting.models import (
 )
 from learning.drawing_diff import diff_drawing_specs
 from learning.apply_drawing import apply_learned_drawing_rules, learned_golden_examples
+from learning.drawing_stats import (
+    format_learned_default, learned_drawing_defaults, load_stats_index,
+    record_approved_rules,
+)
 
 
 def _reset_store():
-    """テスト間の独立性のため図面ルールを空にする。"""
+    """テスト間の独立性のため図面ルールと集計を空にする。"""
     store.save_rules("drawing", [])
+    store.save_drawing_stats([])
 
 
 def _by_type(diffs):
@@ -321,10 +328,10 @@ def test_diff_to_store_to_apply_roundtrip():
 
 def test_prompt_injection():
     """spec_extractor のプロンプトに学習済みお手本が注入されること（無ければ従来通り）。"""
-    from drafting.spec_extractor import build_user_prompt
+    from drafting.spec_extractor import build_system_prompt, build_user_prompt
 
     _reset_store()
-    prompt_before = build_user_prompt()
+    prompt_before = build_system_prompt()
     assert "学習済みお手本" not in prompt_before, "学習ゼロ件なら注入されないはず"
 
     store.add_rules("drawing", [
@@ -332,10 +339,117 @@ def test_prompt_injection():
          "payload": {"name": "テスト商事様 太陽光配置図",
                      "spec": spec_to_dict(sample_specs.kurihara_layout())}},
     ])
-    prompt_after = build_user_prompt()
+    prompt_after = build_system_prompt()
     assert "学習済みお手本" in prompt_after, "学習済みお手本が注入されるはず"
     assert "テスト商事様" in prompt_after
     assert "正解出力例" in prompt_after, "既存のゴールデン例は残るはず"
+    assert "正解出力例" not in build_user_prompt(), "few-shot はシステム側のみのはず"
+
+
+def test_system_prompt_cache():
+    """システムプロンプトは学習お手本が変わらない限り再構築されず、cache_control 付きで送られること。"""
+    import drafting.spec_extractor as se
+
+    _reset_store()
+    first = se.build_system_prompt()
+    assert se.build_system_prompt() is first, "同一キーならキャッシュ済みの同一文字列のはず"
+
+    # 再確認窓を過ぎて読み直しても、内容が同じなら同一文字列（API側キャッシュが当たる）
+    se._system_prompt_cache["checked_at"] -= se.SYSTEM_PROMPT_RECHECK_SEC + 1
+    assert se.build_system_prompt() is first
+
+    # golden 以外のルール追加では学習お手本は変わらない → 同一文字列
+    store.add_rules("drawing", [
+        {"kind": "margin_override", "payload": {"margin_mm": 300, "roof_type": "*"}}])
+    assert se.build_system_prompt() is first
+
+    store.add_rules("drawing", [
+        {"kind": "golden_example",
+         "payload": {"name": "キャッシュ確認様", "spec": {"customer_name": "C"}}}])
+    rebuilt = se.build_system_prompt()
+    assert rebuilt is not first and "キャッシュ確認様" in rebuilt
+
+    blocks = se.build_system_blocks()
+    assert len(blocks) == 1 and blocks[0]["text"] is rebuilt
+    assert blocks[0]["cache_control"] == {"type": "ephemeral"}
+
+
+# =============================================================
+# drawing_stats（逐次集計）
+# =============================================================
+
+def _approve(rules):
+    """承認フロー（learning/app_pages）と同じく add_rules + 集計更新を行う。"""
+    store.add_rules("drawing", rules)
+    return record_approved_rules(rules)
+
+
+def test_stats_running_median_and_mode():
+    """承認ごとに件数・平均・中央値・最頻の向きが逐次更新されること。"""
+    _reset_store()
+    for margin, ori in ((300, Orientation.PORTRAIT), (800, Orientation.PORTRAIT),
+                        (400, Orientation.LANDSCAPE)):
+        assert _approve([
+            {"kind": "margin_override",
+             "payload": {"margin_mm": margin, "roof_type": RoofType.SETSUBAN}},
+            {"kind": "orientation_preference",
+             "payload": {"orientation": ori, "roof_type": RoofType.SETSUBAN}},
+            {"kind": "golden_example", "payload": {"name": f"g{margin}", "spec": {}}},
+        ]) == 2, "golden_example は集計対象外のはず"
+
+    stats = load_stats_index()
+    m = stats[("margin_mm", RoofType.SETSUBAN)]
+    assert m["count"] == 3 and m["median"] == 400 and m["value"] == 400
+    assert abs(m["mean"] - 500) < 1e-9 and (m["min"], m["max"]) == (300, 800)
+    o = stats[("orientation", RoofType.SETSUBAN)]
+    assert o["count"] == 3 and o["value"] == Orientation.PORTRAIT
+    assert o["choices"] == {Orientation.PORTRAIT: 2, Orientation.LANDSCAPE: 1}
+
+    # 偶数件の中央値は中央2値の平均
+    _approve([{"kind": "margin_override",
+               "payload": {"margin_mm": 500, "roof_type": RoofType.SETSUBAN}}])
+    assert load_stats_index()[("margin_mm", RoofType.SETSUBAN)]["median"] == 450
+
+
+def test_apply_uses_aggregate_with_support():
+    """集計が MIN_SUPPORT 件以上なら最新ルールではなく中央値を適用し、件数を示すこと。"""
+    _reset_store()
+    for gl, margin in ((15, 300), (15, 800), (20, 350)):
+        _approve([
+            {"kind": "gap_override",
+             "payload": {"gap_long_mm": gl, "roof_type": RoofType.SETSUBAN}},
+            {"kind": "margin_override",
+             "payload": {"margin_mm": margin, "roof_type": RoofType.SETSUBAN}},
+        ])
+    # ルール本体は最新（gap 20 / margin 350）、集計は中央値（gap 15 / margin 350）
+    spec = DraftingSpec(
+        panel=PanelSpec(gap_long_mm=25, gap_short_mm=10),
+        roof_faces=[RoofFace(name="面1", roof_type=RoofType.SETSUBAN, margin_mm=500)],
+    )
+    spec, msgs = apply_learned_drawing_rules(spec)
+    assert spec.panel.gap_long_mm == 15, "外れた最新値ではなく中央値を使うはず"
+    assert spec.roof_faces[0].margin_mm == 350
+    assert all("図面3件" in m for m in msgs), msgs
+
+    defaults = {(d["field"], d["roof_type"]): d for d in learned_drawing_defaults()}
+    assert defaults[("gap_long_mm", RoofType.SETSUBAN)]["count"] == 3
+    assert defaults[("gap_long_mm", RoofType.SETSUBAN)]["source"] == "aggregate"
+    text = format_learned_default(defaults[("margin_mm", RoofType.SETSUBAN)])
+    assert "350mm" in text and "図面3件" in text, text
+
+
+def test_stats_ignored_without_enabled_rule():
+    """集計があっても、対応ルールを無効化すれば適用されないこと。"""
+    _reset_store()
+    for margin in (300, 300):
+        _approve([{"kind": "margin_override",
+                           "payload": {"margin_mm": margin, "roof_type": "*"}}])
+    rule_id = store.load_rules("drawing")[0]["id"]
+    store.set_rule_enabled("drawing", rule_id, False)
+    spec = DraftingSpec(roof_faces=[RoofFace(name="面1", margin_mm=500)])
+    spec, msgs = apply_learned_drawing_rules(spec)
+    assert spec.roof_faces[0].margin_mm == 500 and msgs == []
+    assert learned_drawing_defaults() == []
 
 
 # =============================================================
@@ -354,6 +468,10 @@ def main() -> bool:
         test_learned_golden_examples,
         test_diff_to_store_to_apply_roundtrip,
         test_prompt_injection,
+        test_system_prompt_cache,
+        test_stats_running_median_and_mode,
+        test_apply_uses_aggregate_with_support,
+        test_stats_ignored_without_enabled_rule,
     ]
     print("=== 図面差分学習テスト（API不要） ===")
     ok = True
@@ -639,10 +639,23 @@ def test_learned_rules_summary():
         {"kind": "item_suppress", "category": "施工費",
          "match_description": "c", "payload": {}},
     ])
-    assert learned_rules_summary() == {"total": 3, "price": 1, "add": 1, "suppress": 1}
+    def _counts(summary):
+        return {k: summary[k] for k in ("total", "price", "add", "suppress")}
+
+    assert _counts(learned_rules_summary()) == \
+        {"total": 3, "price": 1, "add": 1, "suppress": 1}
     # 無効化すると total からも消える
     store.set_rule_enabled("estimate", rules[0]["id"], False)
-    assert learned_rules_summary() == {"total": 2, "price": 0, "add": 1, "suppress": 1}
+    assert _counts(learned_rules_summary()) == \
+        {"total": 2, "price": 0, "add": 1, "suppress": 1}
+
+    # 適用後は timing に直近の計測値が入り、同じルール集合の2回目はキャッシュを使う
+    apply_learned_rules(_sample_pricing_rules())
+    apply_learned_rules(_sample_pricing_rules())
+    timing = learned_rules_summary()["timing"]
+    assert timing["cache_hit"] is True and timing["compile_ms"] == 0.0
+    assert timing["rules"] == 2 and timing["apply_ms"] >= 0
+    assert timing["items_scanned"] > 0
 
 
 # =============================================================
@@ -731,6 +744,30 @@ def test_store_dedup_match_remarks():
 # ラウンドトリップ + knowledge_base フック
 # =============================================================
 
+def test_apply_sequential_semantics():
+    """コンパイル済み適用でも逐次適用と同じ結果になること:
+    suppress 後の同名 item_add は追加され、追加項目に後続の単価上書きが効く。"""
+    _reset_store()
+    store.add_rules("estimate", [
+        {"kind": "item_suppress", "category": "施工費",
+         "match_description": normalize_desc("墨出し"), "payload": {}},
+        {"kind": "item_add", "category": "施工費",
+         "match_description": normalize_desc("墨出し"),
+         "payload": {"category": "施工費", "description": "墨出し",
+                     "quantity_value": 1, "quantity_unit": "式",
+                     "unit_price": 100000}},
+        {"kind": "unit_price_override", "category": "施工費",
+         "match_description": normalize_desc("墨出し"),
+         "payload": {"unit_price": 120000, "old_unit_price": 100000}},
+    ])
+    applied = apply_learned_rules(_sample_pricing_rules())
+    items = [it for it in applied["construction_items"]
+             if normalize_desc(it["description"]) == normalize_desc("墨出し")]
+    assert len(items) == 1, items
+    assert items[0]["note"].startswith("学習により追加"), "元の項目は除去され学習追加項目のみ残るはず"
+    assert items[0]["unit_price"] == 120000, "追加項目に後続の単価上書きが効くはず"
+
+
 def test_diff_to_store_to_apply_roundtrip():
     """diff → 承認（add_rules）→ apply の一気通貫が機能すること。"""
     _reset_store()
@@ -927,6 +964,7 @@ def main() -> bool:
         test_apply_no_rules_passthrough,
         test_apply_old_price_guard,
         test_learned_rules_summary,
+        test_apply_sequential_semantics,
         test_store_roundtrip,
         test_store_dedup_match_remarks,
         test_diff_to_store_to_apply_roundtrip,
@@ -0,0 +1,185 @@
+"""ページ指定のPDF画像化とカタログ抽出のページ選択（extraction/pdf_reader・product/catalog_extractor）のテスト
+（API不要・スクリプト式）
+
+実行: python3 tests/test_pdf_pages.py
+
+カバー範囲:
+- pdf_to_images(pages=...) が指定ページだけを、ページ番号つきで返すこと
+- select_pages_by_text がテキスト層から仕様表のページを選び、表紙は必ず含めること
+  （テキスト層が無ければ従来どおり先頭から）
+- 長いカタログでは MAX_PAGES 枚だけをレンダリングして API に送り、
+  サムネイルは1ページ目のコントラスト強調前のレンダリング結果を使い回す
+  （PDFを開き直さず、プレビューの見た目も変えない）こと
+  （テキスト経路は tests/test_catalog_text.py）
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+import fitz
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from extraction import pdf_reader
+import product.catalog_extractor as ce
+
+_REAL = (ce._call_claude_api, ce.THUMBNAIL_DIR, pdf_reader.fitz.Page.get_pixmap,
+         ce.extract_catalog_thumbnail)
+
+
+def teardown_module(module=None):
+    (ce._call_claude_api, ce.THUMBNAIL_DIR, pdf_reader.fitz.Page.get_pixmap,
+     ce.extract_catalog_thumbnail) = _REAL
+
+
+def _plain_render(path, page, dpi):
+    """コントラスト強調なしのレンダリング（pdf_to_images と同じ倍率）。"""
+    doc = fitz.open(path)
+    try:
+        zoom = dpi / 72
+        return doc[page - 1].get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False).tobytes("png")
+    finally:
+        doc.close()
+
+
+def _catalog_pdf(path, pages=12, spec_pages=(8, 9)):
+    """表紙 + 紹介ページ + 仕様表ページのカタログを作る。"""
+    doc = fitz.open()
+    for i in range(1, pages + 1):
+        page = doc.new_page(width=595, height=842)
+        if i == 1:
+            page.insert_text((60, 80), "Solar Module Catalog", fontsize=20)
+        elif i in spec_pages:
+            for row, line in enumerate(["Pmax 660 W", "Voc 45.8 V", "Isc 18.31 A",
+                                        "Vmp 38.5 V", "Imp 17.15 A", "Dimensions 2384x1303x35 mm",
+                                        "Weight 33.5 kg", "Efficiency 21.3 %"]):
+                page.insert_text((60, 80 + row * 20), line, fontsize=12)
+        else:
+            page.insert_text((60, 80), "Our company story and installation cases", fontsize=12)
+    doc.save(path)
+    doc.close()
+
+
+def _count_renders():
+    calls = []
+    real = _REAL[2]
+
+    def _get_pixmap(self, *args, **kwargs):
+        calls.append(self.number + 1)
+        return real(self, *args, **kwargs)
+
+    pdf_reader.fitz.Page.get_pixmap = _get_pixmap
+    return calls
+
+
+# =============================================================
+# テスト
+# =============================================================
+
+def test_pdf_to_images_renders_only_requested_pages():
+    """指定ページだけをレンダリングし、範囲外は無視すること。"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "catalog.pdf")
+        _catalog_pdf(path, pages=5)
+        try:
+            renders = _count_renders()
+            pages = pdf_reader.pdf_to_images(path, dpi=50, pages=[4, 1, 99], keep_original=(1,))
+        finally:
+            teardown_module()
+        assert [p["page"] for p in pages] == [1, 4]
+        assert renders == [1, 4], renders
+        assert pages[0]["original_bytes"] == _plain_render(path, 1, 50), "強調前の画像"
+        assert pages[0]["original_bytes"] != pages[0]["image_bytes"]
+        assert "original_bytes" not in pages[1], "keep_original のページだけ"
+        assert len(pdf_reader.pdf_to_images(path, dpi=50)) == 5, "省略時は全ページ"
+        try:
+            pdf_reader.pdf_to_images(path, dpi=50, pages=[10])
+        except RuntimeError as e:
+            assert "指定ページ" in str(e)
+        else:
+            raise AssertionError("該当ページが無ければ RuntimeError")
+
+
+def test_select_pages_by_text():
+    """仕様表のページを選び、表紙は必ず含め、テキストが無ければ先頭から選ぶこと。"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "catalog.pdf")
+        _catalog_pdf(path, pages=12, spec_pages=(8, 9))
+        chosen = pdf_reader.select_pages_by_text(path, 3, keywords=ce.SPEC_KEYWORDS)
+        assert chosen == [1, 8, 9], chosen
+        assert pdf_reader.select_pages_by_text(path, 20) == list(range(1, 13))
+
+        blank = str(Path(tmp) / "scan.pdf")
+        doc = fitz.open()
+        for _ in range(8):
+            doc.new_page()
+        doc.save(blank)
+        doc.close()
+        assert pdf_reader.select_pages_by_text(blank, 3, keywords=ce.SPEC_KEYWORDS) == [1, 2, 3]
+
+
+def test_catalog_renders_selected_pages_and_reuses_thumbnail():
+    """長いカタログは MAX_PAGES 枚だけ描き、サムネイルは1ページ目の画像を使い回すこと。"""
+    sent = []
+
+    def _fake_api(content, attempt):
+        sent.append([c for c in content if c["type"] == "image"])
+        return {"product_type": "module", "maker": "Canadian Solar", "model": "CS7L-MS",
+                "output_w": 660}
+
+    thumbnail_sources = []
+
+    def _thumbnail(pdf_path, image_bytes=None, **kwargs):
+        thumbnail_sources.append(image_bytes)
+        return _REAL[3](pdf_path, image_bytes=image_bytes, **kwargs)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "catalog.pdf")
+        _catalog_pdf(path, pages=40, spec_pages=(30, 31))
+        ce._call_claude_api = _fake_api
+        ce.THUMBNAIL_DIR = Path(tmp) / "thumbs"
+        ce.extract_catalog_thumbnail = _thumbnail
+        try:
+            renders = _count_renders()
+            result = ce.extract_product_catalog(path, use_text_layer=False)
+        finally:
+            teardown_module()
+        assert len(sent) == 1 and len(sent[0]) == ce.MAX_PAGES
+        assert sorted(renders) == sorted(set(renders)) and len(renders) == ce.MAX_PAGES, \
+            f"サムネイルのために描き直さない: {renders}"
+        assert 1 in renders and 30 in renders and 31 in renders, renders
+        assert Path(result["catalog_image_path"]).parent == Path(tmp) / "thumbs"
+        assert Path(result["catalog_image_path"]).exists()
+        assert any("40ページ" in w for w in result.get("extracted_warnings", []))
+        assert thumbnail_sources == [_plain_render(path, 1, 200)], \
+            "サムネイルはコントラスト強調前の1ページ目から作る"
+
+
+def main() -> bool:
+    tests = [
+        test_pdf_to_images_renders_only_requested_pages,
+        test_select_pages_by_text,
+        test_catalog_renders_selected_pages_and_reuses_thumbnail,
+    ]
+    print("=== PDFページ指定・カタログページ選択テスト（API不要） ===")
+    ok = True
+    try:
+        for fn in tests:
+            try:
+                fn()
+                print(f"[OK] {fn.__name__}")
+            except AssertionError as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: {e}")
+            except Exception as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: 予期しないエラー: {type(e).__name__}: {e}")
+    finally:
+        teardown_module()
+    print("=== 結果:", "全パス" if ok else "一部失敗", "===")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,173 @@
+"""単価の重ね合わせ（product/price_layers・product/price_master）のテスト（スクリプト式）
+
+実行: python3 tests/test_price_layers.py
+
+カバー範囲:
+- 優先順 campaign > customer > supplier（仕入先は価格表本体と仕入先別価格表の最安）
+- キャンペーンは期間内だけ有効で、期間をまたぐとキャンペーン分だけ作り直すこと
+- お客様修正1件の変更では、その製品の項目だけを作り直すこと
+- find_price / search が勝った層（price_layer / price_source）を返し、
+  仕入先別価格表・キャンペーンが保存先から読み直しても残ること
+"""
+import json
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+
+os.environ.setdefault("SANEI_DISABLE_SUPABASE", "1")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from product import price_layers as pl
+from product import price_master as pm
+from tests.test_price_master_store import (
+    _PRODUCTS, _reset_caches, _write_master, teardown_module as _restore_master,
+)
+
+
+def teardown_module(module=None):
+    _restore_master()
+
+
+class _Clock:
+    def __init__(self, day):
+        self.day = day
+
+    def __call__(self):
+        return self.day
+
+
+def _count_merges(layers):
+    merged = []
+    real = layers._merge
+
+    def _merge(pid):
+        merged.append(pid)
+        real(pid)
+
+    layers._merge = _merge
+    return merged
+
+
+# =============================================================
+# テスト
+# =============================================================
+
+def test_layer_priority_and_campaign_window():
+    """優先順どおりに決まり、キャンペーンは期間内だけ勝つこと。"""
+    clock = _Clock(date(2026, 10, 1))
+    campaign = pl.Campaign("c1", "A", 80, date(2026, 10, 5), date(2026, 10, 10), "秋の特価")
+    layers = pl.PriceLayers(
+        "価格表", {"A": [(95, "B商事"), (90, "C電材")], "B": [(120, "B商事")]},
+        {"C": 70}, [campaign], today=clock)
+
+    a = layers.apply({"id": "A", "unit_price": 100})
+    assert (a["unit_price"], a["price_layer"], a["price_source"]) == (90, "supplier", "C電材")
+    assert a["base_unit_price"] == 100, "仕入先の最安が勝つ"
+    b = layers.apply({"id": "B", "unit_price": 100})
+    assert (b["unit_price"], b["price_source"]) == (100, "価格表"), "高い仕入先は採らない"
+    c = layers.apply({"id": "C", "unit_price": 100})
+    assert (c["unit_price"], c["price_layer"]) == (70, "customer") and c["price_overridden"]
+    plain = layers.apply({"id": "Z", "unit_price": 5})
+    assert plain == {"id": "Z", "unit_price": 5, "price_layer": "supplier",
+                     "price_source": "価格表"}
+
+    merged = _count_merges(layers)
+    clock.day = date(2026, 10, 5)
+    a = layers.apply({"id": "A", "unit_price": 100})
+    assert (a["unit_price"], a["price_layer"], a["price_source"]) == (80, "campaign", "秋の特価")
+    assert a["campaign_end"] == "2026-10-10" and merged == ["A"], "キャンペーン分だけ作り直す"
+    clock.day = date(2026, 10, 9)
+    layers.apply({"id": "A", "unit_price": 100})
+    assert merged == ["A"], "境界をまたがなければ作り直さない"
+    clock.day = date(2026, 10, 11)
+    assert layers.apply({"id": "A", "unit_price": 100})["price_layer"] == "supplier"
+
+
+def test_single_override_rebuilds_one_entry():
+    """お客様修正1件の変更は、その製品の項目だけを作り直すこと。"""
+    layers = pl.PriceLayers("価格表", {str(i): [(i, "B商事")] for i in range(100)}, {})
+    merged = _count_merges(layers)
+    layers.set_customer("42", 5000)
+    assert merged == ["42"]
+    assert layers.layer_of("42")[pl.LAYER_CUSTOMER] == 5000
+    layers.set_customer("42", None)
+    assert layers.layer_of("42")[pl.LAYER_CUSTOMER] is None
+    assert layers.layer_of("500") is None
+
+
+def test_find_price_reports_winning_layer():
+    """find_price / search が勝った層を返し、上書きは保存先から読み直しても残ること。"""
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            _write_master(tmp, _PRODUCTS)
+            pm.SUPPLIERS_DIR.mkdir()
+            (pm.SUPPLIERS_DIR / "b_shoji.json").write_text(json.dumps({
+                "supplier": "B商事",
+                "prices": [{"maker": "HUAWEI", "model": "SUN2000-4.95KTL-JPL1",
+                            "unit_price": 110000},
+                           {"product_code": "UNKNOWN-1", "unit_price": 1}],
+            }, ensure_ascii=False), encoding="utf-8")
+            _reset_caches()
+
+            hit = pm.find_price(maker="HUAWEI", model="SUN2000-4.95KTL-JPL1")
+            assert (hit["unit_price"], hit["price_layer"], hit["price_source"]) == \
+                (110000, "supplier", "B商事")
+            jam = pm.find_by_code("JAM-100")
+            assert (jam["price_layer"], jam["price_source"]) == ("supplier", "テスト価格表")
+
+            merged = _count_merges(pm._layers())
+            assert pm.set_price_override("B0S0014402", 105000)
+            assert merged == ["B0S0014402"], "1件の修正で作り直すのはその製品だけ"
+            hit = pm.find_price(model="SUN2000-4.95KTL-JPL1")
+            assert (hit["unit_price"], hit["price_layer"]) == (105000, "customer")
+
+            today = date.today()
+            cid = pm.set_campaign_price("B0S0014402", 99000, today, today + timedelta(days=7),
+                                        name="決算セール")
+            assert cid
+            hit = pm.search("sun2000")[0]
+            assert (hit["unit_price"], hit["price_layer"], hit["price_source"]) == \
+                (99000, "campaign", "決算セール")
+            assert hit["price_overridden"] and hit["base_unit_price"] == 116000
+
+            _reset_caches()  # 保存先から読み直す
+            assert [c.id for c in pm.get_campaigns()] == [cid]
+            assert pm.find_price(model="SUN2000-4.95KTL-JPL1")["unit_price"] == 99000
+            assert pm.remove_campaign(cid) and not pm.remove_campaign(cid)
+            assert pm.find_price(model="SUN2000-4.95KTL-JPL1")["price_layer"] == "customer"
+            assert pm.set_campaign_price("B0S0014402", 1, today, today - timedelta(days=1)) \
+                is None, "終了日が開始日より前は登録しない"
+        finally:
+            teardown_module()
+
+
+def main() -> bool:
+    tests = [
+        test_layer_priority_and_campaign_window,
+        test_single_override_rebuilds_one_entry,
+        test_find_price_reports_winning_layer,
+    ]
+    print("=== 単価の重ね合わせテスト ===")
+    ok = True
+    try:
+        for fn in tests:
+            try:
+                fn()
+                print(f"[OK] {fn.__name__}")
+            except AssertionError as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: {e}")
+            except Exception as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: 予期しないエラー: {type(e).__name__}: {e}")
+    finally:
+        teardown_module()
+    print("=== 結果:", "全パス" if ok else "一部失敗", "===")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
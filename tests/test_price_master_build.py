@@ -0,0 +1,181 @@
+"""価格表PDFの差分ビルド（build_price_master）のテスト（pdfplumber不要・スクリプト式）
+
+実行: python3 tests/test_price_master_build.py
+
+カバー範囲:
+- ページの内容ハッシュでキャッシュし、変わったページだけを抽出し直すこと
+- 条件フッターはページをまたいでも重複を除き、出現順を保つこと
+- 商品コードで突き合わせた差分（追加・削除・価格変更）を返し、重複コードは
+  canonical の行で比べること
+- 内容が変わらない再ビルドでは price_master.json を書き換えないこと（SQLite は書き出す）
+
+ページ抽出（pdfplumber）は _extract_page の差し替えで代用する。
+"""
+import contextlib
+import io
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+import fitz
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import build_price_master as bpm
+
+_REAL = (bpm._extract_page, bpm.OUTPUT_PATH)
+
+
+def teardown_module(module=None):
+    bpm._extract_page, bpm.OUTPUT_PATH = _REAL
+
+
+def _price_pdf(path, page_texts):
+    doc = fitz.open()
+    for text in page_texts:
+        page = doc.new_page()
+        page.insert_text((60, 80), text, fontsize=12)
+    doc.save(path)
+    doc.close()
+
+
+def _fake_extract(calls, pages):
+    """ページ番号ごとに決めた行・条件を返す抽出の代用品。"""
+    def _extract(job):
+        calls.append(job[1])
+        return pages[job[1]]
+    return _extract
+
+
+def _row(code, price, maker="オムロン", part=""):
+    return [part, maker, code, f"{code}-J4", f"パワコン {code}", price, "10年保証"]
+
+
+# =============================================================
+# テスト
+# =============================================================
+
+def test_page_cache_reextracts_only_changed_pages():
+    """2回目は抽出せず、1ページだけ変えたらそのページだけ抽出すること。"""
+    pages = {
+        1: {"rows": [_row("KPW-A55", "250,000")], "conditions": ["【条件】 1.税別です。"]},
+        2: {"rows": [_row("KPW-A48", "230,000")], "conditions": ["【条件】 1.税別です。"]},
+        3: {"rows": [], "conditions": ["2.運賃別途。"]},
+    }
+    calls = []
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = Path(tmp) / "price.pdf"
+        cache = Path(tmp) / "cache" / "pages.json"
+        _price_pdf(pdf, ["page one", "page two", "page three"])
+        bpm._extract_page = _fake_extract(calls, pages)
+        try:
+            stats = {}
+            rows, conditions = bpm.build_rows(pdf, cache_path=cache, workers=1, stats=stats)
+            assert calls == [1, 2, 3] and stats == {"pages": 3, "cached": 0}
+            assert [(p, c[2]) for p, c in rows] == [(1, "KPW-A55"), (2, "KPW-A48")]
+            assert conditions == ["【条件】 1.税別です。", "2.運賃別途。"], "重複を除き出現順"
+
+            calls.clear()
+            again = bpm.build_rows(pdf, cache_path=cache, workers=1, stats=stats)
+            assert calls == [] and stats["cached"] == 3, "変わらないPDFは抽出しない"
+            assert again == (rows, conditions)
+
+            _price_pdf(pdf, ["page one", "page two (revised)", "page three"])
+            pages[2] = {"rows": [_row("KPW-A48", "220,000")], "conditions": []}
+            rows, _ = bpm.build_rows(pdf, cache_path=cache, workers=1, stats=stats)
+            assert calls == [2] and stats["cached"] == 2, calls
+            assert rows[1][1][5] == "220,000"
+        finally:
+            teardown_module()
+
+
+def test_diff_products_by_code():
+    """追加・削除・価格変更を返し、重複コードは canonical で比べること。"""
+    old = [
+        {"product_code": "A1", "name": "PCS", "unit_price": 100, "unit_price_note": ""},
+        {"product_code": "B2", "name": "架台", "unit_price": 50, "unit_price_note": ""},
+        {"product_code": "C3", "name": "旧版", "unit_price": 10, "unit_price_note": "",
+         "is_canonical": False},
+        {"product_code": "C3", "name": "新版", "unit_price": 12, "unit_price_note": "",
+         "is_canonical": True},
+    ]
+    new = [
+        {"product_code": "A1", "name": "PCS", "unit_price": 110, "unit_price_note": ""},
+        {"product_code": "C3", "name": "新版", "unit_price": 12, "unit_price_note": "",
+         "is_canonical": True},
+        {"product_code": "C3", "name": "旧版", "unit_price": 10, "unit_price_note": "",
+         "is_canonical": False},
+        {"product_code": "D4", "name": "監視装置", "unit_price": None,
+         "unit_price_note": "別途問合せ"},
+    ]
+    diff = bpm.diff_products(old, new)
+    assert [p["product_code"] for p in diff["added"]] == ["D4"]
+    assert [p["product_code"] for p in diff["removed"]] == ["B2"]
+    assert diff["price_changed"] == [
+        {"product_code": "A1", "name": "PCS", "old": (100, ""), "new": (110, "")}]
+    assert bpm.diff_products(new, new) == {"added": [], "removed": [], "price_changed": []}
+
+
+def test_unchanged_rebuild_keeps_master_file():
+    """同じPDFの再ビルドは書き換えず、価格変更は差分として表示すること。"""
+    pages = {1: {"rows": [_row("KPW-A55", "250,000", part="パワーコンディショナ"),
+                          _row("KPW-A48", "230,000")],
+                 "conditions": ["【条件】 1.税別です。"]}}
+    calls = []
+    with tempfile.TemporaryDirectory() as tmp, contextlib.ExitStack() as stack:
+        stack.callback(teardown_module)
+        pdf = Path(tmp) / "price.pdf"
+        _price_pdf(pdf, ["price list"])
+        bpm.OUTPUT_PATH = Path(tmp) / "knowledge" / "price_master.json"
+        bpm._extract_page = _fake_extract(calls, pages)
+        argv = [str(pdf), "--workers", "1", "--no-cache"]
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert bpm.main(argv) == 0
+        first = bpm.OUTPUT_PATH.read_text(encoding="utf-8")
+        assert json.loads(first)["product_count"] == 2
+        assert bpm.OUTPUT_PATH.with_suffix(".sqlite").exists(), "索引つきマスターも書き出す"
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            assert bpm.main(argv) == 0
+        assert "変更なし" in out.getvalue() and "差分: なし" in out.getvalue()
+        assert bpm.OUTPUT_PATH.read_text(encoding="utf-8") == first, "updated_at も据え置き"
+
+        pages[1]["rows"][1] = _row("KPW-A48", "240,000")
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            assert bpm.main(argv + ["--dry-run"]) == 0
+        assert "~ KPW-A48" in out.getvalue() and "¥230,000 -> ¥240,000" in out.getvalue()
+        assert bpm.OUTPUT_PATH.read_text(encoding="utf-8") == first, "--dry-run は書かない"
+
+
+def main() -> bool:
+    tests = [
+        test_page_cache_reextracts_only_changed_pages,
+        test_diff_products_by_code,
+        test_unchanged_rebuild_keeps_master_file,
+    ]
+    print("=== 価格表 差分ビルドテスト（pdfplumber不要） ===")
+    ok = True
+    try:
+        for fn in tests:
+            try:
+                fn()
+                print(f"[OK] {fn.__name__}")
+            except AssertionError as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: {e}")
+            except Exception as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: 予期しないエラー: {type(e).__name__}: {e}")
+    finally:
+        teardown_module()
+    print("=== 結果:", "全パス" if ok else "一部失敗", "===")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,194 @@
+"""単価マスターの索引つき保存形式（product/price_master の SQLite）のテスト（スクリプト式）
+
+実行: python3 tests/test_price_master_store.py
+
+カバー範囲:
+- SQLite があれば JSON を解析せずに開き、検索・単価参照が従来と同じ形で返ること
+- JSON が更新されたら（内容ハッシュの不一致）SQLite を作り直すこと
+- SQLite を書けない環境ではメモリ上に作って動くこと
+- 顧客の単価上書きが search / find_price の結果にも反映されること
+"""
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+os.environ.setdefault("SANEI_DISABLE_SUPABASE", "1")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from product import price_master as pm
+
+_REAL = (pm.MASTER_PATH, pm.DB_PATH, pm.OVERRIDES_PATH, pm.SUPPLIERS_DIR,
+         pm._read_json_master, pm.write_master_db)
+
+
+def _reset_caches():
+    pm._CACHE.update(sig=None, store=None, data=None, layers=None)
+    pm._OVERRIDES_CACHE["loaded"] = False
+
+
+def teardown_module(module=None):
+    (pm.MASTER_PATH, pm.DB_PATH, pm.OVERRIDES_PATH, pm.SUPPLIERS_DIR,
+     pm._read_json_master, pm.write_master_db) = _REAL
+    _reset_caches()
+
+
+def _stored(products):
+    """単価の層の情報（price_layer / price_source）を除いた、保存されている内容。"""
+    return [{k: v for k, v in p.items() if k not in ("price_layer", "price_source")}
+            for p in products]
+
+
+def _product(i, code, model, price, maker="HUAWEI", category="パワーコンディショナ", **extra):
+    p = {"id": code, "category": category, "maker": maker, "product_code": code,
+         "model": model, "name": f"パワコン {model}", "unit_price": price,
+         "unit_price_note": "", "remarks": "", "item_kind": "product",
+         "source_page": 1, "row_index": i, "is_duplicate": False, "is_canonical": True}
+    p.update(extra)
+    return p
+
+
+def _write_master(tmp, products):
+    pm.MASTER_PATH = Path(tmp) / "price_master.json"
+    pm.DB_PATH = Path(tmp) / "price_master.sqlite"
+    pm.OVERRIDES_PATH = Path(tmp) / "price_master_overrides.json"
+    pm.SUPPLIERS_DIR = Path(tmp) / "price_suppliers"
+    pm.MASTER_PATH.write_text(json.dumps({
+        "schema_version": 1, "source": "テスト価格表", "source_date": "2026-10-01",
+        "categories": ["パワーコンディショナ", "架台"], "makers": ["HUAWEI", "オムロン"],
+        "conditions": ["【条件】 税別"], "product_count": len(products),
+        "products": products,
+    }, ensure_ascii=False), encoding="utf-8")
+
+
+def _count_json_reads():
+    reads = []
+
+    def _counting():
+        reads.append(1)
+        return _REAL[4]()
+
+    pm._read_json_master = _counting
+    return reads
+
+
+_PRODUCTS = [
+    _product(0, "B0S0014402", "SUN2000-4.95KTL-JPL1", 116000),
+    _product(1, "B0S0011300", "KPW-A55-2PJ4", 230000, maker="オムロン",
+             is_duplicate=True, is_canonical=False),
+    _product(2, "B0S0011300", "KPW-A55-2PJ4", 219000, maker="オムロン", source_page=2,
+             is_duplicate=True),
+    _product(3, "JAM-100", "", 12000, maker="オムロン", category="架台"),
+]
+
+
+# =============================================================
+# テスト
+# =============================================================
+
+def test_queries_use_db_without_parsing_json():
+    """作成済みの SQLite は JSON を解析せずに開き、返り値の形は従来どおりであること。"""
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            _write_master(tmp, _PRODUCTS)
+            _reset_caches()
+            reads = _count_json_reads()
+            assert pm.get_meta()["product_count"] == 4
+            assert reads == [1] and pm.DB_PATH.exists(), "初回だけ JSON から作る"
+
+            _reset_caches()  # 別プロセスの起動に相当
+            assert pm.get_categories() == ["パワーコンディショナ", "架台"]
+            assert pm.get_conditions() == ["【条件】 税別"]
+            assert pm.find_by_code("b0s0011300")["unit_price"] == 219000, "canonical 優先"
+            assert pm.find_price(maker="HUAWEI", model="ＳＵＮ２０００-４.９５ＫＴＬ-ＪＰＬ１")[
+                "product_code"] == "B0S0014402"
+            assert pm.find_price(model="SUN2000") is None
+            assert pm.find_price(model="SUN2000", allow_fuzzy=True)["unit_price"] == 116000
+            assert [p["row_index"] for p in pm.search("kpw a55")] == [1, 2]
+            assert [p["row_index"] for p in pm.search("kpw", canonical_only=True)] == [2]
+            assert _stored(pm.search(category="架台", maker="オム")) == [_PRODUCTS[3]]
+            assert _stored(pm.get_products()) == _PRODUCTS
+            assert reads == [1], f"2回目以降は JSON を読まない: {len(reads)}回"
+        finally:
+            teardown_module()
+
+
+def test_json_update_rebuilds_db():
+    """JSON の内容が変わったら SQLite を作り直すこと。"""
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            _write_master(tmp, _PRODUCTS)
+            _reset_caches()
+            assert pm.find_by_code("B0S0014402")["unit_price"] == 116000
+            _write_master(tmp, [_product(0, "B0S0014402", "SUN2000-4.95KTL-JPL1", 118000)])
+            _reset_caches()
+            assert pm.find_by_code("B0S0014402")["unit_price"] == 118000
+            assert pm.get_meta()["product_count"] == 1
+        finally:
+            teardown_module()
+
+
+def test_unwritable_db_falls_back_to_memory():
+    """SQLite を書けなくてもメモリ上の索引で検索できること。"""
+    def _fail(*args, **kwargs):
+        raise OSError("read-only file system")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            _write_master(tmp, _PRODUCTS)
+            _reset_caches()
+            pm.write_master_db = _fail
+            assert pm.find_by_code("JAM-100")["category"] == "架台"
+            assert not pm.DB_PATH.exists()
+            assert len(pm.search("パワコン", category="パワーコンディショナ")) == 3
+        finally:
+            teardown_module()
+
+
+def test_overrides_apply_to_queries():
+    """単価上書きが search / find_price / find_by_code に反映されること。"""
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            _write_master(tmp, _PRODUCTS)
+            _reset_caches()
+            assert pm.set_price_override("B0S0014402", 120000)
+            hit = pm.find_price(model="SUN2000-4.95KTL-JPL1")
+            assert hit["unit_price"] == 120000 and hit["base_unit_price"] == 116000
+            assert pm.search("sun2000")[0]["price_overridden"] is True
+            assert pm.load_price_master()["products"][0]["unit_price"] == 120000
+            assert pm.set_price_override("B0S0014402", None)
+            assert pm.find_by_code("B0S0014402")["unit_price"] == 116000
+        finally:
+            teardown_module()
+
+
+def main() -> bool:
+    tests = [
+        test_queries_use_db_without_parsing_json,
+        test_json_update_rebuilds_db,
+        test_unwritable_db_falls_back_to_memory,
+        test_overrides_apply_to_queries,
+    ]
+    print("=== 単価マスター 索引つき保存形式テスト ===")
+    ok = True
+    try:
+        for fn in tests:
+            try:
+                fn()
+                print(f"[OK] {fn.__name__}")
+            except AssertionError as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: {e}")
+            except Exception as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: 予期しないエラー: {type(e).__name__}: {e}")
+    finally:
+        teardown_module()
+    print("=== 結果:", "全パス" if ok else "一部失敗", "===")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
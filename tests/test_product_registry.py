@@ -0,0 +1,217 @@
+"""製品レジストリのキャッシュ・版管理・索引（product/product_registry）のテスト（実Supabase不要・スクリプト式）
+
+実行: python3 tests/test_product_registry.py
+
+カバー範囲:
+- 読み込みは1回だけで、検索（find_by_model / find_by_maker_and_model /
+  get_active_module_for_estimate）はキャッシュと索引だけで完結すること
+- 保存は版を1つ進め、書いた内容でキャッシュを差し替えること（読み直し不要）
+- 他プロセスによるローカルJSONの更新を更新時刻で検知すること
+- 古い版での保存は RegistryConflictError、add_product は読み直して再試行すること
+- Supabase 構成時は CACHE_TTL_SEC の間キャッシュを使い、過ぎたら読み直すこと
+"""
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+os.environ.setdefault("SANEI_DISABLE_SUPABASE", "1")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import learning.storage_backend as backend
+from product import product_registry as pr
+from tests.test_storage_backend import FakeSupabase, _restore
+
+_REAL = (pr.REGISTRY_PATH, pr.CACHE_TTL_SEC, pr._load_from_source)
+
+
+def _restore_module():
+    pr.REGISTRY_PATH, pr.CACHE_TTL_SEC, pr._load_from_source = _REAL
+    pr.invalidate_cache()
+    _restore()
+
+
+def teardown_module(module=None):
+    _restore_module()
+
+
+def _count_reads():
+    reads = []
+
+    def _counting():
+        reads.append(1)
+        return _REAL[2]()
+
+    pr._load_from_source = _counting
+    return reads
+
+
+def _setup(tmp):
+    _restore()
+    backend.is_enabled = lambda: False
+    pr.REGISTRY_PATH = Path(tmp) / "products_registry.json"
+    pr.invalidate_cache()
+
+
+def _write_external(products, version):
+    """他プロセスの保存を模して、ローカルJSONを直接書き換える。"""
+    before = pr.REGISTRY_PATH.stat().st_mtime_ns if pr.REGISTRY_PATH.exists() else 0
+    pr.REGISTRY_PATH.write_text(json.dumps(
+        {"schema_version": 1, "version": version, "products": products},
+        ensure_ascii=False), encoding="utf-8")
+    os.utime(pr.REGISTRY_PATH, ns=(before + 10 ** 9, before + 10 ** 9))
+
+
+_CS = {"product_type": "module", "maker": "Canadian Solar", "model": "CS7L-MS",
+       "model_aliases": ["CS7L-MS-660"], "output_w": 660}
+_LONGI = {"product_type": "module", "maker": "Longi", "model": "LR5-72HTH", "output_w": 575}
+
+
+# =============================================================
+# テスト
+# =============================================================
+
+def test_lookups_hit_cache_and_indexes():
+    """読み込み1回で、各検索はキャッシュから表記揺れも含めて引けること。"""
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            _setup(tmp)
+            pr.add_product(_CS)
+            pr.add_product(_LONGI)
+            reads = _count_reads()
+            for _ in range(3):
+                assert [p["model"] for p in pr.find_by_model("ＣＳ７Ｌ－ＭＳ", fuzzy=False)] == \
+                    ["CS7L-MS"]
+                assert pr.find_by_model("CS7L-MS-660")[0]["model"] == "CS7L-MS", "別名で一致"
+                assert pr.find_by_maker_and_model("longi solar", "LR5")["model"] == "LR5-72HTH"
+                active = pr.get_active_module_for_estimate(
+                    {"equipment": {"module_maker": "Canadian Solar", "module_model": "CS7L-MS"}})
+                assert active["output_w"] == 660
+            assert pr.find_by_model("CS7L-MS-660", fuzzy=False) == [], "完全一致は別名を見ない"
+            assert reads == [], f"検索で保存先を読まない: {len(reads)}回"
+
+            hit = pr.find_by_model("CS7L-MS")[0]
+            hit["output_w"] = 0
+            assert pr.load_registry()[0]["output_w"] == 660, "返り値の変更はキャッシュに波及しない"
+        finally:
+            _restore_module()
+
+
+def test_save_bumps_version_and_writes_through():
+    """保存で版が進み、キャッシュは書いた内容に差し替わること。"""
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            _setup(tmp)
+            assert pr.registry_version() == 0
+            p = pr.add_product(_CS)
+            assert pr.registry_version() == 1
+            pr.add_product(dict(_CS, output_w=670))
+            assert pr.registry_version() == 2
+            doc = json.loads(pr.REGISTRY_PATH.read_text(encoding="utf-8"))
+            assert doc["version"] == 2 and len(doc["products"]) == 1
+
+            reads = _count_reads()
+            loaded = pr.load_registry()
+            assert loaded[0]["output_w"] == 670 and loaded[0]["id"] == p["id"]
+            assert reads == [], "保存直後の読み込みはキャッシュから"
+            assert pr.delete_product(p["id"]) and pr.registry_version() == 3
+            assert not pr.delete_product(p["id"])
+            assert pr.find_by_model("CS7L-MS") == [], "削除は検索結果にも即反映"
+        finally:
+            _restore_module()
+
+
+def test_external_update_and_conflict():
+    """他プロセスの更新を検知し、古い版での保存は競合として扱うこと。"""
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            _setup(tmp)
+            pr.add_product(_CS)
+            stale = pr.registry_version()
+            _write_external([dict(_CS, id="cs-1"), dict(_LONGI, id="lg-1")], version=5)
+            assert [p["model"] for p in pr.load_registry()] == ["CS7L-MS", "LR5-72HTH"]
+            assert pr.registry_version() == 5
+
+            try:
+                pr.save_registry([], expected_version=stale)
+            except pr.RegistryConflictError:
+                pass
+            else:
+                raise AssertionError("古い版での保存は RegistryConflictError")
+            assert len(pr.load_registry()) == 2, "競合時は保存しない"
+
+            # キャッシュを読んだ直後に他の保存が割り込んでも、読み直して両方残る
+            pr.load_registry()
+            real_save = pr.save_registry
+            state = {"interrupted": False}
+
+            def _racing_save(products, expected_version=None):
+                if not state["interrupted"]:
+                    state["interrupted"] = True
+                    _write_external(
+                        [dict(_CS, id="cs-1"), dict(_LONGI, id="lg-1"),
+                         {"maker": "オムロン", "model": "KP-MU", "id": "om-1"}], version=6)
+                return real_save(products, expected_version=expected_version)
+
+            pr.save_registry = _racing_save
+            try:
+                pr.add_product({"maker": "Sharp", "model": "NQ-256AF"})
+            finally:
+                pr.save_registry = real_save
+            models = sorted(p["model"] for p in pr.load_registry())
+            assert models == ["CS7L-MS", "KP-MU", "LR5-72HTH", "NQ-256AF"], models
+            assert pr.registry_version() == 7
+        finally:
+            _restore_module()
+
+
+def test_supabase_cache_ttl():
+    """Supabase 構成時は TTL の間キャッシュを使い、過ぎたら読み直すこと。"""
+    fake = FakeSupabase()
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            _setup(tmp)
+            fake.install()
+            pr.add_product(_CS)
+            assert fake.kv["products_registry"]["version"] == 1
+            fake.kv["products_registry"] = {
+                "schema_version": 1, "version": 9,
+                "products": [dict(_LONGI, id="lg-1")]}
+            assert pr.load_registry()[0]["model"] == "CS7L-MS", "TTL 内はキャッシュ"
+            pr.CACHE_TTL_SEC = 0.0
+            assert pr.load_registry()[0]["model"] == "LR5-72HTH"
+            assert pr.registry_version() == 9
+        finally:
+            _restore_module()
+
+
+def main() -> bool:
+    tests = [
+        test_lookups_hit_cache_and_indexes,
+        test_save_bumps_version_and_writes_through,
+        test_external_update_and_conflict,
+        test_supabase_cache_ttl,
+    ]
+    print("=== 製品レジストリ キャッシュ・版管理テスト（実Supabase不要） ===")
+    ok = True
+    try:
+        for fn in tests:
+            try:
+                fn()
+                print(f"[OK] {fn.__name__}")
+            except AssertionError as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: {e}")
+            except Exception as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: 予期しないエラー: {type(e).__name__}: {e}")
+    finally:
+        teardown_module()
+    print("=== 結果:", "全パス" if ok else "一部失敗", "===")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,242 @@
+"""低信頼度フィールドの部分再読み取り（extraction/roi_reextract）のテスト（API不要・スクリプト式）
+
+実行: python3 tests/test_roi_reextract.py
+
+カバー範囲:
+- 位置特定 → 領域の切り出し（300dpi・近接矩形の統合）→ 対象項目だけの再抽出
+- 元の値＋2回の読み取りの多数決で値と信頼度を更新し、他の項目は変えないこと
+- 票が割れた項目は元の値と low を残すこと
+- 位置特定の失敗時は既定ページ全体で続行すること
+- 再抽出がすべて失敗・一部の項目しか読めない場合、読み直していない項目の
+  信頼度を上げないこと
+- 対象が多すぎる場合は API を呼ばずにそのまま返すこと
+
+Claude 呼び出し（survey_extractor._call_claude_api）はフェイクに差し替える。
+"""
+import base64
+import io
+import sys
+import tempfile
+from pathlib import Path
+
+import fitz
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import extraction.roi_reextract as roi
+import extraction.survey_extractor as se
+from models.survey_data import ConfidenceLevel, PlannedEquipment, ProjectInfo, SurveyData
+
+_REAL_CALL = se._call_claude_api
+
+
+def teardown_module(module=None):
+    se._call_claude_api = _REAL_CALL
+
+
+def _write_pdf(tmp: str) -> str:
+    """A4 2ページ。1ページ目の上部に案件名、中段に計画枚数、2ページ目は別紙。"""
+    path = str(Path(tmp) / "survey.pdf")
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    page.insert_text((60, 80), "Project: Test Factory", fontsize=14)
+    page.insert_text((60, 420), "Panels: 288", fontsize=14)
+    page.insert_text((60, 440), "Output: 660 W", fontsize=14)
+    doc.new_page(width=595, height=842).insert_text((60, 100), "Crane: yes", fontsize=14)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def _survey() -> SurveyData:
+    return SurveyData(
+        project=ProjectInfo(project_name="テスト工揚", address="大阪府大阪市北区"),
+        equipment=PlannedEquipment(module_maker="Canadian Solar", module_output_w=660,
+                                   planned_panels=238, pv_capacity_kw=190.08),
+        field_confidences={
+            "project.project_name": ConfidenceLevel.LOW,
+            "equipment.planned_panels": ConfidenceLevel.LOW,
+            "equipment.module_output_w": ConfidenceLevel.LOW,
+            "equipment.module_maker": ConfidenceLevel.HIGH,
+        },
+    )
+
+
+def _fake(script, calls):
+    def _call(content, attempt, temperature=0.0, system=None, on_section=None):
+        calls.append({"content": content, "temperature": temperature})
+        item = script.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return item
+    return _call
+
+
+def _images(content):
+    return [Image.open(io.BytesIO(base64.b64decode(b["source"]["data"])))
+            for b in content if b["type"] == "image"]
+
+
+_LOCATIONS = {"locations": {
+    "project.project_name": {"page": 1, "bbox": [0.08, 0.07, 0.5, 0.11]},
+    "equipment.planned_panels": {"page": 1, "bbox": [0.08, 0.48, 0.4, 0.51]},
+    "equipment.module_output_w": {"page": 1, "bbox": [0.08, 0.51, 0.4, 0.53]},
+}}
+
+
+# =============================================================
+# テスト
+# =============================================================
+
+def test_reextract_updates_only_targets():
+    """切り出し画像で読み直し、多数決で一致した項目だけ値と信頼度が更新されること。"""
+    calls = []
+    se._call_claude_api = _fake([
+        _LOCATIONS,
+        {"project": {"project_name": "テスト工場"},
+         "equipment": {"planned_panels": 288, "module_output_w": 660}},
+        {"project": {"project_name": "テスト工場"},
+         "equipment": {"planned_panels": 288, "module_output_w": 665}},
+    ], calls)
+    survey = _survey()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            updated, report = roi.reextract_low_confidence_fields(survey, [_write_pdf(tmp)])
+    finally:
+        se._call_claude_api = _REAL_CALL
+
+    assert len(calls) == 3, "位置特定1回 + 再抽出2回"
+    thumbs = _images(calls[0]["content"])
+    assert len(thumbs) == 2 and max(thumbs[0].size) == roi.LOCATE_LONG_EDGE_PX
+    crops = _images(calls[1]["content"])
+    assert len(crops) == 2, "近接する planned_panels / module_output_w は1領域にまとまる"
+    full_w = int(595 * roi.ROI_DPI / 72)
+    assert all(c.size[0] < full_w and c.size[1] < 842 * roi.ROI_DPI / 72 / 4 for c in crops)
+    assert [c["temperature"] for c in calls[1:]] == roi.FOCUSED_TEMPERATURES
+
+    assert updated.project.project_name == "テスト工場"
+    assert updated.equipment.planned_panels == 288
+    assert updated.equipment.module_output_w == 660
+    conf = updated.field_confidences
+    assert conf["project.project_name"] == ConfidenceLevel.MEDIUM, "元の値と割れて2対1"
+    assert conf["equipment.module_output_w"] == ConfidenceLevel.HIGH, "±1%の660/665と元値は一致扱い"
+    assert updated.equipment.module_maker == "Canadian Solar"
+    assert survey.project.project_name == "テスト工揚", "入力の survey は変更しない"
+    assert set(report["changed"]) == {"project.project_name", "equipment.planned_panels"}
+    assert any("部分再読み取り" in w for w in updated.extraction_warnings)
+
+
+def test_split_vote_keeps_original():
+    """3票がバラバラの項目は元の値と low を残すこと。"""
+    se._call_claude_api = _fake([
+        {"locations": {"project.project_name": {"page": 1, "bbox": [0.1, 0.07, 0.5, 0.11]}}},
+        {"project": {"project_name": "テスト商事"}},
+        {"project": {"project_name": "テスト工業"}},
+    ], [])
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            updated, report = roi.reextract_low_confidence_fields(
+                _survey(), [_write_pdf(tmp)], fields=["project.project_name"])
+    finally:
+        se._call_claude_api = _REAL_CALL
+    assert updated.project.project_name == "テスト工揚"
+    assert updated.field_confidences["project.project_name"] == ConfidenceLevel.LOW
+    assert not report["changed"] and not report["confidences"]
+
+
+def test_locate_failure_falls_back_to_default_page():
+    """位置特定が失敗しても既定ページ（別紙は2ページ目）全体で読み直すこと。"""
+    calls = []
+    se._call_claude_api = _fake([
+        RuntimeError("locate failed"),
+        {"supplementary": {"crane_available": True}},
+        {"supplementary": {"crane_available": True}},
+    ], calls)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            updated, report = roi.reextract_low_confidence_fields(
+                _survey(), [_write_pdf(tmp)], fields=["supplementary.crane_available"])
+    finally:
+        se._call_claude_api = _REAL_CALL
+    loc = report["locations"]["supplementary.crane_available"]
+    assert loc["page"] == 2 and loc.get("default")
+    assert calls[1]["content"][0]["text"] == "ページ2の一部"
+    assert updated.supplementary.crane_available is True
+
+
+def test_failed_samples_do_not_raise_confidence():
+    """再抽出がすべて失敗したら変更せず、読めなかった項目は low のまま残すこと。"""
+    se._call_claude_api = _fake([
+        _LOCATIONS, RuntimeError("sample 1 failed"), RuntimeError("sample 2 failed"),
+    ], [])
+    survey = _survey()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            pdf = _write_pdf(tmp)
+            same, report = roi.reextract_low_confidence_fields(survey, [pdf])
+            assert same is survey and report["skipped"]
+            assert not report["changed"] and not report["confidences"]
+            assert not any("部分再読み取り" in w for w in same.extraction_warnings)
+
+            # 1サンプルだけ成功し、出力しか読めなかった場合
+            se._call_claude_api = _fake([
+                _LOCATIONS, RuntimeError("sample 1 failed"),
+                {"equipment": {"planned_panels": None, "module_output_w": 660}},
+            ], [])
+            updated, report = roi.reextract_low_confidence_fields(survey, [pdf])
+    finally:
+        se._call_claude_api = _REAL_CALL
+    conf = updated.field_confidences
+    assert report["confidences"] == {"equipment.module_output_w": "high"}, report["confidences"]
+    assert conf["equipment.planned_panels"] == ConfidenceLevel.LOW, "読み直していない項目"
+    assert conf["project.project_name"] == ConfidenceLevel.LOW
+    assert updated.equipment.planned_panels == 238
+
+
+def test_too_many_fields_skips():
+    """対象が MAX_ROI_FIELDS を超えると API を呼ばずにそのまま返すこと。"""
+    se._call_claude_api = _fake([], [])
+    fields = [f"high_voltage.{k}" for k in
+              ("building_drawing", "single_line_diagram", "vt_available", "ct_available",
+               "relay_space", "pcs_space", "pre_use_self_check", "separation_ns_mm",
+               "separation_ew_mm")]
+    survey = _survey()
+    try:
+        same, report = roi.reextract_low_confidence_fields(survey, ["unused.pdf"], fields=fields)
+    finally:
+        se._call_claude_api = _REAL_CALL
+    assert same is survey and report["skipped"]
+    assert roi.low_confidence_fields(survey) == [
+        "project.project_name", "equipment.planned_panels", "equipment.module_output_w"]
+
+
+def main() -> bool:
+    tests = [
+        test_reextract_updates_only_targets,
+        test_split_vote_keeps_original,
+        test_locate_failure_falls_back_to_default_page,
+        test_failed_samples_do_not_raise_confidence,
+        test_too_many_fields_skips,
+    ]
+    print("=== 部分再読み取りテスト（API不要） ===")
+    ok = True
+    for fn in tests:
+        try:
+            fn()
+            print(f"[OK] {fn.__name__}")
+        except AssertionError as e:
+            ok = False
+            print(f"[NG] {fn.__name__}: {e}")
+        except Exception as e:
+            ok = False
+            print(f"[NG] {fn.__name__}: 予期しないエラー: {type(e).__name__}: {e}")
+        finally:
+            se._call_claude_api = _REAL_CALL
+    print("=== 結果:", "全パス" if ok else "一部失敗", "===")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,203 @@
+"""衛星画像のタイルキャッシュ・並列取得（roof/satellite_fetcher）のテスト（ネット不要・スクリプト式）
+
+実行: python3 tests/test_satellite_cache.py
+
+カバー範囲:
+- ローカルタイルサーバー（tests/tile_server_stub）に対し、4×4 のタイルを並列に取得して
+  1024px の画像に合成し、2回目はキャッシュだけで済むこと
+- 2×2 の合成で、対象地点のタイルが従来どおり画像中央付近に置かれること
+- タイルキャッシュは合計サイズの上限を超えると最終利用が古いものから削除すること
+- ジオコーディングは正規化した住所でキャッシュし、失敗はキャッシュしないこと
+- 任意範囲のタイル合成（build_bbox_mosaic）が範囲ぴったりの画像と、レベルごとの
+  縮尺つき縮小ピラミッドを返し、タイル数の上限を守ること
+"""
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import roof.satellite_fetcher as sf
+from tests.tile_server_stub import LocalTileServer, tile_color
+
+_REAL_CACHE_DIR = sf.os.environ.get(sf._CACHE_DIR_ENV)
+
+_LAT, _LNG = 35.6895, 139.6917
+
+
+def _use_cache_dir(path):
+    sf.os.environ[sf._CACHE_DIR_ENV] = str(path)
+    sf.reset_caches()
+
+
+def teardown_module(module=None):
+    if _REAL_CACHE_DIR is None:
+        sf.os.environ.pop(sf._CACHE_DIR_ENV, None)
+    else:
+        sf.os.environ[sf._CACHE_DIR_ENV] = _REAL_CACHE_DIR
+    sf.reset_caches()
+
+
+# =============================================================
+# テスト
+# =============================================================
+
+def test_large_mosaic_fetched_concurrently_and_cached():
+    """4×4 を並列取得して合成し、2回目はタイルを取りに行かないこと。"""
+    with tempfile.TemporaryDirectory() as tmp, LocalTileServer(delay=0.1) as server:
+        _use_cache_dir(tmp)
+        server.install(sf)
+        try:
+            started = time.monotonic()
+            png = sf._compose_tiles_from_esri(_LAT, _LNG, 18, grid=4)
+            elapsed = time.monotonic() - started
+            first = len(server.tile_requests)
+            again = sf._compose_tiles_from_esri(_LAT, _LNG, 18, grid=4)
+        finally:
+            server.restore(sf)
+            teardown_module()
+    assert Image.open(io.BytesIO(png)).size == (1024, 1024)
+    assert first == 16 and len(set(server.tile_requests)) == 16, server.tile_requests
+    assert server.peak > 1, "タイルは並列に取得する"
+    assert elapsed < 0.8, f"16タイル×0.1秒を直列に待っていない: {elapsed:.2f}s"
+    assert len(server.tile_requests) == 16, "2回目はキャッシュから"
+    assert again == png
+
+
+def test_grid2_keeps_target_near_center():
+    """2×2 の合成は従来と同じく、対象地点のタイルが中央付近に来ること。"""
+    with tempfile.TemporaryDirectory() as tmp, LocalTileServer() as server:
+        _use_cache_dir(tmp)
+        server.install(sf)
+        try:
+            view = sf.fetch_satellite_image(_LAT, _LNG, zoom=18)
+        finally:
+            server.restore(sf)
+            teardown_module()
+    assert view["source"] == "esri" and view["error"] is None, view["error"]
+    img = Image.open(io.BytesIO(view["image_bytes"])).convert("RGB")
+    assert img.size == (512, 512)
+    tx, ty, _, _ = sf._lat_lng_to_tile_pixel(_LAT, _LNG, 18)
+    assert img.getpixel((256, 256)) == tile_color(18, tx, ty)
+    assert len(server.tile_requests) == 4
+
+
+def test_tile_cache_lru_eviction():
+    """上限を超えたら、最近使っていないタイルから削除すること。"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = sf.TileCache(tmp, max_bytes=300)
+        for y in range(3):
+            cache.put(18, 1, y, b"x" * 100)
+        assert cache.get(18, 1, 0) == b"x" * 100, "y=0 を最近使ったことにする"
+        cache.put(18, 1, 3, b"x" * 100)
+        assert cache.get(18, 1, 1) is None, "最終利用が最も古い y=1 が消える"
+        assert cache.get(18, 1, 0) is not None and cache.get(18, 1, 3) is not None
+        assert cache.total_bytes == 300 and len(cache) == 3
+        reopened = sf.TileCache(tmp, max_bytes=300)
+        assert len(reopened) == 3, "再起動後もディスクから索引を作り直す"
+
+
+def test_geocode_cache_normalized():
+    """表記揺れのある同じ住所は1回だけ問い合わせ、失敗はキャッシュしないこと。"""
+    with tempfile.TemporaryDirectory() as tmp, LocalTileServer() as server:
+        _use_cache_dir(tmp)
+        server.install(sf)
+        try:
+            a = sf.geocode_address("東京都新宿区西新宿2-8-1")
+            b = sf.geocode_address(" 東京都新宿区西新宿２－８－１ ")
+            c = sf.geocode_address("東京都新宿区 西新宿2ー8ー1")
+            missing = [sf.geocode_address("該当なし町1-1") for _ in range(2)]
+            sf.reset_caches()
+            d = sf.geocode_address("東京都新宿区西新宿2-8-1")
+        finally:
+            server.restore(sf)
+            teardown_module()
+    assert a["source"] == "nominatim" and a == b == c == d
+    assert server.search_requests.count("東京都新宿区西新宿2-8-1") == 1, server.search_requests
+    assert all(m["error"] for m in missing)
+    assert server.search_requests.count("該当なし町1-1") == 2, "失敗は毎回問い合わせる"
+    assert sf.normalize_address("ＡＢＣビル　3Ｆ") == "abcビル3f"
+
+
+def test_bbox_mosaic_and_pyramid():
+    """120m×80m の範囲を z19 で合成し、タイルの位置と各レベルの縮尺が正しいこと。"""
+    bbox = sf.bbox_around(_LAT, _LNG, 120.0, 80.0)
+    with tempfile.TemporaryDirectory() as tmp, LocalTileServer() as server:
+        _use_cache_dir(tmp)
+        server.install(sf)
+        try:
+            mosaic = sf.build_bbox_mosaic(*bbox, zoom=19, pyramid_min_size=128)
+            first = len(server.tile_requests)
+            sf.build_bbox_mosaic(*bbox, zoom=19, pyramid_min_size=128)
+        finally:
+            server.restore(sf)
+            teardown_module()
+    scale = sf._zoom_to_meter_per_pixel(_LAT, 19)
+    img = mosaic["image"]
+    assert abs(img.width * scale - 120.0) < 1.0 and abs(img.height * scale - 80.0) < 1.0, \
+        (img.size, scale)
+    assert mosaic["tiles"] == first and not mosaic["missing"]
+    assert len(server.tile_requests) == first, "2回目はキャッシュから"
+
+    # 範囲の左上ピクセルは、その地点を含むタイルの色
+    tx, ty, _, _ = sf._lat_lng_to_tile_pixel(bbox[2], bbox[1], 19)
+    assert img.getpixel((0, 0)) == tile_color(19, tx, ty)
+    assert img.getpixel((img.width - 1, img.height - 1)) == tile_color(
+        19, *sf._lat_lng_to_tile_pixel(bbox[0], bbox[3], 19)[:2])
+
+    levels = mosaic["levels"]
+    assert levels[0]["image"] is img and levels[0]["scale_meter_per_pixel"] == scale
+    assert len(levels) >= 3 and max(levels[-1]["image"].size) <= 128
+    for prev, cur in zip(levels, levels[1:]):
+        assert cur["width"] == (prev["width"] + 1) // 2 and cur["zoom"] == prev["zoom"] - 1
+        assert abs(cur["scale_meter_per_pixel"] / prev["scale_meter_per_pixel"] - 2.0) < 1e-9
+
+    for bad in [dict(south=1.0, west=0.0, north=0.5, east=1.0)]:
+        try:
+            sf.build_bbox_mosaic(**bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("逆向きの範囲は ValueError")
+    try:
+        sf.build_bbox_mosaic(*sf.bbox_around(_LAT, _LNG, 2000.0, 2000.0), zoom=20)
+    except ValueError as e:
+        assert "上限" in str(e)
+    else:
+        raise AssertionError("タイル数の上限を超えたら ValueError")
+
+
+def main() -> bool:
+    tests = [
+        test_large_mosaic_fetched_concurrently_and_cached,
+        test_grid2_keeps_target_near_center,
+        test_tile_cache_lru_eviction,
+        test_geocode_cache_normalized,
+        test_bbox_mosaic_and_pyramid,
+    ]
+    print("=== 衛星画像キャッシュ・並列取得テスト（ネット不要） ===")
+    ok = True
+    try:
+        for fn in tests:
+            try:
+                fn()
+                print(f"[OK] {fn.__name__}")
+            except AssertionError as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: {e}")
+            except Exception as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: 予期しないエラー: {type(e).__name__}: {e}")
+    finally:
+        teardown_module()
+    print("=== 結果:", "全パス" if ok else "一部失敗", "===")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
@@ -32,6 +32,7 @@ class FakeSupabase:
         backend.insert_row = self._insert_row
         backend.select_rows = self._select_rows
         backend.get_payload = self._get_payload
+        backend.select_payloads = self._select_payloads
 
     def _kv_set(self, k, v):
         self.kv[k] = v
@@ -54,9 +55,16 @@ class FakeSupabase:
                 return r["payload"]
         return None
 
+    def _select_payloads(self, table, row_ids, chunk=100):
+        self.bulk_calls = getattr(self, "bulk_calls", 0) + 1
+        wanted = {str(i) for i in row_ids}
+        return {str(r["id"]): r["payload"] for r in self.tables[table]
+                if str(r["id"]) in wanted}
+
 
 _ORIG = {name: getattr(backend, name) for name in
-         ("is_enabled", "kv_get", "kv_set", "insert_row", "select_rows", "get_payload")}
+         ("is_enabled", "kv_get", "kv_set", "insert_row", "select_rows", "get_payload",
+          "select_payloads")}
 
 
 def _restore():
@@ -166,6 +174,26 @@ def test_estimate_history_roundtrip_supabase():
     _restore()
 
 
+def test_estimate_history_bulk_payloads():
+    """複数の supabase:// 履歴が1回の一括取得で読め、ローカル履歴と混在できること。"""
+    fake = FakeSupabase()
+    with tempfile.TemporaryDirectory() as tmp:
+        _tmp_paths(tmp)
+        fake.install()
+        for eid in ("A-1", "A-2", "A-3"):
+            est = EstimateData()
+            est.cover.estimate_id = eid
+            history.save_estimate_history(est)
+        paths = [it["path"] for it in history.list_estimate_history()]
+        local = history.save_estimate_history(EstimateData())
+        payloads = history.load_estimate_history_payloads(paths + [str(local)])
+        assert fake.bulk_calls == 1, "Supabase は1回の一括取得で読むはず"
+        assert len(payloads) == 4
+        ids = sorted(payloads[p]["estimate"]["cover"]["estimate_id"] for p in paths)
+        assert ids == ["A-1", "A-2", "A-3"]
+    _restore()
+
+
 def test_drawing_history_roundtrip_supabase():
     """図面履歴が Supabase に保存され supabase:// パスで一覧・読込できること。"""
     fake = FakeSupabase()
@@ -284,6 +312,7 @@ def main():
         test_supabase_failure_falls_back_to_local,
         test_learning_log_via_backend,
         test_estimate_history_roundtrip_supabase,
+        test_estimate_history_bulk_payloads,
         test_drawing_history_roundtrip_supabase,
         test_local_history_still_works_when_disabled,
         test_product_registry_disabled_uses_local,
@@ -0,0 +1,253 @@
+"""ストリーミングJSON抽出のテスト（API不要・スクリプト式）
+
+実行: python3 tests/test_streaming_extraction.py
+
+カバー範囲:
+- IncrementalJSONParser: 1文字ずつ届いてもトップレベル項目が完成順に取り出せること、
+  文字列内の括弧・エスケープ、前置き文/コードフェンス、末尾カンマの修復
+- post_validators.validate_section: validate_and_correct と同じ補正をセクション単位で行うこと
+- extract_survey_data_multi(on_section=...): messages.stream で受信し、
+  セクションが検証済みで先出しされ、最終結果は従来どおり全体検証されること
+- ストリーミング時は thinking モデルでも 20000 の上限に縛られないこと
+- 応答が壊れてリトライしても、先出し済みのセクションを重ねて渡さないこと
+"""
+import json
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import extraction.survey_extractor as se
+from extraction.post_validators import validate_and_correct, validate_section
+from extraction.streaming_json import IncrementalJSONParser
+
+_REAL = (se.anthropic, se.get_api_key, se.CLAUDE_VISION_MODEL, se.pdf_to_images,
+         se.RETRY_DELAY_SEC)
+
+
+def _restore_module():
+    (se.anthropic, se.get_api_key, se.CLAUDE_VISION_MODEL, se.pdf_to_images,
+     se.RETRY_DELAY_SEC) = _REAL
+
+
+def teardown_module(module=None):
+    _restore_module()
+
+
+_RAW = {
+    "project": {"project_name": "テスト工業", "address": "〒530-0001 大阪府大阪市北区梅田1-2-3",
+                "postal_code": "", "survey_date": "R7.12.18"},
+    "equipment": {"module_maker": "Canadian Solar Inc.", "module_model": "CS7L-MS",
+                  "module_output_w": 661, "planned_panels": 288, "pv_capacity_kw": 190.08},
+    "high_voltage": {"separation_ns_mm": "3m", "note": "括弧 { } と \"引用\" を含む"},
+    "extraction_warnings": ["配管図から読み取り"],
+}
+
+
+def _feed_all(parser, text, step=1):
+    out = []
+    for i in range(0, len(text), step):
+        out.extend(parser.feed(text[i:i + step]))
+    return out
+
+
+# =============================================================
+# IncrementalJSONParser
+# =============================================================
+
+def test_parser_char_by_char():
+    """1文字ずつ届いても全トップレベル項目が完成順に取り出せること。"""
+    text = "```json\n" + json.dumps(_RAW, ensure_ascii=False, indent=2) + "\n```"
+    parser = IncrementalJSONParser()
+    got = _feed_all(parser, text)
+    assert [k for k, _v in got] == list(_RAW), got
+    assert dict(got) == _RAW
+    assert parser.done and parser.text == text
+
+
+def test_parser_emits_before_end():
+    """後続が届く前に、閉じたセクションだけが先に返ること。"""
+    parser = IncrementalJSONParser()
+    assert parser.feed('前置きです。{"project": {"a": "x,}"}, "equ') == [
+        ("project", {"a": "x,}"})]
+    assert parser.feed('ipment": {"b": [1, 2') == []
+    assert parser.feed(']},}') == [("equipment", {"b": [1, 2]})], "末尾カンマは無視"
+    assert parser.done
+
+
+def test_parser_tolerant_member():
+    """Python風リテラル・末尾カンマのあるセクションも修復して読めること。"""
+    parser = IncrementalJSONParser()
+    got = parser.feed('{"high_voltage": {"vt_available": True, "x": [1,],}, "bad": }')
+    assert got == [("high_voltage", {"vt_available": True, "x": [1]})], got
+    assert "bad" not in parser.sections, "読めないメンバーは先出ししない"
+
+
+# =============================================================
+# validate_section
+# =============================================================
+
+def test_validate_section_matches_full():
+    """セクション単位の検証結果が全体検証の該当セクションと一致すること。"""
+    full, full_warnings, full_conf = validate_and_correct(_RAW)
+    seen_warnings = []
+    for name in ("project", "equipment", "high_voltage"):
+        corrected, warnings, conf = validate_section(name, _RAW[name])
+        assert corrected == full[name], name
+        assert all(full_conf[k] == v for k, v in conf.items())
+        seen_warnings.extend(warnings)
+    assert seen_warnings == full_warnings
+    assert _RAW["equipment"]["module_output_w"] == 661, "入力は変更しない"
+    assert validate_section("extraction_warnings", ["a"]) == (["a"], [], {})
+
+
+# =============================================================
+# extract_survey_data_multi（ストリーミング）
+# =============================================================
+
+class _FakeStream:
+    def __init__(self, text, chunk_size=7):
+        self._chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        self._text = text
+        self.consumed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        for c in self._chunks:
+            self.consumed += 1
+            yield c
+
+    def get_final_message(self):
+        return SimpleNamespace(content=[SimpleNamespace(type="text", text=self._text)],
+                               stop_reason="end_turn")
+
+
+def _patch_stream(text, *retries):
+    """1回目の呼び出しに text、リトライ（2回目以降）に retries を順に返す。"""
+    calls, streams = [], []
+    texts = [text, *retries]
+
+    class _FakeMessages:
+        def create(self, **kwargs):
+            raise AssertionError("on_section 指定時は stream を使うはず")
+
+        def stream(self, **kwargs):
+            calls.append(kwargs)
+            streams.append(_FakeStream(texts[min(len(calls), len(texts)) - 1]))
+            return streams[-1]
+
+    se.anthropic = SimpleNamespace(
+        Anthropic=lambda api_key=None: SimpleNamespace(messages=_FakeMessages()),
+        APIError=type("APIError", (Exception,), {}),
+        BadRequestError=type("BadRequestError", (Exception,), {}),
+        NotFoundError=type("NotFoundError", (Exception,), {}),
+        PermissionDeniedError=type("PermissionDeniedError", (Exception,), {}),
+    )
+    se.get_api_key = lambda: "test-key"
+    se.pdf_to_images = lambda path, dpi=200: [
+        {"page": 1, "image_base64": "AAAA", "image_bytes": b"", "media_type": "image/png"}]
+    return calls, streams
+
+
+def test_extract_streams_validated_sections():
+    """セクションが検証済みで先出しされ、最終 SurveyData も全体検証済みであること。"""
+    se.CLAUDE_VISION_MODEL = "claude-fable-5"
+    calls, streams = _patch_stream(json.dumps(_RAW, ensure_ascii=False))
+    events = []
+
+    def _on_section(name, section, warnings):
+        events.append((name, section, warnings, streams[-1].consumed))
+
+    try:
+        survey = se.extract_survey_data_multi(
+            ["dummy.pdf"], category="commercial", use_image_enhancement=False,
+            use_self_consistency=False, on_section=_on_section)
+    finally:
+        _restore_module()
+
+    assert [e[0] for e in events] == list(_RAW)
+    project = events[0][1]
+    assert project["postal_code"] == "530-0001", "先出しも post_validators で補正済みのはず"
+    assert events[1][1]["module_output_w"] == 660
+    assert events[0][3] < len(streams[-1]._chunks), "project は応答の途中で先出しされるはず"
+    assert calls[0]["max_tokens"] == se.STREAM_MAX_TOKENS > 20000
+    assert survey.project.postal_code == "530-0001"
+    assert survey.equipment.module_output_w == 660
+
+
+def test_callback_error_does_not_stop_extraction():
+    """先出しコールバックの例外で抽出が止まらないこと。"""
+    se.CLAUDE_VISION_MODEL = "claude-sonnet-4-6"
+    calls, _streams = _patch_stream(json.dumps(_RAW, ensure_ascii=False))
+
+    def _broken(name, section, warnings):
+        raise RuntimeError("UI側の失敗")
+
+    try:
+        survey = se.extract_survey_data_multi(
+            ["dummy.pdf"], category="residential", use_image_enhancement=False,
+            use_self_consistency=False, on_section=_broken)
+    finally:
+        _restore_module()
+    assert calls[0]["max_tokens"] == 8192, "thinking無しモデルの上限は従来どおり"
+    assert survey.project.project_name == "テスト工業"
+
+
+def test_retry_does_not_repeat_sections():
+    """途中で壊れた応答のリトライで、先出し済みのセクションを重ねて渡さないこと。"""
+    se.CLAUDE_VISION_MODEL = "claude-sonnet-4-6"
+    se.RETRY_DELAY_SEC = 0
+    full = json.dumps(_RAW, ensure_ascii=False)
+    broken = full[:full.index('"high_voltage"')] + '"high_voltage": {"note": '
+    calls, _streams = _patch_stream(broken, full)
+    names = []
+    try:
+        survey = se.extract_survey_data_multi(
+            ["dummy.pdf"], category="commercial", use_image_enhancement=False,
+            use_self_consistency=False, on_section=lambda name, *a: names.append(name))
+    finally:
+        _restore_module()
+    assert len(calls) == 2, "壊れた応答はリトライする"
+    assert names == list(_RAW), f"セクションは1度ずつ: {names}"
+    assert survey.project.project_name == "テスト工業"
+
+
+def main() -> bool:
+    tests = [
+        test_parser_char_by_char,
+        test_parser_emits_before_end,
+        test_parser_tolerant_member,
+        test_validate_section_matches_full,
+        test_extract_streams_validated_sections,
+        test_callback_error_does_not_stop_extraction,
+        test_retry_does_not_repeat_sections,
+    ]
+    print("=== ストリーミングJSON抽出テスト（API不要） ===")
+    ok = True
+    try:
+        for fn in tests:
+            try:
+                fn()
+                print(f"[OK] {fn.__name__}")
+            except AssertionError as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: {e}")
+            except Exception as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: 予期しないエラー: {type(e).__name__}: {e}")
+    finally:
+        _restore_module()
+    print("=== 結果:", "全パス" if ok else "一部失敗", "===")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
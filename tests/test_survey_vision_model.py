@@ -15,6 +15,8 @@
 - thinking ブロックが先頭でもテキストブロックからJSONを取れること
 - BadRequest / refusal 時に CLAUDE_MODEL へフォールバックすること
 - レート制限（RateLimitError相当）はフォールバックせず上位リトライに任せること
+- 固定プロンプトが cache_control 付き system で送られ、user 側は画像＋短い指示のみ
+  であること（抽出・分類の両方）。usage のキャッシュ読出トークンを拾えること
 """
 import sys
 from pathlib import Path
@@ -194,6 +196,74 @@ def test_rate_limit_not_swallowed():
     assert len(calls) == 1, "フォールバック呼び出しが発生してはいけない"
 
 
+def _usage(read=0, write=0, plain=0, out=0):
+    return SimpleNamespace(cache_read_input_tokens=read, cache_creation_input_tokens=write,
+                           input_tokens=plain, output_tokens=out)
+
+
+def test_cached_system_prompt_sent():
+    """抽出の固定プロンプトは cache_control 付き system で送られること。"""
+    from extraction.prompts import COMMERCIAL_EXTRACTION_PROMPT, cached_system_blocks
+    se.CLAUDE_VISION_MODEL = "claude-sonnet-4-6"
+    msg = _msg([_text_block(_JSON)])
+    msg.usage = _usage(read=9000, plain=1500, out=300)
+    calls = _patch_api([msg])
+    system = cached_system_blocks(COMMERCIAL_EXTRACTION_PROMPT)
+    se._call_claude_api(_CONTENT, attempt=1, system=system)
+    assert calls[0]["system"] == system
+    assert calls[0]["system"][0]["cache_control"] == {"type": "ephemeral"}
+    assert se.log_cache_usage(msg, "test")["cache_read_input_tokens"] == 9000
+    assert se.log_cache_usage(_msg([]), "test") == {}, "usage無しの応答は空dict"
+
+
+def test_extract_multi_request_layout():
+    """extract_survey_data_multi の user 側は画像＋短い指示だけで、プロンプト本文は system 側。"""
+    from extraction.prompts import (
+        RESIDENTIAL_EXTRACTION_PROMPT, SURVEY_EXTRACTION_INSTRUCTION,
+    )
+    real_pdf_to_images = se.pdf_to_images
+    se.CLAUDE_VISION_MODEL = "claude-sonnet-4-6"
+    se.pdf_to_images = lambda path, dpi=200: [
+        {"page": 1, "image_base64": "AAAA", "image_bytes": b"", "media_type": "image/png"}]
+    try:
+        calls = _patch_api([_msg([_text_block(_JSON)])])
+        se.extract_survey_data_multi(["dummy.pdf"], category="residential",
+                                     use_image_enhancement=False,
+                                     use_self_consistency=False)
+    finally:
+        se.pdf_to_images = real_pdf_to_images
+    content = calls[0]["messages"][0]["content"]
+    assert [b["type"] for b in content] == ["image", "text"]
+    assert content[-1]["text"] == SURVEY_EXTRACTION_INSTRUCTION
+    assert calls[0]["system"][0]["text"] == RESIDENTIAL_EXTRACTION_PROMPT
+
+
+def test_classifier_uses_cached_system():
+    """文書分類も分類基準を cache_control 付き system で送ること。"""
+    import extraction.document_classifier as dc
+    real = (dc.anthropic, dc.get_api_key, dc.pdf_to_images)
+    calls = []
+
+    class _FakeMessages:
+        def create(self, **kwargs):
+            calls.append(kwargs)
+            return _msg([_text_block('{"category": "commercial", "confidence": "high"}')])
+
+    dc.anthropic = SimpleNamespace(Anthropic=lambda api_key=None: SimpleNamespace(
+        messages=_FakeMessages()))
+    dc.get_api_key = lambda: "test-key"
+    dc.pdf_to_images = lambda path, dpi=150: [
+        {"page": 1, "image_base64": "AAAA", "media_type": "image/png"}]
+    try:
+        result = dc.classify_documents(["a.pdf"])
+    finally:
+        dc.anthropic, dc.get_api_key, dc.pdf_to_images = real
+    assert result["category"] == "commercial"
+    assert calls[0]["system"][0]["text"] == dc.CLASSIFICATION_PROMPT
+    assert calls[0]["system"][0]["cache_control"] == {"type": "ephemeral"}
+    assert calls[0]["messages"][0]["content"][-1]["text"] == dc.CLASSIFICATION_INSTRUCTION
+
+
 def main():
     tests = [
         test_fable_request_omits_temperature,
@@ -203,6 +273,9 @@ def main():
         test_fallback_on_refusal,
         test_fallback_on_max_tokens_truncation,
         test_rate_limit_not_swallowed,
+        test_cached_system_prompt_sent,
+        test_extract_multi_request_layout,
+        test_classifier_uses_cached_system,
     ]
     print("=== 画像読み取りモデル切替テスト（API不要） ===")
     ok = True
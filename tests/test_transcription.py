@@ -0,0 +1,251 @@
+"""音声の文字起こしバックエンド（voice/transcription）のテスト（API不要・スクリプト式）
+
+実行: python3 tests/test_transcription.py
+
+カバー範囲:
+- ローカル（faster-whisper）は区間ごとに推論して途中経過を返し、モデルは1度だけ読み込むこと。
+  長い録音は境目付近の静かな位置で区切ること。読み込み中の warm_up() は待たずに戻ること
+- OpenAI Whisper API のクライアントを呼び出しのたびに作らず使い回し、キーが変われば作り直すこと
+- SANEI_STT_BACKEND によるバックエンドの選択と、WAV の読み込み（モノラル化・16kHz への変換）
+- available() / stream() を実装しないバックエンドは生成時に TypeError になること
+
+音声は tests/fixtures/audio の短い WAV（440Hz の音と無音）を使う。
+faster-whisper・openai は入っていなくてもよい（モデルと SDK はフェイクに差し替える）。
+"""
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import voice.voice_recorder as vr
+from voice import transcription as tr
+
+AUDIO_DIR = Path(__file__).resolve().parent / "fixtures" / "audio"
+TONE_GAP = (AUDIO_DIR / "tone_gap_8k_mono.wav").read_bytes()     # 2.5秒・1.1〜1.4秒が無音
+SILENCE = (AUDIO_DIR / "silence_16k_stereo.wav").read_bytes()    # 0.25秒・ステレオ
+
+_REAL = (tr._load_model, tr._import_openai, tr._faster_whisper_installed,
+         tr.KEY_RECHECK_SEC, vr._get_openai_key, os.environ.get(tr.BACKEND_ENV))
+
+
+def teardown_module(module=None):
+    (tr._load_model, tr._import_openai, tr._faster_whisper_installed,
+     tr.KEY_RECHECK_SEC, vr._get_openai_key, backend_env) = _REAL
+    if backend_env is None:
+        os.environ.pop(tr.BACKEND_ENV, None)
+    else:
+        os.environ[tr.BACKEND_ENV] = backend_env
+    tr.reset()
+
+
+class _FakeModel:
+    """faster-whisper の WhisperModel の代わり（区間の長さを文字にして返す）。"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def transcribe(self, audio, language=None, **kwargs):
+        self.chunks.append(len(audio) / tr.SAMPLE_RATE)
+        n = len(self.chunks)
+        segments = (SimpleNamespace(text=f" 区間{n}の{i}") for i in (1, 2))
+        return segments, SimpleNamespace(language=language)
+
+
+def _fake_openai(created, requests):
+    class _Client:
+        def __init__(self, api_key):
+            self.api_key = api_key
+            self.closed = False
+            created.append(self)
+            self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self._create))
+
+        def _create(self, **kwargs):
+            requests.append((self.api_key, kwargs))
+            return SimpleNamespace(text="パネルの単価を5万円に")
+
+        def close(self):
+            self.closed = True
+
+    return SimpleNamespace(OpenAI=_Client)
+
+
+# =============================================================
+# テスト
+# =============================================================
+
+def test_local_backend_streams_chunks_with_one_model_load():
+    """区間ごとに途中経過を返し、モデルの読み込みは1度だけであること。"""
+    loads, model = [], _FakeModel()
+
+    def _load(model_size, compute_type):
+        loads.append((model_size, compute_type))
+        return model
+
+    try:
+        tr.reset()
+        tr._load_model = _load
+        backend = tr.LocalWhisperBackend(model_size="tiny", chunk_sec=1.5)
+        partials = list(backend.stream(TONE_GAP, language="ja"))
+        assert partials == ["区間1の1", "区間1の1区間1の2", "区間1の1区間1の2区間2の1",
+                            "区間1の1区間1の2区間2の1区間2の2"], partials
+        first, second = model.chunks
+        assert 1.1 <= first <= 1.4, f"無音の位置で区切る（{first:.2f}秒）"
+        assert abs(first + second - 2.5) < 0.01
+
+        again = tr.LocalWhisperBackend(model_size="tiny", chunk_sec=1.5)
+        assert again.transcribe(SILENCE) == "区間3の1区間3の2"
+        assert loads == [("tiny", tr.DEFAULT_COMPUTE_TYPE)], "モデルはプロセスで1度だけ読み込む"
+
+        # 録音中に別スレッドで読み込みを済ませておく
+        tr._faster_whisper_installed = lambda: True
+        tr.LocalWhisperBackend(model_size="base").warm_up()
+        deadline = time.monotonic() + 5
+        while ("base", tr.DEFAULT_COMPUTE_TYPE) not in tr._MODELS and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert loads[-1] == ("base", tr.DEFAULT_COMPUTE_TYPE)
+        tr.LocalWhisperBackend(model_size="base").warm_up()
+        assert len(loads) == 2, "読み込み済みなら何もしない"
+
+        # 読み込み中に再実行で warm_up() が呼ばれても、読み込みの終わりを待たない
+        gate = threading.Event()
+
+        def _slow_load(model_size, compute_type):
+            loads.append((model_size, compute_type))
+            gate.wait(5)
+            return model
+
+        tr._load_model = _slow_load
+        slow = tr.LocalWhisperBackend(model_size="medium")
+        slow.warm_up()
+        deadline = time.monotonic() + 5
+        while ("medium", tr.DEFAULT_COMPUTE_TYPE) not in tr._WARMING and time.monotonic() < deadline:
+            time.sleep(0.01)
+        started = time.monotonic()
+        slow.warm_up()
+        assert time.monotonic() - started < 0.5, "読み込み中なら warm_up はすぐ戻る"
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(slow.model()))
+        waiter.start()
+        gate.set()
+        waiter.join(5)
+        assert results == [model] and len(loads) == 3, "読み込み中のモデルを待って使う"
+        tr.reset()
+        assert not tr._MODELS and not tr._WARMING
+    finally:
+        teardown_module()
+
+
+def test_openai_backend_reuses_client():
+    """クライアントを使い回し、APIキーが変わったときだけ作り直すこと。"""
+    created, requests, keys = [], [], ["sk-first"]
+    try:
+        tr.reset()
+        tr._import_openai = lambda: _fake_openai(created, requests)
+        vr._get_openai_key = lambda: keys[0]
+        os.environ[tr.BACKEND_ENV] = "openai"
+
+        assert vr.is_whisper_available()
+        assert vr.transcribe_audio(TONE_GAP) == "パネルの単価を5万円に"
+        assert list(vr.stream_transcription(b"\x1aE\xdf\xa3webm")) == ["パネルの単価を5万円に"]
+        assert len(created) == 1, "2回目の呼び出しも同じクライアント"
+        assert [r[1]["file"][0] for r in requests] == ["recording.wav", "recording.webm"]
+        assert requests[0][1]["model"] == "whisper-1" and requests[0][1]["language"] == "ja"
+
+        tr.KEY_RECHECK_SEC = 0.0
+        keys[0] = "sk-second"
+        vr.transcribe_audio(SILENCE)
+        assert len(created) == 2 and created[0].closed and requests[-1][0] == "sk-second"
+
+        keys[0] = None
+        tr.reset()
+        assert not vr.is_whisper_available()
+        try:
+            vr.transcribe_audio(SILENCE)
+            raise AssertionError("キー未設定なら RuntimeError")
+        except RuntimeError as e:
+            assert "OPENAI_API_KEY" in str(e)
+    finally:
+        teardown_module()
+
+
+def test_backend_selection_and_wav_decoding():
+    """SANEI_STT_BACKEND で選び、WAV をモノラル・16kHz の波形にすること。"""
+    try:
+        os.environ.pop(tr.BACKEND_ENV, None)
+        assert tr.get_backend().name == "openai", "既定は従来どおり openai"
+        os.environ[tr.BACKEND_ENV] = "local"
+        assert isinstance(tr.get_backend(), tr.LocalWhisperBackend)
+        assert tr.get_backend("openai").name == "openai", "引数が環境変数より優先"
+        assert tr.get_backend("whisper.cpp").name == "openai", "不明な指定は openai"
+
+        os.environ[tr.BACKEND_ENV] = "auto"
+        tr._faster_whisper_installed = lambda: False
+        assert tr.get_backend().name == "openai"
+        tr._faster_whisper_installed = lambda: True
+        assert tr.get_backend().name == "local"
+
+        tone = tr.decode_audio(TONE_GAP)
+        assert tone.dtype.name == "float32" and len(tone) == 40000, "8kHz → 16kHz"
+        assert 0.3 < float(abs(tone).max()) < 0.4
+        assert float(abs(tone[int(1.15 * 16000):int(1.35 * 16000)]).max()) == 0.0
+        silence = tr.decode_audio(SILENCE)
+        assert silence.ndim == 1 and len(silence) == 4000, "ステレオはモノラルに"
+        assert tr.split_chunks(silence[:0]) == []
+        assert len(tr.split_chunks(tone)) == 1, "30秒以下は1区間"
+    finally:
+        teardown_module()
+
+
+def test_incomplete_backend_fails_on_creation():
+    """必須メソッドの無いバックエンドは、録音を始める前の生成時に失敗すること。"""
+    class _NoStream(tr.TranscriptionBackend):
+        name = "broken"
+
+        def available(self):
+            return True
+
+    try:
+        _NoStream()
+        raise AssertionError("stream() が無ければ TypeError")
+    except TypeError as e:
+        assert "stream" in str(e), e
+    try:
+        tr.TranscriptionBackend()
+        raise AssertionError("基底クラスは生成できない")
+    except TypeError:
+        pass
+
+
+def main() -> bool:
+    tests = [
+        test_local_backend_streams_chunks_with_one_model_load,
+        test_openai_backend_reuses_client,
+        test_backend_selection_and_wav_decoding,
+        test_incomplete_backend_fails_on_creation,
+    ]
+    print("=== 文字起こしバックエンドテスト（API不要） ===")
+    ok = True
+    try:
+        for fn in tests:
+            try:
+                fn()
+                print(f"[OK] {fn.__name__}")
+            except AssertionError as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: {e}")
+            except Exception as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: 予期しないエラー: {type(e).__name__}: {e}")
+    finally:
+        teardown_module()
+    print("=== 結果:", "全パス" if ok else "一部失敗", "===")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
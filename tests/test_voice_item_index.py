@@ -0,0 +1,143 @@
+"""見積明細の検索索引（voice/item_index）と estimate_editor の明細特定のテスト（API不要・スクリプト式）
+
+実行: python3 tests/test_voice_item_index.py
+
+カバー範囲:
+- 正規化した完全一致・読み（かなの表記ゆれ）・部分一致・2-gram の近似一致の順位付け
+- 同じくらい当たる明細が複数あれば先頭を選ばず候補を返し、apply_commands は適用しないこと
+- 1回の apply_commands の中で、追加・削除・摘要変更が索引に反映されること
+- 明細が多くても、照合で採点するのは 2-gram を共有する候補だけであること
+  （1文字が共通なだけの明細は採点しない）
+- score_item が find_item と同じ基準で1件を採点すること
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from models.estimate_data import (
+    CategorySection, CategoryType, EstimateData, EstimateSummary, LineItem,
+)
+from voice import item_index as ii
+from voice.estimate_editor import apply_commands
+from tests.test_voice_local_parser import _estimate
+
+_REAL = (ii._SectionIndex._score,)
+
+
+def teardown_module(module=None):
+    (ii._SectionIndex._score,) = _REAL
+
+
+# =============================================================
+# テスト
+# =============================================================
+
+def test_ranked_matching():
+    """完全一致・読み・部分一致・近似一致の順に強く、あいまいなら候補を返すこと。"""
+    index = ii.EstimateItemIndex(_estimate())
+    material = index.find_category("材料")
+    assert material is not None and index.find_category("材料費の電線") is material
+
+    assert index.find_item(material, "ｹｰﾌﾞﾙ ﾗｯｸ").item.description == "ケーブルラック"
+    reading = index.find_item(material, "けーぶるらつく")
+    assert (reading.item.description, reading.score) == ("ケーブルラック", ii.SCORE_READING)
+    partial = index.find_item(material, "PF管")
+    assert partial.item.description == "電線管 PF管" and partial.score < ii.SCORE_READING
+    fuzzy = index.find_item(material, "電線 PF")
+    assert fuzzy.item.description == "電線管 PF管", "少しずれた指定も近似一致で拾う"
+
+    ambiguous = index.find_item(material, "電線管")
+    assert ambiguous.item is None and ambiguous.ambiguous
+    assert [c.item.description for c in ambiguous.candidates] == ["電線管 PF管", "電線管 CD管"]
+    assert index.find_item(material, "照明器具").item is None
+    assert not index.find_item(material, "照明器具").ambiguous
+
+    assert ii.score_item("ｹｰﾌﾞﾙ ﾗｯｸ", "ケーブルラック") == ii.SCORE_EXACT
+    assert ii.score_item("けーぶるらつく", "ケーブルラック") == ii.SCORE_READING
+    assert ii.score_item("PF管", "電線管 PF管") == partial.score
+    assert ii.score_item("照明器具", "ケーブルラック") == 0.0
+
+
+def test_apply_commands_keeps_index_current():
+    """追加・削除・摘要変更が同じバッチの後続コマンドに反映され、あいまいなら適用しないこと。"""
+    estimate = _estimate()
+    new_est, logs = apply_commands(estimate, [
+        {"action": "update_unit_price", "category": "材料費", "item_match": "電線管",
+         "new_value": 700},
+        {"action": "add_item", "category": "材料費", "description": "インシュロック タイ",
+         "quantity": "100個", "unit_price": 50},
+        {"action": "update_quantity", "category": "材料費", "item_match": "いんしゅろっくたい",
+         "new_value": 200},
+        {"action": "update_description", "category": "材料費", "item_match": "CD管",
+         "new_value": "波付硬質管 FEP"},
+        {"action": "update_unit_price", "category": "材料費", "item_match": "電線管",
+         "new_value": 700},
+        {"action": "delete_item", "category": "材料", "item_match": "ケーブルラック"},
+        {"action": "delete_item", "category": "材料費", "item_match": "ケーブルラック"},
+    ])
+    assert logs[0].startswith("⚠") and "「電線管 PF管」 / 「電線管 CD管」" in logs[0], logs[0]
+    assert all(log.startswith("✅") for log in logs[1:6]), logs
+    assert logs[6].startswith("❌"), "削除済みの明細はもう当たらない"
+
+    material = new_est.summary.categories[1]
+    assert [(i.no, i.description, i.unit_price) for i in material.items] == [
+        (1, "電線管 PF管", 700), (2, "波付硬質管 FEP", 600), (3, "インシュロック タイ", 50)]
+    assert material.items[2].amount == 200 * 50
+    assert estimate.summary.categories[1].items[1].unit_price == 800, "元データは変えない"
+
+
+def test_lookup_scores_only_ngram_candidates():
+    """明細が多くても、採点するのは 2-gram を共有する候補だけであること。"""
+    items = [LineItem(no=i + 1, description=f"部材{chr(0x4E00 + i * 2)}{chr(0x4E01 + i * 2)}",
+                      quantity="1式", unit_price=100, amount=100) for i in range(500)]
+    items.append(LineItem(no=501, description="接地極 EB-100", quantity="2本"))
+    estimate = EstimateData(summary=EstimateSummary(categories=[
+        CategorySection(category=CategoryType.MATERIAL, category_number=1, items=items)]))
+    scored = []
+
+    def _counting(self, entry, key, reading):
+        scored.append(entry.desc)
+        return _REAL[0](self, entry, key, reading)
+
+    try:
+        ii._SectionIndex._score = _counting
+        index = ii.EstimateItemIndex(estimate)
+        section = index.find_category("材料費")
+        assert index.find_item(section, "接地極").item.no == 501
+        assert scored == ["接地極eb-100"], f"{len(scored)}件を採点した"
+        scored.clear()
+        assert index.find_item(section, "接地極材").item is None
+        assert scored == ["接地極eb-100"], f"「材」だけが共通の{len(scored)}件を採点した"
+    finally:
+        teardown_module()
+
+
+def main() -> bool:
+    tests = [
+        test_ranked_matching,
+        test_apply_commands_keeps_index_current,
+        test_lookup_scores_only_ngram_candidates,
+    ]
+    print("=== 見積明細 検索索引テスト（API不要） ===")
+    ok = True
+    try:
+        for fn in tests:
+            try:
+                fn()
+                print(f"[OK] {fn.__name__}")
+            except AssertionError as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: {e}")
+            except Exception as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: 予期しないエラー: {type(e).__name__}: {e}")
+    finally:
+        teardown_module()
+    print("=== 結果:", "全パス" if ok else "一部失敗", "===")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
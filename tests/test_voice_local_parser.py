@@ -0,0 +1,190 @@
+"""音声コマンドのローカル解析（voice/local_command_parser）のテスト（API不要・スクリプト式）
+
+実行: python3 tests/test_voice_local_parser.py
+
+カバー範囲:
+- 漢数字・万/千/百の単位・全角数字・マイナスの読み取り
+- 定型の指示（単価・数量・削除・値引き・宛先・相対指示）を規則で解析し、
+  apply_commands でそのまま適用できること
+- 規則に当たらない指示・あいまいな明細、割合・範囲・言い直し・否定・加算・
+  値引き前後や合計を含む指示は確信度が低く、Claude に回ること
+- parse_voice_command がローカルで解決したときは API を呼ばず、
+  経路ごとの件数・命中率を parse_stats() で返すこと
+"""
+import json
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import voice.voice_command_parser as vcp
+from models.estimate_data import (
+    CategorySection, CategoryType, EstimateCover, EstimateData, EstimateSummary, LineItem,
+)
+from voice.estimate_editor import apply_commands
+from voice.local_command_parser import (
+    LOCAL_CONFIDENCE_THRESHOLD, parse_japanese_number, parse_local,
+)
+
+_REAL = (vcp.api_replay,)
+
+
+def teardown_module(module=None):
+    (vcp.api_replay,) = _REAL
+    vcp.reset_parse_stats()
+
+
+def _estimate():
+    return EstimateData(
+        cover=EstimateCover(client_name="株式会社サンプル", project_name="太陽光発電設備設置工事"),
+        summary=EstimateSummary(categories=[
+            CategorySection(category=CategoryType.SUPPLIED, category_number=1, items=[
+                LineItem(no=1, description="太陽光パネル 540W 単結晶", quantity="288枚",
+                         quantity_value=288, quantity_unit="枚", unit_price=60000,
+                         amount=17280000),
+            ]),
+            CategorySection(category=CategoryType.MATERIAL, category_number=2, items=[
+                LineItem(no=1, description="ケーブルラック", quantity="30m", quantity_value=30,
+                         quantity_unit="m", unit_price=5000, amount=150000),
+                LineItem(no=2, description="電線管 PF管", quantity="50m", quantity_value=50,
+                         quantity_unit="m", unit_price=800, amount=40000),
+                LineItem(no=3, description="電線管 CD管", quantity="20m", quantity_value=20,
+                         quantity_unit="m", unit_price=600, amount=12000),
+            ]),
+        ]),
+    )
+
+
+def _fake_claude(calls, reply):
+    def _create(**kwargs):
+        calls.append(kwargs)
+        return SimpleNamespace(content=[SimpleNamespace(text=json.dumps(reply, ensure_ascii=False))])
+    client = SimpleNamespace(messages=SimpleNamespace(create=_create))
+    return SimpleNamespace(client=lambda factory, label: client)
+
+
+# =============================================================
+# テスト
+# =============================================================
+
+def test_japanese_numbers():
+    """漢数字と万/千/百の単位を読み取ること。"""
+    cases = {"5万": 50000, "五万円": 50000, "7万5千": 75000, "七万五千円": 75000,
+             "3百万": 3_000_000, "三百万円": 3_000_000, "1.5万": 15000, "１，２００円": 1200,
+             "マイナス5万": -50000, "十万": 100000, "千": 1000, "二〇〇": 200, "0.5": 0.5}
+    for text, expected in cases.items():
+        assert parse_japanese_number(text) == expected, (text, parse_japanese_number(text))
+    assert parse_japanese_number("たくさん") is None
+    assert parse_japanese_number("") is None
+
+
+def test_common_commands_parse_locally():
+    """定型の指示を規則で解析し、そのまま適用できること。"""
+    estimate = _estimate()
+    summary = vcp._summarize_estimate(estimate)
+    result = parse_local(
+        "パネルの単価を5万円に変更して、ケーブルラックを削除して、お値引きを十万円に設定", summary)
+    assert result.confidence >= LOCAL_CONFIDENCE_THRESHOLD, result
+    assert [c["action"] for c in result.commands] == [
+        "update_unit_price", "delete_item", "set_discount"]
+    assert result.commands[0]["category"] == "支給品"
+    assert result.commands[0]["item_match"] == "太陽光パネル 540W 単結晶"
+
+    new_est, logs = apply_commands(estimate, result.commands)
+    assert all(log.startswith("✅") for log in logs), logs
+    assert new_est.summary.categories[0].items[0].amount == 288 * 50000
+    assert [i.description for i in new_est.summary.categories[1].items] == [
+        "電線管 PF管", "電線管 CD管"]
+    assert new_est.summary.discount == -100000
+
+    rel = parse_local("パネルの単価を3千円下げて", summary).commands[0]
+    assert rel["new_value"] == 57000, "相対指示は現在値から計算する"
+    qty = parse_local("材料費のPF管の数量を６０メートルにしてください", summary).commands[0]
+    assert (qty["action"], qty["new_value"], qty["new_unit"]) == ("update_quantity", 60, "m")
+    cover = parse_local("宛先を株式会社テスト商事に変更", summary).commands[0]
+    assert cover == {"action": "set_client_name", "new_value": "株式会社テスト商事",
+                     "reason": "宛先会社名を「株式会社テスト商事」に変更"}
+    assert parse_local("値引きをなしに", summary).commands[0]["new_value"] == 0
+
+    assert parse_local("電線管の単価を700円に", summary).confidence < LOCAL_CONFIDENCE_THRESHOLD, \
+        "2行に当たる指示は Claude に回す"
+    assert parse_local("パネルを少し安くして", summary).confidence == 0.0
+    up_to = parse_local("パネルの単価を5万円に上げて", summary).commands[0]
+    assert up_to["new_value"] == 50000, "「Xに上げて」は変更後の値"
+    cancel = parse_local("値引き5万円を取り消して", summary).commands[0]
+    assert cancel["new_value"] == 0, "取り消しは金額より優先"
+    assert parse_local("ケーブルラックはいらない", summary).commands[0]["action"] == "delete_item"
+    by_reading = parse_local("けーぶるらっくを削除して", summary)
+    assert by_reading.confidence == 1.0, "読みの一致も item_index と同じ基準で当てる"
+    assert by_reading.commands[0]["item_match"] == "ケーブルラック"
+
+    # 割合・範囲・言い直し・否定は規則では判断せず Claude に回す
+    for text in ("値引きを5%に", "値引きを1割に", "パネルの単価を10%下げて",
+                 "パネルの単価を10パーセント下げて", "パネルの単価を5万円から6万円に",
+                 "パネルの単価を5万円ではなく6万円に", "値引きを10万円から5万円に変更",
+                 "パネルを削除しないで", "ケーブルラックの削除はやめて",
+                 "パネルの単価を5万円、いや6万円に",
+                 # 値引き前後・合計・加算・倍は値引きや数量の置き換えではない
+                 "値引き後の金額を500万円に", "値引き前の合計を500万円に",
+                 "パネルの数量を10枚追加", "パネルの数量を2倍に", "値引きを10万円追加",
+                 "パネルの数量を10枚増やして", "値引きを5万円増やして"):
+        result = parse_local(text, summary)
+        assert result.confidence == 0.0 and not result.commands, (text, result)
+    assert parse_local("照明の単価を1万円に", summary).confidence == 0.0, "見積に無い明細"
+
+
+def test_parse_voice_command_routes_and_reports_stats():
+    """ローカルで解決した指示は API を呼ばず、経路ごとの件数を集計すること。"""
+    calls = []
+    reply = [{"action": "update_unit_price", "category": "支給品",
+              "item_match": "太陽光パネル", "new_value": 55000, "reason": "少し安く"}]
+    try:
+        vcp.api_replay = _fake_claude(calls, reply)
+        vcp.reset_parse_stats()
+        estimate = _estimate()
+
+        commands = vcp.parse_voice_command("値引きを10万円", estimate)
+        assert commands[0]["new_value"] == -100000 and calls == []
+        assert vcp.parse_voice_command("パネルを少し安くして", estimate) == reply
+        assert len(calls) == 1
+        assert vcp.parse_voice_command("値引きを10万円", estimate, use_local=False) == reply
+        assert len(calls) == 2, "use_local=False は常に Claude"
+
+        stats = vcp.parse_stats()
+        assert stats["total"] == 3 and stats["hit_rate"] == round(1 / 3, 3)
+        assert stats["local"]["count"] == 1 and stats["claude"]["count"] == 2
+        assert stats["last_path"] == "claude"
+        assert stats["local"]["avg_ms"] >= 0.0
+    finally:
+        teardown_module()
+
+
+def main() -> bool:
+    tests = [
+        test_japanese_numbers,
+        test_common_commands_parse_locally,
+        test_parse_voice_command_routes_and_reports_stats,
+    ]
+    print("=== 音声コマンド ローカル解析テスト（API不要） ===")
+    ok = True
+    try:
+        for fn in tests:
+            try:
+                fn()
+                print(f"[OK] {fn.__name__}")
+            except AssertionError as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: {e}")
+            except Exception as e:
+                ok = False
+                print(f"[NG] {fn.__name__}: 予期しないエラー: {type(e).__name__}: {e}")
+    finally:
+        teardown_module()
+    print("=== 結果:", "全パス" if ok else "一部失敗", "===")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
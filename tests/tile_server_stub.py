@@ -0,0 +1,132 @@
+"""衛星画像取得（roof/satellite_fetcher）のテスト用ローカルタイルサーバー
+
+127.0.0.1 の空きポートで起動し、次の2つに応答する:
+- /tile/{z}/{y}/{x}: (z, x, y) ごとに色の違う 256px の PNG（Esri World Imagery の代わり）
+- /search?q=...: Nominatim 形式の JSON（住所ごとに固定の緯度経度、"該当なし" を含む住所は空配列）
+
+使用例:
+    with LocalTileServer(delay=0.05) as server:
+        server.install(satellite_fetcher)   # タイル・Nominatim の URL を差し替え
+        ...
+        server.restore(satellite_fetcher)
+        print(server.tile_requests)
+"""
+from __future__ import annotations
+
+import io
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+
+def tile_color(z: int, x: int, y: int) -> tuple[int, int, int]:
+    """タイルごとの塗り色（合成結果からどのタイルが置かれたかを判別する）。"""
+    return ((x * 37 + z) % 256, (y * 53 + z) % 256, (x + y) % 256)
+
+
+def tile_png(z: int, x: int, y: int) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (256, 256), tile_color(z, x, y)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class LocalTileServer:
+    """スレッドで動かす最小限のタイル・ジオコーディングサーバー。"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.tile_requests: list[tuple[int, int, int]] = []
+        self.search_requests: list[str] = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self._saved = None
+
+    # --- サーバー本体 ---
+
+    def _handler(self):
+        outer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with outer._lock:
+                    outer.active += 1
+                    outer.peak = max(outer.peak, outer.active)
+                try:
+                    if outer.delay:
+                        time.sleep(outer.delay)
+                    parsed = urllib.parse.urlparse(self.path)
+                    parts = parsed.path.strip("/").split("/")
+                    if parts[0] == "tile" and len(parts) == 4:
+                        z, y, x = (int(p) for p in parts[1:])
+                        with outer._lock:
+                            outer.tile_requests.append((z, x, y))
+                        self._send(200, "image/png", tile_png(z, x, y))
+                    elif parts[0] == "search":
+                        q = urllib.parse.parse_qs(parsed.query).get("q", [""])[0]
+                        with outer._lock:
+                            outer.search_requests.append(q)
+                        body = [] if "該当なし" in q else [
+                            {"lat": "35.6895", "lon": "139.6917", "display_name": q}]
+                        self._send(200, "application/json",
+                                   json.dumps(body, ensure_ascii=False).encode("utf-8"))
+                    else:
+                        self._send(404, "text/plain", b"not found")
+                finally:
+                    with outer._lock:
+                        outer.active -= 1
+
+            def _send(self, code, content_type, body):
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def __enter__(self) -> "LocalTileServer":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        return False
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # --- satellite_fetcher の差し替え ---
+
+    def install(self, module) -> None:
+        """タイル・Nominatim の URL をこのサーバーへ向ける（Google キーは無効化）。"""
+        self._saved = (module._ESRI_TILE_URL, module._NOMINATIM_URL, module._get_google_api_key)
+        module._ESRI_TILE_URL = self.base_url + "/tile/{z}/{y}/{x}"
+        module._NOMINATIM_URL = self.base_url + "/search"
+        module._get_google_api_key = lambda: None
+
+    def restore(self, module) -> None:
+        if self._saved is not None:
+            module._ESRI_TILE_URL, module._NOMINATIM_URL, module._get_google_api_key = self._saved
+            self._saved = None
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.tile_requests.clear()
+            self.search_requests.clear()
+            self.peak = 0
@@ -4,7 +4,11 @@ voice_command_parser.parse_voice_command() で得られた構造化コマンド
 EstimateData に適用する。
 
 副作用なし: ディープコピーされた EstimateData を返す。
-各コマンド適用後に calculate_totals() で合計を再計算する。
+編集は pricing/edit_session.EstimateEditSession 経由で行い、合計は明細の
+金額の差分だけを足し引きして保つ（全カテゴリの再計算はしない）。
+session を渡すとその見積をその場で編集し、1回の適用を1手として取り消せる。
+明細・カテゴリの特定は1回の適用ごとに作る索引（voice/item_index）で行い、
+item_match が複数の明細に同じくらい当たるときは適用せず候補を返す。
 
 使い方:
     from voice.estimate_editor import apply_commands
@@ -22,24 +26,32 @@ from models.estimate_data import (
     EstimateData, CategorySection, LineItem,
     CategoryType, PricingMethod, LineItemReasoning,
 )
+from pricing.edit_session import EstimateEditSession
+from voice.item_index import EstimateItemIndex, ItemMatch
 
 logger = logging.getLogger(__name__)
 
 
 def apply_commands(
-    estimate: EstimateData, commands: list[dict]
+    estimate: EstimateData, commands: list[dict],
+    session: Optional[EstimateEditSession] = None,
 ) -> tuple[EstimateData, list[str]]:
     """構造化コマンドを順次適用する
 
     Args:
-        estimate: 元の EstimateData（副作用なし、ディープコピーされる）
+        estimate: 元の EstimateData（session 省略時は副作用なし、ディープコピーされる）
         commands: 構造化コマンドのリスト
+        session: 編集セッション。渡すと session.estimate をその場で編集し、
+            このバッチ全体を1手として取り消し履歴に積む
 
     Returns:
         (更新後の EstimateData, 適用ログメッセージのリスト)
     """
-    new_estimate = copy.deepcopy(estimate)
+    if session is None:
+        session = EstimateEditSession(copy.deepcopy(estimate))
+    new_estimate = session.estimate
     logs: list[str] = []
+    index = EstimateItemIndex(new_estimate)
 
     handler_map = {
         "update_unit_price": _handle_update_unit_price,
@@ -56,103 +68,80 @@ def apply_commands(
         "unknown": _handle_unknown,
     }
 
-    for cmd in commands:
-        if not isinstance(cmd, dict):
-            logs.append(f"❌ 不正なコマンド形式: {cmd}")
-            continue
-        action = cmd.get("action", "unknown")
-        handler = handler_map.get(action, _handle_unknown)
-        try:
-            log = handler(new_estimate, cmd)
-        except Exception as e:
-            logger.exception(f"コマンド適用エラー: {cmd}")
-            log = f"❌ {action} 適用中にエラー: {e}"
-        logs.append(log)
-
-        # 各コマンド適用後に合計を再計算
-        try:
-            _recalculate_all(new_estimate)
-        except Exception as e:
-            logger.warning(f"合計再計算エラー: {e}")
+    with session.batch("音声編集"):
+        for cmd in commands:
+            if not isinstance(cmd, dict):
+                logs.append(f"❌ 不正なコマンド形式: {cmd}")
+                continue
+            action = cmd.get("action", "unknown")
+            handler = handler_map.get(action, _handle_unknown)
+            try:
+                log = handler(session, cmd, index)
+            except Exception as e:
+                logger.exception(f"コマンド適用エラー: {cmd}")
+                log = f"❌ {action} 適用中にエラー: {e}"
+            logs.append(log)
 
     return new_estimate, logs
 
 
-def _recalculate_all(estimate: EstimateData) -> None:
-    """全カテゴリ + 全体の合計を再計算"""
-    for cat in estimate.summary.categories:
-        cat.calculate_totals()
-    estimate.summary.calculate_totals()
-    # cover の金額も同期
-    estimate.cover.total_before_tax = estimate.summary.total_before_tax
-    estimate.cover.tax = estimate.summary.tax
-    estimate.cover.total_with_tax = estimate.summary.total_with_tax
-
-
 def _find_item(
-    estimate: EstimateData, category: str, item_match: str
-) -> tuple[Optional[CategorySection], Optional[LineItem]]:
-    """カテゴリ名と部分一致文字列から明細を探す
+    index: EstimateItemIndex, category: str, item_match: str
+) -> tuple[Optional[CategorySection], ItemMatch]:
+    """カテゴリ名と item_match から明細を探す
 
     Args:
-        estimate: 検索対象の EstimateData
+        index: apply_commands で作った見積の索引
         category: カテゴリ名（完全一致または前方一致）
-        item_match: 明細の摘要に対する部分一致文字列
+        item_match: 明細の摘要（または備考）に対する照合文字列
 
     Returns:
-        (CategorySection, LineItem) のタプル。見つからなければ (None, None)
+        (CategorySection, ItemMatch) のタプル。カテゴリが決まらなければ
+        (None, ItemMatch())。明細が決まらなければ ItemMatch.item が None
+        （あいまいなときは ItemMatch.candidates に候補が入る）
     """
-    cat_section = _find_category(estimate, category)
+    cat_section = index.find_category(category)
     if cat_section is None:
-        return None, None
-
+        return None, ItemMatch()
     if not item_match:
-        return cat_section, None
-
-    item_match_norm = str(item_match).strip()
-    # 完全一致を優先
-    for item in cat_section.items:
-        if item.description == item_match_norm:
-            return cat_section, item
-    # 部分一致（明細の摘要に含まれる）
-    for item in cat_section.items:
-        if item_match_norm in item.description:
-            return cat_section, item
-    # 部分一致（item_match の方に明細が含まれる: 逆方向）
-    for item in cat_section.items:
-        if item.description and item.description in item_match_norm:
-            return cat_section, item
-    # remarks にもマッチを試みる
-    for item in cat_section.items:
-        if item.remarks and item_match_norm in item.remarks:
-            return cat_section, item
-
-    return cat_section, None
-
-
-def _find_category(estimate: EstimateData, category: str) -> Optional[CategorySection]:
-    """カテゴリ名から CategorySection を探す（完全一致 → 前方一致）"""
+        return cat_section, ItemMatch()
+    return cat_section, index.find_item(cat_section, str(item_match).strip())
+
+
+def _find_category(index: EstimateItemIndex, category: str) -> Optional[CategorySection]:
+    """カテゴリ名から CategorySection を探す（完全一致 → 前方一致。複数当たれば None）"""
     if not category:
         return None
-    cat_str = str(category).strip()
-    # 完全一致
-    for cat in estimate.summary.categories:
-        cat_value = cat.category.value if hasattr(cat.category, "value") else str(cat.category)
-        if cat_value == cat_str:
-            return cat
-    # 前方一致
-    for cat in estimate.summary.categories:
-        cat_value = cat.category.value if hasattr(cat.category, "value") else str(cat.category)
-        if cat_value.startswith(cat_str) or cat_str.startswith(cat_value):
-            return cat
-    return None
+    return index.find_category(str(category))
+
+
+def _category_error(label: str, index: EstimateItemIndex, category: str) -> str:
+    """カテゴリが決まらなかったときのログ（複数当たった場合は候補を示す）"""
+    hits = index.category_candidates(category) if category else []
+    if len(hits) > 1:
+        names = " / ".join(_cat_name(c) for c in hits)
+        return f"⚠ {label}: カテゴリ「{category}」に当たるものが複数あります（{names}）"
+    return f"❌ {label}: カテゴリ「{category}」が見つかりません"
+
+
+def _item_error(label: str, cat: CategorySection, item_match: str, match: ItemMatch) -> str:
+    """明細が決まらなかったときのログ（あいまいなら候補を示し、適用しない）"""
+    if match.ambiguous:
+        names = " / ".join(f"「{c.item.description}」" for c in match.candidates)
+        return (f"⚠ {label}: {_cat_name(cat)}内で「{item_match}」に当たる明細が複数あります。"
+                f"どれか指定してください: {names}")
+    return f"❌ {label}: {_cat_name(cat)}内に「{item_match}」を含む明細が見つかりません"
+
+
+def _cat_name(cat: CategorySection) -> str:
+    return cat.category.value if hasattr(cat.category, "value") else str(cat.category)
 
 
 # ============================================================
 # 各アクションのハンドラ
 # ============================================================
 
-def _handle_update_unit_price(estimate: EstimateData, cmd: dict) -> str:
+def _handle_update_unit_price(session: EstimateEditSession, cmd: dict, index: EstimateItemIndex) -> str:
     category = cmd.get("category", "")
     item_match = cmd.get("item_match", "")
     new_value = cmd.get("new_value")
@@ -163,17 +152,18 @@ def _handle_update_unit_price(estimate: EstimateData, cmd: dict) -> str:
     except (ValueError, TypeError):
         return f"❌ 単価変更: new_value({new_value})を整数に変換できません"
 
-    cat, item = _find_item(estimate, category, item_match)
+    cat, match = _find_item(index, category, item_match)
     if cat is None:
-        return f"❌ 単価変更: カテゴリ「{category}」が見つかりません"
+        return _category_error("単価変更", index, category)
+    item = match.item
     if item is None:
-        return f"❌ 単価変更: {category}内に「{item_match}」を含む明細が見つかりません"
+        return _item_error("単価変更", cat, item_match, match)
 
     old_price = item.unit_price
-    item.unit_price = new_price
+    new_amount = item.amount
     # 数量から金額を再計算
     if item.quantity_value:
-        item.amount = int(item.quantity_value * new_price)
+        new_amount = int(item.quantity_value * new_price)
     else:
         # quantity_value が無い場合は quantity 文字列から推定
         from re import search
@@ -181,15 +171,16 @@ def _handle_update_unit_price(estimate: EstimateData, cmd: dict) -> str:
         if m:
             try:
                 qv = float(m.group(0))
-                item.amount = int(qv * new_price)
+                new_amount = int(qv * new_price)
             except ValueError:
                 pass
+    session.update_item(cat, item, unit_price=new_price, amount=new_amount)
 
     return (f"✅ {cat.category.value if hasattr(cat.category, 'value') else cat.category}"
             f"「{item.description}」の単価を ¥{old_price:,} → ¥{new_price:,} に変更しました")
 
 
-def _handle_update_quantity(estimate: EstimateData, cmd: dict) -> str:
+def _handle_update_quantity(session: EstimateEditSession, cmd: dict, index: EstimateItemIndex) -> str:
     category = cmd.get("category", "")
     item_match = cmd.get("item_match", "")
     new_value = cmd.get("new_value")
@@ -201,31 +192,30 @@ def _handle_update_quantity(estimate: EstimateData, cmd: dict) -> str:
     except (ValueError, TypeError):
         return f"❌ 数量変更: new_value({new_value})を数値に変換できません"
 
-    cat, item = _find_item(estimate, category, item_match)
+    cat, match = _find_item(index, category, item_match)
     if cat is None:
-        return f"❌ 数量変更: カテゴリ「{category}」が見つかりません"
+        return _category_error("数量変更", index, category)
+    item = match.item
     if item is None:
-        return f"❌ 数量変更: {category}内に「{item_match}」を含む明細が見つかりません"
+        return _item_error("数量変更", cat, item_match, match)
 
     old_qty = item.quantity
-    item.quantity_value = new_qty
-    if new_unit:
-        item.quantity_unit = str(new_unit)
-    unit = item.quantity_unit or ""
+    unit = str(new_unit) if new_unit else (item.quantity_unit or "")
     # 数値表記（整数なら整数、小数なら小数）
     if new_qty == int(new_qty):
-        item.quantity = f"{int(new_qty)}{unit}"
+        quantity = f"{int(new_qty)}{unit}"
     else:
-        item.quantity = f"{new_qty}{unit}"
+        quantity = f"{new_qty}{unit}"
     # 金額を再計算
-    if item.unit_price:
-        item.amount = int(new_qty * item.unit_price)
+    new_amount = int(new_qty * item.unit_price) if item.unit_price else item.amount
+    session.update_item(cat, item, quantity_value=new_qty, quantity_unit=unit,
+                        quantity=quantity, amount=new_amount)
 
     return (f"✅ {cat.category.value if hasattr(cat.category, 'value') else cat.category}"
             f"「{item.description}」の数量を {old_qty} → {item.quantity} に変更しました")
 
 
-def _handle_update_amount(estimate: EstimateData, cmd: dict) -> str:
+def _handle_update_amount(session: EstimateEditSession, cmd: dict, index: EstimateItemIndex) -> str:
     category = cmd.get("category", "")
     item_match = cmd.get("item_match", "")
     new_value = cmd.get("new_value")
@@ -236,73 +226,77 @@ def _handle_update_amount(estimate: EstimateData, cmd: dict) -> str:
     except (ValueError, TypeError):
         return f"❌ 金額変更: new_value({new_value})を整数に変換できません"
 
-    cat, item = _find_item(estimate, category, item_match)
+    cat, match = _find_item(index, category, item_match)
     if cat is None:
-        return f"❌ 金額変更: カテゴリ「{category}」が見つかりません"
+        return _category_error("金額変更", index, category)
+    item = match.item
     if item is None:
-        return f"❌ 金額変更: {category}内に「{item_match}」を含む明細が見つかりません"
+        return _item_error("金額変更", cat, item_match, match)
 
     old_amount = item.amount
-    item.amount = new_amount
+    session.update_item(cat, item, amount=new_amount)
 
     return (f"✅ {cat.category.value if hasattr(cat.category, 'value') else cat.category}"
             f"「{item.description}」の金額を ¥{old_amount:,} → ¥{new_amount:,} に変更しました")
 
 
-def _handle_update_description(estimate: EstimateData, cmd: dict) -> str:
+def _handle_update_description(session: EstimateEditSession, cmd: dict, index: EstimateItemIndex) -> str:
     category = cmd.get("category", "")
     item_match = cmd.get("item_match", "")
     new_value = cmd.get("new_value", "")
 
-    cat, item = _find_item(estimate, category, item_match)
+    cat, match = _find_item(index, category, item_match)
     if cat is None:
-        return f"❌ 摘要変更: カテゴリ「{category}」が見つかりません"
+        return _category_error("摘要変更", index, category)
+    item = match.item
     if item is None:
-        return f"❌ 摘要変更: {category}内に「{item_match}」を含む明細が見つかりません"
+        return _item_error("摘要変更", cat, item_match, match)
 
     old_desc = item.description
-    item.description = str(new_value)
+    session.update_item(cat, item, description=str(new_value))
+    index.reindex(cat, item)
     return (f"✅ {cat.category.value if hasattr(cat.category, 'value') else cat.category}"
             f"の摘要を「{old_desc}」→「{item.description}」に変更しました")
 
 
-def _handle_update_remarks(estimate: EstimateData, cmd: dict) -> str:
+def _handle_update_remarks(session: EstimateEditSession, cmd: dict, index: EstimateItemIndex) -> str:
     category = cmd.get("category", "")
     item_match = cmd.get("item_match", "")
     new_value = cmd.get("new_value", "")
 
-    cat, item = _find_item(estimate, category, item_match)
+    cat, match = _find_item(index, category, item_match)
     if cat is None:
-        return f"❌ 備考変更: カテゴリ「{category}」が見つかりません"
+        return _category_error("備考変更", index, category)
+    item = match.item
     if item is None:
-        return f"❌ 備考変更: {category}内に「{item_match}」を含む明細が見つかりません"
+        return _item_error("備考変更", cat, item_match, match)
 
     old_remarks = item.remarks
-    item.remarks = str(new_value)
+    session.update_item(cat, item, remarks=str(new_value))
+    index.reindex(cat, item)
     return (f"✅ {cat.category.value if hasattr(cat.category, 'value') else cat.category}"
             f"「{item.description}」の備考を「{old_remarks}」→「{item.remarks}」に変更しました")
 
 
-def _handle_delete_item(estimate: EstimateData, cmd: dict) -> str:
+def _handle_delete_item(session: EstimateEditSession, cmd: dict, index: EstimateItemIndex) -> str:
     category = cmd.get("category", "")
     item_match = cmd.get("item_match", "")
 
-    cat, item = _find_item(estimate, category, item_match)
+    cat, match = _find_item(index, category, item_match)
     if cat is None:
-        return f"❌ 削除: カテゴリ「{category}」が見つかりません"
+        return _category_error("削除", index, category)
+    item = match.item
     if item is None:
-        return f"❌ 削除: {category}内に「{item_match}」を含む明細が見つかりません"
+        return _item_error("削除", cat, item_match, match)
 
     desc = item.description
-    cat.items.remove(item)
-    # 行番号を振り直し
-    for i, it in enumerate(cat.items, start=1):
-        it.no = i
+    session.delete_item(cat, item)  # 行番号も振り直す
+    index.remove(cat, item)
     return (f"✅ {cat.category.value if hasattr(cat.category, 'value') else cat.category}"
             f"「{desc}」を削除しました")
 
 
-def _handle_add_item(estimate: EstimateData, cmd: dict) -> str:
+def _handle_add_item(session: EstimateEditSession, cmd: dict, index: EstimateItemIndex) -> str:
     category = cmd.get("category", "")
     description = cmd.get("description", "")
     quantity = cmd.get("quantity", "1式")
@@ -312,9 +306,9 @@ def _handle_add_item(estimate: EstimateData, cmd: dict) -> str:
     if not description:
         return f"❌ 明細追加: description が指定されていません"
 
-    cat = _find_category(estimate, category)
+    cat = _find_category(index, category)
     if cat is None:
-        return f"❌ 明細追加: カテゴリ「{category}」が見つかりません"
+        return _category_error("明細追加", index, category)
 
     try:
         unit_price_int = int(unit_price) if unit_price else 0
@@ -358,12 +352,13 @@ def _handle_add_item(estimate: EstimateData, cmd: dict) -> str:
         ),
         is_manual_input=True,
     )
-    cat.items.append(new_item)
+    session.add_item(cat, new_item)
+    index.add(cat, new_item)
     return (f"✅ {cat.category.value if hasattr(cat.category, 'value') else cat.category}"
             f"に明細「{description}」(数量:{quantity}, 単価:¥{unit_price_int:,}, 金額:¥{amount_int:,})を追加しました")
 
 
-def _handle_set_discount(estimate: EstimateData, cmd: dict) -> str:
+def _handle_set_discount(session: EstimateEditSession, cmd: dict, index: EstimateItemIndex) -> str:
     new_value = cmd.get("new_value")
     if new_value is None:
         return f"❌ 値引き設定: new_value が指定されていません"
@@ -372,49 +367,46 @@ def _handle_set_discount(estimate: EstimateData, cmd: dict) -> str:
     except (ValueError, TypeError):
         return f"❌ 値引き設定: new_value({new_value})を整数に変換できません"
 
-    old_discount = estimate.summary.discount
-    estimate.summary.discount = new_discount
+    old_discount = session.estimate.summary.discount
+    session.set_discount(new_discount)
     return f"✅ お値引きを ¥{old_discount:,} → ¥{new_discount:,} に変更しました"
 
 
-def _handle_set_client_name(estimate: EstimateData, cmd: dict) -> str:
+def _handle_set_client_name(session: EstimateEditSession, cmd: dict, index: EstimateItemIndex) -> str:
     new_value = cmd.get("new_value", "")
     if not new_value:
         return f"❌ 宛先変更: new_value が指定されていません"
-    old = estimate.cover.client_name
-    estimate.cover.client_name = str(new_value)
-    return f"✅ 宛先会社名を「{old}」→「{estimate.cover.client_name}」に変更しました"
+    old = session.estimate.cover.client_name
+    session.set_cover(client_name=str(new_value))
+    return f"✅ 宛先会社名を「{old}」→「{session.estimate.cover.client_name}」に変更しました"
 
 
-def _handle_set_project_name(estimate: EstimateData, cmd: dict) -> str:
+def _handle_set_project_name(session: EstimateEditSession, cmd: dict, index: EstimateItemIndex) -> str:
     new_value = cmd.get("new_value", "")
     if not new_value:
         return f"❌ 工事名変更: new_value が指定されていません"
-    old = estimate.cover.project_name
-    estimate.cover.project_name = str(new_value)
-    return f"✅ 工事名を「{old}」→「{estimate.cover.project_name}」に変更しました"
+    old = session.estimate.cover.project_name
+    session.set_cover(project_name=str(new_value))
+    return f"✅ 工事名を「{old}」→「{session.estimate.cover.project_name}」に変更しました"
 
 
-def _handle_set_validity_period(estimate: EstimateData, cmd: dict) -> str:
+def _handle_set_validity_period(session: EstimateEditSession, cmd: dict, index: EstimateItemIndex) -> str:
     new_value = cmd.get("new_value", "")
     if not new_value:
         return f"❌ 有効期限変更: new_value が指定されていません"
-    old = estimate.cover.validity_period
-    estimate.cover.validity_period = str(new_value)
-    return f"✅ 有効期限を「{old}」→「{estimate.cover.validity_period}」に変更しました"
+    old = session.estimate.cover.validity_period
+    session.set_cover(validity_period=str(new_value))
+    return f"✅ 有効期限を「{old}」→「{session.estimate.cover.validity_period}」に変更しました"
 
 
-def _handle_unknown(estimate: EstimateData, cmd: dict) -> str:
+def _handle_unknown(session: EstimateEditSession, cmd: dict, index: EstimateItemIndex) -> str:
     reason = cmd.get("reason", "解釈できませんでした")
     return f"⚠ 未対応の指示: {reason}"
 
 
 if __name__ == "__main__":
     # 動作確認: モックコマンドを直書きして apply_commands をテスト
-    from models.estimate_data import (
-        EstimateData, EstimateCover, EstimateSummary,
-        CategorySection, LineItem, CategoryType,
-    )
+    from models.estimate_data import EstimateCover, EstimateSummary
 
     sample_estimate = EstimateData(
         cover=EstimateCover(
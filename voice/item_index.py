@@ -0,0 +1,310 @@
+"""見積明細の検索索引（音声編集の item_match / category の解決用）
+
+estimate_editor.apply_commands の1回のコマンド適用ごとに1度だけ作り、
+明細の追加・削除・摘要変更のたびに差分で更新する。1コマンドの解決は
+辞書引きと、2-gram の転置索引で絞った候補（指定と2文字の並びを共有する明細）の
+採点で済み、全明細を採点しない。1件だけの照合は score_item() で同じ基準で行う
+（local_command_parser.match_item もこれを使う）。
+
+照合の強さ（score の目安。大きいほど強い）:
+    1.0          摘要の完全一致（NFKC・大小文字・空白を正規化）
+    0.95         読みの一致（カタカナ→ひらがな・小書きかな・長音や中黒の表記ゆれを寄せる。
+                 pykakasi があれば漢字も読みに）
+    0.75〜0.95   摘要に item_match が含まれる（摘要に占める割合が大きいほど強い）
+    0.7〜0.9     item_match に摘要が含まれる（逆方向）
+    0.6〜0.7     備考に item_match が含まれる
+    〜0.7        2-gram の Dice 係数による近似一致（FUZZY_MIN_DICE 以上のみ）
+
+上位2件の差が AMBIGUITY_MARGIN 未満なら「あいまい」とし、先頭を勝手に選ばずに
+候補の一覧を返す（摘要がまったく同じ重複行は、従来どおり先頭を選ぶ）。
+
+    index = EstimateItemIndex(estimate)
+    section = index.find_category("材料費")
+    match = index.find_item(section, "ケーブルラック")
+    if match.item is None and match.ambiguous:
+        print([c.item.description for c in match.candidates])
+"""
+from __future__ import annotations
+
+import logging
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Optional
+
+from models.estimate_data import CategorySection, EstimateData, LineItem
+
+logger = logging.getLogger(__name__)
+
+SCORE_EXACT = 1.0
+SCORE_READING = 0.95
+FUZZY_MIN_DICE = 0.5
+AMBIGUITY_MARGIN = 0.05
+MAX_CANDIDATES = 5
+
+_KANJI_READER: dict = {"loaded": False, "convert": None}
+
+# 読みの比較では小書きのかなを大きいかなに寄せ、中黒・記号は無視する
+_SMALL_KANA = str.maketrans("ぁぃぅぇぉっゃゅょゎ", "あいうえおつやゆよわ")
+_READING_IGNORED = re.compile(r"[ー・･\-‐_/()（）「」]")
+
+
+def _kanji_reader():
+    """pykakasi があれば漢字→ひらがなの変換関数を返す（無ければ None）。"""
+    if not _KANJI_READER["loaded"]:
+        _KANJI_READER["loaded"] = True
+        try:
+            import pykakasi
+            kks = pykakasi.kakasi()
+            _KANJI_READER["convert"] = lambda s: "".join(t["hira"] for t in kks.convert(s))
+        except ImportError:
+            logger.debug("pykakasi 未インストール: 読みの照合はかなの表記ゆれのみ")
+        except Exception as e:
+            logger.warning(f"pykakasi の初期化に失敗したため漢字の読み照合を行いません: {e}")
+    return _KANJI_READER["convert"]
+
+
+def normalize_key(text: str) -> str:
+    """表記の正規化キー（NFKC・小文字・空白除去）。"""
+    return re.sub(r"\s+", "", unicodedata.normalize("NFKC", str(text or "")).lower())
+
+
+def reading_key(text: str) -> str:
+    """読みの正規化キー（カタカナ→ひらがな・小書きかな・長音や記号を寄せる。
+    漢字は pykakasi があれば読みに）。"""
+    key = normalize_key(text)
+    convert = _kanji_reader()
+    if convert is not None:
+        try:
+            key = convert(key)
+        except Exception as e:
+            logger.debug(f"読みの変換に失敗: {text!r} ({e})")
+    key = "".join(chr(ord(ch) - 0x60) if "ァ" <= ch <= "ヶ" else ch for ch in key)
+    return _READING_IGNORED.sub("", key).translate(_SMALL_KANA)
+
+
+def _bigrams(key: str) -> set[str]:
+    """2-gram（1文字のキーはそのもの）。候補の絞り込みと近似一致に使う。"""
+    return {key[i:i + 2] for i in range(len(key) - 1)} or ({key} if key else set())
+
+
+def _match_score(desc: str, desc_reading: str, remarks: str, remarks_reading: str,
+                 key: str, reading: str) -> float:
+    """部分一致・備考・近似一致の強さ（完全一致・読みの一致は呼び出し側で判定）。"""
+    best = 0.0
+    for d, q in ((desc, key), (desc_reading, reading)):
+        if not d or not q:
+            continue
+        if q in d:
+            best = max(best, 0.75 + 0.2 * len(q) / len(d))
+        elif d in q:
+            best = max(best, 0.7 + 0.2 * len(d) / len(q))
+    for r, q in ((remarks, key), (remarks_reading, reading)):
+        if r and q and q in r:
+            best = max(best, 0.6 + 0.1 * len(q) / len(r))
+    if best == 0.0:
+        q_grams = _bigrams(reading)
+        e_grams = _bigrams(desc_reading)
+        if q_grams and e_grams:
+            dice = 2 * len(q_grams & e_grams) / (len(q_grams) + len(e_grams))
+            if dice >= FUZZY_MIN_DICE:
+                best = 0.7 * dice
+    return min(best, SCORE_READING - 0.001)
+
+
+def score_item(item_match: str, description: str, remarks: str = "") -> float:
+    """1件の明細に対する照合の強さ（find_item と同じ基準。当たらなければ 0.0）。"""
+    key, reading = normalize_key(item_match), reading_key(item_match)
+    if not key:
+        return 0.0
+    desc, desc_reading = normalize_key(description), reading_key(description)
+    if desc == key:
+        return SCORE_EXACT
+    if desc_reading and desc_reading == reading:
+        return SCORE_READING
+    return _match_score(desc, desc_reading, normalize_key(remarks), reading_key(remarks),
+                        key, reading)
+
+
+@dataclass
+class _Entry:
+    item: LineItem
+    order: int
+    desc: str
+    desc_reading: str
+    remarks: str
+    remarks_reading: str
+    grams: set[str]
+
+
+@dataclass
+class Candidate:
+    """照合候補（score の大きい順に並べて返す）。"""
+    item: LineItem
+    score: float
+
+
+@dataclass
+class ItemMatch:
+    """find_item の結果。item が None で ambiguous なら candidates から選んでもらう。"""
+    item: Optional[LineItem] = None
+    score: float = 0.0
+    ambiguous: bool = False
+    candidates: list[Candidate] = field(default_factory=list)
+
+
+class _SectionIndex:
+    """1カテゴリ分の明細索引。"""
+
+    def __init__(self, section: CategorySection):
+        self.section = section
+        self._entries: dict[int, _Entry] = {}
+        self._exact: dict[str, list[int]] = {}
+        self._reading: dict[str, list[int]] = {}
+        self._postings: dict[str, set[int]] = {}
+        self._short: set[int] = set()  # 摘要が1文字以下（2-gram を持たない）の明細
+        self._order = 0
+        for item in section.items:
+            self.add(item)
+
+    def add(self, item: LineItem, order: Optional[int] = None) -> None:
+        desc, remarks = normalize_key(item.description), normalize_key(item.remarks)
+        desc_reading, remarks_reading = reading_key(item.description), reading_key(item.remarks)
+        if order is None:
+            order, self._order = self._order, self._order + 1
+        entry = _Entry(item, order, desc, desc_reading, remarks, remarks_reading,
+                       _bigrams(desc) | _bigrams(desc_reading)
+                       | _bigrams(remarks) | _bigrams(remarks_reading))
+        key = id(item)
+        if len(desc) < 2 or len(desc_reading) < 2:
+            self._short.add(key)
+        self._entries[key] = entry
+        self._exact.setdefault(desc, []).append(key)
+        self._reading.setdefault(desc_reading, []).append(key)
+        for g in entry.grams:
+            self._postings.setdefault(g, set()).add(key)
+
+    def remove(self, item: LineItem) -> Optional[int]:
+        """明細を索引から外し、その並び順を返す（未登録なら None）。"""
+        key = id(item)
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._short.discard(key)
+        for table, k in ((self._exact, entry.desc), (self._reading, entry.desc_reading)):
+            ids = table.get(k, [])
+            if key in ids:
+                ids.remove(key)
+            if not ids:
+                table.pop(k, None)
+        for g in entry.grams:
+            ids = self._postings.get(g)
+            if ids is not None:
+                ids.discard(key)
+                if not ids:
+                    del self._postings[g]
+        return entry.order
+
+    def _score(self, entry: _Entry, key: str, reading: str) -> float:
+        return _match_score(entry.desc, entry.desc_reading, entry.remarks,
+                            entry.remarks_reading, key, reading)
+
+    def find(self, item_match: str) -> ItemMatch:
+        key, reading = normalize_key(item_match), reading_key(item_match)
+        if not key:
+            return ItemMatch()
+        exact = self._exact.get(key) or []
+        if exact:
+            # 摘要がまったく同じ行は区別できないため、従来どおり先頭の行
+            first = min(exact, key=lambda k: self._entries[k].order)
+            return ItemMatch(self._entries[first].item, SCORE_EXACT,
+                             candidates=[Candidate(self._entries[first].item, SCORE_EXACT)])
+
+        scored: dict[int, float] = {k: SCORE_READING for k in self._reading.get(reading, [])}
+        # 1文字の指定は2-gram を持たないため、その文字を含む明細を総当たりで探す
+        if len(key) < 2 or len(reading) < 2:
+            pool = set(self._entries)
+        else:
+            pool = set(self._short)
+            for g in _bigrams(key) | _bigrams(reading):
+                pool |= self._postings.get(g, set())
+        for k in pool - set(scored):
+            score = self._score(self._entries[k], key, reading)
+            if score > 0:
+                scored[k] = score
+        if not scored:
+            return ItemMatch()
+
+        ranked = sorted(scored, key=lambda k: (-scored[k], self._entries[k].order))
+        candidates = [Candidate(self._entries[k].item, round(scored[k], 3))
+                      for k in ranked[:MAX_CANDIDATES]]
+        top = candidates[0]
+        if len(candidates) > 1 and top.score - candidates[1].score < AMBIGUITY_MARGIN:
+            return ItemMatch(None, top.score, ambiguous=True, candidates=candidates)
+        return ItemMatch(top.item, top.score, candidates=candidates)
+
+
+def _category_value(section: CategorySection) -> str:
+    return section.category.value if hasattr(section.category, "value") else str(section.category)
+
+
+class EstimateItemIndex:
+    """見積全体の索引（カテゴリ名 → カテゴリ索引）。"""
+
+    def __init__(self, estimate: EstimateData):
+        self._sections: list[_SectionIndex] = [
+            _SectionIndex(section) for section in estimate.summary.categories]
+        self._by_section = {id(s.section): s for s in self._sections}
+        self._cat_exact: dict[str, CategorySection] = {}
+        self._cat_prefix: dict[str, list[CategorySection]] = {}
+        for s in self._sections:
+            name = normalize_key(_category_value(s.section))
+            self._cat_exact.setdefault(name, s.section)
+            for i in range(1, len(name) + 1):
+                self._cat_prefix.setdefault(name[:i], []).append(s.section)
+
+    # --- カテゴリ ------------------------------------------------------------
+    def category_candidates(self, category: str) -> list[CategorySection]:
+        """カテゴリ名の候補（完全一致 → 前方一致 → カテゴリ名を先頭に含む指定）。"""
+        key = normalize_key(category)
+        if not key:
+            return []
+        if key in self._cat_exact:
+            return [self._cat_exact[key]]
+        hits = list(self._cat_prefix.get(key, []))
+        if not hits:
+            # 「材料費の電線」のように指定の方が長い場合
+            for i in range(len(key) - 1, 0, -1):
+                exact = self._cat_exact.get(key[:i])
+                if exact is not None:
+                    hits.append(exact)
+                    break
+        return hits
+
+    def find_category(self, category: str) -> Optional[CategorySection]:
+        """カテゴリ名が1つに決まればその CategorySection、決まらなければ None。"""
+        hits = self.category_candidates(category)
+        return hits[0] if len(hits) == 1 else None
+
+    # --- 明細 ----------------------------------------------------------------
+    def find_item(self, section: CategorySection, item_match: str) -> ItemMatch:
+        index = self._by_section.get(id(section))
+        if index is None:
+            return ItemMatch()
+        return index.find(item_match)
+
+    def add(self, section: CategorySection, item: LineItem) -> None:
+        index = self._by_section.get(id(section))
+        if index is not None:
+            index.add(item)
+
+    def remove(self, section: CategorySection, item: LineItem) -> None:
+        index = self._by_section.get(id(section))
+        if index is not None:
+            index.remove(item)
+
+    def reindex(self, section: CategorySection, item: LineItem) -> None:
+        """摘要・備考を書き換えた明細を索引し直す（並び順は保つ）。"""
+        index = self._by_section.get(id(section))
+        if index is not None:
+            index.add(item, order=index.remove(item))
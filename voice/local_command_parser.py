@@ -0,0 +1,385 @@
+"""音声コマンドのローカル解析（規則ベース・API呼び出しなし）
+
+「パネルの単価を5万円に」「値引きを10万円」のような定型の指示を、
+正規表現の文法と漢数字の読み取りだけで構造化コマンドに変換する。
+voice_command_parser.parse_voice_command の前段で使い、確信度が
+LOCAL_CONFIDENCE_THRESHOLD 未満なら Claude API に回す。
+
+扱う指示（1文を「、」「。」「〜して」で区切った節ごと）:
+- 単価 / 数量 / 金額 を X に（「X上げて」「X下げて」の相対指示を含む）
+- 明細の削除（削除 / 消して / 外して など）
+- 値引きを X 円に / なしに（この定型だけ。「値引き後の金額」「値引きを追加」などは Claude）
+- 宛先会社名 / 工事名 / 有効期限 を X に変更
+
+明細は _summarize_estimate の結果（カテゴリ・摘要・備考）と、音声編集の適用
+（voice.item_index）と同じ基準で突き合わせる。
+どれか1節でも解釈できない・対象があいまいなときは確信度 0 とし、
+全体を Claude に任せる（部分的にローカル解析した結果は使わない）。
+割合（%・割・倍）、数値が2つ以上（「5万円から6万円に」）、言い直し（「〜ではなく」）、
+否定（「〜しないで」「やめて」）、加算（「追加」「増」）、値引き前後・合計を指す節は、
+規則では意味を取り違えやすいため最初から Claude に任せる。
+
+使い方:
+    from voice.local_command_parser import parse_local
+    result = parse_local("パネルの単価を5万円に", _summarize_estimate(estimate))
+    if result.confidence >= LOCAL_CONFIDENCE_THRESHOLD:
+        commands = result.commands
+"""
+from __future__ import annotations
+
+import logging
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Optional, Union
+
+from voice.item_index import AMBIGUITY_MARGIN, SCORE_READING, normalize_key, score_item
+
+logger = logging.getLogger(__name__)
+
+# この確信度以上ならローカル解析の結果をそのまま使う
+LOCAL_CONFIDENCE_THRESHOLD = 0.8
+
+# 明細の突き合わせの確信度。照合の強さ（item_index.score_item）を、摘要の一致・
+# 読みの一致 > 摘要との包含 > それ以外（備考・近似一致）の3段階に丸める
+MATCH_EXACT = 1.0
+MATCH_CONTAINS = 0.9
+MATCH_REMARKS = 0.75
+# 摘要との包含とみなす照合の強さの下限（item_index の包含は 0.7 以上）
+_CONTAINS_MIN_SCORE = 0.7
+
+_KANJI_DIGITS = {"〇": 0, "零": 0, "一": 1, "壱": 1, "二": 2, "弐": 2, "三": 3, "参": 3,
+                 "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_SMALL_UNITS = {"十": 10, "百": 100, "千": 1000}
+_LARGE_UNITS = {"万": 10_000, "億": 100_000_000}
+
+# 数値の候補（算用数字・漢数字・万千百の混在。全角は NFKC 済みの前提）
+_NUM_RE = re.compile(r"(マイナス|-)?([0-9〇零一二三四五六七八九壱弐参十百千万億][0-9.,〇零一二三四五六七八九壱弐参十百千万億]*)")
+
+_FIELD_ACTIONS = {
+    "単価": ("update_unit_price", "unit_price"),
+    "数量": ("update_quantity", "quantity"),
+    "個数": ("update_quantity", "quantity"),
+    "枚数": ("update_quantity", "quantity"),
+    "台数": ("update_quantity", "quantity"),
+    "本数": ("update_quantity", "quantity"),
+    "金額": ("update_amount", "amount"),
+}
+_FIELD_RE = re.compile("|".join(_FIELD_ACTIONS))
+_FIELD_LABELS = {"update_unit_price": "単価", "update_quantity": "数量", "update_amount": "金額"}
+
+_UP_RE = re.compile(r"上げ|アップ|増や|プラス|足し")
+_DOWN_RE = re.compile(r"下げ|ダウン|減ら|引い|値下げ")
+_QTY_UNITS = r"メートル|セット|箇所|ヶ所|か所|枚|台|個|本|式|面|組|kw|m"
+_QTY_UNIT_RE = re.compile(rf"\s*({_QTY_UNITS})", re.IGNORECASE)
+_UNIT_ALIASES = {"メートル": "m", "ヶ所": "箇所", "か所": "箇所", "kw": "kW"}
+
+_DELETE_RE = re.compile(r"(?:を|は)?(?:削除|消して|消去|削って|外して|なくして|取って|いらない)")
+_DISCOUNT_RE = re.compile(r"値引|ディスカウント")
+# 「〜に設定して」「〜に変更」などの言い終わり（値の後ろに続いてよいもの）
+_SET_TAIL = r"\s*(?:に|へ)?\s*(?:設定|変更)?\s*(?:して|する|します)?\s*(?:ください)?$"
+_DISCOUNT_HEAD = r"^(?:お)?(?:値引き?|ディスカウント)(?:額|金額)?\s*"
+# ローカルで扱う値引きは「値引きをX円に」「値引きをなしに」「値引き(X円)を取り消して」だけ
+_DISCOUNT_SET_RE = re.compile(_DISCOUNT_HEAD + r"(?:を|は)?\s*(?P<value>[^\sをはにへ]+?)\s*円?" + _SET_TAIL)
+_DISCOUNT_CANCEL_RE = re.compile(
+    _DISCOUNT_HEAD + r"(?:[0-9.,〇零一二三四五六七八九十百千万億]+\s*円)?\s*(?:を|は)?\s*"
+    r"(?:取り消|削除|なくして|消して|外して)")
+_DISCOUNT_ZERO_RE = re.compile(r"^(?:なし|無し|ゼロ)$")
+# 「X円に上げて」のように変更後の値を指す（相対指示ではない）
+_ABSOLUTE_RE = re.compile(rf"\s*(?:円|{_QTY_UNITS})?\s*(?:に|へ|まで)", re.IGNORECASE)
+# 「単価を5万円」「数量を60m」のように値で言い終わる指示
+_VALUE_TAIL_RE = re.compile(rf"\s*(?:円|{_QTY_UNITS})?" + _SET_TAIL, re.IGNORECASE)
+
+# 規則では意味を取り違えやすい節（割合・範囲・言い直し・否定・加算・値引き前後や合計）。
+# 「いらない」は削除の指示
+_NEEDS_CLAUDE_RE = re.compile(
+    r"%|割(?!引)|倍|パーセント|ではなく|じゃなく|から.+(?:に|へ)|ない|やめ|追加|増|後|前|合計")
+_NOT_NEGATION_RE = re.compile(r"いらない")
+
+_COVER_RULES = [
+    ("set_client_name", "宛先会社名",
+     re.compile(r"(?:宛先|宛名|会社名|お客様名)(?:の?会社名)?(?:を|は)\s*(.+?)\s*(?:に|へ)(?:変更|して|変え|修正|する)")),
+    ("set_project_name", "工事名",
+     re.compile(r"(?:工事名|件名)(?:を|は)\s*(.+?)\s*(?:に|へ)(?:変更|して|変え|修正|する)")),
+    ("set_validity_period", "有効期限",
+     re.compile(r"有効期限(?:を|は)\s*(.+?)\s*(?:に|へ)(?:変更|して|変え|修正|する)")),
+]
+
+# 節の区切り（数字の桁区切りのカンマでは切らない）と、意味を持たない節
+_CLAUSE_SPLIT_RE = re.compile(r"[、。;\n]+|(?<![0-9])[,](?![0-9])|(?<=して)|(?<=ください)")
+_FILLER_RE = re.compile(r"^(?:お願い(?:します)?|よろしく.*|ください|下さい|です|ます|以上|あと|それと|それから|そして|次に)?$")
+_LEADING_RE = re.compile(r"^(?:あと|それと|それから|そして|次に|また)\s*")
+
+
+@dataclass
+class LocalParseResult:
+    """ローカル解析の結果。confidence は全節の最小値（解釈できない節があれば 0）。"""
+    commands: list[dict] = field(default_factory=list)
+    confidence: float = 0.0
+    reason: str = ""
+
+
+def normalize_text(text: str) -> str:
+    """全角英数・記号を半角にし、空白を詰める（比較・解析用）。"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def parse_japanese_number(text: str) -> Optional[Union[int, float]]:
+    """漢数字・算用数字・万/千/百の単位を含む金額や数量を数値にする。
+
+    「5万」「五万円」「7万5千」「3百万」「1.5万」「1,200円」「マイナス5万」などに対応。
+    解釈できなければ None。整数になる値は int で返す。
+    """
+    s = normalize_text(text).replace(",", "").replace("円", "").replace(" ", "")
+    sign = 1
+    if s.startswith("マイナス"):
+        sign, s = -1, s[len("マイナス"):]
+    elif s.startswith("-"):
+        sign, s = -1, s[1:]
+    if not s:
+        return None
+
+    total = 0.0     # 万・億で確定した分
+    section = 0.0   # 万未満の十・百・千で確定した分
+    current: Optional[float] = None
+    i = 0
+    while i < len(s):
+        ch = s[i]
+        m = re.match(r"[0-9]+(?:\.[0-9]+)?", s[i:])
+        if m:
+            if current is not None:
+                return None
+            current = float(m.group(0))
+            i += len(m.group(0))
+            continue
+        if ch in _KANJI_DIGITS:
+            # 「二〇〇」のような桁の並びは10進数として読む
+            current = (current or 0) * 10 + _KANJI_DIGITS[ch]
+        elif ch in _SMALL_UNITS:
+            section += (1 if current is None else current) * _SMALL_UNITS[ch]
+            current = None
+        elif ch in _LARGE_UNITS:
+            chunk = section + (current or 0)
+            total += (chunk or 1) * _LARGE_UNITS[ch]
+            section, current = 0.0, None
+        else:
+            return None
+        i += 1
+
+    value = sign * (total + section + (current or 0))
+    return int(value) if value == int(value) else value
+
+
+def _find_number(text: str) -> Optional[tuple[Union[int, float], re.Match]]:
+    """文字列中の最初の数値表現を読み取る。"""
+    for m in _NUM_RE.finditer(text):
+        value = parse_japanese_number(m.group(0))
+        if value is not None:
+            return value, m
+    return None
+
+
+def _needs_claude(clause: str) -> bool:
+    """割合・範囲・言い直し・否定を含む節や、数値が2つ以上ある節か。"""
+    if _NEEDS_CLAUDE_RE.search(_NOT_NEGATION_RE.sub("", clause)):
+        return True
+    numbers = [m for m in _NUM_RE.finditer(clause) if parse_japanese_number(m.group(0)) is not None]
+    return len(numbers) > 1
+
+
+def _clauses(text: str) -> list[str]:
+    parts = []
+    for part in _CLAUSE_SPLIT_RE.split(normalize_text(text)):
+        part = _LEADING_RE.sub("", part.strip())
+        if part and not _FILLER_RE.match(part):
+            parts.append(part)
+    return parts
+
+
+def _mentioned_category(clause: str, categories: list[str]) -> tuple[Optional[str], str]:
+    """節の先頭にあるカテゴリ名（「材料費の〜」）を取り出し、残りの文字列を返す。"""
+    for name in sorted(categories, key=len, reverse=True):
+        if clause.startswith(name):
+            return name, re.sub(r"^(?:の|で|にある)", "", clause[len(name):]).strip()
+    return None, clause
+
+
+def _clean_target(target: str) -> str:
+    target = re.sub(r"(?:の|を|は|が|も)$", "", target.strip())
+    return target.strip("「」『』\"' ")
+
+
+def match_item(target: str, summary: dict, category: Optional[str] = None):
+    """摘要・備考から明細を探す（照合は voice.item_index.score_item と同じ基準）。
+
+    Returns:
+        (カテゴリ名, 明細 dict, 確信度)。上位2件の差が AMBIGUITY_MARGIN 未満なら
+        確信度を下げる。何も見つからなければ (None, None, 0.0)。
+    """
+    if not normalize_key(target):
+        return None, None, 0.0
+    scored = []
+    for cat in summary.get("categories", []):
+        cat_name = cat.get("category", "")
+        if category and cat_name != category:
+            continue
+        for item in cat.get("items", []):
+            score = score_item(target, item.get("description", ""), item.get("remarks", ""))
+            if score > 0:
+                scored.append((score, cat_name, item))
+    if not scored:
+        return None, None, 0.0
+    scored.sort(key=lambda s: -s[0])
+    best, cat_name, item = scored[0]
+    if best >= SCORE_READING:
+        confidence = MATCH_EXACT
+    elif best >= _CONTAINS_MIN_SCORE:
+        confidence = MATCH_CONTAINS
+    else:
+        confidence = MATCH_REMARKS
+    if len(scored) > 1 and best - scored[1][0] < AMBIGUITY_MARGIN:
+        # 同じくらいの強さで複数の明細に当たる指示はローカルでは決めない
+        return cat_name, item, confidence / 2
+    return cat_name, item, confidence
+
+
+def _current_number(item: dict, key: str) -> Optional[float]:
+    value = item.get(key)
+    if key == "quantity":
+        m = re.search(r"[0-9.]+", normalize_text(str(value or "")))
+        return float(m.group(0)) if m else None
+    return value if isinstance(value, (int, float)) else None
+
+
+def _format_value(action: str, value) -> str:
+    if action == "update_quantity":
+        return f"{value:g}" if isinstance(value, float) else str(value)
+    return f"{int(value):,}円"
+
+
+def _parse_cover(clause: str) -> Optional[tuple[dict, float]]:
+    for action, label, pattern in _COVER_RULES:
+        m = pattern.search(clause)
+        if m:
+            value = m.group(1).strip().strip("「」『』\"' ")
+            if not value:
+                return None
+            return ({"action": action, "new_value": value,
+                     "reason": f"{label}を「{value}」に変更"}, 1.0)
+    return None
+
+
+def _parse_discount(clause: str) -> Optional[tuple[dict, float]]:
+    """「値引きをX円に」「値引きをなしに」「値引きを取り消して」だけを解析する。"""
+    # 「値引き5万円を取り消して」は金額より取り消しを優先する
+    if _DISCOUNT_CANCEL_RE.match(clause):
+        return {"action": "set_discount", "new_value": 0, "reason": "お値引きをなしに設定"}, 1.0
+    m = _DISCOUNT_SET_RE.match(clause)
+    if not m:
+        return None
+    if _DISCOUNT_ZERO_RE.match(m.group("value")):
+        return {"action": "set_discount", "new_value": 0, "reason": "お値引きをなしに設定"}, 1.0
+    found = parse_japanese_number(m.group("value"))
+    if found is None or found != int(found):
+        return None
+    value = -abs(int(found))
+    return ({"action": "set_discount", "new_value": value,
+             "reason": f"お値引きを{abs(value):,}円に設定"}, 1.0)
+
+
+def _parse_delete(clause: str, summary: dict, categories: list[str]) -> Optional[tuple[dict, float]]:
+    m = _DELETE_RE.search(clause)
+    if not m:
+        return None
+    category, rest = _mentioned_category(clause[:m.start()], categories)
+    target = _clean_target(rest)
+    cat_name, item, score = match_item(target, summary, category)
+    if item is None:
+        return None
+    return ({"action": "delete_item", "category": cat_name,
+             "item_match": item.get("description", ""),
+             "reason": f"{cat_name}の{item.get('description', '')}を削除"}, score)
+
+
+def _parse_field(clause: str, summary: dict, categories: list[str]) -> Optional[tuple[dict, float]]:
+    m = _FIELD_RE.search(clause)
+    if not m:
+        return None
+    action, key = _FIELD_ACTIONS[m.group(0)]
+    category, rest = _mentioned_category(clause[:m.start()], categories)
+    target = _clean_target(rest)
+    tail = clause[m.end():]
+    found = _find_number(tail)
+    if found is None:
+        return None
+    value, num_match = found
+    after = tail[num_match.end():]
+
+    cat_name, item, score = match_item(target, summary, category)
+    if item is None:
+        return None
+
+    label = _FIELD_LABELS[action]
+    desc = item.get("description", "")
+    direction = 0
+    if not (_ABSOLUTE_RE.match(after) or _VALUE_TAIL_RE.match(after)):
+        direction = 1 if _UP_RE.search(after) else -1 if _DOWN_RE.search(after) else 0
+        if not direction:
+            return None  # 値の後ろが読めない指示は Claude に任せる
+    if direction:
+        current = _current_number(item, key)
+        if current is None:
+            return None
+        delta = value
+        value = current + direction * abs(delta)
+        reason = (f"{cat_name}の{desc}の{label}を{_format_value(action, abs(delta))}"
+                  f"{'上げ' if direction > 0 else '下げ'}て{_format_value(action, value)}に変更")
+    else:
+        reason = f"{cat_name}の{desc}の{label}を{_format_value(action, value)}に変更"
+
+    cmd = {"action": action, "category": cat_name, "item_match": desc, "reason": reason}
+    if action == "update_quantity":
+        cmd["new_value"] = value
+        unit = _QTY_UNIT_RE.match(after)
+        if unit:
+            cmd["new_unit"] = _UNIT_ALIASES.get(unit.group(1).lower(), unit.group(1))
+    else:
+        if value != int(value):
+            return None
+        cmd["new_value"] = int(value)
+    return cmd, score
+
+
+def parse_local(text: str, summary: dict) -> LocalParseResult:
+    """指示文を節に分け、規則で構造化コマンドにする。
+
+    Args:
+        text: ユーザーの指示（音声の文字起こし）
+        summary: voice_command_parser._summarize_estimate の結果
+
+    Returns:
+        LocalParseResult。どれかの節を解釈できなければ confidence=0.0
+    """
+    clauses = _clauses(text)
+    if not clauses:
+        return LocalParseResult(reason="指示が空です")
+    categories = [c.get("category", "") for c in summary.get("categories", [])]
+
+    result = LocalParseResult(confidence=1.0)
+    for clause in clauses:
+        if _needs_claude(clause):
+            return LocalParseResult(reason=f"規則では判断しない指示: {clause}")
+        if _DISCOUNT_RE.search(clause):
+            # 値引きに触れる節は定型に当たらなければ明細の指示として読まない
+            parsed = _parse_cover(clause) or _parse_discount(clause)
+        else:
+            parsed = (_parse_cover(clause)
+                      or _parse_delete(clause, summary, categories)
+                      or _parse_field(clause, summary, categories))
+        if parsed is None:
+            return LocalParseResult(reason=f"規則に当たらない指示: {clause}")
+        cmd, score = parsed
+        result.commands.append(cmd)
+        result.confidence = min(result.confidence, score)
+    return result
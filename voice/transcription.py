@@ -0,0 +1,402 @@
+"""音声の文字起こしバックエンド（クラウドの Whisper API / ローカルの faster-whisper）
+
+voice_recorder.transcribe_audio は、これまで呼び出しのたびに openai.OpenAI を作って
+OpenAI Whisper API に音声を送っていた（毎回クライアント生成と新規接続・往復の待ち）。
+このモジュールは文字起こしをバックエンドとして差し替えられるようにする:
+
+- "openai": OpenAI Whisper API（whisper-1）。クライアントはプロセス内で使い回し、
+  HTTP 接続を再利用する（APIキーは KEY_RECHECK_SEC ごとに読み直し、変われば作り直す）
+- "local":  faster-whisper（CTranslate2）を CPU で動かす。モデルはプロセス内で1度だけ
+  読み込んで保持し、以降の呼び出しは読み込み待ちなしで推論だけ行う
+- "auto":   faster-whisper が入っていれば local、無ければ openai
+
+どれを使うかは環境変数 SANEI_STT_BACKEND（既定 openai。従来どおり）で選ぶ。
+ローカルのモデルは SANEI_WHISPER_MODEL（既定 small。モデル名またはディレクトリ）と
+SANEI_WHISPER_COMPUTE（既定 int8）で指定する。faster-whisper はオプション依存で、
+使うときだけ読み込む（pip install faster-whisper）。
+
+ローカルでは長い録音を CHUNK_SEC ごと（区切りは境目付近の最も静かな位置）に分けて
+順に推論し、stream() で「それまでの全文」を区間ごとに返す（途中経過の表示用）。
+
+    backend = get_backend()               # SANEI_STT_BACKEND に従う
+    for partial in backend.stream(audio_bytes, language="ja"):
+        placeholder.caption(partial)
+    text = backend.transcribe(audio_bytes)
+"""
+from __future__ import annotations
+
+import importlib.util
+import io
+import logging
+import os
+import threading
+import time
+import wave
+from abc import ABC, abstractmethod
+from typing import Callable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+BACKEND_ENV = "SANEI_STT_BACKEND"
+LOCAL_MODEL_ENV = "SANEI_WHISPER_MODEL"
+LOCAL_COMPUTE_ENV = "SANEI_WHISPER_COMPUTE"
+
+BACKEND_OPENAI = "openai"
+BACKEND_LOCAL = "local"
+BACKEND_AUTO = "auto"
+
+OPENAI_MODEL = "whisper-1"
+DEFAULT_LOCAL_MODEL = "small"
+DEFAULT_COMPUTE_TYPE = "int8"
+# APIキーを読み直す間隔（extraction/api_client と同じ）
+KEY_RECHECK_SEC = 300.0
+
+SAMPLE_RATE = 16000
+# ローカル推論の1区間の長さ（Whisper の入力窓は30秒）と、区切りを探す幅
+CHUNK_SEC = 30.0
+SPLIT_SEARCH_SEC = 2.0
+_FRAME_SEC = 0.02
+
+
+def _missing_openai_key() -> RuntimeError:
+    return RuntimeError(
+        "OpenAI APIキーが設定されていません。"
+        "環境変数 OPENAI_API_KEY または .streamlit/secrets.toml に設定してください。"
+    )
+
+
+# =============================================================
+# 音声の読み込み・区間分割（ローカル用）
+# =============================================================
+
+def _is_wav(audio_bytes: bytes) -> bool:
+    return audio_bytes[:4] == b"RIFF" and audio_bytes[8:12] == b"WAVE"
+
+
+def decode_audio(audio_bytes: bytes, sampling_rate: int = SAMPLE_RATE):
+    """音声バイト列を、モノラル・sampling_rate の float32 波形（numpy 配列）にする。
+
+    WAV（st.audio_input の録音）は標準ライブラリで読み、それ以外（webm など）は
+    faster-whisper の decode_audio（PyAV）に任せる。
+    """
+    import numpy as np
+
+    if not _is_wav(audio_bytes):
+        try:
+            from faster_whisper import decode_audio as fw_decode
+        except ImportError as e:
+            raise RuntimeError(
+                "WAV 以外の音声を読むには faster-whisper が必要です。"
+                "`pip install faster-whisper` でインストールしてください。"
+            ) from e
+        return fw_decode(io.BytesIO(audio_bytes), sampling_rate=sampling_rate)
+
+    with wave.open(io.BytesIO(audio_bytes), "rb") as wf:
+        channels, width, rate = wf.getnchannels(), wf.getsampwidth(), wf.getframerate()
+        raw = wf.readframes(wf.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise RuntimeError(f"対応していない WAV のサンプル幅です: {width * 8}bit")
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    if rate != sampling_rate and len(samples):
+        n_out = int(round(len(samples) * sampling_rate / rate))
+        samples = np.interp(np.arange(n_out) * (rate / sampling_rate),
+                            np.arange(len(samples)), samples).astype(np.float32)
+    return samples.astype(np.float32, copy=False)
+
+
+def split_chunks(samples, sampling_rate: int = SAMPLE_RATE,
+                 chunk_sec: float = CHUNK_SEC, search_sec: float = SPLIT_SEARCH_SEC) -> list:
+    """波形を chunk_sec 以下の区間に分ける。
+
+    単語の途中で切らないよう、各区間の終わり search_sec の範囲で最も静かな
+    位置（_FRAME_SEC ごとの二乗平均が最小のフレーム）で区切る。
+    """
+    import numpy as np
+
+    size = int(chunk_sec * sampling_rate)
+    if size <= 0 or len(samples) <= size:
+        return [samples] if len(samples) else []
+    frame = max(1, int(_FRAME_SEC * sampling_rate))
+    search = min(int(search_sec * sampling_rate), size // 2)
+    chunks, start = [], 0
+    while len(samples) - start > size:
+        lo, hi = start + size - search, start + size
+        window = samples[lo:hi]
+        n_frames = len(window) // frame
+        cut = hi
+        if n_frames > 1:
+            energy = (window[:n_frames * frame].reshape(n_frames, frame) ** 2).mean(axis=1)
+            cut = lo + int(np.argmin(energy)) * frame + frame // 2
+        chunks.append(samples[start:cut])
+        start = cut
+    chunks.append(samples[start:])
+    return chunks
+
+
+def _join(parts: list[str], language: str) -> str:
+    sep = "" if language in ("ja", "zh") else " "
+    return sep.join(p for p in parts if p).strip()
+
+
+# =============================================================
+# バックエンド
+# =============================================================
+
+class TranscriptionBackend(ABC):
+    """文字起こしバックエンドの共通インターフェース。
+
+    available() と stream() を実装しないサブクラスは生成時に TypeError になる
+    （録音の途中で未実装に気づくことがないように）。
+    """
+
+    name = ""
+
+    @abstractmethod
+    def available(self) -> bool:
+        """このバックエンドを今使えるか（キー・パッケージの有無）。"""
+
+    @abstractmethod
+    def stream(self, audio_bytes: bytes, language: str = "ja") -> Iterator[str]:
+        """文字起こしの途中経過（それまでの全文）を順に返す。最後の値が最終結果。"""
+
+    def warm_up(self) -> None:
+        """使う前に済ませておける準備（モデルの読み込みなど）を裏で始める。"""
+
+    def transcribe(self, audio_bytes: bytes, language: str = "ja") -> str:
+        text = ""
+        for text in self.stream(audio_bytes, language):
+            pass
+        return text
+
+
+class OpenAIWhisperBackend(TranscriptionBackend):
+    """OpenAI Whisper API（クライアントはプロセス内で共有）。
+
+    Args:
+        api_key_fn: APIキーを返す関数（voice_recorder._get_openai_key など）
+    """
+
+    name = BACKEND_OPENAI
+
+    def __init__(self, api_key_fn: Callable[[], Optional[str]]):
+        self._api_key_fn = api_key_fn
+
+    def available(self) -> bool:
+        if not self._api_key_fn():
+            return False
+        try:
+            _import_openai()
+            return True
+        except ImportError:
+            return False
+
+    def stream(self, audio_bytes: bytes, language: str = "ja") -> Iterator[str]:
+        # whisper-1 は途中経過を返さないため、1回の送信で全文を返す
+        client = _openai_client(self._api_key_fn)
+        filename, mime = (("recording.wav", "audio/wav") if _is_wav(audio_bytes)
+                          else ("recording.webm", "audio/webm"))
+        resp = client.audio.transcriptions.create(
+            model=OPENAI_MODEL,
+            file=(filename, audio_bytes, mime),
+            language=language,
+        )
+        yield resp.text
+
+
+def _import_openai():
+    import openai
+    return openai
+
+
+_OPENAI: dict = {"client": None, "api_key": None, "checked": 0.0}
+_openai_lock = threading.Lock()
+
+
+def _openai_client(api_key_fn: Callable[[], Optional[str]]):
+    """共有の OpenAI クライアント（キーが変わったときだけ作り直す）。
+
+    Raises:
+        RuntimeError: APIキー未設定 or openai パッケージ未インストール
+    """
+    with _openai_lock:
+        now = time.monotonic()
+        if _OPENAI["client"] is not None and now - _OPENAI["checked"] < KEY_RECHECK_SEC:
+            return _OPENAI["client"]
+        api_key = api_key_fn()
+        if not api_key:
+            raise _missing_openai_key()
+        if _OPENAI["client"] is not None and _OPENAI["api_key"] == api_key:
+            _OPENAI["checked"] = now
+            return _OPENAI["client"]
+        try:
+            openai = _import_openai()
+        except ImportError as e:
+            raise RuntimeError(
+                "openai パッケージがインストールされていません。"
+                "`pip install openai` でインストールしてください。"
+            ) from e
+        if _OPENAI["client"] is not None:
+            logger.info("OpenAI APIキーが変わったため文字起こしクライアントを作り直します")
+            _close_quietly(_OPENAI["client"])
+        _OPENAI.update(client=openai.OpenAI(api_key=api_key), api_key=api_key, checked=now)
+        return _OPENAI["client"]
+
+
+def _close_quietly(client) -> None:
+    try:
+        client.close()
+    except Exception as e:
+        logger.debug(f"クライアントのクローズに失敗（無視）: {e}")
+
+
+class LocalWhisperBackend(TranscriptionBackend):
+    """faster-whisper による CPU 上の文字起こし（モデルはプロセス内で1度だけ読み込む）。
+
+    Args:
+        model_size: モデル名（tiny/base/small/medium 等）またはモデルのディレクトリ
+        compute_type: CTranslate2 の量子化（CPU では int8 が速い）
+        chunk_sec: 1区間の長さ（秒）
+    """
+
+    name = BACKEND_LOCAL
+
+    def __init__(self, model_size: Optional[str] = None, compute_type: Optional[str] = None,
+                 chunk_sec: float = CHUNK_SEC):
+        self.model_size = model_size or os.environ.get(LOCAL_MODEL_ENV) or DEFAULT_LOCAL_MODEL
+        self.compute_type = (compute_type or os.environ.get(LOCAL_COMPUTE_ENV)
+                             or DEFAULT_COMPUTE_TYPE)
+        self.chunk_sec = chunk_sec
+
+    def available(self) -> bool:
+        return _faster_whisper_installed()
+
+    def model(self):
+        """読み込み済みのモデル（初回だけ読み込む）。"""
+        return _local_model(self.model_size, self.compute_type)
+
+    def warm_up(self) -> None:
+        """モデルの読み込みを別スレッドで始める（録音している間に読み込みを済ませる）。
+
+        読み込み済み・読み込み中ならすぐ戻る（Streamlit の再実行ごとに呼んでも待たない）。
+        """
+        key = (self.model_size, self.compute_type)
+        with _model_lock:
+            if key in _MODELS or key in _WARMING:
+                return
+        if not self.available():
+            return
+        threading.Thread(target=self._warm, daemon=True, name="whisper-warm-up").start()
+
+    def _warm(self) -> None:
+        try:
+            self.model()
+        except Exception as e:
+            logger.warning(f"faster-whisper モデルの事前読み込みに失敗しました: {e}")
+
+    def stream(self, audio_bytes: bytes, language: str = "ja") -> Iterator[str]:
+        model = self.model()
+        samples = decode_audio(audio_bytes)
+        parts: list[str] = []
+        for chunk in split_chunks(samples, chunk_sec=self.chunk_sec):
+            segments, _info = model.transcribe(chunk, language=language, beam_size=1,
+                                               vad_filter=True)
+            # segments は推論しながら1つずつ返るため、区間の途中でも途中経過を出す
+            for segment in segments:
+                parts.append(segment.text.strip())
+                yield _join(parts, language)
+        if not parts:
+            yield ""
+
+
+def _faster_whisper_installed() -> bool:
+    # 入っているかだけを見る（重い import はモデルの読み込み時まで遅らせる）
+    return importlib.util.find_spec("faster_whisper") is not None
+
+
+def _load_model(model_size: str, compute_type: str):
+    """faster-whisper のモデルを読み込む（テストではフェイクに差し替える）。"""
+    try:
+        from faster_whisper import WhisperModel
+    except ImportError as e:
+        raise RuntimeError(
+            "ローカル文字起こしには faster-whisper が必要です。"
+            "`pip install faster-whisper` でインストールしてください。"
+        ) from e
+    return WhisperModel(model_size, device="cpu", compute_type=compute_type)
+
+
+_MODELS: dict = {}      # (モデル, 量子化) → 読み込み済みのモデル
+_WARMING: dict = {}     # (モデル, 量子化) → 読み込み中の完了通知（threading.Event）
+_model_lock = threading.Lock()
+
+
+def _local_model(model_size: str, compute_type: str):
+    """読み込み済みのモデルを返す（無ければ読み込む）。
+
+    読み込み自体はロックの外で行う。同じモデルを別スレッドが読み込み中なら、
+    その完了を待って結果を使う（失敗していれば自分で読み込み直す）。
+    """
+    key = (model_size, compute_type)
+    while True:
+        with _model_lock:
+            model = _MODELS.get(key)
+            if model is not None:
+                return model
+            loading = _WARMING.get(key)
+            if loading is None:
+                loading = _WARMING[key] = threading.Event()
+                break
+        loading.wait()
+
+    started = time.monotonic()
+    try:
+        model = _load_model(model_size, compute_type)
+        with _model_lock:
+            if _WARMING.get(key) is loading:   # 読み込み中に reset() されたら保持しない
+                _MODELS[key] = model
+        logger.info(f"faster-whisper モデル {model_size}（{compute_type}）を読み込みました"
+                    f"（{time.monotonic() - started:.1f}秒）")
+        return model
+    finally:
+        with _model_lock:
+            if _WARMING.get(key) is loading:
+                del _WARMING[key]
+        loading.set()
+
+
+def reset() -> None:
+    """共有クライアントと読み込み済みモデルを破棄する（設定変更後・テスト用）。"""
+    with _openai_lock:
+        if _OPENAI["client"] is not None:
+            _close_quietly(_OPENAI["client"])
+        _OPENAI.update(client=None, api_key=None, checked=0.0)
+    with _model_lock:
+        _MODELS.clear()
+        _WARMING.clear()
+
+
+def get_backend(name: Optional[str] = None,
+                api_key_fn: Optional[Callable[[], Optional[str]]] = None) -> TranscriptionBackend:
+    """バックエンドを選ぶ（name 省略時は SANEI_STT_BACKEND、既定 openai）。
+
+    Args:
+        name: "openai" / "local" / "auto"
+        api_key_fn: OpenAI のAPIキーを返す関数（省略時は環境変数 OPENAI_API_KEY）
+    """
+    if api_key_fn is None:
+        api_key_fn = lambda: (os.environ.get("OPENAI_API_KEY") or "").strip() or None  # noqa: E731
+    name = (name or os.environ.get(BACKEND_ENV) or BACKEND_OPENAI).strip().lower()
+    if name == BACKEND_AUTO:
+        name = BACKEND_LOCAL if _faster_whisper_installed() else BACKEND_OPENAI
+    if name == BACKEND_LOCAL:
+        return LocalWhisperBackend()
+    if name != BACKEND_OPENAI:
+        logger.warning(f"文字起こしバックエンド {name!r} は不明なため openai を使います")
+    return OpenAIWhisperBackend(api_key_fn)
@@ -1,7 +1,9 @@
 """音声コマンド解析モジュール
 
-ユーザーの自然言語指示（音声から文字起こしされたテキスト）を Claude API で
-構造化コマンドのリストに変換する。
+ユーザーの自然言語指示（音声から文字起こしされたテキスト）を
+構造化コマンドのリストに変換する。定型の指示はまずローカルの規則
+（voice/local_command_parser）で解析し、確信度が低いときだけ Claude API を呼ぶ。
+経路ごとの件数と所要時間は parse_stats() で確認できる。
 
 サポートするアクション:
 - update_unit_price / update_quantity / update_amount
@@ -21,12 +23,16 @@ from __future__ import annotations
 import json
 import logging
 import re
+import threading
+import time
 from typing import Any
 
 import anthropic
 
 from models.estimate_data import EstimateData
 from config import get_api_key, CLAUDE_MODEL
+from extraction import api_client, api_replay
+from voice.local_command_parser import LOCAL_CONFIDENCE_THRESHOLD, parse_local
 
 logger = logging.getLogger(__name__)
 
@@ -66,13 +72,64 @@ SUPPORTED_CATEGORIES = [
     "設置工事",
 ]
 
+# 解析経路
+PATH_LOCAL = "local"
+PATH_CLAUDE = "claude"
 
-def parse_voice_command(text: str, estimate: EstimateData) -> list[dict]:
+# 経路ごとの件数・所要時間（parse_stats / reset_parse_stats）
+_STATS_LOCK = threading.Lock()
+_STATS: dict[str, dict] = {}
+
+
+def reset_parse_stats() -> None:
+    """経路ごとの集計を 0 に戻す。"""
+    with _STATS_LOCK:
+        _STATS.clear()
+        for path in (PATH_LOCAL, PATH_CLAUDE):
+            _STATS[path] = {"count": 0, "total_ms": 0.0}
+        _STATS["last_path"] = None
+
+
+reset_parse_stats()
+
+
+def _record(path: str, started: float) -> None:
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    with _STATS_LOCK:
+        _STATS[path]["count"] += 1
+        _STATS[path]["total_ms"] += elapsed_ms
+        _STATS["last_path"] = path
+    logger.info(f"音声コマンド解析: 経路={path} {elapsed_ms:.1f}ms")
+
+
+def parse_stats() -> dict:
+    """ローカル解析の命中率と、経路ごとの件数・平均所要時間(ms)を返す。
+
+    claude の所要時間には、先に試したローカル解析の時間も含む。
+    """
+    with _STATS_LOCK:
+        total = sum(_STATS[p]["count"] for p in (PATH_LOCAL, PATH_CLAUDE))
+        report: dict[str, Any] = {
+            "total": total,
+            "hit_rate": round(_STATS[PATH_LOCAL]["count"] / total, 3) if total else 0.0,
+            "last_path": _STATS["last_path"],
+        }
+        for path in (PATH_LOCAL, PATH_CLAUDE):
+            count = _STATS[path]["count"]
+            report[path] = {
+                "count": count,
+                "avg_ms": round(_STATS[path]["total_ms"] / count, 1) if count else 0.0,
+            }
+    return report
+
+
+def parse_voice_command(text: str, estimate: EstimateData, use_local: bool = True) -> list[dict]:
     """自然言語テキストを構造化コマンドのリストに変換する
 
     Args:
         text: ユーザーの自然言語指示（例: "太陽光パネルの単価を5万円にして"）
         estimate: 現在の見積データ（item_match を正確にするための参照）
+        use_local: True ならローカルの規則解析を先に試す（False で常に Claude）
 
     Returns:
         構造化コマンドのリスト。各要素は dict で以下のキーを持つ:
@@ -88,11 +145,32 @@ def parse_voice_command(text: str, estimate: EstimateData) -> list[dict]:
     if not text or not text.strip():
         return [{"action": "unknown", "reason": "解釈できませんでした（入力テキストが空です）"}]
 
+    started = time.perf_counter()
     estimate_summary = _summarize_estimate(estimate)
+    if use_local:
+        try:
+            local = parse_local(text, estimate_summary)
+        except Exception as e:
+            logger.warning(f"音声コマンドのローカル解析エラー（Claude で解析します）: {e}")
+        else:
+            if local.commands and local.confidence >= LOCAL_CONFIDENCE_THRESHOLD:
+                _record(PATH_LOCAL, started)
+                return local.commands
+            logger.debug(f"ローカル解析の確信度不足 ({local.confidence:.2f}): {local.reason}")
+
+    try:
+        return _parse_with_claude(text, estimate_summary)
+    finally:
+        _record(PATH_CLAUDE, started)
+
+
+def _parse_with_claude(text: str, estimate_summary: dict) -> list[dict]:
+    """Claude API で指示を構造化コマンドに変換する（失敗時は unknown を返す）。"""
     prompt = _build_command_extraction_prompt(text, estimate_summary)
 
     try:
-        client = anthropic.Anthropic(api_key=get_api_key())
+        client = api_replay.client(
+            lambda: api_client.shared_client(anthropic, get_api_key), "voice")
         response = client.messages.create(
             model=CLAUDE_MODEL,
             max_tokens=MAX_TOKENS,
@@ -354,7 +432,7 @@ def _validate_commands(commands: list) -> list[dict]:
 if __name__ == "__main__":
     # 動作確認: API呼び出しなしでプロンプト生成のみテスト
     from models.estimate_data import (
-        EstimateData, EstimateCover, EstimateSummary,
+        EstimateCover, EstimateSummary,
         CategorySection, LineItem, CategoryType,
     )
 
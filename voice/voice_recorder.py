@@ -23,7 +23,10 @@
         4) st.text_input() による手入力（最終フォールバック）
 
     文字起こし:
-        1) OpenAI Whisper API (whisper-1)
+        1) voice.transcription のバックエンド（SANEI_STT_BACKEND で選択）
+           - openai: OpenAI Whisper API (whisper-1)（既定）
+           - local:  faster-whisper を CPU で実行（長い録音は区間ごとに途中経過を表示）
+           - auto:   faster-whisper があれば local、無ければ openai
         2) Web Speech API（クライアント側でテキスト化されたものを受け取る）
 
 注意:
@@ -32,11 +35,14 @@
 """
 from __future__ import annotations
 
+import hashlib
 import os
-from typing import Optional
+from typing import Iterator, Optional
 
 import streamlit as st
 
+from voice import transcription
+
 
 # ============================================================================
 # キー取得ユーティリティ
@@ -96,61 +102,49 @@ def _get_anthropic_key() -> Optional[str]:
 
 
 def is_whisper_available() -> bool:
-    """OpenAI Whisper API が利用可能か（APIキーが設定されているか）チェックする。
+    """選択中の文字起こしバックエンド（SANEI_STT_BACKEND）が利用可能かチェックする。
 
     Returns:
-        True: APIキーが設定されている
-        False: APIキー未設定 or openai パッケージ未インストール
+        True: 利用可能（openai: APIキー設定済み / local: faster-whisper インストール済み）
+        False: APIキー未設定 or 必要なパッケージ未インストール
     """
-    if _get_openai_key() is None:
-        return False
-    try:
-        import openai  # noqa: F401
-        return True
-    except ImportError:
-        return False
+    return _backend().available()
 
 
 # ============================================================================
 # 文字起こし
 # ============================================================================
 
-def transcribe_audio(audio_bytes: bytes, language: str = "ja") -> str:
-    """音声バイト列を文字起こしする（OpenAI Whisper API）。
+def _backend(name: Optional[str] = None) -> transcription.TranscriptionBackend:
+    return transcription.get_backend(name, api_key_fn=_get_openai_key)
+
+
+def transcribe_audio(audio_bytes: bytes, language: str = "ja",
+                     backend: Optional[str] = None) -> str:
+    """音声バイト列を文字起こしする。
 
     Args:
         audio_bytes: 音声データ（webm/wav/mp3/m4a 等）
         language: ISO-639-1 言語コード（"ja" = 日本語）
+        backend: "openai" / "local" / "auto"（省略時は SANEI_STT_BACKEND、既定 openai）
 
     Returns:
         文字起こし結果のテキスト
 
     Raises:
-        RuntimeError: APIキー未設定 or openai パッケージ未インストール
-        Exception:    Whisper API 呼び出しの失敗
+        RuntimeError: APIキー未設定 or 必要なパッケージ未インストール
+        Exception:    Whisper API 呼び出し・ローカル推論の失敗
     """
-    api_key = _get_openai_key()
-    if not api_key:
-        raise RuntimeError(
-            "OpenAI APIキーが設定されていません。"
-            "環境変数 OPENAI_API_KEY または .streamlit/secrets.toml に設定してください。"
-        )
+    return _backend(backend).transcribe(audio_bytes, language)
 
-    try:
-        import openai
-    except ImportError as e:
-        raise RuntimeError(
-            "openai パッケージがインストールされていません。"
-            "`pip install openai` でインストールしてください。"
-        ) from e
-
-    client = openai.OpenAI(api_key=api_key)
-    resp = client.audio.transcriptions.create(
-        model="whisper-1",
-        file=("recording.webm", audio_bytes, "audio/webm"),
-        language=language,
-    )
-    return resp.text
+
+def stream_transcription(audio_bytes: bytes, language: str = "ja",
+                         backend: Optional[str] = None) -> Iterator[str]:
+    """文字起こしの途中経過（それまでの全文）を順に返す。最後の値が最終結果。
+
+    local では長い録音を区間ごとに推論して都度返す。openai は全文を1回だけ返す。
+    """
+    return _backend(backend).stream(audio_bytes, language)
 
 
 # ============================================================================
@@ -375,10 +369,13 @@ def record_and_transcribe(
     if state_key not in st.session_state:
         st.session_state[state_key] = None
 
-    whisper_ok = is_whisper_available()
+    backend = _backend()
+    whisper_ok = backend.available()
 
     # ----- 録音UI（Whisperが使える場合のみ意味がある） -----
     if whisper_ok:
+        # ローカルモデルは録音している間に読み込んでおく（2回目以降は何もしない）
+        backend.warm_up()
         audio_bytes: Optional[bytes] = None
 
         # 1) streamlit-mic-recorder
@@ -395,14 +392,22 @@ def record_and_transcribe(
             )
             return _fallback_web_speech(key, help_text)
 
-        # 録音されたら文字起こし
-        if audio_bytes:
+        # 録音されたら文字起こし（同じ録音は再実行のたびに文字起こしし直さない）
+        digest_key = f"{key}_audio_digest"
+        digest = hashlib.sha1(audio_bytes).hexdigest() if audio_bytes else None
+        if audio_bytes and st.session_state.get(digest_key) != digest:
+            partial = st.empty()
             with st.spinner("🎙️ 文字起こし中..."):
                 try:
-                    text = transcribe_audio(audio_bytes, language="ja")
+                    text = ""
+                    for text in backend.stream(audio_bytes, language="ja"):
+                        partial.caption(f"📝 {text}")
                     st.session_state[state_key] = text
+                    st.session_state[digest_key] = digest
                 except Exception as e:
                     st.warning(f"文字起こしに失敗しました: {e}")
+                finally:
+                    partial.empty()
 
         return st.session_state[state_key]
 
@@ -453,5 +458,6 @@ def _fallback_web_speech(key: str, help_text: str) -> Optional[str]:
 
 if __name__ == "__main__":
     print(f"is_whisper_available(): {is_whisper_available()}")
+    print(f"STT backend: {_backend().name}")
     print(f"OpenAI API key configured: {_get_openai_key() is not None}")
     print(f"Anthropic API key configured: {_get_anthropic_key() is not None}")